@@ -1,50 +1,90 @@
-from collections import defaultdict, namedtuple
+from collections import defaultdict, deque, namedtuple
 from datetime import datetime
 import logging
+import threading
 
 from hyperapp.boot.htypes import ref_t, bundle_t
 from hyperapp.boot.util import is_list_inst
+from hyperapp.boot.web import RefResolveFailure
 
 from .services import (
     association_reg,
     mosaic,
     pyobj_creg,
+    web,
     )
 
 log = logging.getLogger(__name__)
 
 
 BUNDLED_REFS_LIMIT = 100000
+BUNDLER_CACHE_LIMIT = 100000
 
 _RefsAndBundle = namedtuple('_RefsAndBundle', 'ref_set bundle')
+_RefDeps = namedtuple('_RefDeps', 'associations dep_refs')
+
+
+class BundlerCache:
+    """Direct dependencies of already bundled refs: their associations and refs picked from their values.
+
+    Associations depend on association registry contents, so whole cache is dropped when it is changed.
+    Used by bundlers in many threads.
+    """
+
+    def __init__(self, limit=BUNDLER_CACHE_LIMIT):
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._association_version = None
+        self._ref_to_deps = {}
+
+    def get(self, ref):
+        # Returns deps and registry version they should be put with.
+        version = association_reg.version
+        with self._lock:
+            if self._association_version != version:
+                self._ref_to_deps = {}
+                self._association_version = version
+                return (None, version)
+            return (self._ref_to_deps.get(ref), version)
+
+    def put(self, ref, deps, version):
+        # Deps collected while registry was changed may miss new associations; Do not store them.
+        with self._lock:
+            if version != self._association_version or version != association_reg.version:
+                return
+            if len(self._ref_to_deps) >= self._limit:
+                self._ref_to_deps = {}
+            self._ref_to_deps[ref] = deps
 
 
 class Bundler:
 
-    def __init__(self, pick_refs):
+    def __init__(self, pick_refs, cache):
         self._pick_refs = pick_refs
+        self._cache = cache
 
     def bundle(self, ref_list, seen_refs=None, size_limit=None):
         assert is_list_inst(ref_list, ref_t), repr(ref_list)
         log.debug("Making bundle from refs: %s", [str(ref) for ref in ref_list])
-        refs, asss, capsule_list = self._collect_capsule_list(ref_list, seen_refs or [], size_limit)
-        bundle = bundle_t(
-            roots=tuple(ref_list),
-            associations=tuple(asss),
-            capsule_list=tuple(capsule_list),
-            )
+        refs, asss, capsule_list = self._collect_capsule_list(ref_list, seen_refs or set(), size_limit)
+        bundle = bundle_t.instantiate_trusted((
+            tuple(ref_list),
+            tuple(asss),
+            tuple(capsule_list),
+            ))
         return _RefsAndBundle(refs, bundle)
 
     def _collect_capsule_list(self, ref_list, seen_refs, size_limit):
+        # seen_refs may be any container, it is not copied. Seen refs are not traversed.
         result_capsule_list = []  # Capsules within size limit
         result_size = 0
         current_capsule_list = []  # Current ref capsule and it's type dependencies.
         current_size = 0
         missing_ref_count = 0
         seen_asss = set()
-        visited_refs = set(seen_refs)
-        unvisited_refs = [*ref_list]
-        current_refs = []
+        visited_refs = set()
+        unvisited_refs = deque(ref_list)
+        current_refs = deque()
         type_idx = {}  # ref -> index of type in current capsule list.
         current_types = set()  # Type refs in current block.
 
@@ -54,18 +94,18 @@ class Bundler:
                 raise RuntimeError(f"Bundler: Reached refs limit {BUNDLED_REFS_LIMIT}")
             if current_refs:
                 # Types and their deps should come first, or unbundler won't be able to decode capsules.
-                ref = current_refs.pop(0)
+                ref = current_refs.popleft()
                 target_refs = current_refs
             else:
-                ref = unvisited_refs.pop(0)
+                ref = unvisited_refs.popleft()
                 target_refs = unvisited_refs
             if ref.hash_algorithm == 'phony':
                 continue
-            if ref in visited_refs:
+            if ref in visited_refs or ref in seen_refs:
                 continue
             try:
-                rec = mosaic.resolve_ref(ref)
-            except KeyError:
+                rec = web.resolve_ref(ref)
+            except RefResolveFailure:
                 log.warning("Failed to resolve ref %s", ref)
                 missing_ref_count += 1
                 continue
@@ -79,15 +119,15 @@ class Bundler:
             current_size += len(rec.capsule.encoded_object)
             if size_limit and result_size + current_size > size_limit:
                 break
-            if rec.type_ref.hash_algorithm != 'phony' and rec.type_ref not in visited_refs:
+            if (rec.type_ref.hash_algorithm != 'phony'
+                    and rec.type_ref not in visited_refs and rec.type_ref not in seen_refs):
                 current_refs.append(rec.type_ref)
                 current_types.add(rec.type_ref)
             visited_refs.add(ref)
-            associations = self._collect_associations(ref, rec.t, rec.value)
-            current_refs += [ass for ass in associations if ass not in visited_refs]
-            seen_asss |= set(associations)
-            dep_refs = self._pick_refs(rec.value, rec.t)
-            target_refs += [d for d in dep_refs if d not in visited_refs]
+            deps = self._ref_deps(ref, rec)
+            current_refs += [ass for ass in deps.associations if ass not in visited_refs and ass not in seen_refs]
+            seen_asss.update(deps.associations)
+            target_refs += [d for d in deps.dep_refs if d not in visited_refs and d not in seen_refs]
             if not current_refs:
                 result_capsule_list += reversed(current_capsule_list)
                 current_capsule_list = []
@@ -100,7 +140,18 @@ class Bundler:
             result_capsule_list += reversed(current_capsule_list)
         if missing_ref_count:
             log.warning("Failed to resolve %d refs", missing_ref_count)
-        return (visited_refs, seen_asss & visited_refs, result_capsule_list)
+        asss = {ass for ass in seen_asss if ass in visited_refs or ass in seen_refs}
+        return (visited_refs, asss, result_capsule_list)
+
+    def _ref_deps(self, ref, rec):
+        deps, version = self._cache.get(ref)
+        if deps is None:
+            deps = _RefDeps(
+                associations=tuple(self._collect_associations(ref, rec.t, rec.value)),
+                dep_refs=tuple(self._pick_refs(rec.value, rec.t)),
+                )
+            self._cache.put(ref, deps, version)
+        return deps
 
     def _collect_associations(self, ref, t, value):
         result = []
@@ -114,5 +165,9 @@ class Bundler:
         return result
 
 
-def bundler(pick_refs, ref_list, seen_refs=None, size_limit=None):
-    return Bundler(pick_refs).bundle(ref_list, seen_refs, size_limit)
+def bundler_cache():
+    return BundlerCache()
+
+
+def bundler(pick_refs, bundler_cache, ref_list, seen_refs=None, size_limit=None):
+    return Bundler(pick_refs, bundler_cache).bundle(ref_list, seen_refs, size_limit)
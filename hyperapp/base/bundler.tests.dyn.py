@@ -2,6 +2,7 @@ from hyperapp.boot.ref import decode_capsule
 
 from . import htypes
 from .services import (
+    association_reg,
     mosaic,
     pyobj_creg,
     web,
@@ -162,3 +163,33 @@ def test_size_limit(bundler, simple_t, big_t, composite_t):
     assert has(rb.bundle, simple)
     assert has(rb.bundle, composite)
     assert not has(rb.bundle, big)
+
+
+def test_association_change_invalidates_cache(bundler, simple_t):
+    simple = simple_t(id=456)
+    cfg_item = simple_t(id=789)
+    rb_1 = bundler([mosaic.put(simple)])
+    assert not rb_1.bundle.associations
+    association_reg.set_association([simple], 'test_service', cfg_item)
+    try:
+        rb_2 = bundler([mosaic.put(simple)])
+    finally:
+        association_reg.remove_association('test_service', cfg_item)
+    assert len(rb_2.bundle.associations) == 1
+    assert has(rb_2.bundle, cfg_item)
+
+
+def test_cache_skips_deps_collected_before_association_change(simple_t):
+    cache = bundler.BundlerCache()
+    simple = simple_t(id=321)
+    cfg_item = simple_t(id=654)
+    ref = mosaic.put(simple)
+    deps, version = cache.get(ref)
+    assert deps is None
+    association_reg.set_association([simple], 'test_service', cfg_item)
+    try:
+        cache.put(ref, 'stale deps', version)
+        deps, version = cache.get(ref)
+    finally:
+        association_reg.remove_association('test_service', cfg_item)
+    assert deps is None
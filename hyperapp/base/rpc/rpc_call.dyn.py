@@ -1,15 +1,20 @@
+import asyncio
 import logging
+import threading
+import time
 import uuid
+from collections import namedtuple
 from concurrent.futures import Future
+from contextlib import contextmanager
 from functools import partial
 
 from hyperapp.boot.htypes import HException
 
 from . import htypes
 from .services import (
-    deduce_t,
     mosaic,
     )
+from .code.rpc_endpoint import register_rpc_stream
 
 log = logging.getLogger(__name__)
 
@@ -17,27 +22,147 @@ log = logging.getLogger(__name__)
 DEFAULT_TIMEOUT = 10
 
 
-def _param_value_to_ref(value):
-    t = deduce_t(value)
+def _param_value(value):
     if type(value) is list:
-        value = tuple(value)
-    return mosaic.put(value, t)
-
-
-def rpc_submit_target_factory(transport, rpc_request_futures, receiver_peer, sender_identity):
-
-    def submit(target):
+        return tuple(value)
+    return value
+
+
+_BatchEntry = namedtuple('_BatchEntry', 'request_id request_ref future')
+
+
+class _PeerQueue:
+
+    def __init__(self, receiver_peer, sender_identity):
+        self.receiver_peer = receiver_peer
+        self.sender_identity = sender_identity
+        self.entry_list = []
+
+
+class RpcBatcher:
+    """Sends rpc requests to the same peer together, as roots of one bundle.
+
+    Requests submitted inside batch() context are sent when it exits; do not wait for their results inside it.
+    Other requests are sent at once, unless a request to the same peer is being sent by another thread:
+    then it sends them too, together, right after it's own.
+    """
+
+    def __init__(self, transport, rpc_request_futures):
+        self._transport = transport
+        self._rpc_request_futures = rpc_request_futures
+        self._lock = threading.Lock()
+        self._key_to_queue = {}  # Queues to peers being sent to.
+        self._local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        if getattr(self._local, 'key_to_queue', None) is not None:
+            # Nested batch is sent with outer one.
+            yield
+            return
+        self._local.key_to_queue = key_to_queue = {}
+        try:
+            yield
+        finally:
+            self._local.key_to_queue = None
+            for queue in key_to_queue.values():
+                self._send(queue.receiver_peer, queue.sender_identity, queue.entry_list)
+
+    def send(self, receiver_peer, sender_identity, request_id, request_ref, future):
+        # Peers and identities may be unhashable; Queues keep them referenced while in use.
+        key = (id(receiver_peer), id(sender_identity))
+        entry = _BatchEntry(request_id, request_ref, future)
+        batch_key_to_queue = getattr(self._local, 'key_to_queue', None)
+        if batch_key_to_queue is not None:
+            queue = batch_key_to_queue.get(key)
+            if not queue:
+                queue = batch_key_to_queue[key] = _PeerQueue(receiver_peer, sender_identity)
+            queue.entry_list.append(entry)
+            return
+        with self._lock:
+            queue = self._key_to_queue.get(key)
+            if queue:
+                queue.entry_list.append(entry)
+                return
+            queue = self._key_to_queue[key] = _PeerQueue(receiver_peer, sender_identity)
+        entry_list = [entry]
+        while entry_list:
+            self._send(receiver_peer, sender_identity, entry_list)
+            with self._lock:
+                entry_list = queue.entry_list
+                queue.entry_list = []
+                if not entry_list:
+                    del self._key_to_queue[key]
+
+    def _send(self, receiver_peer, sender_identity, entry_list):
+        if len(entry_list) > 1:
+            log.info("Rpc batcher: receiver=%s: send %d requests together", receiver_peer, len(entry_list))
+        try:
+            self._transport.send(receiver_peer, sender_identity, [entry.request_ref for entry in entry_list])
+        except Exception as x:
+            log.warning("Rpc batcher: receiver=%s: Failed to send %d requests: %r", receiver_peer, len(entry_list), x)
+            for entry in entry_list:
+                self._rpc_request_futures.pop(entry.request_id, None)
+                if not entry.future.done():
+                    entry.future.set_exception(x)
+
+
+def rpc_batcher(transport, rpc_request_futures):
+    return RpcBatcher(transport, rpc_request_futures)
+
+
+def rpc_submit_target_factory(
+        transport, rpc_batcher, rpc_request_futures, rpc_request_streams, route_manager, endpoint_scheduler,
+        receiver_peer, sender_identity):
+
+    def send_cancel(request_id):
+        cancel = htypes.rpc.cancel(request_id=request_id)
+        try:
+            transport.send(receiver_peer, sender_identity, [mosaic.put(cancel)])
+        except Exception as x:
+            log.warning("Rpc call: receiver=%s: Failed to send cancel for %s: %r", receiver_peer, request_id, x)
+
+    def on_done(start, request_id, future):
+        if not future.cancelled():
+            route_manager.add_rtt(receiver_peer, time.monotonic() - start)
+            return
+        # Caller is not waiting for result anymore; Futures cancelled on shutdown are already removed.
+        if rpc_request_futures.pop(request_id, None) is None:
+            return
+        log.info("Rpc call: receiver=%s: request %s is cancelled; Cancelling it on receiver", receiver_peer, request_id)
+        try:
+            # Future may be cancelled from event loop thread; Do not block it with sending.
+            endpoint_scheduler.submit_priority(send_cancel, request_id)
+        except RuntimeError as x:
+            log.info("Rpc call: receiver=%s: Not sending cancel for %s: %s", receiver_peer, request_id, x)
+
+    def submit(target, streamed=False, timeout_sec=None, lane=None):
+        # Returns RpcStream if streamed, future otherwise.
+        # Receiver drops request not started before timeout; It's servants may check it using cancel_token.
+        # Requests with the same lane are processed by receiver one by one, in order they are received;
+        # Others are processed concurrently.
         request_id = str(uuid.uuid4())
         request = htypes.rpc.request(
             request_id=request_id,
             target=mosaic.put(target),
+            timeout_ms=None if timeout_sec is None else int(timeout_sec * 1000),
+            lane=lane,
             )
         request_ref = mosaic.put(request)
         future = Future()
+        future.add_done_callback(partial(on_done, time.monotonic(), request_id))
         rpc_request_futures[request_id] = future
+        if streamed:
+            # Registered before sending, so no chunk is missed.
+            result = register_rpc_stream(rpc_request_streams, request_id, future)
+        else:
+            result = future
         log.info("Rpc call target: receiver=%s: send rpc request %s: %s", receiver_peer, request_ref, request)
-        transport.send(receiver_peer, sender_identity, [request_ref])
-        return future
+        rpc_batcher.send(receiver_peer, sender_identity, request_id, request_ref, future)
+        # If called while processing a request, let following requests from the same peer to start:
+        # this call response may depend on them.
+        endpoint_scheduler.release_lane()
+        return result
 
     return submit
 
@@ -97,17 +222,22 @@ class RpcServiceWrapper:
 
 
 def _kw_to_params(kw):
+    kw = {
+        name: value for name, value in kw.items()
+        if name != 'request'  # Do not pass local request to remote host.
+        }
+    value_refs = mosaic.put_many(_param_value(value) for value in kw.values())
     return tuple(
         htypes.rpc.param(
             name=name,
-            value=_param_value_to_ref(value),
+            value=value_ref,
             )
-        for name, value in kw.items()
-        if name != 'request'  # Do not pass local request to remote host.
+        for name, value_ref in zip(kw, value_refs)
         )
 
 
-def rpc_submit_factory(rpc_submit_target_factory, rpc_servant_wrapper, receiver_peer, sender_identity, servant_ref):
+def rpc_submit_factory(
+        rpc_submit_target_factory, rpc_servant_wrapper, receiver_peer, sender_identity, servant_ref, timeout_sec=None):
     submit_factory = rpc_submit_target_factory(receiver_peer, sender_identity)
 
     def submit(**kw):
@@ -119,29 +249,50 @@ def rpc_submit_factory(rpc_submit_target_factory, rpc_servant_wrapper, receiver_
             )
         log.info("Rpc call: receiver=%s servant=%s (%s): send rpc request: %s",
                  receiver_peer, wrapped_servant_ref, wrapped_kw, target)
-        return submit_factory(target)
+        return submit_factory(target, timeout_sec=timeout_sec)
 
     return submit
 
 
-def rpc_system_fn_submit_factory(rpc_submit_target_factory, rpc_system_servant_wrapper, receiver_peer, sender_identity, fn):
+def _system_fn_target(rpc_system_servant_wrapper, receiver_peer, fn, kw):
+    wrapped_fn, wrapped_kw = rpc_system_servant_wrapper.wrap(fn, kw)
+    params = _kw_to_params(wrapped_kw)
+    target = htypes.rpc.system_fn_target(
+        fn=mosaic.put(wrapped_fn.piece),
+        params=params,
+        )
+    log.info("Rpc system call: receiver=%s fn=%s (%s): send rpc request: %s",
+             receiver_peer, wrapped_fn.piece, wrapped_kw, target)
+    return target
+
+
+def rpc_system_fn_submit_factory(
+        rpc_submit_target_factory, rpc_system_servant_wrapper, receiver_peer, sender_identity, fn,
+        timeout_sec=None, lane=None):
     submit_factory = rpc_submit_target_factory(receiver_peer, sender_identity)
 
     def submit(**kw):
-        wrapped_fn, wrapped_kw = rpc_system_servant_wrapper.wrap(fn, kw)
-        params = _kw_to_params(wrapped_kw)
-        target = htypes.rpc.system_fn_target(
-            fn=mosaic.put(wrapped_fn.piece),
-            params=params,
-            )
-        log.info("Rpc system call: receiver=%s fn=%s (%s): send rpc request: %s",
-                 receiver_peer, wrapped_fn.piece, wrapped_kw, target)
-        return submit_factory(target)
+        target = _system_fn_target(rpc_system_servant_wrapper, receiver_peer, fn, kw)
+        return submit_factory(target, timeout_sec=timeout_sec, lane=lane)
+
+    return submit
+
+
+def rpc_system_stream_factory(
+        rpc_submit_target_factory, rpc_system_servant_wrapper, receiver_peer, sender_identity, fn, lane=None):
+    # For functions yielding items: returned stream gets them in chunks, as they are yielded on remote side.
+    # Items of functions returning a list arrive all at once, with the response.
+    submit_factory = rpc_submit_target_factory(receiver_peer, sender_identity)
+
+    def submit(**kw):
+        target = _system_fn_target(rpc_system_servant_wrapper, receiver_peer, fn, kw)
+        return submit_factory(target, streamed=True, lane=lane)
 
     return submit
 
 
-def service_submit_factory(rpc_submit_target_factory, rpc_service_wrapper, receiver_peer, sender_identity, service_name):
+def service_submit_factory(
+        rpc_submit_target_factory, rpc_service_wrapper, receiver_peer, sender_identity, service_name, timeout_sec=None):
     submit_factory = rpc_submit_target_factory(receiver_peer, sender_identity)
 
     def submit(**kw):
@@ -153,14 +304,33 @@ def service_submit_factory(rpc_submit_target_factory, rpc_service_wrapper, recei
             )
         log.info("Rpc service call: receiver=%s service=%r (%s): send rpc request: %s",
                  receiver_peer, wrapped_service_name, wrapped_kw, target)
-        return submit_factory(target)
+        return submit_factory(target, timeout_sec=timeout_sec)
 
     return submit
 
 
-def rpc_wait_for_future(future, timeout_sec):
+def rpc_wait_for_future(async_tcp_loop, future, timeout_sec):
+    # Fail right away instead of waiting for response which can not arrive.
+    async_tcp_loop.check_can_block()
     try:
         result = future.result(timeout_sec)
+    except TimeoutError:
+        # Nobody will read the result; Let receiver stop working on it.
+        future.cancel()
+        raise
+    except HException as x:
+        if isinstance(x, htypes.rpc.server_error):
+            log.error("Rpc call: got server error: %s\n%s", x.message, "".join(x.traceback))
+        raise
+    log.info("Rpc call: got result: %s", result)
+    return result
+
+
+async def rpc_await_future(future, timeout_sec):
+    # Same as rpc_wait_for_future, but does not block event loop it is awaited from.
+    # Timeout, or cancelling awaiting task, like UI command, cancels request future, and request on receiver.
+    try:
+        result = await asyncio.wait_for(asyncio.wrap_future(future), timeout_sec)
     except HException as x:
         if isinstance(x, htypes.rpc.server_error):
             log.error("Rpc call: got server error: %s\n%s", x.message, "".join(x.traceback))
@@ -170,7 +340,7 @@ def rpc_wait_for_future(future, timeout_sec):
 
 
 def rpc_call_factory(rpc_submit_factory, rpc_wait_for_future, receiver_peer, sender_identity, servant_ref, timeout_sec=DEFAULT_TIMEOUT):
-    submit_factory = rpc_submit_factory(receiver_peer, sender_identity, servant_ref)
+    submit_factory = rpc_submit_factory(receiver_peer, sender_identity, servant_ref, timeout_sec)
     def call(**kw):
         future = submit_factory(**kw)
         return rpc_wait_for_future(future, timeout_sec)
@@ -178,15 +348,23 @@ def rpc_call_factory(rpc_submit_factory, rpc_wait_for_future, receiver_peer, sen
 
 
 def rpc_system_call_factory(rpc_system_fn_submit_factory, rpc_wait_for_future, receiver_peer, sender_identity, fn, timeout_sec=DEFAULT_TIMEOUT):
-    submit_factory = rpc_system_fn_submit_factory(receiver_peer, sender_identity, fn)
+    submit_factory = rpc_system_fn_submit_factory(receiver_peer, sender_identity, fn, timeout_sec)
     def call(**kw):
         future = submit_factory(**kw)
         return rpc_wait_for_future(future, timeout_sec)
     return call
 
 
+def async_rpc_system_call_factory(rpc_system_fn_submit_factory, rpc_await_future, receiver_peer, sender_identity, fn, timeout_sec=DEFAULT_TIMEOUT):
+    submit_factory = rpc_system_fn_submit_factory(receiver_peer, sender_identity, fn, timeout_sec)
+    async def call(**kw):
+        future = submit_factory(**kw)
+        return await rpc_await_future(future, timeout_sec)
+    return call
+
+
 def service_call_factory(service_submit_factory, rpc_wait_for_future, receiver_peer, sender_identity, service_name, timeout_sec=DEFAULT_TIMEOUT):
-    submit_factory = service_submit_factory(receiver_peer, sender_identity, service_name)
+    submit_factory = service_submit_factory(receiver_peer, sender_identity, service_name, timeout_sec)
     def call(**kw):
         future = submit_factory(**kw)
         return rpc_wait_for_future(future, timeout_sec)
@@ -1,7 +1,12 @@
+import asyncio
 import logging
+import threading
+import time
+from concurrent.futures import Future
 
 from hyperapp.boot.htypes import HException
 
+from . import htypes
 from .services import (
     mosaic,
     )
@@ -17,8 +22,12 @@ class TestException(HException):
 
 class PhonyTransport:
 
+    def __init__(self):
+        self.sent_ref_lists = []
+
     def send(self, receiver, sender_identity, ref_list):
         log.info("Phony transport: send %s <- %s: %s", receiver, sender_identity, ref_list)
+        self.sent_ref_lists.append(ref_list)
 
 
 @mark.fixture
@@ -84,3 +93,111 @@ def test_rpc_call_factory_exception(generate_rsa_identity, rpc_call_factory, fut
         pass
     else:
         assert False, "No test exception was raised"
+
+
+def test_rpc_await_future():
+    future = Future()
+
+    async def main():
+        asyncio.get_running_loop().call_later(0.01, future.set_result, "Sample result")
+        return await rpc_call_module.rpc_await_future(future, timeout_sec=5)
+
+    assert asyncio.run(main()) == "Sample result"
+
+
+def test_rpc_await_future_timeout():
+    future = Future()
+    try:
+        asyncio.run(rpc_call_module.rpc_await_future(future, timeout_sec=0.01))
+    except TimeoutError:
+        pass
+    else:
+        assert False, "No timeout error was raised"
+    # Timed out request is cancelled.
+    assert future.cancelled()
+
+
+def test_rpc_wait_for_future_timeout(async_tcp_loop):
+    future = Future()
+    try:
+        rpc_call_module.rpc_wait_for_future(async_tcp_loop, future, timeout_sec=0.01)
+    except TimeoutError:
+        pass
+    else:
+        assert False, "No timeout error was raised"
+    assert future.cancelled()
+
+
+def test_batch_is_sent_together(transport, rpc_batcher, rpc_submit_target_factory):
+    submit = rpc_submit_target_factory(
+        receiver_peer='phony receiver peer',
+        sender_identity='phony sender identity',
+        )
+    with rpc_batcher.batch():
+        for idx in range(3):
+            submit(f"Phony target #{idx}")
+        assert transport.sent_ref_lists == []
+    [ref_list] = transport.sent_ref_lists
+    assert len(ref_list) == 3
+
+
+class BlockingTransport(PhonyTransport):
+
+    def __init__(self):
+        super().__init__()
+        self.sending = threading.Event()
+        self.resume = threading.Event()
+
+    def send(self, receiver, sender_identity, ref_list):
+        super().send(receiver, sender_identity, ref_list)
+        self.sending.set()
+        self.resume.wait(5)
+
+
+def test_requests_are_sent_after_one_being_sent():
+    transport = BlockingTransport()
+    batcher = rpc_call_module.RpcBatcher(transport, {})
+    ref_list = [mosaic.put(f"Phony request #{idx}") for idx in range(3)]
+    thread = threading.Thread(
+        target=batcher.send, args=('phony receiver peer', 'phony sender identity', 'id-0', ref_list[0], Future()))
+    thread.start()
+    assert transport.sending.wait(5)
+    for idx in [1, 2]:
+        batcher.send('phony receiver peer', 'phony sender identity', f'id-{idx}', ref_list[idx], Future())
+    transport.resume.set()
+    thread.join()
+    assert transport.sent_ref_lists == [[ref_list[0]], [ref_list[1], ref_list[2]]]
+
+
+class FailingTransport:
+
+    def send(self, receiver, sender_identity, ref_list):
+        raise RuntimeError("Phony send error")
+
+
+def test_send_error_is_set_to_futures():
+    request_futures = {}
+    batcher = rpc_call_module.RpcBatcher(FailingTransport(), request_futures)
+    future = request_futures['id-0'] = Future()
+    batcher.send('phony receiver peer', 'phony sender identity', 'id-0', mosaic.put("Phony request"), future)
+    assert isinstance(future.exception(), RuntimeError)
+    assert request_futures == {}
+
+
+def test_cancel_is_sent_to_receiver(transport, rpc_request_futures, rpc_submit_target_factory):
+    submit = rpc_submit_target_factory(
+        receiver_peer='phony receiver peer',
+        sender_identity='phony sender identity',
+        )
+    future = submit("Phony target", timeout_sec=1.5)
+    [[request_ref]] = transport.sent_ref_lists
+    request = mosaic.resolve_ref(request_ref).value
+    assert request.timeout_ms == 1500
+    future.cancel()
+    assert request.request_id not in rpc_request_futures
+    for idx in range(100):
+        if len(transport.sent_ref_lists) > 1:
+            break
+        time.sleep(0.01)
+    [cancel_ref] = transport.sent_ref_lists[1]
+    assert mosaic.resolve_ref(cancel_ref).value == htypes.rpc.cancel(request.request_id)
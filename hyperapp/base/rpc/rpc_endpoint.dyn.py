@@ -2,6 +2,7 @@ import asyncio
 import logging
 import inspect
 import threading
+import time
 import traceback
 from collections import namedtuple
 from functools import partial
@@ -20,58 +21,336 @@ from .code.context import Context
 log = logging.getLogger(__name__)
 
 
-RpcRequest = namedtuple('RpcRequest', 'system receiver_identity remote_peer')
+STREAM_CHUNK_SIZE = 200  # Max items in one response chunk.
+STREAM_CHUNK_SEC = 0.05  # Items yielded slower than this are sent in a chunk without waiting for more.
+EARLY_CANCEL_TTL_SEC = 60  # Cancel received before it's request is kept this long, waiting for it.
+
+
+RpcRequest = namedtuple('RpcRequest', 'system receiver_identity remote_peer cancel_token')
+
+# Responses complete calls running requests may be waiting for.
+# Cancels should not wait behind requests they cancel.
+_priority_types = (
+    htypes.rpc.cancel,
+    htypes.rpc.response,
+    htypes.rpc.response_chunk,
+    htypes.rpc.stream_end,
+    htypes.rpc.error_response,
+    )
+
+
+class RpcCancelled(Exception):
+    pass
+
+
+class RpcCancelToken:
+    """Tells servant if it's result is still wanted: request is not cancelled by caller and deadline is not passed.
+
+    Passed to servants as 'cancel_token' parameter or context attribute; Long running ones should check it.
+    """
+
+    def __init__(self, deadline=None):
+        self._deadline = deadline  # Monotonic time.
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @property
+    def is_cancelled(self):
+        return self._cancelled or (self._deadline is not None and time.monotonic() >= self._deadline)
+
+    @property
+    def remaining_sec(self):
+        if self._deadline is None:
+            return None
+        return max(0, self._deadline - time.monotonic())
+
+    def check(self):
+        if self.is_cancelled:
+            raise RpcCancelled("Rpc request is cancelled or it's deadline is passed")
+
+
+class RpcCancelRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._request_id_to_token = {}  # Requests being processed.
+        self._early_cancels = {}  # request id -> monotonic time; Cancels for requests not started yet.
+
+    def start(self, request_id, deadline):
+        token = RpcCancelToken(deadline)
+        with self._lock:
+            if self._early_cancels.pop(request_id, None) is not None:
+                token.cancel()
+            self._request_id_to_token[request_id] = token
+        return token
+
+    def finish(self, request_id):
+        with self._lock:
+            self._request_id_to_token.pop(request_id, None)
+
+    def cancel(self, request_id):
+        now = time.monotonic()
+        with self._lock:
+            token = self._request_id_to_token.get(request_id)
+            if token is None:
+                # Request is still queued, or is already processed; Forget it if it does not start in time.
+                self._early_cancels = {
+                    cancelled_id: cancel_time for cancelled_id, cancel_time in self._early_cancels.items()
+                    if now - cancel_time < EARLY_CANCEL_TTL_SEC
+                    }
+                self._early_cancels[request_id] = now
+                return
+        token.cancel()
 
 
 class RpcEndpoint:
 
-    def __init__(self, rpc_message_creg):
+    def __init__(self, rpc_message_creg, transport):
         self._rpc_message_creg = rpc_message_creg
+        self._transport = transport
+        # Messages are told apart by their capsule types, so they are not decoded by receiving thread.
+        self._priority_type_refs = {pyobj_creg.actor_to_ref(t) for t in _priority_types}
+        self._request_type_ref = pyobj_creg.actor_to_ref(htypes.rpc.request)
 
     def __repr__(self):
         return '<sync RpcEndpoint>'
 
     def process(self, request):
         log.debug("Received rpc message: %s", request)
-        self._rpc_message_creg.invite(request.ref_list[0], request)
+        # Endpoint route submits each root of a bundle as a separate request.
+        # Response is sent as soon as it is ready, not waiting for other messages.
+        for message_ref in request.ref_list:
+            response_ref = self._rpc_message_creg.invite(message_ref, request)
+            if response_ref is not None:
+                self._transport.send(request.remote_peer, request.receiver_identity, [response_ref])
+
+    def is_priority(self, request):
+        return all(self._type_ref(ref) in self._priority_type_refs for ref in request.ref_list)
+
+    def request_lane(self, request):
+        # Returns lane requests should be processed in one by one, or None if they may be processed concurrently.
+        # Request records are small; Their targets are decoded only when processed.
+        for ref in request.ref_list:
+            if self._type_ref(ref) != self._request_type_ref:
+                continue
+            lane = mosaic.resolve_ref(ref).value.lane
+            if lane is not None:
+                return lane
+        return None
+
+    @staticmethod
+    def _type_ref(ref):
+        capsule = mosaic.get(ref)
+        if capsule is None:
+            return None
+        return capsule.type_ref
+
+
+class RpcStream:
+    """Result of a request to generator servant, received as item chunks.
+
+    Chunks may be processed by several endpoint workers at once; Items are delivered to subscriber in order.
+    """
+
+    def __init__(self, future):
+        self.future = future
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._deliver_lock = threading.Lock()
+        self._seq_to_items = {}
+        self._next_seq = 0
+        self._chunk_count = None
+        self._is_complete = False
+        self._items = []
+        self._undelivered = []
+        self._subscriber = None
+        future.add_done_callback(self._on_future_done)
+
+    @property
+    def items(self):
+        return tuple(self._items)
+
+    def subscribe(self, fn):
+        # Returns items received so far; Following ones are passed to fn as lists, from endpoint worker thread.
+        with self._lock:
+            self._subscriber = fn
+            self._undelivered = []
+            return list(self._items)
+
+    def wait_for_items(self, timeout_sec):
+        # Wait for first items or for whole result. Raises if request failed before that.
+        with self._lock:
+            if not self._cond.wait_for(lambda: self._items or self.future.done(), timeout_sec):
+                raise TimeoutError(f"No items were received in {timeout_sec} seconds")
+        if not self._items:
+            self.future.result()
+
+    def result(self, timeout_sec):
+        # Timeout is counted from last received chunk, so long streams are not cut while items keep coming.
+        while True:
+            with self._lock:
+                seq = self._next_seq
+            try:
+                return self.future.result(timeout_sec)
+            except TimeoutError:
+                with self._lock:
+                    if self._next_seq == seq:
+                        raise
+
+    def add_chunk(self, seq, item_list):
+        # Returns True if stream is complete now.
+        with self._lock:
+            self._seq_to_items[seq] = item_list
+            while self._next_seq in self._seq_to_items:
+                items = self._seq_to_items.pop(self._next_seq)
+                self._items += items
+                self._undelivered += items
+                self._next_seq += 1
+            self._cond.notify_all()
+        return self._deliver()
+
+    def set_end(self, chunk_count):
+        with self._lock:
+            self._chunk_count = chunk_count
+        return self._deliver()
+
+    def _deliver(self):
+        # Completion is checked after delivery, so subscriber gets all items before result is set.
+        with self._deliver_lock:
+            while True:
+                with self._lock:
+                    item_list = self._undelivered
+                    self._undelivered = []
+                    subscriber = self._subscriber
+                if not item_list:
+                    break
+                if subscriber:
+                    try:
+                        subscriber(item_list)
+                    except Exception:
+                        log.exception("Rpc stream: Error delivering items to %s:", subscriber)
+            with self._lock:
+                if self._is_complete or self._chunk_count is None or self._next_seq < self._chunk_count:
+                    return False
+                self._is_complete = True
+                return True
+
+    def _on_future_done(self, future):
+        with self._lock:
+            if not self._is_complete and not future.cancelled() and future.exception() is None:
+                # Servant is not a generator: items came in a single response.
+                self._items = list(future.result())
+                self._undelivered = list(self._items)
+                self._is_complete = True
+            self._cond.notify_all()
+        self._deliver()
+
+
+def register_rpc_stream(rpc_request_streams, request_id, future):
+    new_stream = RpcStream(future)
+    stream = rpc_request_streams.setdefault(request_id, new_stream)
+    if stream is new_stream:
+        future.add_done_callback(lambda future: rpc_request_streams.pop(request_id, None))
+    return stream
 
 
 def rpc_message_creg(config):
     return code_registry_ctr('rpc_message_creg', config)
 
 
-def rpc_endpoint(rpc_message_creg):
-    return RpcEndpoint(rpc_message_creg)
+def rpc_endpoint(rpc_message_creg, transport):
+    return RpcEndpoint(rpc_message_creg, transport)
+
+
+def _cancel_all_futures(rpc_request_futures):
+    # Removed before cancelling, so cancels are not sent to remote peers.
+    future_list = list(rpc_request_futures.values())
+    rpc_request_futures.clear()
+    for future in future_list:
+        future.cancel()
 
 
 def rpc_request_futures():
     request_id_to_future = {}
     yield request_id_to_future
     log.info("Rpc endpoint: Shutting down: Cancelling futures: %s", request_id_to_future)
-    for future in request_id_to_future.values():
-        future.cancel()
+    _cancel_all_futures(request_id_to_future)
 
 
 def cancel_rpc_request_futures(rpc_request_futures):
     def _cancel_rpc_request_futures():
         log.info("Rpc endpoint: Cancelling futures: %s", rpc_request_futures)
-        for future in rpc_request_futures.values():
-            future.cancel()
-        rpc_request_futures.clear()
+        _cancel_all_futures(rpc_request_futures)
     return _cancel_rpc_request_futures
 
 
+def _pop_pending_future(rpc_request_futures, request_id):
+    future = rpc_request_futures.pop(request_id, None)
+    if future is None or future.cancelled():
+        log.info("Rpc request %s is abandoned by caller; Dropping it's response", request_id)
+        return None
+    return future
+
+
 def on_rpc_response(response, transport_request, rpc_request_futures):
     log.debug("Process rpc response: %s", response)
+    future = _pop_pending_future(rpc_request_futures, response.request_id)
+    if future is None:
+        return
     result = mosaic.resolve_ref(response.result_ref).value
-    future = rpc_request_futures.pop(response.request_id)
     future.set_result(result)
 
 
+def rpc_request_streams():
+    return {}  # request_id -> RpcStream
+
+
+def _request_stream(rpc_request_futures, rpc_request_streams, request_id):
+    try:
+        return rpc_request_streams[request_id]
+    except KeyError:
+        pass
+    # Caller waits for whole result and have not registered a stream.
+    future = rpc_request_futures.get(request_id)
+    if future is None:
+        log.warning("Rpc stream %s: Request is not pending; Discarding chunk", request_id)
+        return None
+    return register_rpc_stream(rpc_request_streams, request_id, future)
+
+
+def _complete_stream(rpc_request_futures, request_id, stream):
+    if _pop_pending_future(rpc_request_futures, request_id) is not None:
+        stream.future.set_result(stream.items)
+
+
+def on_rpc_response_chunk(chunk, transport_request, rpc_request_futures, rpc_request_streams):
+    log.debug("Process rpc response chunk #%d for %s: %d items", chunk.seq, chunk.request_id, len(chunk.item_list))
+    stream = _request_stream(rpc_request_futures, rpc_request_streams, chunk.request_id)
+    if stream is None:
+        return
+    item_list = [mosaic.resolve_ref(ref).value for ref in chunk.item_list]
+    if stream.add_chunk(chunk.seq, item_list):
+        _complete_stream(rpc_request_futures, chunk.request_id, stream)
+
+
+def on_rpc_stream_end(end, transport_request, rpc_request_futures, rpc_request_streams):
+    log.debug("Process rpc stream end for %s: %d chunks", end.request_id, end.chunk_count)
+    stream = _request_stream(rpc_request_futures, rpc_request_streams, end.request_id)
+    if stream is None:
+        return
+    if stream.set_end(end.chunk_count):
+        _complete_stream(rpc_request_futures, end.request_id, stream)
+
+
 def on_rpc_error_response(response, transport_request, rpc_request_futures):
     exception = mosaic.resolve_ref(response.exception_ref).value
     log.info("Process rpc error response: %s", exception)
-    future = rpc_request_futures.pop(response.request_id)
+    future = _pop_pending_future(rpc_request_futures, response.request_id)
+    if future is None:
+        return
+    # Registered stream, if any, is removed by future done callback.
     future.set_exception(exception)
 
 
@@ -79,21 +358,87 @@ def rpc_target_creg(config):
     return code_registry_ctr('rpc_target_creg', config)
 
 
-def on_rpc_request(request, transport_request, system, transport, peer_creg, rpc_target_creg):
+def _send_result_stream(transport, transport_request, request_id, cancel_token, item_iter):
+    # Chunks are sent as soon as they are filled, each in it's own parcel; Returned stream end is sent as response.
+    seq = 0
+    item_list = []
+    flush_at = time.monotonic() + STREAM_CHUNK_SEC
+
+    def send_chunk():
+        chunk = htypes.rpc.response_chunk(
+            request_id=request_id,
+            seq=seq,
+            item_list=tuple(mosaic.put_many(tuple(item) if type(item) is list else item for item in item_list)),
+            )
+        log.debug("Rpc request %s: send response chunk #%d: %d items", request_id, seq, len(item_list))
+        transport.send(transport_request.remote_peer, transport_request.receiver_identity, [mosaic.put(chunk)])
+
+    for item in item_iter:
+        cancel_token.check()
+        item_list.append(item)
+        if len(item_list) >= STREAM_CHUNK_SIZE or time.monotonic() >= flush_at:
+            send_chunk()
+            seq += 1
+            item_list = []
+            flush_at = time.monotonic() + STREAM_CHUNK_SEC
+    if item_list:
+        send_chunk()
+        seq += 1
+    log.info("Rpc request %s: streamed result in %d chunks", request_id, seq)
+    return htypes.rpc.stream_end(
+        request_id=request_id,
+        chunk_count=seq,
+        )
+
+
+def on_rpc_request(request, transport_request, system, peer_creg, rpc_target_creg, transport, rpc_cancel_registry):
     log.info("Process rpc request: %s", request)
-    receiver_identity = transport_request.receiver_identity
-    remote_peer = transport_request.remote_peer
-    rpc_request = RpcRequest(system, receiver_identity, remote_peer)
+    if request.timeout_ms is None:
+        deadline = None
+    else:
+        # Time spent waiting in endpoint queue is counted too.
+        deadline = (transport_request.receive_time or time.monotonic()) + request.timeout_ms / 1000
+    cancel_token = rpc_cancel_registry.start(request.request_id, deadline)
+    try:
+        if cancel_token.is_cancelled:
+            log.info("Rpc request %s is cancelled or it's deadline is passed before start; Dropping it", request.request_id)
+            return None
+        rpc_request = RpcRequest(system, transport_request.receiver_identity, transport_request.remote_peer, cancel_token)
+        response = _process_rpc_request(request, transport_request, rpc_request, rpc_target_creg, transport)
+    finally:
+        rpc_cancel_registry.finish(request.request_id)
+    if response is None:
+        return None
+    return mosaic.put(response)
+
+
+def on_rpc_cancel(cancel, transport_request, rpc_cancel_registry):
+    log.info("Process rpc cancel: %s", cancel)
+    rpc_cancel_registry.cancel(cancel.request_id)
+
+
+def rpc_cancel_registry():
+    return RpcCancelRegistry()
+
+
+def _process_rpc_request(request, transport_request, rpc_request, rpc_target_creg, transport):
     try:
         result = rpc_target_creg.invite(request.target, rpc_request)
-        if type(result) is list:
-            result = tuple(result)
-        result_t = deduce_t(result)
-        result_ref = mosaic.put(result, result_t)
-        response = htypes.rpc.response(
-            request_id=request.request_id,
-            result_ref=result_ref,
-            )
+        if inspect.isgenerator(result):
+            response = _send_result_stream(
+                transport, transport_request, request.request_id, rpc_request.cancel_token, result)
+        else:
+            if type(result) is list:
+                result = tuple(result)
+            result_t = deduce_t(result)
+            result_ref = mosaic.put(result, result_t)
+            response = htypes.rpc.response(
+                request_id=request.request_id,
+                result_ref=result_ref,
+                )
+    except RpcCancelled as x:
+        log.info("Rpc target %s is stopped: %s", request.target, x)
+        response = None
     except HException as x:
         log.info("Rpc target %s call h-typed error: %s", request.target, x)
         response = htypes.rpc.error_response(
@@ -114,8 +459,7 @@ def on_rpc_request(request, transport_request, system, transport, peer_creg, rpc
             request_id=request.request_id,
             exception_ref=mosaic.put(exception),
             )
-    response_ref = mosaic.put(response)
-    transport.send(remote_peer, receiver_identity, [response_ref])
+    return response
 
 
 def _params_to_kw(params):
@@ -129,8 +473,11 @@ def run_function_target(target, rpc_request):
     log.debug("Resolve rpc servant: %s", target.servant_ref)
     servant_fn = pyobj_creg.invite(target.servant_ref)
     kw = _params_to_kw(target.params)
-    if 'request' in inspect.signature(servant_fn).parameters:
+    servant_params = inspect.signature(servant_fn).parameters
+    if 'request' in servant_params:
         kw = {**kw, 'request': rpc_request}
+    if 'cancel_token' in servant_params:
+        kw = {**kw, 'cancel_token': rpc_request.cancel_token}
     log.info("Call rpc servant: %s (%s)", servant_fn, kw)
     result = servant_fn(**kw)
     if inspect.iscoroutine(result):
@@ -148,6 +495,7 @@ def run_system_fn_target(target, rpc_request, system_fn_creg):
     ctx = Context(
         **kw,
         request=rpc_request,
+        cancel_token=rpc_request.cancel_token,
         )
     result = fn.call(ctx)
     if inspect.iscoroutine(result):
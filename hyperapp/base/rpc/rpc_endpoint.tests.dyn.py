@@ -1,6 +1,9 @@
 import logging
+from concurrent.futures import Future
 from unittest.mock import Mock
 
+from hyperapp.boot.htypes import TList, tString
+
 from . import htypes
 from .services import (
     mosaic,
@@ -28,6 +31,8 @@ def _test_with(transport, rpc_endpoint, generate_rsa_identity, servant_fn):
     rpc_request = htypes.rpc.request(
         request_id='Phony request id',
         target=mosaic.put(target),
+        timeout_ms=None,
+        lane=None,
         )
     request = Request(
         receiver_identity=None,
@@ -65,3 +70,185 @@ def _raise_non_happ_error(sample_param):
 
 def test_non_happ_error(_test_with):
     _test_with(_raise_non_happ_error)
+
+
+def test_responses_are_sent_when_ready(transport, rpc_endpoint):
+    request_refs = []
+    for idx in range(3):
+        target = htypes.rpc.function_target(
+            servant_ref=pyobj_creg.actor_to_ref(_return_str_list),
+            params=(htypes.rpc.param('sample_param', mosaic.put(f"Sample param value #{idx}")),),
+            )
+        rpc_request = htypes.rpc.request(
+            request_id=f'Phony request id #{idx}',
+            target=mosaic.put(target),
+            timeout_ms=None,
+            lane=None,
+            )
+        request_refs.append(mosaic.put(rpc_request))
+    request = Request(
+        receiver_identity=None,
+        remote_peer=None,
+        ref_list=request_refs,
+        )
+    rpc_endpoint.process(request)
+    assert transport.send.call_count == 3
+    response_list = []
+    for call in transport.send.call_args_list:
+        remote_peer, receiver_identity, response_refs = call.args
+        [response_ref] = response_refs
+        response_list.append(mosaic.resolve_ref(response_ref).value)
+    assert [response.request_id for response in response_list] == [f'Phony request id #{idx}' for idx in range(3)]
+
+
+def test_request_scheduling(rpc_endpoint):
+    rpc_request = htypes.rpc.request(
+        request_id='Phony lane request id',
+        target=mosaic.put("Phony target"),
+        timeout_ms=None,
+        lane='test-lane',
+        )
+    request = Request(receiver_identity=None, remote_peer=None, ref_list=[mosaic.put(rpc_request)])
+    assert not rpc_endpoint.is_priority(request)
+    assert rpc_endpoint.request_lane(request) == 'test-lane'
+    response = htypes.rpc.response(
+        request_id='Phony lane request id',
+        result_ref=mosaic.put("Phony result"),
+        )
+    request = Request(receiver_identity=None, remote_peer=None, ref_list=[mosaic.put(response)])
+    assert rpc_endpoint.is_priority(request)
+
+
+def _streamed_str_list():
+    return [f"Sample streamed string #{idx}" for idx in range(rpc_endpoint.STREAM_CHUNK_SIZE * 2 + 1)]
+
+
+def _yield_str_list(sample_param):
+    log.info("_yield_str_list: %s", sample_param)
+    yield from _streamed_str_list()
+
+
+def test_generator_result_is_streamed(transport, rpc_endpoint):
+    target = htypes.rpc.function_target(
+        servant_ref=pyobj_creg.actor_to_ref(_yield_str_list),
+        params=(htypes.rpc.param('sample_param', mosaic.put("Sample param value")),),
+        )
+    rpc_request = htypes.rpc.request(
+        request_id='Phony stream request id',
+        target=mosaic.put(target),
+        timeout_ms=None,
+        lane=None,
+        )
+    request = Request(
+        receiver_identity=None,
+        remote_peer=None,
+        ref_list=[mosaic.put(rpc_request)],
+        )
+    rpc_endpoint.process(request)
+    message_list = []
+    for call in transport.send.call_args_list:
+        remote_peer, receiver_identity, ref_list = call.args
+        message_list += [mosaic.resolve_ref(ref).value for ref in ref_list]
+    *chunk_list, end = message_list
+    assert end == htypes.rpc.stream_end('Phony stream request id', len(chunk_list))
+    assert [chunk.seq for chunk in chunk_list] == list(range(len(chunk_list)))
+    item_list = [mosaic.resolve_ref(ref).value for chunk in chunk_list for ref in chunk.item_list]
+    assert item_list == _streamed_str_list()
+
+
+def _chunk(request_id, seq, item_list):
+    return htypes.rpc.response_chunk(
+        request_id=request_id,
+        seq=seq,
+        item_list=tuple(mosaic.put(item) for item in item_list),
+        )
+
+
+def test_stream_chunks_are_delivered_in_order():
+    rpc_request_futures = {}
+    rpc_request_streams = {}
+    request_id = 'Phony stream request id'
+    future = rpc_request_futures[request_id] = Future()
+    stream = rpc_endpoint.register_rpc_stream(rpc_request_streams, request_id, future)
+    # Chunk #1 waits for #0.
+    rpc_endpoint.on_rpc_response_chunk(_chunk(request_id, 1, ["c", "d"]), None, rpc_request_futures, rpc_request_streams)
+    delivered = []
+    assert stream.subscribe(delivered.extend) == []
+    rpc_endpoint.on_rpc_response_chunk(_chunk(request_id, 0, ["a", "b"]), None, rpc_request_futures, rpc_request_streams)
+    assert delivered == ["a", "b", "c", "d"]
+    rpc_endpoint.on_rpc_stream_end(htypes.rpc.stream_end(request_id, 3), None, rpc_request_futures, rpc_request_streams)
+    assert not future.done()
+    rpc_endpoint.on_rpc_response_chunk(_chunk(request_id, 2, ["e"]), None, rpc_request_futures, rpc_request_streams)
+    assert delivered == ["a", "b", "c", "d", "e"]
+    assert stream.result(timeout_sec=1) == ("a", "b", "c", "d", "e")
+    assert request_id not in rpc_request_futures
+    assert request_id not in rpc_request_streams
+
+
+def test_stream_without_subscriber():
+    # Caller waiting for whole result gets all streamed items.
+    rpc_request_futures = {}
+    rpc_request_streams = {}
+    request_id = 'Phony stream request id'
+    future = rpc_request_futures[request_id] = Future()
+    rpc_endpoint.on_rpc_response_chunk(_chunk(request_id, 0, ["a", "b"]), None, rpc_request_futures, rpc_request_streams)
+    rpc_endpoint.on_rpc_stream_end(htypes.rpc.stream_end(request_id, 1), None, rpc_request_futures, rpc_request_streams)
+    assert future.result(timeout=1) == ("a", "b")
+    assert not rpc_request_streams
+
+
+def test_list_response_is_received_by_stream():
+    rpc_request_futures = {}
+    rpc_request_streams = {}
+    request_id = 'Phony stream request id'
+    future = rpc_request_futures[request_id] = Future()
+    stream = rpc_endpoint.register_rpc_stream(rpc_request_streams, request_id, future)
+    response = htypes.rpc.response(
+        request_id=request_id,
+        result_ref=mosaic.put(("a", "b"), TList(tString)),
+        )
+    rpc_endpoint.on_rpc_response(response, None, rpc_request_futures)
+    stream.wait_for_items(timeout_sec=1)
+    assert stream.subscribe(lambda items: None) == ["a", "b"]
+
+
+def _request(servant_fn, timeout_ms=None):
+    target = htypes.rpc.function_target(
+        servant_ref=pyobj_creg.actor_to_ref(servant_fn),
+        params=(htypes.rpc.param('sample_param', mosaic.put("Sample param value")),),
+        )
+    rpc_request = htypes.rpc.request(
+        request_id='Phony request id',
+        target=mosaic.put(target),
+        timeout_ms=timeout_ms,
+        lane=None,
+        )
+    return Request(
+        receiver_identity=None,
+        remote_peer=None,
+        ref_list=[mosaic.put(rpc_request)],
+        )
+
+
+def test_expired_request_is_dropped(transport, rpc_endpoint):
+    rpc_endpoint.process(_request(_return_str_list, timeout_ms=0))
+    transport.send.assert_not_called()
+
+
+def test_cancelled_request_is_dropped(transport, rpc_endpoint, rpc_cancel_registry):
+    # Cancel is received while request is still queued.
+    rpc_cancel_registry.cancel('Phony request id')
+    rpc_endpoint.process(_request(_return_str_list))
+    transport.send.assert_not_called()
+
+
+def _return_remaining_time(sample_param, cancel_token):
+    cancel_token.check()
+    return int(cancel_token.remaining_sec * 1000)
+
+
+def test_cancel_token_is_passed_to_servant(transport, rpc_endpoint):
+    rpc_endpoint.process(_request(_return_remaining_time, timeout_ms=10000))
+    remote_peer, receiver_identity, [response_ref] = transport.send.call_args.args
+    response = mosaic.resolve_ref(response_ref).value
+    assert 0 < mosaic.resolve_ref(response.result_ref).value <= 10000
@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+
+from hyperapp.boot.capsule_store import CapsuleStore
+from hyperapp.boot.htypes import bundle_t
+from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.ref import decode_capsule
+
+from .services import (
+    mosaic,
+    pyobj_creg,
+    unbundler,
+    web,
+    )
+from .code.mark import mark
+
+log = logging.getLogger(__name__)
+
+
+ROOTS_FILE_NAME = 'roots.cdr'
+ROOTS_ENCODING = 'cdr'
+LEGACY_ENCODING = 'cdr'
+COMPACT_MIN_SIZE = 1024 * 1024
+COMPACT_RATIO = 2  # Compact when store grows this many times over it's size after last compaction.
+
+
+class CapsuleStorePool:
+    """Stores opened by store bundles. Stores are added as web sources and kept open until pool is closed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path_to_store = {}
+
+    def open(self, path):
+        # Store keeps it's directory locked, so there should be only one instance per path.
+        path = path.resolve()
+        with self._lock:
+            try:
+                return self._path_to_store[path]
+            except KeyError:
+                pass
+            store = CapsuleStore(path)
+            web.add_source(store)
+            self._path_to_store[path] = store
+            return store
+
+    def close(self):
+        with self._lock:
+            for store in self._path_to_store.values():
+                web.remove_source(store)
+                store.close()
+            self._path_to_store.clear()
+
+
+def _write_atomically(path, data):
+    temp_path = path.with_name(path.name + '.tmp')
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+class StoreBundle:
+    """Same interface as FileBundle, but capsules are kept in a capsule store at path directory.
+
+    Only capsules missing from the store are written on save. Roots and associations
+    are kept in a small bundle file, without capsules. Store is added as a web source
+    and capsules are pulled from it on demand.
+    If legacy_path is given, it is a FileBundle file this bundle was kept in before;
+    it is moved to the store when loaded, and removed when saved.
+    """
+
+    def __init__(self, bundler, pick_refs, capsule_store_pool, path, legacy_path=None):
+        self._bundler = bundler
+        self._pick_refs = pick_refs
+        self._capsule_store_pool = capsule_store_pool
+        self.path = path
+        self._legacy_path = legacy_path
+
+    @property
+    def _store(self):
+        return self._capsule_store_pool.open(self.path)
+
+    @property
+    def _roots_path(self):
+        return self.path / ROOTS_FILE_NAME
+
+    @property
+    def bundle(self):
+        return packet_coders.decode(ROOTS_ENCODING, self._roots_path.read_bytes(), bundle_t)
+
+    def save_ref(self, ref):
+        store = self._store
+        # Store always has whole closures, so refs it has are skipped together with their dependencies.
+        bundle = self._bundler([ref], seen_refs=store).bundle
+        for capsule in bundle.capsule_list:
+            store.put(capsule)
+        store.sync()
+        associations = list(bundle.associations)
+        try:
+            prev_associations = self.bundle.associations
+        except FileNotFoundError:
+            prev_associations = ()
+        # Associations for stored refs are not collected again, so keep previous ones
+        # while their bases are still reachable from the root.
+        live_refs = self._collect_live_refs([ref])
+        associations += [
+            ass for ass in prev_associations
+            if ass not in associations and self._is_live_association(ass, live_refs)
+            ]
+        self._write_roots((ref,), associations)
+        if self._legacy_path:
+            self._legacy_path.unlink(missing_ok=True)
+        log.info("Saved %s to %s (%d new capsules, %d associations)",
+                 ref, self.path, len(bundle.capsule_list), len(associations))
+        stats = store.stats
+        if stats.total_size > COMPACT_RATIO * max(stats.live_size, COMPACT_MIN_SIZE):
+            self.compact()
+
+    def _write_roots(self, roots, associations):
+        bundle = bundle_t(
+            roots=tuple(roots),
+            associations=tuple(associations),
+            capsule_list=(),
+            )
+        _write_atomically(self._roots_path, packet_coders.encode(ROOTS_ENCODING, bundle, bundle_t))
+
+    def _is_live_association(self, ass_ref, live_refs):
+        capsule = self._store.pull(ass_ref)
+        if capsule is None:
+            return False
+        ass = decode_capsule(pyobj_creg, capsule).value
+        return any(base in live_refs for base in ass.bases)
+
+    def _migrate_legacy(self):
+        # Old file bundle has all capsules inside; move them to store as is.
+        legacy_bundle = packet_coders.decode(LEGACY_ENCODING, self._legacy_path.read_bytes(), bundle_t)
+        store = self._store
+        for capsule in legacy_bundle.capsule_list:
+            store.put(capsule)
+        store.sync()
+        self._write_roots(legacy_bundle.roots, legacy_bundle.associations)
+        self._legacy_path.unlink()
+        log.info("Moved %s to %s (%d capsules)", self._legacy_path, self.path, len(legacy_bundle.capsule_list))
+
+    def load(self, register_associations=True):
+        if self._legacy_path and self._legacy_path.exists() and not self._roots_path.exists():
+            self._migrate_legacy()
+        bundle = self.bundle
+        self._store  # Add it as a web source.
+        if register_associations:
+            # Unbundler resolves associations using mosaic, pull them there.
+            for ass_ref in bundle.associations:
+                web.summon(ass_ref)
+        unbundler.register_bundle(bundle, register_associations)
+        return bundle
+
+    def load_ref(self, register_associations=True):
+        bundle = self.load(register_associations)
+        ref_count = len(bundle.roots)
+        if ref_count != 1:
+            raise RuntimeError(f"Bundle {self.path} has {ref_count} refs, but expected only one")
+        return bundle.roots[0]
+
+    def save_piece(self, piece):
+        log.info("Save %s to %s", piece, self.path)
+        ref = mosaic.put(piece)
+        self.save_ref(ref)
+
+    def load_piece(self, register_associations=True):
+        ref = self.load_ref(register_associations)
+        return web.summon(ref)
+
+    def compact(self):
+        bundle = self.bundle
+        live_refs = self._collect_live_refs([*bundle.roots, *bundle.associations])
+        self._store.compact(live_refs)
+
+    def _collect_live_refs(self, ref_list):
+        store = self._store
+        live_refs = set()
+        unvisited_refs = [*ref_list]
+        while unvisited_refs:
+            ref = unvisited_refs.pop()
+            if ref in live_refs or ref.hash_algorithm == 'phony':
+                continue
+            capsule = store.pull(ref)
+            if capsule is None:
+                continue
+            live_refs.add(ref)
+            unvisited_refs.append(capsule.type_ref)
+            # Not put to mosaic: most of them are not needed in this process.
+            dc = decode_capsule(pyobj_creg, capsule)
+            unvisited_refs += self._pick_refs(dc.value, dc.t)
+        return live_refs
+
+
+@mark.service
+def capsule_store_pool():
+    pool = CapsuleStorePool()
+    yield pool
+    pool.close()
+
+
+@mark.service
+def store_bundle_factory(bundler, pick_refs, capsule_store_pool, path, legacy_path=None):
+    return StoreBundle(bundler, pick_refs, capsule_store_pool, path, legacy_path)
@@ -0,0 +1,55 @@
+import tempfile
+from pathlib import Path
+
+from . import htypes
+from .services import (
+    mosaic,
+    )
+from .tested.code import store_bundle
+
+
+def _sample(value, *elements):
+    return htypes.store_bundle_tests.sample(
+        value=value,
+        elements=tuple(mosaic.put(elt) for elt in elements),
+        )
+
+
+def test_save_and_load(store_bundle_factory):
+    with tempfile.TemporaryDirectory() as dir:
+        path = Path(dir) / 'store'
+        piece = _sample('root', _sample('child-1'), _sample('child-2'))
+        bundle = store_bundle_factory(path)
+        bundle.save_piece(piece)
+        assert bundle.load_piece() == piece
+        # Loaded by another instance, pulling capsules from the same store.
+        assert store_bundle_factory(path).load_piece() == piece
+
+
+def test_incremental_save(capsule_store_pool, store_bundle_factory):
+    with tempfile.TemporaryDirectory() as dir:
+        path = Path(dir) / 'store'
+        child_1 = _sample('child-1')
+        bundle = store_bundle_factory(path)
+        bundle.save_piece(_sample('root-1', child_1))
+        store = capsule_store_pool.open(path)
+        count = len(store)
+        bundle.save_piece(_sample('root-2', child_1, _sample('child-2')))
+        # Only new root and new child are added.
+        assert len(store) == count + 2
+        bundle.compact()
+        # Previous root is dropped.
+        assert len(store) == count + 1
+        assert bundle.load_piece().value == 'root-2'
+
+
+def test_legacy_file_bundle(file_bundle_factory, store_bundle_factory):
+    with tempfile.TemporaryDirectory() as dir:
+        legacy_path = Path(dir) / 'store.cdr'
+        path = Path(dir) / 'store'
+        piece = _sample('root', _sample('child'))
+        file_bundle_factory(legacy_path, encoding='cdr').save_piece(piece)
+        bundle = store_bundle_factory(path, legacy_path=legacy_path)
+        assert bundle.load_piece() == piece
+        assert not legacy_path.exists()
+        assert store_bundle_factory(path).load_piece() == piece
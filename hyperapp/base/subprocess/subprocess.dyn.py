@@ -4,11 +4,13 @@ import sys
 from contextlib import contextmanager
 from pathlib import Path
 
-from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.htypes import bundle_t
+from hyperapp.boot.known_refs import KnownRefs
 
 from .services import (
     mosaic,
     )
+from .code.subprocess_transport import BUNDLE_ENCODING, subprocess_compressor
 
 log = logging.getLogger(__name__)
 
@@ -35,16 +37,16 @@ def subprocess_running(bundler):
         subprocess_main = module.subprocess_main
 
         refs_and_bundle = bundler([main_fn_ref])
-        bundle_cdr = packet_coders.encode('cdr', refs_and_bundle.bundle)
-        log.info("Subprocess %s: Packed main function. Bundle size: %.2f KB", name, len(bundle_cdr)/1024)
+        encoding, bundle_data = subprocess_compressor().encode(refs_and_bundle.bundle, BUNDLE_ENCODING, bundle_t)
+        log.info("Subprocess %s: Packed main function. Bundle size: %.2f KB (%s)", name, len(bundle_data)/1024, encoding)
 
         parent_connection, child_connection = _mp_context.Pipe()
-        subprocess_args = [name, child_connection, bundle_cdr]
+        subprocess_args = [name, child_connection, encoding, bundle_data]
         process = _mp_context.Process(target=subprocess_main, args=subprocess_args)
         process.start()
 
         try:
-            yield _Subprocess(parent_connection, refs_and_bundle.ref_set)
+            yield _Subprocess(parent_connection, KnownRefs(refs_and_bundle.ref_set))
         finally:
             parent_connection.close()  # Signal child to stop.
             log.info("Joining process %s...", name)
@@ -6,7 +6,8 @@ from contextlib import contextmanager
 
 from hyperapp.boot.htypes import bundle_t
 from hyperapp.boot import cdr_coders  # self-registering
-from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.known_refs import KnownRefs
+from hyperapp.boot.packet_compression import PacketCompressor
 from hyperapp.boot.services import HYPERAPP_DIR, Services
 
 log = logging.getLogger(__name__)
@@ -29,16 +30,16 @@ def logging_inited(process_name):
         handler.close()
 
 
-def subprocess_main(process_name, connection, main_fn_bundle_cdr):
+def subprocess_main(process_name, connection, main_fn_bundle_encoding, main_fn_bundle_data):
     with logging_inited(process_name):
         try:
-            subprocess_main_safe(connection, main_fn_bundle_cdr)
+            subprocess_main_safe(connection, main_fn_bundle_encoding, main_fn_bundle_data)
         except Exception as x:
             log.exception("Subprocess: Failed with exception: %r", x)
         connection.close()
 
 
-def subprocess_main_safe(connection, main_fn_bundle_cdr):
+def subprocess_main_safe(connection, main_fn_bundle_encoding, main_fn_bundle_data):
     log.info("Subprocess: Init services.")
     services = Services()
     services.init_services()
@@ -46,10 +47,12 @@ def subprocess_main_safe(connection, main_fn_bundle_cdr):
     pyobj_creg = services.pyobj_creg
     unbundler = services.unbundler
 
-    log.info("Subprocess: Unpack main function. Bundle size: %.2f KB", len(main_fn_bundle_cdr)/1024)
+    log.info("Subprocess: Unpack main function. Bundle size: %.2f KB (%s)",
+             len(main_fn_bundle_data)/1024, main_fn_bundle_encoding)
 
-    bundle = packet_coders.decode('cdr', main_fn_bundle_cdr, bundle_t)
-    received_refs = unbundler.register_bundle(bundle)
+    # Compression is announced by encoding, so settings of decoding side do not matter.
+    bundle = PacketCompressor().decode(main_fn_bundle_encoding, main_fn_bundle_data, bundle_t)
+    received_refs = KnownRefs(unbundler.register_bundle(bundle))
     main_fn_ref = bundle.roots[0]
     main_fn = pyobj_creg.invite(main_fn_ref)
 
@@ -1,8 +1,9 @@
 import logging
+import threading
 from concurrent.futures import CancelledError
 from functools import partial
 
-from .code.subprocess_transport import SubprocessRoute
+from .code.subprocess_transport import SubprocessRoute, subprocess_compressor
 from .code.reconstructors import register_reconstructors
 
 log = logging.getLogger(__name__)
@@ -39,7 +40,9 @@ def rpc_server_main(
     register_reconstructors()
 
     master_peer = peer_creg.animate(master_peer_piece)
-    route = SubprocessRoute(bundler, transport_log, 'master', received_refs, connection)
+    compressor = subprocess_compressor()
+    send_lock = threading.Lock()
+    route = SubprocessRoute(bundler, transport_log, 'master', received_refs, connection, compressor, send_lock)
     route_table.add_route(master_peer, route)
 
     my_identity = generate_rsa_identity(fast=True)
@@ -47,7 +50,9 @@ def rpc_server_main(
     endpoint_registry.register(my_identity, rpc_endpoint)
 
     on_stop = partial(_stop, stop_signal, cancel_rpc_request_futures)
-    subprocess_transport.add_server_connection('master', connection, received_refs, on_eof=on_stop, on_reset=on_stop)
+    subprocess_transport.add_server_connection(
+        'master', connection, received_refs, on_eof=on_stop, on_reset=on_stop, compressor=compressor,
+        send_lock=send_lock)
 
     rpc_call = rpc_call_factory(master_peer, my_identity, master_servant_ref, timeout_sec=None)
 
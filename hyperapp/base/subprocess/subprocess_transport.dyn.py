@@ -1,11 +1,11 @@
 import logging
 import multiprocessing
-import struct
 import threading
 from collections import namedtuple
 
 from hyperapp.boot.htypes import bundle_t
-from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.packet_buffer import HEADER, PacketBuffer
+from hyperapp.boot.packet_compression import PacketCompressor
 
 from .services import (
     mosaic,
@@ -15,63 +15,62 @@ from .services import (
 log = logging.getLogger(__name__)
 
 
-# packet data size
-HEADER_FORMAT = '!Q'
-HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# Packet is: header, encoding, packet data. Encoding may have compression suffix: 'cdr+zlib'.
+BUNDLE_ENCODING = 'cdr'
+# Subprocesses are local, and pipes are fast: prefer compression speed over ratio.
+COMPRESSION_LEVEL = 1
 
 
-def encode_packet(data):
-    header = struct.pack(HEADER_FORMAT, len(data))
-    return header + data
+def subprocess_compressor():
+    return PacketCompressor(level=COMPRESSION_LEVEL)
+
+
+def encode_packet(encoding, data):
+    encoded_encoding = encoding.encode()
+    header = HEADER.pack(len(encoded_encoding), len(data))
+    return header + encoded_encoding + data
 
 
 class ConnectionRec:
 
-    def __init__(self, subprocess_transport, connection, name, seen_refs, on_eof=None, on_reset=None):
+    def __init__(self, subprocess_transport, connection, name, seen_refs,
+                 on_eof=None, on_reset=None, compressor=None, send_lock=None):
         self._subprocess_transport = subprocess_transport
         self._connection = connection
         self.name = name
         self.seen_refs = seen_refs
+        self.compressor = compressor or subprocess_compressor()  # Shared with routes sending to this connection.
+        self.send_lock = send_lock or threading.Lock()  # Same.
         self.on_eof = on_eof or self._do_nothing
         self.on_reset = on_reset or self.on_eof
-        self._buffer = b''
+        self._buffer = PacketBuffer()
 
     def _do_nothing(self):
         pass
 
     def close(self):
-        log.info("Subprocess transport: close connection %r", self.name)
+        log.info("Subprocess transport: close connection %r. Compression: %s", self.name, self.compressor.stats)
         self._connection.close()
         self._subprocess_transport.server_connection_closed(self._connection)
 
     def read(self):
-        self._buffer += self._connection.recv()
-        if self._has_full_packet():
-            return self._pop_packet()
-        else:
-            return None
-
-    def _has_full_packet(self):
-        if len(self._buffer) < HEADER_SIZE:
-            return False
-        [size] = struct.unpack(HEADER_FORMAT, self._buffer[:HEADER_SIZE])
-        return len(self._buffer) >= HEADER_SIZE + size
-
-    def _pop_packet(self):
-        [size] = struct.unpack(HEADER_FORMAT, self._buffer[:HEADER_SIZE])
-        packet_data = self._buffer[HEADER_SIZE : HEADER_SIZE + size]
-        self._buffer = self._buffer[HEADER_SIZE + size:]
-        return packet_data
+        # Returned packet data is valid until next read.
+        self._buffer.recv_from_connection(self._connection)
+        return self._buffer.pop_packet()
 
 
 class SubprocessRoute:
 
-    def __init__(self, bundler, transport_log, name, seen_refs, connection):
+    def __init__(self, bundler, transport_log, name, seen_refs, connection, compressor, send_lock):
         self._bundler = bundler
         self._log = transport_log
         self._name = name
         self._seen_refs = seen_refs
         self._connection = connection
+        self._compressor = compressor
+        # Parcels should be written in the same order as they are bundled:
+        # later ones do not include refs bundled with earlier ones.
+        self._send_lock = send_lock
 
     @property
     def piece(self):
@@ -83,19 +82,23 @@ class SubprocessRoute:
 
     def send(self, parcel):
         parcel_ref = mosaic.put(parcel.piece)
+        with self._send_lock:
+            self._send(parcel, parcel_ref)
+        log.debug("Subprocess %s: parcel is sent: %s", self._name, parcel_ref)
+
+    def _send(self, parcel, parcel_ref):
         refs_and_bundle = self._bundler([parcel_ref], self._seen_refs)
         self._seen_refs |= refs_and_bundle.ref_set
-        bundle_cdr = packet_coders.encode('cdr', refs_and_bundle.bundle)
-        self._log.commit_out_message(parcel, 'subprocess', refs_and_bundle.bundle, len(bundle_cdr))
-        log.debug("Subprocess transport: send bundle to %r. Bundle size: %.2f KB", self._name, len(bundle_cdr)/1024)
+        encoding, data = self._compressor.encode(refs_and_bundle.bundle, BUNDLE_ENCODING, bundle_t)
+        self._log.commit_out_message(parcel, 'subprocess', refs_and_bundle.bundle, len(data))
+        log.debug("Subprocess transport: send bundle to %r. Bundle size: %.2f KB (%s)", self._name, len(data)/1024, encoding)
         try:
-            self._connection.send(encode_packet(bundle_cdr))
+            self._connection.send_bytes(encode_packet(encoding, data))
         except OSError as x:
             if str(x) == 'handle is closed':
                 raise RuntimeError(f"Error sending message to subprocess {self._name!r}: subprocess is gone") from x
             else:
                 raise
-        log.debug("Subprocess %s: parcel is sent: %s", self._name, parcel_ref)
 
 
 class SubprocessTransport:
@@ -115,8 +118,9 @@ class SubprocessTransport:
         self._server_thread = threading.Thread(target=self._server_thread_main, name='SubpServer')
         self._server_thread.start()
 
-    def add_server_connection(self, name, connection, seen_refs, on_eof=None, on_reset=None):
-        rec = ConnectionRec(self, connection, name, seen_refs, on_eof, on_reset)
+    def add_server_connection(
+            self, name, connection, seen_refs, on_eof=None, on_reset=None, compressor=None, send_lock=None):
+        rec = ConnectionRec(self, connection, name, seen_refs, on_eof, on_reset, compressor, send_lock)
         self._server_connections[connection] = rec
         self._signal_connection_in.send(None)  # Wake up server main.
         return rec
@@ -159,7 +163,7 @@ class SubprocessTransport:
     def _process_ready_connection(self, connection):
         rec = self._server_connections[connection]
         try:
-            data = rec.read()
+            packet = rec.read()
         except EOFError as x:
             log.info("Subprocess connection %s was closed by the other side: %s", rec.name, x)
             rec.on_eof()
@@ -167,10 +171,10 @@ class SubprocessTransport:
             log.warning("Subprocess connection %s was reset by the other side: %s", rec.name, x)
             rec.on_reset()
         else:
-            if data is None:
+            if packet is None:
                 return  # Partial packet is received.
             try:
-                self._process_bundle(connection, rec, data)
+                self._process_bundle(connection, rec, packet)
                 return  # Keep connection.
             except Exception as x:
                 my_name = f"Processing bundle from {rec.name}"
@@ -183,19 +187,21 @@ class SubprocessTransport:
         else:
             self._signal_connection_in.send(None)
 
-    def _process_bundle(self, connection, connection_rec, data):
-        log.debug("Subprocess transport: received bundle from %r. Bundle size: %.2f KB", connection_rec.name, len(data)/1024)
-        parcel_bundle = packet_coders.decode('cdr', data, bundle_t)
+    def _process_bundle(self, connection, connection_rec, packet):
+        log.debug("Subprocess transport: received bundle from %r. Bundle size: %.2f KB (%s)",
+                  connection_rec.name, len(packet.data)/1024, packet.encoding)
+        parcel_bundle = connection_rec.compressor.decode(packet.encoding, packet.data, bundle_t)
         ref_set = unbundler.register_bundle(parcel_bundle)
         connection_rec.seen_refs |= ref_set
         parcel_piece_ref = parcel_bundle.roots[0]
         parcel = self._parcel_creg.invite(parcel_piece_ref)
-        self._transport_log.add_in_message(parcel, 'subprocess', parcel_bundle, len(data))
+        self._transport_log.add_in_message(parcel, 'subprocess', parcel_bundle, packet.size)
         self._process_parcel(connection, connection_rec, parcel)
 
     def _process_parcel(self, connection, connection_rec, parcel):
         route = SubprocessRoute(
-            self._bundler, self._transport_log, connection_rec.name, connection_rec.seen_refs, connection)
+            self._bundler, self._transport_log, connection_rec.name, connection_rec.seen_refs, connection,
+            connection_rec.compressor, connection_rec.send_lock)
         self._route_table.add_route(parcel.sender, route)
         self._transport.send_parcel(parcel)
 
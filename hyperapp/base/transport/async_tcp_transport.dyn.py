@@ -0,0 +1,479 @@
+import asyncio
+import logging
+import socket
+import threading
+from collections import namedtuple
+
+from hyperapp.boot.known_refs import KnownRefs
+from hyperapp.boot.packet_buffer import HEADER, Packet
+from hyperapp.boot.packet_compression import PacketCompressor
+
+from . import htypes
+from .services import (
+    mosaic,
+    unbundler,
+    )
+from .code.mark import mark
+from .code.transport import RemoteIsGoneError
+from .code.tcp_utils import (
+    TcpEncoding,
+    address_to_str,
+    decode_tcp_packet,
+    encode_tcp_packet,
+    )
+
+log = logging.getLogger(__name__)
+
+
+LOOP_THREAD_NAME = 'TCP-asyncio'
+CONNECT_TIMEOUT_SEC = 10
+# Sends wait for stream to drain; Drain taking longer means remote end does not read or event loop is blocked.
+SEND_TIMEOUT_SEC = 60
+STOP_TIMEOUT_SEC = 10
+LISTEN_BACKLOG = 100
+# Sending threads wait for stream to drain when more than high watermark bytes are buffered,
+# until it is drained below low watermark.
+WRITE_BUFFER_HIGH_WATERMARK = 8 * 1024 * 1024
+WRITE_BUFFER_LOW_WATERMARK = 2 * 1024 * 1024
+
+
+_Services = namedtuple('_Services', [
+    'system_failed',
+    'bundler',
+    'parcel_creg',
+    'transport',
+    'route_table',
+    'transport_log',
+    'conn_lock',
+    'address_to_conn',
+    'event_loop',
+    ])
+
+
+def _in_loop_thread(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def _run_in_loop(loop, coro, timeout):
+    # Run coroutine in event loop thread from other thread and wait for it's result.
+    if _in_loop_thread(loop):
+        coro.close()
+        raise RuntimeError(f"Event loop thread can not wait for itself; Await {coro.__qualname__} instead")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+class Server:
+
+    def __init__(self, svc, async_tcp_connection_factory, bind_address=None):
+        self._svc = svc
+        self._async_tcp_connection_factory = async_tcp_connection_factory
+        # Socket is listening right away, so route is usable before event loop gets to start serving it.
+        self._listen_socket = socket.socket()
+        self._listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listen_socket.bind(bind_address or ('localhost', 0))
+        self._listen_socket.listen(LISTEN_BACKLOG)
+        self._actual_address = self._listen_socket.getsockname()
+        self._server = None
+        self._serve_task = None
+
+    def __repr__(self):
+        return f"<async tcp Server:{address_to_str(self._actual_address)}>"
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._on_accept, sock=self._listen_socket, backlog=LISTEN_BACKLOG, start_serving=False)
+        # Server is closed when this task is cancelled on event loop shutdown.
+        self._serve_task = asyncio.create_task(self._serve())
+        log.info("%s: Listening.", self)
+
+    async def _serve(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    @property
+    def route(self):
+        return Route(self._async_tcp_connection_factory, self._actual_address, is_local=True)
+
+    async def _on_accept(self, reader, writer):
+        address = writer.get_extra_info('peername')[:2]
+        log.info("%s: Accepted connection from %s", self, address_to_str(address))
+        connection = Connection(self._svc, address)
+        connection.set_streams(reader, writer)
+        await connection.read_loop()
+
+
+class Connection:
+    """Connection using asyncio streams. Streams are used only from event loop thread.
+
+    Sending from other threads schedules write to event loop and waits for it;
+    this wait is longer only while stream buffer is above high watermark.
+    """
+
+    def __init__(self, svc, address):
+        self._svc = svc
+        self._address = address
+        self._reader = None
+        self._writer = None
+        self._connected = asyncio.Event()
+        self._this_route = IncomingConnectionRoute(self)
+        self._seen_refs = KnownRefs()
+        self._encoding = TcpEncoding()
+        self._compressor = PacketCompressor()
+        self._is_closed = False
+        self._pending_tasks = set()  # Sends from event loop thread made before connection is established.
+
+    def __repr__(self):
+        return f"<async tcp Connection from: {address_to_str(self._address)}>"
+
+    @property
+    def is_closed(self):
+        return self._is_closed
+
+    @property
+    def compression_stats(self):
+        return self._compressor.stats
+
+    @property
+    def address(self):
+        return self._address
+
+    async def connect(self):
+        host, port = self._address
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), CONNECT_TIMEOUT_SEC)
+        except BaseException:
+            # Including timeout and cancel. Closing also removes this connection from cache.
+            self._close()
+            raise
+        self.set_streams(reader, writer)
+        task = asyncio.create_task(self.read_loop())
+        self._pending_tasks.add(task)
+        task.add_done_callback(self._pending_tasks.discard)
+
+    def set_streams(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH_WATERMARK, low=WRITE_BUFFER_LOW_WATERMARK)
+        self._reader = reader
+        self._writer = writer
+        self._connected.set()
+
+    def send(self, parcel):
+        parcel_ref = mosaic.put(parcel.piece)
+        refs_and_bundle = self._svc.bundler(self._encoding.bundle_roots(parcel_ref), self._seen_refs)
+        self._seen_refs |= refs_and_bundle.ref_set
+        data = encode_tcp_packet(refs_and_bundle.bundle, self._compressor, self._encoding.encoding)
+        self._svc.transport_log.commit_out_message(parcel, 'tcp', refs_and_bundle.bundle, len(data))
+        loop = self._svc.event_loop.loop
+        if _in_loop_thread(loop):
+            self._send_from_loop(data)
+        else:
+            try:
+                _run_in_loop(loop, self._write(data), SEND_TIMEOUT_SEC)
+            except TimeoutError:
+                raise RemoteIsGoneError(f"{self}: Parcel is not sent in {SEND_TIMEOUT_SEC} seconds")
+        log.info("%s: Parcel is sent (%d bytes): %s", self, len(data), parcel_ref)
+
+    def _send_from_loop(self, data):
+        # Event loop thread must not wait for itself, so drain is not awaited here.
+        if self._is_closed:
+            raise RemoteIsGoneError(f"{self}: Connection is closed")
+        if self._writer:
+            self._writer.write(data)
+            return
+        task = asyncio.create_task(self._write(data))
+        self._pending_tasks.add(task)
+        task.add_done_callback(self._on_pending_write_done)
+
+    def _on_pending_write_done(self, task):
+        self._pending_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            log.warning("%s: Error sending to remote end: %s", self, task.exception())
+
+    async def _write(self, data):
+        try:
+            await asyncio.wait_for(self._connected.wait(), CONNECT_TIMEOUT_SEC)
+        except TimeoutError:
+            self._close()
+            raise RemoteIsGoneError(f"{self}: Connection is not established in {CONNECT_TIMEOUT_SEC} seconds")
+        if self._is_closed:
+            raise RemoteIsGoneError(f"{self}: Connection is closed")
+        self._writer.write(data)
+        try:
+            await self._writer.drain()
+        except ConnectionError as x:
+            log.warning("%s: Error sending to remote end: %s", self, x)
+            self._close()
+            raise RemoteIsGoneError(f"{self}: Connection is closed: {x}") from x
+
+    async def read_loop(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(HEADER.size)
+                encoding_size, data_size = HEADER.unpack(header)
+                body = await self._reader.readexactly(encoding_size + data_size)
+                packet = Packet(
+                    encoding=body[:encoding_size].decode(),
+                    data=memoryview(body)[encoding_size:],
+                    size=HEADER.size + len(body),
+                    )
+                bundle, encoding = decode_tcp_packet(packet, self._compressor)
+                self._encoding.received(bundle, encoding)
+                self._process_bundle(bundle, packet.size)
+        except asyncio.IncompleteReadError as x:
+            if x.partial:
+                log.warning("%s: Remote end closed connection in the middle of packet", self)
+            else:
+                log.info("%s: Remote end closed connection", self)
+        except ConnectionResetError as x:
+            log.warning("%s: Remote end reset connection: %s", self, x)
+        except asyncio.CancelledError:
+            log.info("%s: Cancelled", self)
+        except Exception as x:
+            log.exception("%s: Error processing received packet:", self)
+            self._svc.system_failed(f"{self}: Error processing received packet: {x}", x)
+        finally:
+            self._close()
+
+    def _close(self):
+        if self._is_closed:
+            return
+        log.info("%s: Closed. Compression: %s", self, self._compressor.stats)
+        self._is_closed = True
+        self._connected.set()  # Wake up pending writes.
+        if self._writer:
+            self._writer.close()
+        _drop_connection(self._svc, self)
+
+    def _process_bundle(self, bundle, packet_size):
+        parcel_ref = bundle.roots[0]
+        log.info("%s: Received bundle, %d bytes: parcel: %s", self, packet_size, parcel_ref)
+        ref_set = unbundler.register_bundle(bundle)
+        self._seen_refs |= ref_set
+        parcel = self._svc.parcel_creg.invite(parcel_ref)
+        self._svc.transport_log.add_in_message(parcel, 'tcp', bundle, packet_size)
+        if not self._svc.route_table.has_route(parcel.sender):
+            # Looks like incoming connection. Add incoming route.
+            # Add route before sending parcel - it may be used during parcel processing.
+            log.info("%s will be routed via established connection from: %s", parcel.sender, self)
+            self._svc.route_table.add_route(parcel.sender, self._this_route)
+        self._svc.transport.send_parcel(parcel)
+
+
+class Route:
+
+    @classmethod
+    @mark.actor.route_creg(htypes.async_tcp_transport.route)
+    def from_piece(cls, piece, async_tcp_connection_factory):
+        return cls(async_tcp_connection_factory, (piece.host, piece.port), is_local=False)
+
+    def __init__(self, async_tcp_connection_factory, address, is_local):
+        self._async_tcp_connection_factory = async_tcp_connection_factory
+        self._is_local = is_local  # True for routes produced by this process.
+        self._address = address
+
+    def __repr__(self):
+        if self._is_local:
+            suffix = '/local'
+        else:
+            suffix = ''
+        return f"<async tcp Route:{self}{suffix}>"
+
+    def __str__(self):
+        return address_to_str(self._address)
+
+    @property
+    def piece(self):
+        host, port = self._address
+        return htypes.async_tcp_transport.route(host, port)
+
+    @property
+    def available(self):
+        return not self._is_local
+
+    def send(self, parcel):
+        if self._is_local:
+            raise RuntimeError("Can not send parcel using TCP to myself")
+        conn = self._async_tcp_connection_factory(self._address)
+        conn.send(parcel)
+
+    def reconnect(self):
+        self._async_tcp_connection_factory(self._address)
+
+
+class IncomingConnectionRoute:
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    @property
+    def piece(self):
+        return None  # Not persistable.
+
+    @property
+    def available(self):
+        return True
+
+    def send(self, parcel):
+        if self._connection.is_closed:
+            raise RemoteIsGoneError(f"Can not send {parcel} back to {self._connection}: it is already closed")
+        self._connection.send(parcel)
+
+
+async def _cancel_all_tasks():
+    task_list = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in task_list:
+        task.cancel()
+    await asyncio.gather(*task_list, return_exceptions=True)
+
+
+class AsyncTcpLoop:
+    """Event loop connections and servers run in.
+
+    Application already running an event loop, like client with qasync, passes it with use_running_loop
+    before transport is used. Otherwise loop is run in it's own thread, started on first use.
+    Blocking rpc calls made from loop thread can not get their responses via this transport; Await them instead.
+    """
+
+    def __init__(self, system_failed):
+        self._system_failed = system_failed
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def use_running_loop(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is not None and self._loop is not loop:
+                raise RuntimeError(f"Async TCP transport is already running in another event loop: {self._loop}")
+            self._loop = loop
+        log.info("TCP: Using running event loop: %s", loop)
+
+    @property
+    def loop(self):
+        loop = self._loop
+        if loop is not None:
+            return loop
+        with self._lock:
+            if self._loop is None:
+                self._loop = self._start_thread()
+            return self._loop
+
+    def check_can_block(self):
+        # Own loop thread reads responses for all connections; Waiting for one there never ends.
+        # Running loop passed by application may wait for responses coming via other transports.
+        thread = self._thread
+        if thread is not None and threading.current_thread() is thread:
+            raise RuntimeError("Blocking wait in TCP event loop thread would never end; Await instead")
+
+    def _start_thread(self):
+        loop = asyncio.new_event_loop()
+
+        def main():
+            log.info("TCP event loop thread is started.")
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_forever()
+            except Exception as x:
+                log.exception("TCP event loop thread is failed:")
+                self._system_failed(f"TCP event loop thread is failed: {x}", x)
+            log.info("TCP event loop thread is finished.")
+
+        self._thread = threading.Thread(target=main, name=LOOP_THREAD_NAME)
+        self._thread.start()
+        return loop
+
+    def stop(self):
+        with self._lock:
+            loop = self._loop
+            thread = self._thread
+            self._loop = None
+            self._thread = None
+        if thread is None:
+            return  # Not started, or running loop is used; It and it's tasks are stopped by it's owner.
+        log.info("Stop TCP event loop thread.")
+        try:
+            _run_in_loop(loop, _cancel_all_tasks(), STOP_TIMEOUT_SEC)
+        except TimeoutError:
+            log.warning("TCP event loop tasks are not cancelled in %d seconds", STOP_TIMEOUT_SEC)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        log.info("TCP event loop thread is stopped.")
+
+
+@mark.service
+def async_tcp_loop(system_failed):
+    event_loop = AsyncTcpLoop(system_failed)
+    yield event_loop
+    event_loop.stop()
+
+
+@mark.service
+def _async_tcp_services(
+        system_failed,
+        bundler,
+        parcel_creg,
+        transport,
+        route_table,
+        transport_log,
+        async_tcp_loop,
+        ):
+    return _Services(
+        system_failed=system_failed,
+        bundler=bundler,
+        parcel_creg=parcel_creg,
+        transport=transport,
+        route_table=route_table,
+        transport_log=transport_log,
+        conn_lock=threading.Lock(),
+        address_to_conn={},  # (host, port) -> Connection
+        event_loop=async_tcp_loop,
+        )
+
+
+def _drop_connection(svc, connection):
+    with svc.conn_lock:
+        if svc.address_to_conn.get(connection.address) is connection:
+            del svc.address_to_conn[connection.address]
+
+
+@mark.service
+def async_tcp_connection_factory(_async_tcp_services, address):
+    svc = _async_tcp_services
+    loop = svc.event_loop.loop
+    with svc.conn_lock:
+        connection = svc.address_to_conn.get(address)
+        if connection and not connection.is_closed:
+            return connection
+        connection = Connection(svc, address)
+        svc.address_to_conn[address] = connection
+    future = asyncio.run_coroutine_threadsafe(connection.connect(), loop)
+    if _in_loop_thread(loop):
+        # Can not wait here; Sends are written once connection is established.
+        return connection
+    try:
+        future.result(CONNECT_TIMEOUT_SEC)
+    except (OSError, TimeoutError) as x:
+        # Connect task closes connection on it's own errors, but not if it did not finish in time here.
+        future.cancel()
+        _drop_connection(svc, connection)
+        raise RemoteIsGoneError(f"Connecting to {address_to_str(address)}: {x}")
+    return connection
+
+
+@mark.service
+def async_tcp_server_factory(_async_tcp_services, async_tcp_connection_factory, bind_address=None):
+    server = Server(_async_tcp_services, async_tcp_connection_factory, bind_address)
+    loop = _async_tcp_services.event_loop.loop
+    if _in_loop_thread(loop):
+        loop.create_task(server.start())
+    else:
+        _run_in_loop(loop, server.start(), CONNECT_TIMEOUT_SEC)
+    return server
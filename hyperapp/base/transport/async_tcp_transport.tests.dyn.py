@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+from . import htypes
+from .services import (
+    pyobj_creg,
+    )
+from .code.mark import mark
+from .tested.code import async_tcp_transport
+
+log = logging.getLogger(__name__)
+
+
+def test_route_from_piece(async_tcp_connection_factory):
+    piece = htypes.async_tcp_transport.route(host='', port=0)
+    route = async_tcp_transport.Route.from_piece(piece, async_tcp_connection_factory)
+    assert isinstance(route, async_tcp_transport.Route)
+
+
+async def _check_can_block(async_tcp_loop):
+    async_tcp_loop.check_can_block()
+
+
+async def _run_in_own_loop(loop):
+    async_tcp_transport._run_in_loop(loop, asyncio.sleep(0), timeout=1)
+
+
+def test_loop_thread_can_not_block(async_tcp_loop):
+    async_tcp_loop.check_can_block()  # Other threads can.
+    loop = async_tcp_loop.loop
+    for coro in [_check_can_block(async_tcp_loop), _run_in_own_loop(loop)]:
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            future.result(timeout=10)
+        except RuntimeError as x:
+            log.info("Loop thread can not block: %s", x)
+        else:
+            assert False, "Blocking in loop thread is not detected"
+
+
+_callback_message = []
+
+
+def my_callback(message):
+    log.info("Callback with: %r", message)
+    _callback_message.append(message)
+
+
+@mark.fixture
+def async_tcp_test_callback(
+        peer_creg,
+        generate_rsa_identity,
+        endpoint_registry,
+        rpc_endpoint,
+        rpc_submit_factory,
+        rpc_await_future,
+        tcp_master_peer_piece,
+        master_fn_ref,
+        message,
+        ):
+    log.info("async_tcp_test_callback: entered")
+    tcp_master_peer = peer_creg.animate(tcp_master_peer_piece)
+    my_identity = generate_rsa_identity(fast=True)
+    endpoint_registry.register(my_identity, rpc_endpoint)
+    submit = rpc_submit_factory(tcp_master_peer, my_identity, master_fn_ref)
+    log.info("async_tcp_test_callback: Calling master:")
+    asyncio.run(rpc_await_future(submit(message=message), timeout_sec=10))
+    log.info("async_tcp_test_callback: Calling master: done")
+
+
+def test_async_tcp_call(
+        route_table,
+        generate_rsa_identity,
+        endpoint_registry,
+        rpc_endpoint,
+        subprocess_rpc_server_running,
+        async_tcp_server_factory,
+        ):
+    log.info("Test async TCP call")
+
+    master_identity = generate_rsa_identity(fast=True)
+    endpoint_registry.register(master_identity, rpc_endpoint)
+
+    tcp_master_identity = generate_rsa_identity(fast=True)
+    endpoint_registry.register(tcp_master_identity, rpc_endpoint)
+
+    server = async_tcp_server_factory(bind_address=None)
+
+    with subprocess_rpc_server_running('test-async-tcp-send', master_identity) as process:
+        log.info("Started: %r", process)
+
+        # Should add route after rpc server is started, see test_tcp_call.
+        log.info("Tcp route: %r", server.route)
+        route_table.add_route(tcp_master_identity.peer, server.route)
+
+        process.service_call('async_tcp_test_callback')(
+            tcp_master_peer_piece=tcp_master_identity.peer.piece,
+            master_fn_ref=pyobj_creg.actor_to_ref(my_callback),
+            message='hello',
+        )
+        assert _callback_message == ['hello']
+        log.info("Stopping: %r", process)
+    log.info("Stopped: %r", process)
@@ -1,27 +1,60 @@
 import logging
+import threading
+import time
+import uuid
 from collections import namedtuple
-from concurrent.futures import ThreadPoolExecutor
 
+from hyperapp.boot.htypes import ref_t
 from hyperapp.boot.ref import ref_repr
 
+from . import htypes
 from .services import (
+    mosaic,
     unbundler,
     )
 
 log = logging.getLogger(__name__)
 
 
-Request = namedtuple('Request', 'receiver_identity remote_peer ref_list')
+RESYNC_TIMEOUT = 10  # Seconds to wait for resent refs before processing request anyway.
+TIMEOUT_CHECK_INTERVAL_SEC = 1
+STREAM_TIMEOUT = 60  # Seconds to wait for next stream chunk before dropping the stream.
+
+# Receive time is monotonic; Endpoints use it to count time request waited in queue.
+Request = namedtuple('Request', 'receiver_identity remote_peer ref_list receive_time', defaults=[None])
+_PendingRequest = namedtuple('_PendingRequest', 'request start')
+
+# Transport-level pieces, handled by route itself and not passed to endpoint.
+_control_types = (
+    htypes.transport.missing_refs,
+    htypes.transport.resent_refs,
+    htypes.transport.stream_chunk,
+    htypes.transport.stream_ack,
+    )
+
+
+class _InStream:
+
+    def __init__(self):
+        self.ref_set = set()
+        self.dep_refs = set()
+        self.next_seq = 0
+        self.last_time = time.monotonic()
 
 
 class LocalRoute:
 
-    def __init__(self, system_failed, transport_log, endpoint_thread_pool, identity, endpoint):
+    def __init__(self, system_failed, transport_log, endpoint_scheduler, transport, pick_refs, identity, endpoint):
         self._system_failed = system_failed
         self._transport_log = transport_log
-        self._endpoint_thread_pool = endpoint_thread_pool
+        self._endpoint_scheduler = endpoint_scheduler
+        self._transport = transport
+        self._pick_refs = pick_refs
         self._identity = identity
         self._endpoint = endpoint
+        self._lock = threading.Lock()
+        self._pending_requests = {}  # request id -> _PendingRequest, waiting for missing refs.
+        self._in_streams = {}  # stream id -> _InStream, being received.
 
     def __repr__(self):
         return f'<sync LocalRoute to: {self._endpoint}>'
@@ -36,11 +69,174 @@ class LocalRoute:
 
     def send(self, parcel):
         parcel.verify()
-        bundle = self._identity.decrypt_parcel(parcel)
-        unbundler.register_bundle(bundle)
+        bundle = parcel.decrypt(self._identity)
+        ref_set = unbundler.register_bundle(bundle)
         self._transport_log.commit_in_message(parcel, bundle)
-        request = Request(self._identity, parcel.sender, bundle.roots)
-        self._endpoint_thread_pool.submit(self._process_endpoint, request)
+        root = self._control_root(bundle.roots, ref_set)
+        if isinstance(root, htypes.transport.stream_chunk):
+            self._process_stream_chunk(parcel.sender, root, ref_set, self._bundle_dep_refs(ref_set))
+            return
+        if isinstance(root, htypes.transport.stream_ack):
+            self._transport.on_stream_ack(root.stream_id, root.seq)
+            return
+        self._process_bundle(parcel.sender, bundle.roots, ref_set, self._bundle_dep_refs(ref_set), root)
+
+    def check_timeouts(self):
+        # Called periodically by registry, so requests are not stuck when sender sends nothing more.
+        self._submit_stale_requests()
+        self._drop_stale_streams()
+
+    def _process_bundle(self, sender, roots, ref_set, dep_refs, root):
+        if isinstance(root, htypes.transport.missing_refs):
+            ref_list = [ref_t(ref.hash_algorithm, ref.hash) for ref in root.ref_list]
+            self._endpoint_scheduler.submit_priority(
+                self._transport.resend_missing_refs, sender, self._identity, root.request_id, ref_list)
+            return
+        if isinstance(root, htypes.transport.resent_refs):
+            with self._lock:
+                pending = self._pending_requests.pop(root.request_id, None)
+            if pending:
+                log.info("Endpoint %s: Got %d missing refs for request %s", self._endpoint, len(root.ref_list), root.request_id)
+                self._submit_request(pending.request)
+            return
+        request = Request(self._identity, sender, roots, time.monotonic())
+        missing_refs = self._missing_refs(roots, ref_set, dep_refs)
+        if not missing_refs:
+            self._submit_request(request)
+            return
+        request_id = str(uuid.uuid4())
+        log.warning("Endpoint %s: Missing %d refs from %s; requesting them as %s",
+                    self._endpoint, len(missing_refs), sender, request_id)
+        with self._lock:
+            self._pending_requests[request_id] = _PendingRequest(request, time.monotonic())
+        self._endpoint_scheduler.submit_priority(self._request_missing_refs, sender, request_id, missing_refs)
+
+    def _process_stream_chunk(self, sender, chunk, ref_set, dep_refs):
+        with self._lock:
+            if chunk.seq == 0:
+                self._in_streams[chunk.stream_id] = _InStream()
+            stream = self._in_streams.get(chunk.stream_id)
+            if not stream or chunk.seq != stream.next_seq:
+                log.warning("Endpoint %s: Dropping stream %s from %s: got chunk #%d out of order",
+                            self._endpoint, chunk.stream_id, sender, chunk.seq)
+                self._in_streams.pop(chunk.stream_id, None)
+                return
+            stream.ref_set |= ref_set
+            stream.dep_refs |= dep_refs
+            stream.next_seq += 1
+            stream.last_time = time.monotonic()
+            is_last = chunk.seq == chunk.chunk_count - 1
+            if is_last:
+                del self._in_streams[chunk.stream_id]
+        self._endpoint_scheduler.submit_priority(self._send_stream_ack, sender, chunk.stream_id, chunk.seq)
+        if is_last:
+            log.info("Endpoint %s: Got stream %s of %d chunks", self._endpoint, chunk.stream_id, chunk.chunk_count)
+            root = self._control_root(chunk.ref_list, stream.ref_set)
+            self._process_bundle(sender, chunk.ref_list, stream.ref_set, stream.dep_refs, root)
+
+    @staticmethod
+    def _control_root(roots, ref_set):
+        # Control pieces have unique ids, so they are always bundled.
+        if len(roots) != 1 or roots[0] not in ref_set:
+            return None
+        root = mosaic.resolve_ref(roots[0]).value
+        if isinstance(root, _control_types):
+            return root
+        return None
+
+    def _bundle_dep_refs(self, ref_set):
+        # Type refs and refs picked from every bundled capsule, associations included.
+        # Capsule of unknown type can not be decoded; It's type ref is requested as missing then.
+        dep_refs = set()
+        for ref in ref_set:
+            capsule = mosaic.get(ref)
+            if capsule is not None:
+                dep_refs.add(capsule.type_ref)
+                if not self._is_known(capsule.type_ref):
+                    continue
+            rec = mosaic.resolve_ref(ref)
+            dep_refs |= set(self._pick_refs(rec.value, rec.t))
+        return dep_refs
+
+    @staticmethod
+    def _is_known(ref):
+        # Only checks ref is in mosaic, does not decode it. Phony refs are builtin ones.
+        return ref.hash_algorithm == 'phony' or mosaic.get(ref) is not None
+
+    def _missing_refs(self, roots, ref_set, dep_refs):
+        # Refs not in bundle are ones sender considers known to us. Check them only, not their dependencies:
+        # those were checked when they were received.
+        return [
+            ref for ref in dep_refs | set(roots)
+            if ref not in ref_set and not self._is_known(ref)
+            ]
+
+    def _request_missing_refs(self, sender, request_id, ref_list):
+        missing_refs = htypes.transport.missing_refs(
+            request_id=request_id,
+            ref_list=tuple(
+                htypes.transport.missing_ref(ref.hash_algorithm, ref.hash)
+                for ref in ref_list
+                ),
+            )
+        try:
+            self._transport.send(sender, self._identity, [mosaic.put(missing_refs)])
+        except Exception as x:
+            log.warning("Endpoint %s: Failed to request missing refs from %s: %s", self._endpoint, sender, x)
+
+    def _send_stream_ack(self, sender, stream_id, seq):
+        ack = htypes.transport.stream_ack(stream_id=stream_id, seq=seq)
+        try:
+            self._transport.send(sender, self._identity, [mosaic.put(ack)])
+        except Exception as x:
+            log.warning("Endpoint %s: Failed to acknowledge stream %s chunk #%d to %s: %s",
+                        self._endpoint, stream_id, seq, sender, x)
+
+    def _drop_stale_streams(self):
+        now = time.monotonic()
+        with self._lock:
+            stale_ids = [
+                stream_id for stream_id, stream in self._in_streams.items()
+                if now - stream.last_time > STREAM_TIMEOUT
+                ]
+            for stream_id in stale_ids:
+                log.warning("Endpoint %s: Dropping stream %s: no chunks for %d seconds",
+                            self._endpoint, stream_id, STREAM_TIMEOUT)
+                del self._in_streams[stream_id]
+
+    def _submit_stale_requests(self):
+        # Sender may be gone or not answering; let endpoint process and fail such requests.
+        now = time.monotonic()
+        with self._lock:
+            stale_ids = [
+                request_id for request_id, pending in self._pending_requests.items()
+                if now - pending.start > RESYNC_TIMEOUT
+                ]
+            stale_list = [self._pending_requests.pop(request_id) for request_id in stale_ids]
+        for pending in stale_list:
+            log.warning("Endpoint %s: Missing refs are not received in time; process request anyway: %s",
+                        self._endpoint, pending.request)
+            # Missing root can not be checked for priority or lane.
+            for ref in pending.request.ref_list:
+                self._endpoint_scheduler.submit(self._process_endpoint, pending.request._replace(ref_list=(ref,)))
+
+    def _submit_request(self, request):
+        # Each bundle root is processed by it's own task, so a slow or failing one does not hold the others.
+        for ref in request.ref_list:
+            self._submit_root(request._replace(ref_list=(ref,)))
+
+    def _submit_root(self, request):
+        # Roots are processed concurrently, unless endpoint puts them to a lane: roots in the same lane
+        # from one peer are processed in order they are received.
+        # Responses should not wait for requests: those may be waiting for responses.
+        if self._endpoint.is_priority(request):
+            self._endpoint_scheduler.submit_priority(self._process_endpoint, request)
+            return
+        lane = self._endpoint.request_lane(request)
+        if lane is None:
+            self._endpoint_scheduler.submit(self._process_endpoint, request)
+        else:
+            self._endpoint_scheduler.submit_ordered((request.remote_peer.piece, lane), self._process_endpoint, request)
 
     def _process_endpoint(self, request):
         log.info("Endpoint %s: process request: %s", self._endpoint, request)
@@ -54,25 +250,49 @@ class LocalRoute:
 
 class EndpointRegistry:
 
-    def __init__(self, system_failed, transport_log, endpoint_thread_pool, route_table):
+    def __init__(self, system_failed, transport_log, endpoint_scheduler, route_table, transport, pick_refs):
         self._system_failed = system_failed
         self._transport_log = transport_log
-        self._endpoint_thread_pool = endpoint_thread_pool
+        self._endpoint_scheduler = endpoint_scheduler
         self._route_table = route_table
+        self._transport = transport
+        self._pick_refs = pick_refs
+        self._lock = threading.Lock()
+        self._route_list = []
 
     def register(self, identity, endpoint):
         log.info("Local peer %s: %s", identity.peer, endpoint)
-        route = LocalRoute(self._system_failed, self._transport_log, self._endpoint_thread_pool, identity, endpoint)
+        route = LocalRoute(
+            self._system_failed, self._transport_log, self._endpoint_scheduler,
+            self._transport, self._pick_refs, identity, endpoint)
+        with self._lock:
+            self._route_list.append(route)
         self._route_table.add_route(identity.peer, route)
 
+    def check_timeouts(self):
+        with self._lock:
+            route_list = list(self._route_list)
+        for route in route_list:
+            route.check_timeouts()
+
 
-def endpoint_thread_pool():
-    thread_pool = ThreadPoolExecutor(max_workers=5, thread_name_prefix='Endpoint')
-    yield thread_pool
-    log.info("Shutdown endpoint thread pool")
-    thread_pool.shutdown()
-    log.info("Endpoint thread pool is shut down")
+def endpoint_registry(system_failed, route_table, transport_log, endpoint_scheduler, transport, pick_refs):
+    registry = EndpointRegistry(system_failed, transport_log, endpoint_scheduler, route_table, transport, pick_refs)
+    stop_signal = threading.Event()
 
+    def main():
+        log.info("Endpoint timeout thread is started.")
+        while not stop_signal.wait(TIMEOUT_CHECK_INTERVAL_SEC):
+            try:
+                registry.check_timeouts()
+            except Exception:
+                log.exception("Endpoint timeout thread: Error checking timeouts:")
+        log.info("Endpoint timeout thread is finished.")
 
-def endpoint_registry(system_failed, route_table, transport_log, endpoint_thread_pool):
-    return EndpointRegistry(system_failed, transport_log, endpoint_thread_pool, route_table)
+    thread = threading.Thread(target=main, name='Endpoint-timeouts', daemon=True)
+    thread.start()
+    yield registry
+    log.info("Stop endpoint timeout thread.")
+    stop_signal.set()
+    thread.join()
+    log.info("Endpoint timeout thread is stopped.")
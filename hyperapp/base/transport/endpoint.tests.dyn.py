@@ -0,0 +1,193 @@
+from unittest.mock import Mock
+
+from hyperapp.boot.htypes import bundle_t, ref_t
+
+from . import htypes
+from .services import (
+    mosaic,
+    )
+from .tested.code import endpoint
+
+
+class _ImmediateScheduler:
+
+    def __init__(self):
+        self.ordered_lanes = []
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+    def submit_priority(self, fn, *args):
+        fn(*args)
+
+    def submit_ordered(self, lane, fn, *args):
+        self.ordered_lanes.append(lane)
+        fn(*args)
+
+
+def _bundle(root_ref, with_capsule):
+    capsule_list = (mosaic.get(root_ref),) if with_capsule else ()
+    return bundle_t(roots=(root_ref,), associations=(), capsule_list=capsule_list)
+
+
+def _parcel(bundle):
+    return Mock(decrypt=Mock(return_value=bundle))
+
+
+def _make_route(pick_refs, scheduler=None):
+    transport = Mock()
+    target = Mock()
+    route = endpoint.LocalRoute(
+        system_failed=Mock(),
+        transport_log=Mock(),
+        endpoint_scheduler=scheduler or _ImmediateScheduler(),
+        transport=transport,
+        pick_refs=pick_refs,
+        identity=Mock(),
+        endpoint=target,
+        )
+    return (route, transport, target)
+
+
+def test_missing_refs_are_requested(pick_refs):
+    route, transport, target = _make_route(pick_refs)
+    unknown_ref = ref_t('sha512', b'unknown ref for missing refs test')
+
+    parcel = _parcel(_bundle(unknown_ref, with_capsule=False))
+    route.send(parcel)
+    target.process.assert_not_called()
+    transport.send.assert_called_once()
+    receiver, identity, [missing_refs_ref] = transport.send.call_args.args
+    assert receiver is parcel.sender
+    missing_refs = mosaic.resolve_ref(missing_refs_ref).value
+    assert [ref_t(ref.hash_algorithm, ref.hash) for ref in missing_refs.ref_list] == [unknown_ref]
+
+    resent_refs = htypes.transport.resent_refs(
+        request_id=missing_refs.request_id,
+        ref_list=(unknown_ref,),
+        )
+    route.send(_parcel(_bundle(mosaic.put(resent_refs), with_capsule=True)))
+    target.process.assert_called_once()
+    assert target.process.call_args.args[0].ref_list == (unknown_ref,)
+
+
+def test_refs_of_non_root_capsule_are_checked(pick_refs):
+    route, transport, target = _make_route(pick_refs)
+    unknown_ref = ref_t('sha512', b'unknown ref for non-root capsule test')
+    root_ref = mosaic.put('root for non-root capsule test')
+    # Any piece having refs. Not a root, so it is not processed as control one.
+    inner_ref = mosaic.put(htypes.transport.resent_refs(request_id='inner', ref_list=(unknown_ref,)))
+    bundle = bundle_t(roots=(root_ref,), associations=(), capsule_list=(mosaic.get(inner_ref), mosaic.get(root_ref)))
+    route.send(_parcel(bundle))
+    target.process.assert_not_called()
+    receiver, identity, [missing_refs_ref] = transport.send.call_args.args
+    missing_refs = mosaic.resolve_ref(missing_refs_ref).value
+    assert [ref_t(ref.hash_algorithm, ref.hash) for ref in missing_refs.ref_list] == [unknown_ref]
+
+
+def test_missing_refs_are_resent(pick_refs):
+    route, transport, target = _make_route(pick_refs)
+    ref = mosaic.put('some known ref')
+    missing_refs = htypes.transport.missing_refs(
+        request_id='test-request',
+        ref_list=(htypes.transport.missing_ref(ref.hash_algorithm, ref.hash),),
+        )
+    parcel = _parcel(_bundle(mosaic.put(missing_refs), with_capsule=True))
+    route.send(parcel)
+    target.process.assert_not_called()
+    transport.resend_missing_refs.assert_called_once_with(parcel.sender, route._identity, 'test-request', [ref])
+
+
+def _chunk_bundle(stream_id, seq, chunk_count, capsule_refs, roots=()):
+    chunk = htypes.transport.stream_chunk(
+        stream_id=stream_id,
+        seq=seq,
+        chunk_count=chunk_count,
+        ref_list=roots,
+        )
+    chunk_ref = mosaic.put(chunk)
+    capsule_list = tuple(mosaic.get(ref) for ref in [*capsule_refs, chunk_ref])
+    return bundle_t(roots=(chunk_ref,), associations=(), capsule_list=capsule_list)
+
+
+def test_stream_is_reassembled(pick_refs):
+    route, transport, target = _make_route(pick_refs)
+    element_ref = mosaic.put('stream element')
+    root_ref = mosaic.put((element_ref,))
+
+    route.send(_parcel(_chunk_bundle('test-stream', 0, 2, [element_ref])))
+    target.process.assert_not_called()
+    route.send(_parcel(_chunk_bundle('test-stream', 1, 2, [root_ref], roots=(root_ref,))))
+    target.process.assert_called_once()
+    assert target.process.call_args.args[0].ref_list == (root_ref,)
+
+    ack_list = [mosaic.resolve_ref(call.args[2][0]).value for call in transport.send.call_args_list]
+    assert ack_list == [
+        htypes.transport.stream_ack(stream_id='test-stream', seq=0),
+        htypes.transport.stream_ack(stream_id='test-stream', seq=1),
+        ]
+
+
+def test_stream_ack_is_passed_to_transport(pick_refs):
+    route, transport, target = _make_route(pick_refs)
+    ack = htypes.transport.stream_ack(stream_id='test-ack-stream', seq=3)
+    route.send(_parcel(_bundle(mosaic.put(ack), with_capsule=True)))
+    transport.on_stream_ack.assert_called_once_with('test-ack-stream', 3)
+    target.process.assert_not_called()
+
+
+def test_request_is_ordered_by_sender_and_lane(pick_refs):
+    scheduler = _ImmediateScheduler()
+    route, transport, target = _make_route(pick_refs, scheduler)
+    target.is_priority.return_value = False
+    target.request_lane.return_value = 'test-lane'
+    parcel = _parcel(_bundle(mosaic.put('ordered request'), with_capsule=True))
+    route.send(parcel)
+    target.process.assert_called_once()
+    assert scheduler.ordered_lanes == [(parcel.sender.piece, 'test-lane')]
+
+
+def test_request_without_lane_is_not_ordered(pick_refs):
+    scheduler = _ImmediateScheduler()
+    route, transport, target = _make_route(pick_refs, scheduler)
+    target.is_priority.return_value = False
+    target.request_lane.return_value = None
+    route.send(_parcel(_bundle(mosaic.put('concurrent request'), with_capsule=True)))
+    target.process.assert_called_once()
+    assert scheduler.ordered_lanes == []
+
+
+def test_bundle_roots_are_processed_separately(pick_refs):
+    route, transport, target = _make_route(pick_refs)
+    target.is_priority.return_value = False
+    target.request_lane.return_value = None
+    target.process.side_effect = [RuntimeError("Test root failure"), None]
+    root_refs = (mosaic.put('failing root'), mosaic.put('next root'))
+    bundle = bundle_t(roots=root_refs, associations=(), capsule_list=tuple(mosaic.get(ref) for ref in root_refs))
+    route.send(_parcel(bundle))
+    assert [call.args[0].ref_list for call in target.process.call_args_list] == [root_refs[:1], root_refs[1:]]
+    route._system_failed.assert_called_once()
+
+
+def test_stale_request_is_processed_on_timeout_check(pick_refs):
+    route, transport, target = _make_route(pick_refs)
+    unknown_ref = ref_t('sha512', b'unknown ref for stale request test')
+    route.send(_parcel(_bundle(unknown_ref, with_capsule=False)))
+    route.check_timeouts()
+    target.process.assert_not_called()
+    # No more parcels from sender; timeout check alone should process request.
+    [(request_id, pending)] = route._pending_requests.items()
+    route._pending_requests[request_id] = pending._replace(start=pending.start - endpoint.RESYNC_TIMEOUT - 1)
+    route.check_timeouts()
+    target.process.assert_called_once()
+    assert target.process.call_args.args[0].ref_list == (unknown_ref,)
+
+
+def test_stale_stream_is_dropped_on_timeout_check(pick_refs):
+    route, transport, target = _make_route(pick_refs)
+    route.send(_parcel(_chunk_bundle('test-stale-stream', 0, 2, [mosaic.put('stale stream element')])))
+    route.check_timeouts()
+    assert 'test-stale-stream' in route._in_streams
+    route._in_streams['test-stale-stream'].last_time -= endpoint.STREAM_TIMEOUT + 1
+    route.check_timeouts()
+    assert 'test-stale-stream' not in route._in_streams
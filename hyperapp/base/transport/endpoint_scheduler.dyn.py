@@ -0,0 +1,230 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_MIN_WORKERS = 2
+DEFAULT_MAX_WORKERS = 16
+IDLE_TIMEOUT_SEC = 10  # Worker above minimum count exits after being idle for this long.
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 1, 10)  # Wait time histogram bucket upper bounds, in seconds.
+
+
+QueueStats = namedtuple('QueueStats', [
+    'name',
+    'length',  # Tasks waiting to be started.
+    'lane_count',  # Lanes having running or waiting tasks.
+    'task_count',  # Tasks started.
+    'wait_histogram',  # Started task counts by wait time: one per WAIT_BUCKETS bound, plus one for longer waits.
+    ])
+
+SchedulerStats = namedtuple('SchedulerStats', 'worker_count busy_count queue_list')
+
+
+class _Task:
+
+    def __init__(self, fn, args, lane=None):
+        self.fn = fn
+        self.args = args
+        self.lane = lane
+        self.submit_time = time.monotonic()
+
+
+class _Queue:
+
+    def __init__(self, name):
+        self.name = name
+        self.tasks = deque()
+        self.task_count = 0
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def pop(self, now):
+        task = self.tasks.popleft()
+        self.task_count += 1
+        self.wait_histogram[bisect.bisect_right(WAIT_BUCKETS, now - task.submit_time)] += 1
+        return task
+
+    def stats(self, waiting_count=0, lane_count=0):
+        return QueueStats(
+            name=self.name,
+            length=len(self.tasks) + waiting_count,
+            lane_count=lane_count,
+            task_count=self.task_count,
+            wait_histogram=tuple(self.wait_histogram),
+            )
+
+
+class EndpointScheduler:
+    """Worker threads for endpoint requests, growing from min to max count under load.
+
+    Requests submitted with the same lane are started one by one, in submit order.
+    Running task may release it's lane, letting next one to start, when it is going to wait for other peers.
+    Priority tasks, like RPC responses, are started before requests; There is always a worker for them,
+    even if max count is reached, as requests may be blocked waiting for them.
+    """
+
+    def __init__(self, min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS):
+        self._min_workers = min_workers
+        self._max_workers = max(min_workers, max_workers)
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._priority = _Queue('priority')
+        self._requests = _Queue('request')
+        self._lane_to_waiting = {}  # lane -> deque of tasks waiting for running one.
+        self._worker_count = 0
+        self._idle_count = 0
+        self._thread_set = set()
+        self._thread_idx = 0
+        self._stopped = False
+        with self._cond:
+            for idx in range(self._min_workers):
+                self._start_worker()
+
+    def submit(self, fn, *args):
+        self._submit(self._requests, _Task(fn, args))
+
+    def submit_priority(self, fn, *args):
+        self._submit(self._priority, _Task(fn, args))
+
+    def submit_ordered(self, lane, fn, *args):
+        task = _Task(fn, args, lane)
+        with self._cond:
+            self._check_running()
+            waiting = self._lane_to_waiting.get(lane)
+            if waiting is not None:
+                waiting.append(task)
+                return
+            self._lane_to_waiting[lane] = deque()
+            self._add_task(self._requests, task)
+
+    def release_lane(self):
+        # Called by task running in this thread. Does nothing if there is no such task.
+        task = getattr(self._local, 'task', None)
+        if task is None:
+            return
+        with self._cond:
+            self._release_lane(task)
+
+    def stats(self):
+        with self._cond:
+            waiting_count = sum(len(waiting) for waiting in self._lane_to_waiting.values())
+            return SchedulerStats(
+                worker_count=self._worker_count,
+                busy_count=self._worker_count - self._idle_count,
+                queue_list=[
+                    self._priority.stats(),
+                    self._requests.stats(waiting_count, len(self._lane_to_waiting)),
+                    ],
+                )
+
+    def shutdown(self):
+        # Already submitted tasks are finished first.
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread_list = list(self._thread_set)
+        for thread in thread_list:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _check_running(self):
+        if self._stopped:
+            raise RuntimeError("Endpoint scheduler is shut down")
+
+    def _submit(self, queue, task):
+        with self._cond:
+            self._check_running()
+            self._add_task(queue, task)
+
+    def _add_task(self, queue, task):
+        queue.tasks.append(task)
+        ready_count = len(self._priority.tasks) + len(self._requests.tasks)
+        while ready_count > self._idle_count:
+            if self._worker_count >= self._max_workers and len(self._priority.tasks) <= self._idle_count:
+                break
+            self._start_worker()
+        self._cond.notify()
+
+    def _start_worker(self):
+        self._worker_count += 1
+        self._idle_count += 1
+        self._thread_idx += 1
+        thread = threading.Thread(target=self._worker_main, name=f'Endpoint-{self._thread_idx}', daemon=True)
+        self._thread_set.add(thread)
+        thread.start()
+
+    def _next_task(self):
+        now = time.monotonic()
+        if self._priority.tasks:
+            return self._priority.pop(now)
+        if self._requests.tasks:
+            return self._requests.pop(now)
+        return None
+
+    def _release_lane(self, task):
+        if task.lane is None:
+            return
+        waiting = self._lane_to_waiting[task.lane]
+        if waiting:
+            self._add_task(self._requests, waiting.popleft())
+        else:
+            del self._lane_to_waiting[task.lane]
+        task.lane = None
+
+    def _wait_for_task(self):
+        # Returns None if worker should exit.
+        while True:
+            task = self._next_task()
+            if task is not None:
+                return task
+            if self._stopped:
+                return None
+            if not self._cond.wait(IDLE_TIMEOUT_SEC) and self._worker_count > self._min_workers:
+                task = self._next_task()
+                if task is None:
+                    log.debug("Endpoint scheduler: worker is idle for %d seconds, exiting", IDLE_TIMEOUT_SEC)
+                return task
+
+    def _worker_main(self):
+        with self._cond:
+            while True:
+                task = self._wait_for_task()
+                if task is None:
+                    self._idle_count -= 1
+                    break
+                self._idle_count -= 1
+                self._cond.release()
+                try:
+                    self._run(task)
+                finally:
+                    self._cond.acquire()
+                self._release_lane(task)
+                if self._worker_count > self._max_workers:
+                    # Was started for priority task over max count.
+                    break
+                self._idle_count += 1
+            self._worker_count -= 1
+            self._thread_set.discard(threading.current_thread())
+
+    def _run(self, task):
+        self._local.task = task
+        try:
+            task.fn(*task.args)
+        except Exception:
+            log.exception("Endpoint scheduler: Error running %s:", task.fn)
+        finally:
+            self._local.task = None
+
+
+def endpoint_scheduler(config):
+    scheduler = EndpointScheduler(
+        min_workers=config.min_workers or DEFAULT_MIN_WORKERS,
+        max_workers=config.max_workers or DEFAULT_MAX_WORKERS,
+        )
+    yield scheduler
+    log.info("Shutdown endpoint scheduler")
+    scheduler.shutdown()
+    log.info("Endpoint scheduler is shut down")
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from .tested.code import endpoint_scheduler
+
+
+def _wait_for(predicate):
+    for idx in range(200):
+        if predicate():
+            return
+        time.sleep(0.01)
+    assert False, "Condition is not reached in time"
+
+
+def test_lane_is_processed_in_order():
+    scheduler = endpoint_scheduler.EndpointScheduler(min_workers=4, max_workers=4)
+    result = []
+    for idx in range(20):
+        scheduler.submit_ordered('lane', lambda idx: (time.sleep(0.001), result.append(idx)), idx)
+    scheduler.shutdown()
+    assert result == list(range(20))
+
+
+def test_lanes_are_processed_concurrently():
+    scheduler = endpoint_scheduler.EndpointScheduler(min_workers=1, max_workers=2)
+    event = threading.Event()
+    scheduler.submit_ordered('lane-1', event.wait, 5)
+    scheduler.submit_ordered('lane-2', event.set)
+    assert event.wait(5)
+    scheduler.shutdown()
+
+
+def test_released_lane_starts_next_task():
+    scheduler = endpoint_scheduler.EndpointScheduler(min_workers=1, max_workers=2)
+    event = threading.Event()
+
+    def wait_for_next():
+        scheduler.release_lane()
+        event.wait(5)
+
+    scheduler.submit_ordered('lane', wait_for_next)
+    scheduler.submit_ordered('lane', event.set)
+    assert event.wait(5)
+    scheduler.shutdown()
+
+
+def test_priority_task_runs_when_max_workers_are_busy():
+    scheduler = endpoint_scheduler.EndpointScheduler(min_workers=1, max_workers=1)
+    request_event = threading.Event()
+    response_event = threading.Event()
+    scheduler.submit_ordered('lane', request_event.wait, 5)
+    scheduler.submit(request_event.set)  # Waits for a free worker.
+    scheduler.submit_priority(response_event.set)
+    assert response_event.wait(5)
+    assert not request_event.is_set()
+    request_event.set()
+    scheduler.shutdown()
+    stats = scheduler.stats()
+    [priority, request] = stats.queue_list
+    assert priority.task_count == 1
+    assert request.task_count == 2
+    assert sum(request.wait_histogram) == 2
+
+
+def test_workers_are_added_up_to_max():
+    scheduler = endpoint_scheduler.EndpointScheduler(min_workers=1, max_workers=3)
+    event = threading.Event()
+    for idx in range(5):
+        scheduler.submit(event.wait, 5)
+    _wait_for(lambda: scheduler.stats().busy_count == 3)
+    stats = scheduler.stats()
+    assert stats.worker_count == 3
+    [priority, request] = stats.queue_list
+    assert request.length == 2
+    event.set()
+    scheduler.shutdown()
+    assert scheduler.stats().worker_count == 0
+
+
+def test_endpoint_scheduler_service(endpoint_scheduler):
+    stats = endpoint_scheduler.stats()
+    assert stats.worker_count > 0
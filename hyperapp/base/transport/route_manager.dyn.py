@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+
+BACKOFF_MIN_SEC = 0.5
+BACKOFF_MAX_SEC = 60
+RTT_WEIGHT = 0.2  # Weight of new sample in RTT moving average.
+RECONNECT_CHECK_INTERVAL_SEC = 0.5
+
+
+RouteStats = namedtuple('RouteStats', [
+    'peer',
+    'route',  # Route repr.
+    'is_up',
+    'send_count',
+    'error_count',
+    'consecutive_errors',
+    'last_error',
+    'rtt',  # Moving average, in seconds; None if not measured yet.
+    ])
+
+
+class _RouteHealth:
+
+    def __init__(self, peer, route):
+        self.peer = peer
+        self.route = route  # Last route instance; routes from config are animated anew each time.
+        self.send_count = 0
+        self.error_count = 0
+        self.consecutive_errors = 0
+        self.last_error = None
+        self.rtt = None
+        self.retry_at = 0  # Monotonic time; route is down until then.
+
+    def is_up(self, now):
+        return self.consecutive_errors == 0 or now >= self.retry_at
+
+    def set_failed(self, error, now):
+        self.error_count += 1
+        self.consecutive_errors += 1
+        self.last_error = str(error) or type(error).__name__
+        backoff = min(BACKOFF_MIN_SEC * 2 ** (self.consecutive_errors - 1), BACKOFF_MAX_SEC)
+        self.retry_at = now + backoff
+
+    def set_ok(self):
+        self.consecutive_errors = 0
+        self.retry_at = 0
+
+    def stats(self):
+        return RouteStats(
+            peer=self.peer,
+            route=repr(self.route),
+            is_up=self.consecutive_errors == 0,
+            send_count=self.send_count,
+            error_count=self.error_count,
+            consecutive_errors=self.consecutive_errors,
+            last_error=self.last_error,
+            rtt=self.rtt,
+            )
+
+
+def _route_key(peer, route):
+    # Routes without piece are bound to this process, like incoming connections and local routes.
+    # They are not tracked: they are created for every connection and can not be reconnected.
+    if route.piece is None:
+        return None
+    return (peer.piece, route.piece)
+
+
+class RouteManager:
+    """Health of routes to peers: used to pick and order routes, and to reconnect failed ones.
+
+    Failed route is moved behind healthy ones for exponentially growing backoff time.
+    Routes having reconnect method are reconnected in background when backoff time is passed.
+    Routes without piece are not tracked and are considered healthy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_to_health = {}
+        self._peer_to_last_key = {}
+
+    def ordered_routes(self, peer, route_list):
+        # Healthy routes first, faster ones before slower; Then failed ones, those to be retried sooner first.
+        now = time.monotonic()
+        with self._lock:
+            health_list = [self._health(peer, route) for route in route_list]
+
+        def sort_key(idx):
+            health = health_list[idx]
+            if health is None:
+                return (0, 0, idx)
+            if health.is_up(now):
+                return (0, health.rtt or 0, idx)
+            return (1, health.retry_at, idx)
+
+        return [route_list[idx] for idx in sorted(range(len(route_list)), key=sort_key)]
+
+    def on_sent(self, peer, route):
+        key = _route_key(peer, route)
+        with self._lock:
+            # Round trip times for untracked routes should not be attributed to others.
+            self._peer_to_last_key[peer.piece] = key
+            health = self._health(peer, route)
+            if health is None:
+                return
+            health.send_count += 1
+            if health.consecutive_errors:
+                log.info("Route %s to %s is up again", route, peer)
+            health.set_ok()
+
+    def on_failed(self, peer, route, error):
+        with self._lock:
+            health = self._health(peer, route)
+            if health is None:
+                log.warning("Route %s to %s is failed: %s", route, peer, error)
+                return
+            health.set_failed(error, time.monotonic())
+            log.warning("Route %s to %s is failed (%d in a row), retry in %.1f sec: %s",
+                        route, peer, health.consecutive_errors, health.retry_at - time.monotonic(), error)
+
+    def add_rtt(self, peer, rtt):
+        # Round trip time measured by caller, attributed to the last route used for the peer.
+        with self._lock:
+            key = self._peer_to_last_key.get(peer.piece)
+            health = self._key_to_health.get(key)
+            if not health:
+                return
+            if health.rtt is None:
+                health.rtt = rtt
+            else:
+                health.rtt += (rtt - health.rtt) * RTT_WEIGHT
+
+    def stats(self):
+        with self._lock:
+            return [health.stats() for health in self._key_to_health.values()]
+
+    def reconnect_due_routes(self):
+        now = time.monotonic()
+        with self._lock:
+            due_list = [
+                health for health in self._key_to_health.values()
+                if health.consecutive_errors and now >= health.retry_at and hasattr(health.route, 'reconnect')
+                ]
+        for health in due_list:
+            try:
+                health.route.reconnect()
+            except Exception as x:
+                self.on_failed(health.peer, health.route, x)
+            else:
+                log.info("Route %s to %s is reconnected", health.route, health.peer)
+                with self._lock:
+                    health.set_ok()
+
+    def _health(self, peer, route):
+        # Returns None for untracked route.
+        key = _route_key(peer, route)
+        if key is None:
+            return None
+        try:
+            health = self._key_to_health[key]
+        except KeyError:
+            health = self._key_to_health[key] = _RouteHealth(peer, route)
+        health.route = route
+        return health
+
+
+def route_manager():
+    manager = RouteManager()
+    stop_signal = threading.Event()
+
+    def main():
+        log.info("Route reconnect thread is started.")
+        while not stop_signal.wait(RECONNECT_CHECK_INTERVAL_SEC):
+            try:
+                manager.reconnect_due_routes()
+            except Exception:
+                log.exception("Route reconnect thread: Error reconnecting routes:")
+        log.info("Route reconnect thread is finished.")
+
+    thread = threading.Thread(target=main, name='Route-reconnect', daemon=True)
+    thread.start()
+    yield manager
+    log.info("Stop route reconnect thread.")
+    stop_signal.set()
+    thread.join()
+    log.info("Route reconnect thread is stopped.")
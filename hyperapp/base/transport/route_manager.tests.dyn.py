@@ -0,0 +1,69 @@
+from unittest.mock import Mock
+
+from .tested.code import route_manager
+
+
+def _route(name):
+    return Mock(piece=name, spec=['piece', 'send', 'reconnect'])
+
+
+def test_failed_route_is_ordered_last():
+    manager = route_manager.RouteManager()
+    peer = Mock(piece='peer')
+    route_1 = _route('route-1')
+    route_2 = _route('route-2')
+    assert manager.ordered_routes(peer, [route_1, route_2]) == [route_1, route_2]
+    manager.on_failed(peer, route_1, RuntimeError("Test failure"))
+    assert manager.ordered_routes(peer, [route_1, route_2]) == [route_2, route_1]
+    manager.on_sent(peer, route_1)
+    assert manager.ordered_routes(peer, [route_1, route_2]) == [route_1, route_2]
+
+
+def test_faster_route_is_ordered_first():
+    manager = route_manager.RouteManager()
+    peer = Mock(piece='peer')
+    route_1 = _route('route-1')
+    route_2 = _route('route-2')
+    manager.on_sent(peer, route_1)
+    manager.add_rtt(peer, 0.5)
+    manager.on_sent(peer, route_2)
+    manager.add_rtt(peer, 0.1)
+    assert manager.ordered_routes(peer, [route_1, route_2]) == [route_2, route_1]
+
+
+def test_failed_route_is_reconnected():
+    manager = route_manager.RouteManager()
+    peer = Mock(piece='peer')
+    route = _route('route')
+    route.reconnect.side_effect = RuntimeError("Still down")
+    manager.on_failed(peer, route, RuntimeError("Test failure"))
+    [stats] = manager.stats()
+    assert not stats.is_up
+    manager._key_to_health[peer.piece, route.piece].retry_at = 0
+    manager.reconnect_due_routes()
+    route.reconnect.assert_called_once()
+    [stats] = manager.stats()
+    assert stats.consecutive_errors == 2
+    assert stats.last_error == "Still down"
+    route.reconnect.side_effect = None
+    manager._key_to_health[peer.piece, route.piece].retry_at = 0
+    manager.reconnect_due_routes()
+    [stats] = manager.stats()
+    assert stats.is_up
+    assert stats.error_count == 2
+
+
+def test_route_without_piece_is_not_tracked():
+    manager = route_manager.RouteManager()
+    peer = Mock(piece='peer')
+    route_1 = _route(None)
+    route_2 = _route('route-2')
+    manager.on_sent(peer, route_1)
+    manager.on_failed(peer, route_1, RuntimeError("Test failure"))
+    manager.add_rtt(peer, 0.1)
+    assert manager.ordered_routes(peer, [route_1, route_2]) == [route_1, route_2]
+    assert [stats.route for stats in manager.stats()] == [repr(route_2)]
+
+
+def test_route_manager_service(route_manager):
+    assert route_manager.stats() == []
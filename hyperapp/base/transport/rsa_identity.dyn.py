@@ -81,15 +81,18 @@ class RsaIdentity:
             signature=signature,
             )
 
-    def decrypt_parcel(self, parcel):
+    def decrypt_key(self, encrypted_key):
         hash_algorithm = hashes.SHA256()
-        fernet_key = self._private_key.decrypt(
-            parcel.encrypted_fernet_key,
+        return self._private_key.decrypt(
+            encrypted_key,
             padding.OAEP(
                 mgf=padding.MGF1(algorithm=hash_algorithm),
                 algorithm=hash_algorithm,
                 label=None,
                 ))
+
+    def decrypt_parcel(self, parcel):
+        fernet_key = self.decrypt_key(parcel.encrypted_fernet_key)
         fernet = Fernet(fernet_key)
         bundle_cdr = fernet.decrypt(parcel.encrypted_bundle)
         return packet_coders.decode(BUNDLE_ENCODING, bundle_cdr, bundle_t)
@@ -130,13 +133,9 @@ class RsaPeer:
             format=serialization.PublicFormat.SubjectPublicKeyInfo,
             )
 
-    def make_parcel(self, bundle, sender_identity):
-        key = Fernet.generate_key()
-        fernet = Fernet(key)
-        bundle_cdr = packet_coders.encode(BUNDLE_ENCODING, bundle)
-        encrypted_bundle = fernet.encrypt(bundle_cdr)
+    def encrypt_key(self, key):
         hash_algorithm = hashes.SHA256()
-        encrypted_key = self._public_key.encrypt(
+        return self._public_key.encrypt(
             key,
             padding.OAEP(
                 mgf=padding.MGF1(algorithm=hash_algorithm),
@@ -144,6 +143,13 @@ class RsaPeer:
                 label=None,
                 ),
             )
+
+    def make_parcel(self, bundle, sender_identity):
+        key = Fernet.generate_key()
+        fernet = Fernet(key)
+        bundle_cdr = packet_coders.encode(BUNDLE_ENCODING, bundle)
+        encrypted_bundle = fernet.encrypt(bundle_cdr)
+        encrypted_key = self.encrypt_key(key)
         signature = sender_identity.sign(encrypted_bundle)
         return RsaParcel(
             receiver=self,
@@ -227,6 +233,9 @@ class RsaParcel:
     def verify(self):
         return self._signature.verify(self._encrypted_bundle)
 
+    def decrypt(self, identity):
+        return identity.decrypt_parcel(self)
+
     @property
     def sender(self):
         return self._signature.signer
@@ -0,0 +1,95 @@
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from hyperapp.boot.rsa_keygen import generate_private_key_pem
+
+from . import htypes
+from .code.rsa_identity import RSA_KEY_SIZE_FAST, RSA_KEY_SIZE_SAFE, RsaIdentity
+
+log = logging.getLogger(__name__)
+
+
+POOL_SIZE = 2  # Ready identities kept for each key size in use.
+
+_mp_context = multiprocessing.get_context('spawn')
+
+
+class RsaIdentityPool:
+    """Identities pre-generated by worker process in background.
+
+    Generation for a key size is started by first get for it, or earlier by prefill;
+    after that, each taken identity is replaced by a new one. Get generates in place if none is ready.
+    """
+
+    def __init__(self, executor, pool_size=POOL_SIZE):
+        self._executor = executor
+        self._pool_size = pool_size
+        self._lock = threading.Lock()
+        self._ready = {False: deque(), True: deque()}  # fast -> RsaIdentity deque.
+        self._pending_count = {False: 0, True: 0}
+        self._is_stopped = False
+
+    def prefill(self, fast=False):
+        self._refill(fast)
+
+    def ready_count(self, fast=False):
+        with self._lock:
+            return len(self._ready[fast])
+
+    def get(self, fast=False):
+        with self._lock:
+            ready = self._ready[fast]
+            identity = ready.popleft() if ready else None
+        self._refill(fast)
+        if identity:
+            return identity
+        log.info("Identity pool: no ready identity (fast=%s); generating in place", fast)
+        return RsaIdentity.generate(fast)
+
+    def stop(self):
+        with self._lock:
+            self._is_stopped = True
+
+    def _refill(self, fast):
+        with self._lock:
+            if self._is_stopped:
+                return
+            missing_count = self._pool_size - len(self._ready[fast]) - self._pending_count[fast]
+            self._pending_count[fast] += max(missing_count, 0)
+        key_size = RSA_KEY_SIZE_FAST if fast else RSA_KEY_SIZE_SAFE
+        for idx in range(missing_count):
+            future = self._executor.submit(generate_private_key_pem, key_size)
+            future.add_done_callback(partial(self._on_generated, fast, time.monotonic()))
+
+    def _on_generated(self, fast, start, future):
+        with self._lock:
+            self._pending_count[fast] -= 1
+        if future.cancelled():
+            return
+        if future.exception():
+            log.warning("Identity pool: key generation failed: %s", future.exception())
+            return
+        piece = htypes.rsa_identity.rsa_identity(private_key_pem=future.result())
+        identity = RsaIdentity.from_piece(piece)
+        with self._lock:
+            self._ready[fast].append(identity)
+        log.info("Identity pool: generated %s (fast=%s) in %.2f s", identity, fast, time.monotonic() - start)
+
+
+def rsa_identity_pool():
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=_mp_context)
+    pool = RsaIdentityPool(executor)
+    yield pool
+    log.info("Shutdown identity pool")
+    pool.stop()
+    executor.shutdown(cancel_futures=True)
+    log.info("Identity pool is shut down")
+
+
+def generate_rsa_identity(rsa_identity_pool, fast=False):
+    return rsa_identity_pool.get(fast)
@@ -0,0 +1,31 @@
+import time
+
+from .tested.code import rsa_identity_pool as rsa_identity_pool_module
+
+
+def _wait_until_filled(rsa_identity_pool):
+    for idx in range(100):
+        if rsa_identity_pool.ready_count(fast=True) == rsa_identity_pool_module.POOL_SIZE:
+            return
+        time.sleep(0.1)
+    assert False, "Identities are not generated in background"
+
+
+def test_get_starts_refill(rsa_identity_pool):
+    # Nothing is ready yet; Identity is generated in place.
+    identity = rsa_identity_pool.get(fast=True)
+    assert identity.peer
+    _wait_until_filled(rsa_identity_pool)
+
+
+def test_prefilled_identity(rsa_identity_pool):
+    rsa_identity_pool.prefill(fast=True)
+    _wait_until_filled(rsa_identity_pool)
+    identity = rsa_identity_pool.get(fast=True)
+    assert identity.peer
+    assert rsa_identity_pool.ready_count(fast=True) == rsa_identity_pool_module.POOL_SIZE - 1
+
+
+def test_generate_rsa_identity(generate_rsa_identity):
+    identity = generate_rsa_identity(fast=True)
+    assert identity.peer
@@ -0,0 +1,187 @@
+import logging
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from functools import cached_property
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from hyperapp.boot.htypes import bundle_t
+from hyperapp.boot.htypes.packet_coders import packet_coders
+
+from . import htypes
+from .services import (
+    mosaic,
+    web,
+    )
+from .code.rsa_identity import BUNDLE_ENCODING, RsaIdentity, RsaPeer, RsaSignature
+
+log = logging.getLogger(__name__)
+
+
+SESSION_KEY_LIFETIME_SEC = 60 * 60
+# Sender switches to a new key this long before current one expires, so parcels in flight are still accepted.
+SESSION_KEY_ROTATE_MARGIN_SEC = 60
+# Random nonces are safe for AES-GCM for much more parcels than this; rotate well before that.
+SESSION_KEY_MAX_PARCELS = 2**24
+KEY_ID_SIZE = 16
+NONCE_SIZE = 12
+
+
+class SessionKeyExpiredError(Exception):
+    pass
+
+
+_SentKey = namedtuple('_SentKey', 'offer_ref offer aead')
+
+
+def _offer_signed_data(key_id, receiver_public_key_pem, encrypted_key, expires_at):
+    return b''.join([key_id, receiver_public_key_pem, encrypted_key, struct.pack('!Q', expires_at)])
+
+
+class RsaSessionStore:
+    """Symmetric session keys between local identities and remote peers.
+
+    First parcel from identity to peer generates a key, encrypted for receiver and signed by sender.
+    This offer is referenced by every parcel using the key, so it is bundled once per connection,
+    and receiver does RSA operations once per key instead of once per parcel.
+    Keys are rotated before they expire, or after too many parcels.
+    """
+
+    def __init__(self, lifetime_sec=SESSION_KEY_LIFETIME_SEC):
+        self._lifetime_sec = lifetime_sec
+        self._lock = threading.Lock()
+        self._sent_keys = {}  # (sender peer, receiver peer) -> (_SentKey, parcel count)
+        self._verified_offers = {}  # offer ref -> expires_at
+        self._received_keys = {}  # offer ref -> AESGCM
+
+    def make_parcel(self, receiver, bundle, sender_identity):
+        if not isinstance(receiver, RsaPeer) or not isinstance(sender_identity, RsaIdentity):
+            # Fall back to per-parcel keys.
+            return receiver.make_parcel(bundle, sender_identity)
+        sent_key = self._sent_key(receiver, sender_identity)
+        nonce = os.urandom(NONCE_SIZE)
+        bundle_cdr = packet_coders.encode(BUNDLE_ENCODING, bundle)
+        encrypted_bundle = sent_key.aead.encrypt(nonce, bundle_cdr, sent_key.offer.key_id)
+        return SessionParcel(self, sent_key.offer_ref, sent_key.offer, nonce, encrypted_bundle)
+
+    def _sent_key(self, receiver, sender_identity):
+        key = (sender_identity.peer, receiver)
+        now = time.time()
+        with self._lock:
+            sent_key, parcel_count = self._sent_keys.get(key, (None, 0))
+            if (sent_key is None
+                    or sent_key.offer.expires_at - SESSION_KEY_ROTATE_MARGIN_SEC <= now
+                    or parcel_count >= SESSION_KEY_MAX_PARCELS):
+                sent_key = None
+            else:
+                self._sent_keys[key] = (sent_key, parcel_count + 1)
+        if sent_key:
+            return sent_key
+        # RSA operations are done outside of lock. Concurrent senders may both make a new key; last one is kept.
+        sent_key = self._make_sent_key(receiver, sender_identity, now)
+        with self._lock:
+            self._sent_keys[key] = (sent_key, 1)
+        return sent_key
+
+    def _make_sent_key(self, receiver, sender_identity, now):
+        key = AESGCM.generate_key(bit_length=256)
+        key_id = os.urandom(KEY_ID_SIZE)
+        encrypted_key = receiver.encrypt_key(key)
+        expires_at = int(now) + self._lifetime_sec
+        signature = sender_identity.sign(
+            _offer_signed_data(key_id, receiver.public_key_pem, encrypted_key, expires_at))
+        offer = htypes.rsa_session.session_key_offer(
+            key_id=key_id,
+            sender_public_key_pem=sender_identity.peer.public_key_pem,
+            receiver_public_key_pem=receiver.public_key_pem,
+            encrypted_key=encrypted_key,
+            expires_at=expires_at,
+            signature=signature.piece.signature,
+            )
+        log.info("New session key from %s to %s, expires at %s",
+                 sender_identity.peer, receiver, time.ctime(offer.expires_at))
+        return _SentKey(mosaic.put(offer), offer, AESGCM(key))
+
+    def verify_offer(self, offer_ref, offer):
+        now = time.time()
+        if offer.expires_at <= now:
+            raise SessionKeyExpiredError(f"Session key is expired at {time.ctime(offer.expires_at)}")
+        with self._lock:
+            if offer_ref in self._verified_offers:
+                return
+        signer = RsaPeer.from_public_key_pem(offer.sender_public_key_pem)
+        signature = RsaSignature(signer, 'sha256', 'pss', offer.signature)
+        signature.verify(_offer_signed_data(
+            offer.key_id, offer.receiver_public_key_pem, offer.encrypted_key, offer.expires_at))
+        with self._lock:
+            self._remove_expired(now)
+            self._verified_offers[offer_ref] = offer.expires_at
+
+    def received_key(self, offer_ref, offer, identity):
+        self.verify_offer(offer_ref, offer)
+        with self._lock:
+            aead = self._received_keys.get(offer_ref)
+        if aead:
+            return aead
+        if offer.receiver_public_key_pem != identity.peer.public_key_pem:
+            raise RuntimeError(f"Session key is offered to other peer, not to {identity}")
+        aead = AESGCM(identity.decrypt_key(offer.encrypted_key))
+        with self._lock:
+            self._received_keys[offer_ref] = aead
+        return aead
+
+    def _remove_expired(self, now):
+        expired_refs = [ref for ref, expires_at in self._verified_offers.items() if expires_at <= now]
+        for ref in expired_refs:
+            del self._verified_offers[ref]
+            self._received_keys.pop(ref, None)
+
+
+class SessionParcel:
+
+    @classmethod
+    def from_piece(cls, piece, rsa_session_store):
+        offer = web.summon(piece.key_offer_ref)
+        return cls(rsa_session_store, piece.key_offer_ref, offer, piece.nonce, piece.encrypted_bundle)
+
+    def __init__(self, session_store, offer_ref, offer, nonce, encrypted_bundle):
+        self._session_store = session_store
+        self._offer_ref = offer_ref
+        self._offer = offer
+        self._nonce = nonce
+        self._encrypted_bundle = encrypted_bundle
+
+    def __repr__(self):
+        return f'<SessionParcel for: {self.receiver}>'
+
+    @property
+    def piece(self):
+        return htypes.rsa_session.session_parcel(
+            key_offer_ref=self._offer_ref,
+            nonce=self._nonce,
+            encrypted_bundle=self._encrypted_bundle,
+            )
+
+    @cached_property
+    def receiver(self):
+        return RsaPeer.from_public_key_pem(self._offer.receiver_public_key_pem)
+
+    @cached_property
+    def sender(self):
+        return RsaPeer.from_public_key_pem(self._offer.sender_public_key_pem)
+
+    def verify(self):
+        # Signature is verified once per key. Bundle itself is authenticated when decrypted.
+        self._session_store.verify_offer(self._offer_ref, self._offer)
+
+    def decrypt(self, identity):
+        aead = self._session_store.received_key(self._offer_ref, self._offer, identity)
+        bundle_cdr = aead.decrypt(self._nonce, self._encrypted_bundle, self._offer.key_id)
+        return packet_coders.decode(BUNDLE_ENCODING, bundle_cdr, bundle_t)
+
+
+def rsa_session_store():
+    return RsaSessionStore()
@@ -0,0 +1,86 @@
+from unittest.mock import Mock
+
+from hyperapp.boot.htypes import bundle_t
+from hyperapp.boot import cdr_coders  # self-registering
+
+from .services import (
+    mosaic,
+    )
+from .tested.code import rsa_session
+
+
+def _make_bundle(identity):
+    test_ref = mosaic.put(identity.peer.piece)
+    return bundle_t(roots=(test_ref,), associations=(), capsule_list=())
+
+
+def test_session_parcel(parcel_creg, generate_rsa_identity, rsa_session_store):
+    sender_identity = generate_rsa_identity(fast=True)
+    receiver_identity = generate_rsa_identity(fast=True)
+    bundle_1 = _make_bundle(receiver_identity)
+
+    parcel_1 = rsa_session_store.make_parcel(receiver_identity.peer, bundle_1, sender_identity)
+    parcel_1.verify()
+
+    parcel_2 = parcel_creg.animate(parcel_1.piece)
+    assert parcel_2.piece == parcel_1.piece
+    parcel_2.verify()
+
+    assert receiver_identity.peer.piece == parcel_2.receiver.piece
+    assert sender_identity.peer.piece == parcel_2.sender.piece
+
+    bundle_2 = parcel_2.decrypt(receiver_identity)
+    assert bundle_2 == bundle_1
+
+
+def test_session_key_is_reused(generate_rsa_identity):
+    store = rsa_session.RsaSessionStore()
+    sender_identity = generate_rsa_identity(fast=True)
+    receiver_identity = generate_rsa_identity(fast=True)
+    bundle = _make_bundle(receiver_identity)
+
+    parcel_1 = store.make_parcel(receiver_identity.peer, bundle, sender_identity)
+    parcel_2 = store.make_parcel(receiver_identity.peer, bundle, sender_identity)
+    assert parcel_1.piece.key_offer_ref == parcel_2.piece.key_offer_ref
+    assert parcel_1.piece.nonce != parcel_2.piece.nonce
+
+    receiver_store = rsa_session.RsaSessionStore()
+    for parcel in [parcel_1, parcel_2]:
+        received = rsa_session.SessionParcel.from_piece(parcel.piece, receiver_store)
+        assert received.decrypt(receiver_identity) == bundle
+
+
+def test_session_key_rotation(generate_rsa_identity):
+    # Lifetime is shorter than rotate margin: every parcel gets new key.
+    store = rsa_session.RsaSessionStore(lifetime_sec=rsa_session.SESSION_KEY_ROTATE_MARGIN_SEC - 1)
+    sender_identity = generate_rsa_identity(fast=True)
+    receiver_identity = generate_rsa_identity(fast=True)
+    bundle = _make_bundle(receiver_identity)
+
+    parcel_1 = store.make_parcel(receiver_identity.peer, bundle, sender_identity)
+    parcel_2 = store.make_parcel(receiver_identity.peer, bundle, sender_identity)
+    assert parcel_1.piece.key_offer_ref != parcel_2.piece.key_offer_ref
+    assert parcel_2.decrypt(receiver_identity) == bundle
+
+
+def test_expired_session_key(generate_rsa_identity):
+    store = rsa_session.RsaSessionStore(lifetime_sec=-1)
+    sender_identity = generate_rsa_identity(fast=True)
+    receiver_identity = generate_rsa_identity(fast=True)
+    parcel = store.make_parcel(receiver_identity.peer, _make_bundle(receiver_identity), sender_identity)
+    try:
+        parcel.verify()
+    except rsa_session.SessionKeyExpiredError:
+        pass
+    else:
+        assert False, "Expired session key is accepted"
+
+
+def test_fallback_to_per_parcel_key(generate_rsa_identity):
+    store = rsa_session.RsaSessionStore()
+    sender_identity = generate_rsa_identity(fast=True)
+    receiver = Mock()
+    bundle = _make_bundle(sender_identity)
+    parcel = store.make_parcel(receiver, bundle, sender_identity)
+    receiver.make_parcel.assert_called_once_with(bundle, sender_identity)
+    assert parcel is receiver.make_parcel.return_value
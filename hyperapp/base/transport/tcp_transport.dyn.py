@@ -1,11 +1,16 @@
 import logging
-import select
 import selectors
 import socket
 import threading
-from collections import namedtuple
+import time
+import weakref
+from collections import deque, namedtuple
 from functools import partial
 
+from hyperapp.boot.known_refs import KnownRefs
+from hyperapp.boot.packet_buffer import PacketBuffer
+from hyperapp.boot.packet_compression import PacketCompressor
+
 from . import htypes
 from .services import (
     mosaic,
@@ -13,19 +18,42 @@ from .services import (
     )
 from .code.mark import mark
 from .code.transport import RemoteIsGoneError
-from .code.tcp_utils import address_to_str, has_full_tcp_packet, decode_tcp_packet, encode_tcp_packet
+from .code.tcp_utils import (
+    TcpEncoding,
+    address_to_str,
+    decode_tcp_packet,
+    encode_tcp_packet,
+    )
 
 log = logging.getLogger(__name__)
 
 
+SELECTOR_THREAD_NAME = 'TCP-selector'
+# Senders are blocked when more than high watermark bytes are queued for a connection,
+# until queue is drained below low watermark. Selector thread is never blocked.
+SEND_QUEUE_HIGH_WATERMARK = 8 * 1024 * 1024
+SEND_QUEUE_LOW_WATERMARK = 2 * 1024 * 1024
+CONNECT_TIMEOUT_SEC = 10
+
+
 _Services = namedtuple('_Services', [
     'bundler',
     'parcel_creg',
     'transport',
     'route_table',
     'transport_log',
+    'conn_lock',
     'address_to_tcp_conn',
     'tcp_selector',
+    'connections',
+    ])
+
+SendQueueStats = namedtuple('SendQueueStats', [
+    'queued_size',
+    'peak_queued_size',
+    'sent_size',
+    'wait_count',  # Sends blocked by high watermark.
+    'wait_time',  # Total time they were blocked, in seconds.
     ])
 
 
@@ -56,20 +84,42 @@ class Server:
     def _on_accept(self, listen_sock, mask):
         sock, address = listen_sock.accept()
         log.info("%s: Accepted connection from %s", self, address_to_str(address))
+        _set_no_delay(sock)
         sock.setblocking(False)
         connection = Connection(self._svc, address, sock)
-        self._svc.tcp_selector.register(sock, selectors.EVENT_READ, connection.on_read)
+        self._svc.tcp_selector.register(sock, selectors.EVENT_READ, connection.on_event)
+
+
+def _set_no_delay(sock):
+    # Parcels, like responses to requests from one bundle, are sent one after another as they are ready;
+    # Do not hold small ones until previous ones are acknowledged.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
 
 class Connection:
+    """Sent packets are queued and written by selector thread when socket is ready.
+
+    Sending thread writes directly while queue is empty. Writing never blocks.
+    """
 
     def __init__(self, svc, address, sock):
         self._svc = svc
         self._address = address
         self._socket = sock
-        self._buffer = b''
+        self._buffer = PacketBuffer()
         self._this_route = IncomingConnectionRoute(self)
-        self._seen_refs = set()
+        self._seen_refs = KnownRefs()
+        self._encoding = TcpEncoding()
+        self._compressor = PacketCompressor()
+        self._send_lock = threading.Lock()
+        self._send_queue_drained = threading.Condition(self._send_lock)
+        self._send_queue = deque()  # memoryviews of unsent data.
+        self._queued_size = 0
+        self._peak_queued_size = 0
+        self._sent_size = 0
+        self._wait_count = 0
+        self._wait_time = 0
+        svc.connections.add(self)
 
     def __repr__(self):
         return f"<sync tcp Connection from: {address_to_str(self._address)}>"
@@ -78,51 +128,136 @@ class Connection:
     def is_closed(self):
         return self._socket is None
 
+    @property
+    def compression_stats(self):
+        return self._compressor.stats
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def send_queue_stats(self):
+        with self._send_lock:
+            return self._send_queue_stats()
+
+    def _send_queue_stats(self):
+        return SendQueueStats(
+            queued_size=self._queued_size,
+            peak_queued_size=self._peak_queued_size,
+            sent_size=self._sent_size,
+            wait_count=self._wait_count,
+            wait_time=self._wait_time,
+            )
+
     def send(self, parcel):
         parcel_ref = mosaic.put(parcel.piece)
-        refs_and_bundle = self._svc.bundler([parcel_ref], self._seen_refs)
+        refs_and_bundle = self._svc.bundler(self._encoding.bundle_roots(parcel_ref), self._seen_refs)
         self._seen_refs |= refs_and_bundle.ref_set
-        data = encode_tcp_packet(refs_and_bundle.bundle)
+        data = encode_tcp_packet(refs_and_bundle.bundle, self._compressor, self._encoding.encoding)
         self._svc.transport_log.commit_out_message(parcel, 'tcp', refs_and_bundle.bundle, len(data))
-        ofs = 0
-        while ofs < len(data):
-            sent_size = self._socket_send(data[ofs:])
-            log.debug("%s: Sent %d bytes", self, sent_size)
-            if sent_size == 0:
-                raise RuntimeError(f"{self}: remote end closed connection")
-            ofs += sent_size
+        self._enqueue(data)
         log.info("%s: Parcel is sent (%d bytes): %s", self, len(data), parcel_ref)
 
-    def _socket_send(self, data):
-        while True:
+    def _enqueue(self, data):
+        with self._send_lock:
+            if (self._queued_size > SEND_QUEUE_HIGH_WATERMARK
+                    and threading.current_thread().name != SELECTOR_THREAD_NAME):
+                self._wait_for_drain()
+            if self.is_closed:
+                raise RemoteIsGoneError(f"{self}: Connection is closed")
+            was_empty = not self._send_queue
+            self._send_queue.append(memoryview(data))
+            self._queued_size += len(data)
+            self._peak_queued_size = max(self._peak_queued_size, self._queued_size)
+            if was_empty:
+                try:
+                    self._write_queue()
+                except OSError as x:
+                    log.warning("%s: Error sending to remote end: %s", self, x)
+                    self._close()
+                    raise RemoteIsGoneError(f"{self}: Error sending to remote end: {x}") from x
+                if self._send_queue:
+                    self._svc.tcp_selector.modify(
+                        self._socket, selectors.EVENT_READ | selectors.EVENT_WRITE, self.on_event)
+
+    def _wait_for_drain(self):
+        log.info("%s: Send queue is full (%d bytes); waiting", self, self._queued_size)
+        start = time.monotonic()
+        while self._queued_size > SEND_QUEUE_LOW_WATERMARK and not self.is_closed:
+            self._send_queue_drained.wait()
+        self._wait_count += 1
+        self._wait_time += time.monotonic() - start
+
+    def _write_queue(self):
+        # Called with send lock held. Writes until queue is empty or socket buffer is full.
+        while self._send_queue:
+            data = self._send_queue[0]
+            try:
+                sent_size = self._socket.send(data)
+            except BlockingIOError:
+                break
+            log.debug("%s: Sent %d bytes", self, sent_size)
+            self._queued_size -= sent_size
+            self._sent_size += sent_size
+            if sent_size < len(data):
+                self._send_queue[0] = data[sent_size:]
+                break
+            self._send_queue.popleft()
+        if self._queued_size <= SEND_QUEUE_LOW_WATERMARK:
+            self._send_queue_drained.notify_all()
+
+    def on_event(self, sock, mask):
+        if mask & selectors.EVENT_WRITE:
+            self._on_write(sock)
+        if mask & selectors.EVENT_READ and not self.is_closed:
+            self.on_read(sock)
+
+    def _on_write(self, sock):
+        with self._send_lock:
             try:
-                return self._socket.send(data)
+                self._write_queue()
             except OSError as x:
-                if x.errno != socket.errno.EAGAIN:
-                    raise
-            rd, wr, er = select.select([], [self._socket], [])
-            assert wr
+                log.warning("%s: Error sending to remote end: %s", self, x)
+                self._close()
+                return
+            if not self._send_queue:
+                self._svc.tcp_selector.modify(sock, selectors.EVENT_READ, self.on_event)
 
-    def on_read(self, sock, mask):
+    def on_read(self, sock):
         try:
-            data = sock.recv(1024**2)
+            size = self._buffer.recv_from_socket(sock)
         except ConnectionResetError as x:
             log.warning("%s: Remote end reset connection: %s", self, x)
         else:
-            if data == b'':
+            if size == 0:
                 log.info("%s: Remote end closed connection", self)
             else:
-                self._buffer += data
                 self._process_buffer()
                 return
-        self._svc.tcp_selector.unregister(sock)
+        with self._send_lock:
+            self._close()
+
+    def _close(self):
+        # Called with send lock held.
+        log.info("%s: Compression: %s; send queue: %s", self, self._compressor.stats, self._send_queue_stats())
+        self._svc.tcp_selector.unregister(self._socket)
         self._socket = None
+        self._send_queue.clear()
+        self._queued_size = 0
+        self._send_queue_drained.notify_all()
+        self._svc.connections.discard(self)
+        with self._svc.conn_lock:
+            # It may be already replaced by reconnected one. Incoming connections are not there.
+            if self._svc.address_to_tcp_conn.get(self._address) is self:
+                log.debug("Remove connection %s from cache", self)
+                del self._svc.address_to_tcp_conn[self._address]
 
     def _process_buffer(self):
-        while has_full_tcp_packet(self._buffer):
-            bundle, packet_size = decode_tcp_packet(self._buffer)
-            self._buffer = self._buffer[packet_size:]
-            self._process_bundle(bundle, packet_size)
+        while packet := self._buffer.pop_packet():
+            bundle, encoding = decode_tcp_packet(packet, self._compressor)
+            self._encoding.received(bundle, encoding)
+            self._process_bundle(bundle, packet.size)
 
     def _process_bundle(self, bundle, packet_size):
         parcel_ref = bundle.roots[0]
@@ -176,6 +311,9 @@ class Route:
         conn = self._tcp_connection_factory(self._address)
         conn.send(parcel)
 
+    def reconnect(self):
+        self._tcp_connection_factory(self._address)
+
 
 class IncomingConnectionRoute:
 
@@ -202,7 +340,7 @@ def _address_to_tcp_conn():
 
 
 @mark.service
-def _tcp_selector(system_failed, _address_to_tcp_conn):
+def _tcp_selector(system_failed):
     tcp_stop_signal = threading.Event()
     selector = selectors.DefaultSelector()
 
@@ -214,16 +352,12 @@ def _tcp_selector(system_failed, _address_to_tcp_conn):
                 for key, mask in event_list:
                     handler = key.data
                     handler(key.fileobj, mask)
-                for address, conn in list(_address_to_tcp_conn.items()):
-                    if conn.is_closed:
-                        log.debug("Remove connection %s from cache", conn)
-                        del _address_to_tcp_conn[address]
         except Exception as x:
             log.exception("TCP selector thread is failed:")
             system_failed(f"TCP selector thread is failed: {x}", x)
         log.info("TCP selector thread is finished.")
 
-    thread = threading.Thread(target=main, name="TCP-selector")
+    thread = threading.Thread(target=main, name=SELECTOR_THREAD_NAME)
     thread.start()
 
     yield selector
@@ -250,25 +384,53 @@ def _tcp_services(
         transport=transport,
         route_table=route_table,
         transport_log=transport_log,
+        conn_lock=threading.Lock(),
         address_to_tcp_conn=_address_to_tcp_conn,
         tcp_selector=_tcp_selector,
+        connections=weakref.WeakSet(),
         )
 
 
+@mark.service
+def tcp_send_queue_stats(_tcp_services):
+
+    def get_stats():
+        # Address -> SendQueueStats, for all open connections.
+        return {
+            conn.address: conn.send_queue_stats
+            for conn in list(_tcp_services.connections)
+            }
+
+    return get_stats
+
+
 @mark.service
 def tcp_connection_factory(_tcp_services, address):
     svc = _tcp_services
-    connection = svc.address_to_tcp_conn.get(address)
-    if not connection:
-        sock = socket.socket()
-        try:
-            sock.connect(address)
-        except ConnectionRefusedError as x:
-            raise RuntimeError(f"Connecting to %s: %s", address, x)
-        sock.setblocking(False)
+    # Concurrent senders to the same address should share one connection.
+    with svc.conn_lock:
+        connection = svc.address_to_tcp_conn.get(address)
+    if connection and not connection.is_closed:
+        return connection
+    # Connect without lock: selector thread takes it to drop closed connections.
+    sock = socket.socket()
+    sock.settimeout(CONNECT_TIMEOUT_SEC)
+    try:
+        sock.connect(address)
+    except OSError as x:
+        sock.close()
+        raise RemoteIsGoneError(f"Connecting to {address_to_str(address)}: {x}")
+    _set_no_delay(sock)
+    sock.setblocking(False)
+    with svc.conn_lock:
+        connection = svc.address_to_tcp_conn.get(address)
+        if connection and not connection.is_closed:
+            log.debug("Connection to %s is already made by another thread", address_to_str(address))
+            sock.close()
+            return connection
         connection = Connection(svc, address, sock)
+        svc.tcp_selector.register(sock, selectors.EVENT_READ, connection.on_event)
         svc.address_to_tcp_conn[address] = connection
-        svc.tcp_selector.register(sock, selectors.EVENT_READ, connection.on_read)
     return connection
 
 
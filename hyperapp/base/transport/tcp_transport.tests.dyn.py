@@ -1,4 +1,10 @@
 import logging
+import selectors
+import socket
+import struct
+import threading
+import time
+from unittest.mock import Mock
 
 from hyperapp.boot.htypes.packet_coders import packet_coders
 
@@ -82,3 +88,77 @@ def test_tcp_call(
         assert _callback_message == ['hello']
         log.info("Stopping: %r", process)
     log.info("Stopped: %r", process)
+
+
+def test_send_queue():
+    selector = Mock()
+    svc = Mock(tcp_selector=selector, connections=set())
+    sender_sock, receiver_sock = socket.socketpair()
+    with sender_sock, receiver_sock:
+        sender_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        sender_sock.setblocking(False)
+        conn = tcp_transport.Connection(svc, ('localhost', 0), sender_sock)
+        data = b'x' * 1024**2
+        # Socket buffer is small, so most of data is queued, and is written when socket is ready.
+        conn._enqueue(data)
+        conn._enqueue(data)
+        stats = conn.send_queue_stats
+        assert 0 < stats.queued_size < 2 * len(data)
+        assert stats.sent_size + stats.queued_size == 2 * len(data)
+        selector.modify.assert_called_once()
+        received = b''
+        while len(received) < 2 * len(data):
+            received += receiver_sock.recv(1024**2)
+            conn.on_event(sender_sock, selectors.EVENT_WRITE)
+        assert received == data + data
+        assert conn.send_queue_stats.queued_size == 0
+        assert conn.send_queue_stats.peak_queued_size == stats.peak_queued_size
+        assert selector.modify.call_args.args[1] == selectors.EVENT_READ
+
+
+def test_send_to_reset_peer():
+    svc = Mock(connections=set(), conn_lock=threading.Lock(), address_to_tcp_conn={})
+    listen_sock = socket.create_server(('localhost', 0))
+    with listen_sock:
+        sender_sock = socket.create_connection(listen_sock.getsockname())
+        receiver_sock, address = listen_sock.accept()
+    # Zero linger time makes close reset the connection.
+    receiver_sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+    receiver_sock.close()
+    sender_sock.setblocking(False)
+    conn = tcp_transport.Connection(svc, address, sender_sock)
+    svc.address_to_tcp_conn[address] = conn
+    try:
+        for idx in range(100):
+            conn._enqueue(b'x' * 1024)
+            time.sleep(0.01)
+    except tcp_transport.RemoteIsGoneError:
+        pass
+    else:
+        assert False, "Sending to reset peer did not fail"
+    finally:
+        sender_sock.close()
+    assert conn.is_closed
+    assert conn.send_queue_stats.queued_size == 0
+    assert address not in svc.address_to_tcp_conn
+    svc.tcp_selector.unregister.assert_called_once_with(sender_sock)
+
+
+def test_connect_race_keeps_existing_connection():
+    # Other thread stored it's connection while this one was connecting.
+    existing_conn = Mock(is_closed=False)
+    address_to_tcp_conn = Mock()
+    address_to_tcp_conn.get.side_effect = [None, existing_conn]
+    svc = Mock(connections=set(), conn_lock=threading.Lock(), address_to_tcp_conn=address_to_tcp_conn)
+    with socket.create_server(('localhost', 0)) as listen_sock:
+        conn = tcp_transport.tcp_connection_factory(svc, listen_sock.getsockname())
+        assert conn is existing_conn
+        svc.tcp_selector.register.assert_not_called()
+        # Socket connected by this thread is closed.
+        accepted_sock, address = listen_sock.accept()
+        with accepted_sock:
+            assert accepted_sock.recv(1) == b''
+
+
+def test_send_queue_stats_service(tcp_send_queue_stats):
+    assert isinstance(tcp_send_queue_stats(), dict)
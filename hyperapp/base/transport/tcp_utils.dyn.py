@@ -1,12 +1,41 @@
-import struct
-
 from hyperapp.boot.htypes import bundle_t
-from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.packet_buffer import HEADER
+from hyperapp.boot.packet_compression import split_encoding
+
+from .services import (
+    mosaic,
+    )
+
+
+# Packet is: header, encoding, packet data. Packets are received using PacketBuffer.
+# Encoding may have compression suffix: 'cdr2+zlib'.
+TCP_BUNDLE_ENCODING = 'cdr2'
+# Peers knowing only 'cdr' fail on any other encoding; it is used until peer shows it accepts cdr2.
+LEGACY_TCP_BUNDLE_ENCODING = 'cdr'
+# Sent as extra bundle root while legacy encoding is used. Older peers use only first root and ignore it.
+CDR2_ANNOUNCE = 'tcp-bundle-encoding: cdr2'
+
 
+class TcpEncoding:
+    """Encoding of bundles sent over one connection.
 
-# utf-8 encoded encoding size, packet data size
-STRUCT_FORMAT = '!QQ'
-TCP_BUNDLE_ENCODING = 'cdr'
+    Starts with legacy encoding, announcing cdr2 with every bundle.
+    Switches to cdr2 once peer sends cdr2 packet or announces it.
+    """
+
+    def __init__(self):
+        self.encoding = LEGACY_TCP_BUNDLE_ENCODING
+
+    def bundle_roots(self, parcel_ref):
+        if self.encoding == TCP_BUNDLE_ENCODING:
+            return [parcel_ref]
+        return [parcel_ref, mosaic.put(CDR2_ANNOUNCE)]
+
+    def received(self, bundle, base_encoding):
+        if self.encoding == TCP_BUNDLE_ENCODING:
+            return
+        if base_encoding == TCP_BUNDLE_ENCODING or mosaic.put(CDR2_ANNOUNCE) in bundle.roots[1:]:
+            self.encoding = TCP_BUNDLE_ENCODING
 
 
 def address_to_str(address):
@@ -16,28 +45,16 @@ def address_to_str(address):
     return f'{host}:{port}'
 
 
-def has_full_tcp_packet(data):
-    header_size = struct.calcsize(STRUCT_FORMAT)
-    if len(data) < header_size:
-        return False
-    encoding_size, size = struct.unpack(STRUCT_FORMAT, data[:header_size])
-    return len(data) >= header_size + encoding_size + size
-
-
-def decode_tcp_packet(data):
-    assert has_full_tcp_packet(data)
-    header_size = struct.calcsize(STRUCT_FORMAT)
-    encoding_size, size = struct.unpack(STRUCT_FORMAT, data[:header_size])
-    encoding = data[header_size:header_size + encoding_size].decode()
-    packet_data = data[header_size + encoding_size:header_size + encoding_size + size]
-    bundle = packet_coders.decode(encoding, packet_data, bundle_t)
-    return (bundle, header_size + encoding_size + size)
+def decode_tcp_packet(packet, compressor):
+    # Returns bundle and it's encoding without compression suffix.
+    bundle = compressor.decode(packet.encoding, packet.data, bundle_t)
+    base_encoding, compression = split_encoding(packet.encoding)
+    return (bundle, base_encoding)
 
 
-def encode_tcp_packet(bundle):
+def encode_tcp_packet(bundle, compressor, encoding):
     assert isinstance(bundle, bundle_t), repr(bundle)
-    encoding = TCP_BUNDLE_ENCODING
-    packet_data = packet_coders.encode(encoding, bundle)
+    encoding, packet_data = compressor.encode(bundle, encoding, bundle_t)
     encoded_encoding = encoding.encode()
-    header = struct.pack(STRUCT_FORMAT, len(encoded_encoding), len(packet_data))
+    header = HEADER.pack(len(encoded_encoding), len(packet_data))
     return header + encoded_encoding + packet_data
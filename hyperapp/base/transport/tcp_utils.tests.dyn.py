@@ -0,0 +1,34 @@
+from hyperapp.boot.htypes import bundle_t
+
+from .services import (
+    mosaic,
+    )
+from .tested.code import tcp_utils
+
+
+def _bundle(roots):
+    return bundle_t(roots=tuple(roots), associations=(), capsule_list=())
+
+
+def test_legacy_peer():
+    encoding = tcp_utils.TcpEncoding()
+    parcel_ref = mosaic.put('parcel')
+    assert encoding.encoding == 'cdr'
+    assert len(encoding.bundle_roots(parcel_ref)) == 2
+    # Peer not knowing cdr2 replies without announcing it.
+    encoding.received(_bundle([parcel_ref]), 'cdr')
+    assert encoding.encoding == 'cdr'
+
+
+def test_announced_cdr2():
+    encoding = tcp_utils.TcpEncoding()
+    parcel_ref = mosaic.put('parcel')
+    encoding.received(_bundle(encoding.bundle_roots(parcel_ref)), 'cdr')
+    assert encoding.encoding == 'cdr2'
+    assert encoding.bundle_roots(parcel_ref) == [parcel_ref]
+
+
+def test_received_cdr2():
+    encoding = tcp_utils.TcpEncoding()
+    encoding.received(_bundle([mosaic.put('parcel')]), 'cdr2')
+    assert encoding.encoding == 'cdr2'
@@ -1,21 +1,60 @@
 import logging
-from collections import defaultdict
+import threading
+import uuid
+
+from hyperapp.boot.htypes import bundle_t
+from hyperapp.boot.known_refs import KnownRefs
+
+from . import htypes
+from .services import (
+    mosaic,
+    )
 
 log = logging.getLogger(__name__)
 
 
+STREAM_WINDOW = 8  # Chunks sent but not yet acknowledged by receiver.
+STREAM_ACK_TIMEOUT = 30  # Seconds.
+
+
 class RemoteIsGoneError(Exception):
     pass
 
 
+class StreamAckTimeoutError(Exception):
+    pass
+
+
+class _OutStream:
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.acked_seq = -1
+
+
+class _SendingRefs:
+    # Refs known to receiver plus ones being sent to it. Latter become known only when they are sent.
+
+    def __init__(self, known_refs, ref_set):
+        self._known_refs = known_refs
+        self._ref_set = ref_set
+
+    def __contains__(self, ref):
+        return ref in self._ref_set or ref in self._known_refs
+
+
 class Transport:
 
-    def __init__(self, bundler, route_table, transport_log, message_size_limit):
+    def __init__(self, bundler, route_table, route_manager, transport_log, rsa_session_store, message_size_limit):
         self._bundler = bundler
+        self._session_store = rsa_session_store
         self._route_table = route_table
+        self._route_manager = route_manager
         self._log = transport_log
-        self._receiver_peer_to_seen_refs = defaultdict(set)
+        self._lock = threading.Lock()
+        self._receiver_peer_to_known_refs = {}
         self._message_size_limit = message_size_limit
+        self._out_streams = {}  # stream id -> _OutStream.
 
     def send_parcel(self, parcel):
         route_list = self._route_table.peer_route_list(parcel.receiver)
@@ -25,19 +64,126 @@ class Transport:
         available_route_list = [route for route in route_list if route.available]
         if not available_route_list:
             raise RuntimeError(f"No available route for peer {parcel.receiver}")
-        route, *_ = available_route_list
-        log.debug("Send parcel %s by route %s (all routes: %s)", parcel, route, route_list)
-        route.send(parcel)
+        # Fail over to next route when one is failed. Failed routes are tried last, so error is raised only
+        # if all of them are failed.
+        for route in self._route_manager.ordered_routes(parcel.receiver, available_route_list):
+            log.debug("Send parcel %s by route %s (all routes: %s)", parcel, route, route_list)
+            try:
+                route.send(parcel)
+            except Exception as x:
+                self._route_manager.on_failed(parcel.receiver, route, x)
+                error = x
+                continue
+            self._route_manager.on_sent(parcel.receiver, route)
+            return
+        raise error
 
     def send(self, receiver, sender_identity, ref_list):
         log.debug("Send ref list %s to %s from %s", ref_list, receiver, sender_identity)
-        seen_refs = self._receiver_peer_to_seen_refs[receiver.piece]
-        refs_and_bundle = self._bundler(ref_list, seen_refs, size_limit=self._message_size_limit)
-        seen_refs |= refs_and_bundle.ref_set
-        parcel = receiver.make_parcel(refs_and_bundle.bundle, sender_identity)
-        self._log.add_out_message(parcel, refs_and_bundle.bundle)
+        known_refs = self._known_refs(receiver)
+        refs_and_bundle = self._bundler(ref_list, known_refs)
+        ref_set = set(refs_and_bundle.ref_set)
+        bundle = refs_and_bundle.bundle
+        if self._message_size_limit and _capsules_size(bundle.capsule_list) > self._message_size_limit:
+            self._send_stream(receiver, sender_identity, _SendingRefs(known_refs, ref_set), ref_set, bundle)
+        else:
+            self._send_bundle(receiver, sender_identity, bundle)
+        # Raised error skips this, so refs of failed send are bundled again next time.
+        known_refs |= ref_set
+
+    def on_stream_ack(self, stream_id, seq):
+        with self._lock:
+            stream = self._out_streams.get(stream_id)
+        if not stream:
+            log.debug("Ack for unknown or finished stream %s #%d", stream_id, seq)
+            return
+        with stream.condition:
+            stream.acked_seq = max(stream.acked_seq, seq)
+            stream.condition.notify_all()
+
+    def _send_bundle(self, receiver, sender_identity, bundle):
+        parcel = self._session_store.make_parcel(receiver, bundle, sender_identity)
+        self._log.add_out_message(parcel, bundle)
         self.send_parcel(parcel)
 
+    def _send_stream(self, receiver, sender_identity, seen_refs, ref_set, bundle):
+        # Bundle capsules are in type-dependency order; chunks keep that order.
+        # Associations are registered only when their pieces are all available, so they go with last chunk.
+        # Receiver processes roots when it gets last chunk.
+        chunk_list = list(_split_capsules(bundle.capsule_list, self._message_size_limit))
+        stream_id = str(uuid.uuid4())
+        stream = _OutStream()
+        log.info("Send bundle to %s as stream %s of %d chunks", receiver, stream_id, len(chunk_list))
+        with self._lock:
+            self._out_streams[stream_id] = stream
+        try:
+            for seq, capsule_list in enumerate(chunk_list):
+                is_last = seq == len(chunk_list) - 1
+                self._wait_for_window(stream, stream_id, seq)
+                chunk = htypes.transport.stream_chunk(
+                    stream_id=stream_id,
+                    seq=seq,
+                    chunk_count=len(chunk_list),
+                    ref_list=bundle.roots if is_last else (),
+                    )
+                chunk_rb = self._bundler([mosaic.put(chunk)], seen_refs)
+                ref_set |= chunk_rb.ref_set
+                chunk_bundle = bundle_t(
+                    roots=chunk_rb.bundle.roots,
+                    associations=bundle.associations if is_last else (),
+                    capsule_list=(*capsule_list, *chunk_rb.bundle.capsule_list),
+                    )
+                self._send_bundle(receiver, sender_identity, chunk_bundle)
+        finally:
+            with self._lock:
+                del self._out_streams[stream_id]
+
+    @staticmethod
+    def _wait_for_window(stream, stream_id, seq):
+        with stream.condition:
+            is_open = stream.condition.wait_for(
+                lambda: seq - stream.acked_seq <= STREAM_WINDOW, timeout=STREAM_ACK_TIMEOUT)
+        if not is_open:
+            raise StreamAckTimeoutError(
+                f"Stream {stream_id}: chunk #{stream.acked_seq + 1} is not acknowledged in {STREAM_ACK_TIMEOUT} seconds")
+
+    def resend_missing_refs(self, receiver, sender_identity, request_id, ref_list):
+        # Receiver lacks refs we considered known to it: it was restarted or it's cache evicted them.
+        # Forget everything it is known to have, so whole closure of missing refs is bundled.
+        log.info("Resend %d missing refs for request %s to %s", len(ref_list), request_id, receiver)
+        self._known_refs(receiver).clear()
+        resent_refs = htypes.transport.resent_refs(
+            request_id=request_id,
+            ref_list=tuple(ref_list),
+            )
+        self.send(receiver, sender_identity, [mosaic.put(resent_refs)])
+
+    def _known_refs(self, receiver):
+        with self._lock:
+            try:
+                return self._receiver_peer_to_known_refs[receiver.piece]
+            except KeyError:
+                known_refs = self._receiver_peer_to_known_refs[receiver.piece] = KnownRefs()
+                return known_refs
+
+
+def _capsules_size(capsule_list):
+    return sum(len(capsule.encoded_object) for capsule in capsule_list)
+
+
+def _split_capsules(capsule_list, size_limit):
+    chunk = []
+    size = 0
+    for capsule in capsule_list:
+        capsule_size = len(capsule.encoded_object)
+        if chunk and size + capsule_size > size_limit:
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(capsule)
+        size += capsule_size
+    yield chunk
+
 
-def transport(config, bundler, route_table, transport_log):
-    return Transport(bundler, route_table, transport_log, config.message_size_limit)
+def transport(config, bundler, route_table, route_manager, transport_log, rsa_session_store):
+    return Transport(bundler, route_table, route_manager, transport_log, rsa_session_store, config.message_size_limit)
@@ -0,0 +1,126 @@
+import threading
+import time
+from unittest.mock import Mock
+
+from . import htypes
+from .services import (
+    mosaic,
+    )
+from .tested.code import transport
+
+
+def _make_transport(bundler, route_manager, message_size_limit, route_list=None):
+    parcel_list = []
+    if route_list is None:
+        route = Mock(available=True)
+        route.send = parcel_list.append
+        route_list = [route]
+    route_table = Mock()
+    route_table.peer_route_list.return_value = route_list
+    session_store = Mock()
+    session_store.make_parcel = lambda receiver, bundle, sender_identity: Mock(receiver=receiver, bundle=bundle)
+    tr = transport.Transport(bundler, route_table, route_manager, Mock(), session_store, message_size_limit)
+    return (tr, parcel_list)
+
+
+def test_small_bundle_is_sent_as_is(bundler, route_manager):
+    tr, parcel_list = _make_transport(bundler, route_manager, message_size_limit=1024)
+    ref = mosaic.put("Small transport test value")
+    tr.send(Mock(), Mock(), [ref])
+    [parcel] = parcel_list
+    assert parcel.bundle.roots == (ref,)
+
+
+def test_big_bundle_is_sent_as_stream(bundler, route_manager):
+    tr, parcel_list = _make_transport(bundler, route_manager, message_size_limit=1024)
+    element_refs = tuple(mosaic.put(f"Transport stream test value #{idx}: " + 'x' * 300) for idx in range(10))
+    ref = mosaic.put(element_refs)
+    full_bundle = bundler([ref]).bundle
+    tr.send(Mock(), Mock(), [ref])
+    assert len(parcel_list) > 1
+    capsule_list = []
+    for seq, parcel in enumerate(parcel_list):
+        [chunk_ref] = parcel.bundle.roots
+        chunk = mosaic.resolve_ref(chunk_ref).value
+        assert isinstance(chunk, htypes.transport.stream_chunk)
+        assert chunk.seq == seq
+        assert chunk.chunk_count == len(parcel_list)
+        is_last = seq == len(parcel_list) - 1
+        assert chunk.ref_list == ((ref,) if is_last else ())
+        capsule_list += [
+            capsule for capsule in parcel.bundle.capsule_list
+            if capsule in full_bundle.capsule_list
+            ]
+    assert capsule_list == list(full_bundle.capsule_list)
+
+
+def test_resent_refs_are_not_truncated(bundler, route_manager):
+    tr, parcel_list = _make_transport(bundler, route_manager, message_size_limit=1024)
+    element_refs = tuple(mosaic.put(f"Transport resend test value #{idx}: " + 'x' * 300) for idx in range(10))
+    ref = mosaic.put(element_refs)
+    receiver = Mock()
+    tr.send(receiver, Mock(), [ref])
+    parcel_list.clear()
+    tr.resend_missing_refs(receiver, Mock(), 'test-request', [ref])
+    sent_capsules = {capsule for parcel in parcel_list for capsule in parcel.bundle.capsule_list}
+    for element_ref in [ref, *element_refs]:
+        assert mosaic.get(element_ref) in sent_capsules
+
+
+def test_stream_waits_for_ack(bundler, route_manager):
+    tr, parcel_list = _make_transport(bundler, route_manager, message_size_limit=1024)
+    chunk_count = transport.STREAM_WINDOW * 2
+    element_refs = tuple(
+        mosaic.put(f"Transport stream ack test value #{idx}: " + 'x' * 1000)
+        for idx in range(chunk_count)
+        )
+    thread = threading.Thread(target=tr.send, args=(Mock(), Mock(), [mosaic.put(element_refs)]))
+    thread.start()
+    for idx in range(100):
+        if len(parcel_list) >= transport.STREAM_WINDOW:
+            break
+        time.sleep(0.01)
+    time.sleep(0.1)
+    # Window is full: none of sent chunks is acknowledged.
+    assert len(parcel_list) == transport.STREAM_WINDOW
+    [chunk_ref] = parcel_list[0].bundle.roots
+    stream_id = mosaic.resolve_ref(chunk_ref).value.stream_id
+    seq = 0
+    while thread.is_alive() and seq < 10 * chunk_count:
+        tr.on_stream_ack(stream_id, seq)
+        seq += 1
+        time.sleep(0.01)
+    thread.join()
+    assert len(parcel_list) >= chunk_count
+
+
+def test_failed_route_is_failed_over(bundler, route_manager):
+    parcel_list = []
+    failed_route = Mock(available=True, piece='failed route piece')
+    failed_route.send.side_effect = RuntimeError("Test route failure")
+    good_route = Mock(available=True, piece='good route piece')
+    good_route.send = parcel_list.append
+    tr, _ = _make_transport(bundler, route_manager, message_size_limit=1024, route_list=[failed_route, good_route])
+    receiver = Mock()
+    tr.send(receiver, Mock(), [mosaic.put("Failover test value")])
+    assert len(parcel_list) == 1
+    failed_route.send.assert_called_once()
+    # Failed route is tried last now.
+    tr.send(receiver, Mock(), [mosaic.put("Failover test value 2")])
+    assert len(parcel_list) == 2
+    failed_route.send.assert_called_once()
+
+
+def test_failed_send_refs_are_not_known(bundler, route_manager):
+    failed_route = Mock(available=True, piece='failed route piece')
+    failed_route.send.side_effect = RuntimeError("Test route failure")
+    tr, _ = _make_transport(bundler, route_manager, message_size_limit=1024, route_list=[failed_route])
+    receiver = Mock()
+    ref = mosaic.put("Failed send test value")
+    try:
+        tr.send(receiver, Mock(), [ref])
+    except RuntimeError:
+        pass
+    else:
+        assert False, "Send error is not raised"
+    assert ref not in tr._known_refs(receiver)
@@ -39,6 +39,11 @@ class AssociationRegistry:
         self._by_base = defaultdict(list)
         self._by_cfg_item_key = {}
         self._hook = lambda service_name, cfg_item: None  # Do we need several hooks or weak refs?
+        self._version = 0  # Incremented on every change, lets users invalidate their caches.
+
+    @property
+    def version(self):
+        return self._version
 
     def set_hook(self, hook):
         self._hook = hook
@@ -69,11 +74,13 @@ class AssociationRegistry:
         self._by_cfg_item_key[ass.cfg_item_key] = ass
         for base in ass.bases:
             self._by_base[base].append(ass)
+        self._version += 1
 
     def _remove(self, ass):
         del self._by_cfg_item_key[ass.cfg_item_key]
         for base in ass.bases:
             self._by_base[base].remove(ass)
+        self._version += 1
         
     def base_to_ass_list(self, base):
         return self._by_base.get(base, [])
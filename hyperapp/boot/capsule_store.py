@@ -0,0 +1,420 @@
+# persistent content-addressed capsule storage: append-only segment files plus memory-mapped index
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+from .htypes import capsule_t
+from .htypes.packet_coders import packet_coders
+from .ref import make_ref
+
+log = logging.getLogger(__name__)
+
+
+STORE_ENCODING = 'cdr'
+DEFAULT_SEGMENT_SIZE_LIMIT = 64 * 1024 * 1024
+DEFAULT_INDEX_TAIL_LIMIT = 10000  # Rewrite index when this many records are appended after it.
+
+# Segment record: header, then key (encoded ref), then data (encoded capsule).
+# Crc covers key and data, and is used to detect torn writes on recovery.
+_record_header = struct.Struct('!IHI')  # crc32, key size, data size
+
+# Index file: header, segment table, entries sorted by digest, crc32 of all preceding bytes.
+_INDEX_MAGIC = b'HCSI'
+_INDEX_VERSION = 1
+_index_header = struct.Struct('!4sHIQQ')  # magic, version, segment count, entry count, live size
+_index_segment = struct.Struct('!IQ')  # segment id, indexed size
+_index_entry = struct.Struct('!16sIQI')  # key digest, segment id, offset, record size
+_index_crc = struct.Struct('!I')
+
+_SEGMENT_NAME_RE = re.compile(r'^segment-(\d{8})$')
+
+_Location = namedtuple('_Location', 'segment_id offset size')
+
+CapsuleStoreStats = namedtuple('CapsuleStoreStats', 'entry_count segment_count total_size live_size')
+
+
+class CapsuleStoreError(RuntimeError):
+    pass
+
+
+def _ref_key(ref):
+    return ref.hash_algorithm.encode() + b':' + ref.hash
+
+
+def _key_digest(key):
+    return hashlib.blake2b(key, digest_size=16).digest()
+
+
+def _segment_name(segment_id):
+    return f'segment-{segment_id:08d}'
+
+
+class _Index:
+    # Read-only view of index file, memory-mapped.
+
+    @classmethod
+    def load(cls, path):
+        try:
+            file = path.open('rb')
+        except FileNotFoundError:
+            return None
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            if size < _index_header.size + _index_crc.size:
+                log.warning("Capsule store index %s is truncated; rebuilding", path)
+                return None
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls._from_mmap(path, mm, size)
+        except CapsuleStoreError as x:
+            mm.close()
+            log.warning("Capsule store index %s is broken (%s); rebuilding", path, x)
+            return None
+
+    @classmethod
+    def _from_mmap(cls, path, mm, size):
+        crc_ofs = size - _index_crc.size
+        [crc] = _index_crc.unpack_from(mm, crc_ofs)
+        if zlib.crc32(memoryview(mm)[:crc_ofs]) != crc:
+            raise CapsuleStoreError("crc mismatch")
+        magic, version, segment_count, entry_count, live_size = _index_header.unpack_from(mm, 0)
+        if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+            raise CapsuleStoreError(f"unknown format: {magic!r} v{version}")
+        segments = dict(
+            _index_segment.iter_unpack(mm[_index_header.size:_index_header.size + segment_count * _index_segment.size]))
+        entries_ofs = _index_header.size + segment_count * _index_segment.size
+        if entries_ofs + entry_count * _index_entry.size != crc_ofs:
+            raise CapsuleStoreError("size mismatch")
+        return cls(mm, segments, entries_ofs, entry_count, live_size)
+
+    def __init__(self, mm, segments, entries_ofs, entry_count, live_size):
+        self._mm = mm
+        self.segments = segments  # segment id -> indexed size
+        self._entries_ofs = entries_ofs
+        self.entry_count = entry_count
+        self.live_size = live_size
+
+    def close(self):
+        self._mm.close()
+
+    def _entry(self, idx):
+        return _index_entry.unpack_from(self._mm, self._entries_ofs + idx * _index_entry.size)
+
+    def entries(self):
+        data = self._mm[self._entries_ofs:self._entries_ofs + self.entry_count * _index_entry.size]
+        return _index_entry.iter_unpack(data)
+
+    def find(self, digest):
+        # Binary search; yields locations of all entries with this digest.
+        lo, hi = 0, self.entry_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            ofs = self._entries_ofs + mid * _index_entry.size
+            if self._mm[ofs:ofs + 16] < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        for idx in range(lo, self.entry_count):
+            entry_digest, segment_id, offset, size = self._entry(idx)
+            if entry_digest != digest:
+                break
+            yield _Location(segment_id, offset, size)
+
+
+def _write_index(path, segments, entries, live_size):
+    # Index is written to temporary file and atomically moved over the old one.
+    # Entries are (digest, segment_id, offset, size) tuples.
+    entries = sorted(entries)
+    chunks = [_index_header.pack(_INDEX_MAGIC, _INDEX_VERSION, len(segments), len(entries), live_size)]
+    chunks += [_index_segment.pack(segment_id, size) for segment_id, size in sorted(segments.items())]
+    chunks += [_index_entry.pack(*entry) for entry in entries]
+    data = b''.join(chunks)
+    data += _index_crc.pack(zlib.crc32(data))
+    temp_path = path.with_name(path.name + '.tmp')
+    with temp_path.open('wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CapsuleStore:
+    """Capsules keyed by ref, stored in append-only segment files under a directory.
+
+    Index file maps ref digests to record locations. It is memory-mapped on open
+    and replaced atomically when rewritten. Records appended after the last index
+    write are found by scanning segment tails on open; a torn last record is truncated.
+    Store may be used as a Web source.
+    """
+
+    def __init__(self, path, segment_size_limit=DEFAULT_SEGMENT_SIZE_LIMIT, index_tail_limit=DEFAULT_INDEX_TAIL_LIMIT):
+        self.path = path
+        self._segment_size_limit = segment_size_limit
+        self._index_tail_limit = index_tail_limit
+        self._lock = threading.Lock()
+        self._index = None
+        self._tail = {}  # key -> _Location, records not in index file yet.
+        self._segment_sizes = {}  # segment id -> size
+        self._segment_fds = {}  # segment id -> read fd
+        self._active_file = None
+        self._active_segment_id = None
+        path.mkdir(parents=True, exist_ok=True)
+        self._lock_file = (path / 'lock').open('wb')
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise CapsuleStoreError(f"Capsule store {path} is used by another process")
+        self._open()
+
+    @property
+    def _index_path(self):
+        return self.path / 'index'
+
+    def _segment_path(self, segment_id):
+        return self.path / _segment_name(segment_id)
+
+    def _open(self):
+        self._index = _Index.load(self._index_path)
+        segment_ids = sorted(
+            int(m.group(1)) for m in map(_SEGMENT_NAME_RE.match, os.listdir(self.path)) if m)
+        if self._index:
+            max_indexed_id = max(self._index.segments, default=0)
+        else:
+            max_indexed_id = 0
+        for segment_id in segment_ids:
+            if self._index and segment_id in self._index.segments:
+                indexed_size = self._index.segments[segment_id]
+            elif segment_id <= max_indexed_id:
+                # Left by interrupted compaction: these records were dropped.
+                log.info("Capsule store %s: Removing stale segment #%d", self.path, segment_id)
+                self._segment_path(segment_id).unlink()
+                continue
+            else:
+                indexed_size = 0
+            self._segment_sizes[segment_id] = self._recover_tail(segment_id, indexed_size)
+        log.info("Capsule store %s: %d indexed and %d recovered records in %d segments",
+                 self.path, self._index.entry_count if self._index else 0, len(self._tail), len(self._segment_sizes))
+
+    def _recover_tail(self, segment_id, indexed_size):
+        # Read records appended after index was written. Returns valid segment size.
+        path = self._segment_path(segment_id)
+        size = path.stat().st_size
+        if size < indexed_size:
+            raise CapsuleStoreError(f"Segment {path} is shorter ({size}) than indexed ({indexed_size})")
+        if size == indexed_size:
+            return size
+        with path.open('rb') as file:
+            file.seek(indexed_size)
+            data = file.read()
+        ofs = 0
+        while ofs < len(data):
+            if ofs + _record_header.size > len(data):
+                break
+            crc, key_size, data_size = _record_header.unpack_from(data, ofs)
+            record_size = _record_header.size + key_size + data_size
+            body = data[ofs + _record_header.size:ofs + record_size]
+            if len(body) != key_size + data_size or zlib.crc32(body) != crc:
+                break
+            self._tail[bytes(body[:key_size])] = _Location(segment_id, indexed_size + ofs, record_size)
+            ofs += record_size
+        valid_size = indexed_size + ofs
+        if valid_size != size:
+            log.warning("Capsule store %s: Truncating torn record at %s:%d", self.path, path.name, valid_size)
+            with path.open('r+b') as file:
+                file.truncate(valid_size)
+        return valid_size
+
+    def close(self):
+        with self._lock:
+            if self._tail:
+                self._write_index()
+            self._close_files()
+            if self._index:
+                self._index.close()
+                self._index = None
+        self._lock_file.close()
+
+    def _close_files(self):
+        if self._active_file:
+            self._active_file.close()
+            self._active_file = None
+            self._active_segment_id = None
+        for fd in self._segment_fds.values():
+            os.close(fd)
+        self._segment_fds.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, tb):
+        self.close()
+
+    def __len__(self):
+        index_count = self._index.entry_count if self._index else 0
+        return index_count + len(self._tail)
+
+    def __contains__(self, ref):
+        # Does not read the record; 128-bit digest match is trusted here.
+        key = _ref_key(ref)
+        with self._lock:
+            if key in self._tail:
+                return True
+            if not self._index:
+                return False
+            return next(self._index.find(_key_digest(key)), None) is not None
+
+    @property
+    def stats(self):
+        total_size = sum(self._segment_sizes.values())
+        return CapsuleStoreStats(
+            entry_count=len(self),
+            segment_count=len(self._segment_sizes),
+            total_size=total_size,
+            live_size=self._index.live_size if self._index else 0,
+            )
+
+    def _find(self, key):
+        # Returns (location, data) or None.
+        location = self._tail.get(key)
+        if location:
+            return (location, self._read_data(location, key))
+        if not self._index:
+            return None
+        for location in self._index.find(_key_digest(key)):
+            data = self._read_data(location, key)
+            if data is not None:
+                return (location, data)
+        return None
+
+    def _read_data(self, location, key):
+        try:
+            fd = self._segment_fds[location.segment_id]
+        except KeyError:
+            fd = os.open(self._segment_path(location.segment_id), os.O_RDONLY)
+            self._segment_fds[location.segment_id] = fd
+        record = os.pread(fd, location.size, location.offset)
+        crc, key_size, data_size = _record_header.unpack_from(record, 0)
+        ofs = _record_header.size
+        if record[ofs:ofs + key_size] != key:
+            return None  # Digest collision.
+        return record[ofs + key_size:ofs + key_size + data_size]
+
+    def pull(self, ref):
+        key = _ref_key(ref)
+        with self._lock:
+            found = self._find(key)
+        if not found:
+            return None
+        location, data = found
+        return packet_coders.decode(STORE_ENCODING, data, capsule_t)
+
+    def put(self, capsule, ref=None):
+        if ref is None:
+            ref = make_ref(capsule)
+        key = _ref_key(ref)
+        with self._lock:
+            if self._find(key) is None:
+                data = packet_coders.encode(STORE_ENCODING, capsule, capsule_t)
+                self._tail[key] = self._append(key, data)
+                if len(self._tail) >= self._index_tail_limit:
+                    self._write_index()
+        return ref
+
+    def _append(self, key, data):
+        body = key + data
+        record = _record_header.pack(zlib.crc32(body), len(key), len(data)) + body
+        segment_id = self._active_segment_id
+        if segment_id is None or self._segment_sizes[segment_id] + len(record) > self._segment_size_limit:
+            segment_id = self._start_segment()
+        offset = self._segment_sizes[segment_id]
+        self._active_file.write(record)
+        # Records are read with pread, bypassing file buffer.
+        self._active_file.flush()
+        self._segment_sizes[segment_id] = offset + len(record)
+        return _Location(segment_id, offset, len(record))
+
+    def _start_segment(self):
+        if self._active_file:
+            self._active_file.close()
+        segment_id = max(self._segment_sizes, default=0) + 1
+        if self._index:
+            segment_id = max(segment_id, max(self._index.segments, default=0) + 1)
+        self._active_file = self._segment_path(segment_id).open('ab')
+        self._active_segment_id = segment_id
+        self._segment_sizes[segment_id] = 0
+        return segment_id
+
+    def sync(self):
+        # Make all appended records durable and indexed.
+        with self._lock:
+            if self._tail:
+                self._write_index()
+
+    def _write_index(self, live_size=None):
+        if self._active_file:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+        entries = list(self._index.entries()) if self._index else []
+        entries += [
+            (_key_digest(key), *location)
+            for key, location in self._tail.items()
+            ]
+        if live_size is None:
+            live_size = self._index.live_size if self._index else 0
+        _write_index(self._index_path, self._segment_sizes, entries, live_size)
+        if self._index:
+            self._index.close()
+        self._index = _Index.load(self._index_path)
+        self._tail.clear()
+
+    def compact(self, live_refs):
+        """Rewrite store keeping only capsules for live_refs. Others are dropped."""
+        with self._lock:
+            old_segment_ids = list(self._segment_sizes)
+            if self._active_file:
+                self._active_file.close()
+                self._active_file = None
+                self._active_segment_id = None
+            # Live records are copied to new segments, with ids above all existing ones.
+            new_tail = {}
+            for ref in live_refs:
+                key = _ref_key(ref)
+                if key in new_tail:
+                    continue
+                found = self._find(key)
+                if found:
+                    location, data = found
+                    new_tail[key] = self._append(key, data)
+            # Index switches to new segments atomically; old ones are removed after that.
+            if self._index:
+                self._index.close()
+                self._index = None
+            self._tail = new_tail
+            for segment_id in old_segment_ids:
+                del self._segment_sizes[segment_id]
+            live_size = sum(self._segment_sizes.values())
+            self._write_index(live_size)
+            for fd in self._segment_fds.values():
+                os.close(fd)
+            self._segment_fds.clear()
+            for segment_id in old_segment_ids:
+                self._segment_path(segment_id).unlink()
+            log.info("Capsule store %s: Compacted to %d records, %d bytes", self.path, len(new_tail), live_size)
@@ -0,0 +1,202 @@
+from datetime import timedelta, timezone
+
+from .htypes import (
+    TNone,
+    TString,
+    TBinary,
+    TInt,
+    TBool,
+    TDateTime,
+    TOptional,
+    TList,
+    TRecord,
+    TException,
+    TRef,
+    )
+from .htypes.packet_coders import DecodeError
+from .cdr_decoder import MAX_SANE_LIST_SIZE
+from .cdr2_encoder import MAX_INTERNED_SIZE, EPOCH_NAIVE
+
+
+# Decoder is called as decoder(buf, ofs, strings) and returns (value, next_ofs) tuple.
+# Strings is a list of strings interned so far.
+
+
+class _Cdr2Error(Exception):
+    pass
+
+
+_offset_to_timezone = {0: timezone.utc}
+
+
+def _read_varint(buf, ofs):
+    byte = buf[ofs]
+    ofs += 1
+    if byte < 0x80:
+        return (byte, ofs)
+    value = byte & 0x7f
+    shift = 7
+    while True:
+        byte = buf[ofs]
+        ofs += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (value, ofs)
+        shift += 7
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _read_sized(buf, ofs, size):
+    next_ofs = ofs + size
+    if next_ofs > len(buf):
+        raise _Cdr2Error(f"Unexpected EOF while reading {size} bytes at {ofs}. Total size is {len(buf)}")
+    return (buf[ofs:next_ofs], next_ofs)
+
+
+def _timezone(offset):
+    try:
+        return _offset_to_timezone[offset]
+    except KeyError:
+        pass
+    tz = timezone(timedelta(seconds=offset))
+    _offset_to_timezone[offset] = tz
+    return tz
+
+
+def _decode_none(buf, ofs, strings):
+    return (None, ofs)
+
+
+def _decode_int(buf, ofs, strings):
+    value, ofs = _read_varint(buf, ofs)
+    return (_unzigzag(value), ofs)
+
+
+def _decode_bool(buf, ofs, strings):
+    return (buf[ofs] != 0, ofs + 1)
+
+
+def _decode_binary(buf, ofs, strings):
+    size, ofs = _read_varint(buf, ofs)
+    data, ofs = _read_sized(buf, ofs, size)
+    return (bytes(data), ofs)
+
+
+def _decode_string(buf, ofs, strings):
+    tag, ofs = _read_varint(buf, ofs)
+    if tag & 1:
+        idx = tag >> 1
+        if idx >= len(strings):
+            raise _Cdr2Error(f"Reference to unknown interned string #{idx}; there are only {len(strings)}")
+        return (strings[idx], ofs)
+    size = tag >> 1
+    data, ofs = _read_sized(buf, ofs, size)
+    value = str(data, 'utf-8')
+    if size <= MAX_INTERNED_SIZE:
+        strings.append(value)
+    return (value, ofs)
+
+
+def _decode_datetime(buf, ofs, strings):
+    microseconds, ofs = _read_varint(buf, ofs)
+    tz_tag, ofs = _read_varint(buf, ofs)
+    microseconds = _unzigzag(microseconds)
+    if not tz_tag:
+        return (EPOCH_NAIVE + timedelta(microseconds=microseconds), ofs)
+    offset = _unzigzag(tz_tag >> 1)
+    local = EPOCH_NAIVE + timedelta(microseconds=microseconds, seconds=offset)
+    return (local.replace(tzinfo=_timezone(offset)), ofs)
+
+
+def _optional_decoder(t):
+    base_decoder = _type_to_decoder(t.base_t)
+
+    def decode_optional(buf, ofs, strings):
+        if buf[ofs]:
+            return base_decoder(buf, ofs + 1, strings)
+        else:
+            return (None, ofs + 1)
+
+    return decode_optional
+
+
+def _list_decoder(t):
+    elt_decoder = _type_to_decoder(t.element_t)
+
+    def decode_list(buf, ofs, strings):
+        size, ofs = _read_varint(buf, ofs)
+        if size > MAX_SANE_LIST_SIZE:
+            raise _Cdr2Error(f"List size is too large: {size}")
+        elements = []
+        for idx in range(size):
+            elt, ofs = elt_decoder(buf, ofs, strings)
+            elements.append(elt)
+        return (tuple(elements), ofs)
+
+    return decode_list
+
+
+def _record_decoder(t):
+    decoders = [_type_to_decoder(field_t) for field_t in t.fields.values()]
+
+    def decode_record(buf, ofs, strings):
+        values = []
+        for decoder in decoders:
+            value, ofs = decoder(buf, ofs, strings)
+            values.append(value)
+        return (t.instantiate_trusted(values), ofs)
+
+    return decode_record
+
+
+_type_to_primitive_decoder = {
+    TNone: _decode_none,
+    TBinary: _decode_binary,
+    TString: _decode_string,
+    TInt: _decode_int,
+    TBool: _decode_bool,
+    TDateTime: _decode_datetime,
+    }
+
+_type_to_decoder_ctr = {
+    TOptional: _optional_decoder,
+    TList: _list_decoder,
+    TRecord: _record_decoder,
+    TException: _record_decoder,
+    TRef: _record_decoder,
+    }
+
+
+_type_to_decoder_cache = {}
+
+
+def _type_to_decoder(t):
+    try:
+        return _type_to_decoder_cache[t]
+    except KeyError:
+        pass
+    tt = type(t)
+    try:
+        decoder = _type_to_primitive_decoder[tt]
+    except KeyError:
+        ctr = _type_to_decoder_ctr[tt]
+        decoder = ctr(t)
+    _type_to_decoder_cache[t] = decoder
+    return decoder
+
+
+class Cdr2Decoder:
+
+    @staticmethod
+    def decode(t, value):
+        decoder = _type_to_decoder(t)
+        try:
+            result, ofs = decoder(memoryview(value), 0, [])
+        except _Cdr2Error as x:
+            raise DecodeError(f"{t}: {x}") from x
+        except (IndexError, UnicodeDecodeError, OverflowError) as x:
+            raise DecodeError(f"{t}: Malformed cdr2 data: {x}") from x
+        return result
@@ -0,0 +1,195 @@
+from datetime import datetime, timezone
+from operator import attrgetter, itemgetter
+
+from .htypes import (
+    TNone,
+    TString,
+    TBinary,
+    TInt,
+    TBool,
+    TDateTime,
+    TOptional,
+    TRecord,
+    TException,
+    TList,
+    TRef,
+    )
+
+
+# Strings with encoded size up to this are interned: repeated ones are written as back-references.
+MAX_INTERNED_SIZE = 64
+
+EPOCH_NAIVE = datetime(1970, 1, 1)
+EPOCH_AWARE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class _EncodeBuffer(bytearray):
+
+    def __init__(self):
+        super().__init__()
+        self.strings = {}  # interned string -> it's index.
+
+
+def encode_varint(buf, value):
+    # Unsigned LEB128.
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _zigzag(value):
+    # Maps signed ints to unsigned ones, so small negative values have short encodings too.
+    if value >= 0:
+        return value << 1
+    return ((-value) << 1) - 1
+
+
+def _timedelta_to_microseconds(td):
+    return (td.days * 86400 + td.seconds) * 1000000 + td.microseconds
+
+
+def _encode_none(buf, value):
+    pass
+
+
+def _encode_int(buf, value):
+    if 0 <= value < 0x40:
+        buf.append(value << 1)
+    else:
+        encode_varint(buf, _zigzag(value))
+
+
+def _encode_bool(buf, value):
+    buf.append(1 if value else 0)
+
+
+def _encode_binary(buf, value):
+    encode_varint(buf, len(value))
+    buf += value
+
+
+def _encode_string(buf, value):
+    # Tag is (index << 1 | 1) for back-reference to interned string, (size << 1) for a literal.
+    strings = buf.strings
+    idx = strings.get(value)
+    if idx is not None:
+        encode_varint(buf, idx << 1 | 1)
+        return
+    if type(value) is bytes:
+        data = value
+    else:
+        data = value.encode('utf-8')
+    size = len(data)
+    if size <= MAX_INTERNED_SIZE:
+        strings[value] = len(strings)
+    encode_varint(buf, size << 1)
+    buf += data
+
+
+def _encode_datetime(buf, value):
+    # Microseconds since epoch, followed by timezone tag:
+    # 0 for naive datetime, (zigzag(utc offset seconds) << 1 | 1) for aware one.
+    offset = value.utcoffset()
+    if offset is None:
+        encode_varint(buf, _zigzag(_timedelta_to_microseconds(value - EPOCH_NAIVE)))
+        buf.append(0)
+    else:
+        encode_varint(buf, _zigzag(_timedelta_to_microseconds(value - EPOCH_AWARE)))
+        encode_varint(buf, _zigzag(offset.days * 86400 + offset.seconds) << 1 | 1)
+
+
+def _optional_encoder(t):
+    base_encoder = _type_to_encoder(t.base_t)
+
+    def encode_optional(buf, value):
+        if value is None:
+            buf.append(0)
+        else:
+            buf.append(1)
+            base_encoder(buf, value)
+
+    return encode_optional
+
+
+def _list_encoder(t):
+    elt_encoder = _type_to_encoder(t.element_t)
+
+    def encode_list(buf, value):
+        encode_varint(buf, len(value))
+        for elt in value:
+            elt_encoder(buf, elt)
+
+    return encode_list
+
+
+def _record_encoder(t):
+    # Record values are tuples, so fields are fetched by index. Exceptions are not.
+    if isinstance(t, TException):
+        make_getter = attrgetter
+    else:
+        make_getter = itemgetter
+    steps = []
+    for idx, (name, field_t) in enumerate(t.fields.items()):
+        if type(field_t) is TNone:
+            continue
+        key = name if isinstance(t, TException) else idx
+        steps.append((make_getter(key), _type_to_encoder(field_t)))
+
+    def encode_record(buf, value):
+        for getter, encoder in steps:
+            encoder(buf, getter(value))
+
+    return encode_record
+
+
+_type_to_primitive_encoder = {
+    TNone: _encode_none,
+    TBinary: _encode_binary,
+    TString: _encode_string,
+    TInt: _encode_int,
+    TBool: _encode_bool,
+    TDateTime: _encode_datetime,
+    }
+
+_type_to_encoder_ctr = {
+    TOptional: _optional_encoder,
+    TList: _list_encoder,
+    TRecord: _record_encoder,
+    TException: _record_encoder,
+    TRef: _record_encoder,
+    }
+
+
+_type_to_encoder_cache = {}
+
+
+def _type_to_encoder(t):
+    try:
+        return _type_to_encoder_cache[t]
+    except KeyError:
+        pass
+    tt = type(t)
+    try:
+        encoder = _type_to_primitive_encoder[tt]
+    except KeyError:
+        ctr = _type_to_encoder_ctr[tt]
+        encoder = ctr(t)
+    _type_to_encoder_cache[t] = encoder
+    return encoder
+
+
+class Cdr2Encoder:
+    """Compact variant of CDR.
+
+    Ints and sizes are LEB128 varints, signed ones zigzag-encoded. Datetimes are
+    microseconds since epoch with UTC offset. Short strings are interned within
+    one encoded value: repeated ones are written as index of their first occurrence.
+    """
+
+    @staticmethod
+    def encode(value, t):
+        encoder = _type_to_encoder(t)
+        buf = _EncodeBuffer()
+        encoder(buf, value)
+        return bytes(buf)
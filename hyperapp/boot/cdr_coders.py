@@ -1,6 +1,9 @@
 from .htypes.packet_coders import packet_coders
 from .cdr_encoder import CdrEncoder
 from .cdr_decoder import CdrDecoder
+from .cdr2_encoder import Cdr2Encoder
+from .cdr2_decoder import Cdr2Decoder
 
 
 packet_coders.register('cdr', CdrEncoder, CdrDecoder)
+packet_coders.register('cdr2', Cdr2Encoder, Cdr2Decoder)
@@ -147,11 +147,11 @@ class RecordDecoder:
         self._field_to_decoder = field_to_decoder
 
     def __call__(self, buf, path):
-        fields = {
-            name: decoder(buf, [*path, name])
+        values = [
+            decoder(buf, [*path, name])
             for name, decoder in self._field_to_decoder.items()
-            }
-        return self._t(**fields)
+            ]
+        return self._t.instantiate_trusted(values)
 
 
 _type_to_primitive_decoder = {
@@ -192,10 +192,193 @@ def _type_to_decoder(t):
     return decoder
 
 
+# Fast path decoders: read from memoryview at offsets, do not track paths.
+# Fast decoder is called as decoder(buf, ofs) and returns (value, next_ofs) tuple.
+# Any failure is reported by re-running path-tracking decoder above.
+
+
+class _FastPathError(Exception):
+    pass
+
+
+_int_unpack_from = DecodeBuffer._int_struct.unpack_from
+
+# Primitive types with fixed-size encoding -> struct format character.
+_type_to_fixed_format = {
+    TInt: 'q',
+    TBool: '?',
+    }
+
+
+def _fast_decode_none(buf, ofs):
+    return (None, ofs)
+
+
+def _fast_decode_int(buf, ofs):
+    return (_int_unpack_from(buf, ofs)[0], ofs + 8)
+
+
+def _fast_decode_bool(buf, ofs):
+    return (buf[ofs] != 0, ofs + 1)
+
+
+def _read_sized(buf, ofs):
+    size = _int_unpack_from(buf, ofs)[0]
+    ofs += 8
+    next_ofs = ofs + size
+    if size < 0 or next_ofs > len(buf):
+        raise _FastPathError()
+    return (buf[ofs:next_ofs], next_ofs)
+
+
+def _fast_decode_binary(buf, ofs):
+    data, ofs = _read_sized(buf, ofs)
+    return (bytes(data), ofs)
+
+
+def _fast_decode_string(buf, ofs):
+    data, ofs = _read_sized(buf, ofs)
+    return (str(data, 'utf-8'), ofs)
+
+
+def _fast_decode_datetime(buf, ofs):
+    value, ofs = _fast_decode_string(buf, ofs)
+    return (dateutil.parser.parse(value), ofs)
+
+
+def _fast_optional_decoder(t):
+    base_decoder = _type_to_fast_decoder(t.base_t)
+
+    def decode_optional(buf, ofs):
+        if buf[ofs]:
+            return base_decoder(buf, ofs + 1)
+        else:
+            return (None, ofs + 1)
+
+    return decode_optional
+
+
+def _fast_list_decoder(t):
+    fmt = _type_to_fixed_format.get(type(t.element_t))
+    if fmt:
+        elt_size = struct.calcsize('!' + fmt)
+
+        def decode_fixed_list(buf, ofs):
+            size = _int_unpack_from(buf, ofs)[0]
+            ofs += 8
+            if size < 0 or ofs + size * elt_size > len(buf):
+                raise _FastPathError()
+            return (struct.unpack_from(f'!{size}{fmt}', buf, ofs), ofs + size * elt_size)
+
+        return decode_fixed_list
+
+    elt_decoder = _type_to_fast_decoder(t.element_t)
+
+    def decode_list(buf, ofs):
+        size = _int_unpack_from(buf, ofs)[0]
+        ofs += 8
+        if size < 0 or size > MAX_SANE_LIST_SIZE:
+            raise _FastPathError()
+        elements = []
+        for idx in range(size):
+            elt, ofs = elt_decoder(buf, ofs)
+            elements.append(elt)
+        return (tuple(elements), ofs)
+
+    return decode_list
+
+
+def _fast_record_steps(t):
+    # Returns list of (unpack_from, size, decoder) tuples.
+    # Runs of fixed-size fields are merged into single step with struct unpacker, and no decoder.
+    steps = []
+    run_fmt = ''
+
+    def flush_run():
+        if run_fmt:
+            st = struct.Struct('!' + run_fmt)
+            steps.append((st.unpack_from, st.size, None))
+
+    for field_t in t.fields.values():
+        fmt = _type_to_fixed_format.get(type(field_t))
+        if fmt:
+            run_fmt += fmt
+            continue
+        flush_run()
+        run_fmt = ''
+        steps.append((None, 0, _type_to_fast_decoder(field_t)))
+    flush_run()
+    return steps
+
+
+def _fast_record_decoder(t):
+    steps = _fast_record_steps(t)
+
+    def decode_record(buf, ofs):
+        values = []
+        for unpack_from, size, decoder in steps:
+            if decoder is None:
+                values += unpack_from(buf, ofs)
+                ofs += size
+            else:
+                value, ofs = decoder(buf, ofs)
+                values.append(value)
+        return (t.instantiate_trusted(values), ofs)
+
+    return decode_record
+
+
+_type_to_fast_primitive_decoder = {
+    TNone: _fast_decode_none,
+    TBinary: _fast_decode_binary,
+    TString: _fast_decode_string,
+    TInt: _fast_decode_int,
+    TBool: _fast_decode_bool,
+    TDateTime: _fast_decode_datetime,
+    }
+
+_type_to_fast_decoder_ctr = {
+    TOptional: _fast_optional_decoder,
+    TList: _fast_list_decoder,
+    TRecord: _fast_record_decoder,
+    TException: _fast_record_decoder,
+    TRef: _fast_record_decoder,
+    }
+
+
+_type_to_fast_decoder_cache = {}
+
+
+def _type_to_fast_decoder(t):
+    try:
+        return _type_to_fast_decoder_cache[t]
+    except KeyError:
+        pass
+    tt = type(t)
+    try:
+        decoder = _type_to_fast_primitive_decoder[tt]
+    except KeyError:
+        ctr = _type_to_fast_decoder_ctr[tt]
+        decoder = ctr(t)
+    _type_to_fast_decoder_cache[t] = decoder
+    return decoder
+
+
 class CdrDecoder:
 
     @staticmethod
     def decode(t, value):
+        decoder = _type_to_fast_decoder(t)
+        try:
+            result, ofs = decoder(memoryview(value), 0)
+            return result
+        except Exception:
+            # Fast path does not know where it failed. Decode again, tracking paths,
+            # to get same error as before.
+            return CdrDecoder.decode_with_path(t, value)
+
+    @staticmethod
+    def decode_with_path(t, value):
         decoder = _type_to_decoder(t)
-        buf = DecodeBuffer(value)
+        buf = DecodeBuffer(bytes(value))
         return decoder(buf, path=[])
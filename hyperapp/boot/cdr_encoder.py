@@ -1,93 +1,193 @@
-import io
 import struct
-from functools import singledispatchmethod
+from operator import attrgetter, itemgetter
 
 from .htypes import (
     TNone,
     TString,
     TBinary,
-    tBinary,
     TInt,
     TBool,
     TDateTime,
-    tString,
     TOptional,
     TRecord,
     TException,
     TList,
+    TRef,
     )
 
 
-class CdrEncoder(object):
+_int_pack = struct.Struct('!q').pack
+_bool_pack = struct.Struct('!?').pack
 
-    _int_struct = struct.Struct('!q')
-    _bool_struct = struct.Struct('!?')
+_optional_missing = _bool_pack(False)
+_optional_present = _bool_pack(True)
 
-    def encode(self, value, t):
-        self._buf = io.BytesIO()
-        self.dispatch(t, value)
-        return self._buf.getvalue()
+# Primitive types with fixed-size encoding -> struct format character.
+# Adjacent fields of these types are packed with a single struct.pack call.
+_type_to_fixed_format = {
+    TInt: 'q',
+    TBool: '?',
+    }
 
-    @singledispatchmethod
-    def dispatch(self, t, value):
-        assert False, repr((t, value))  # Unknown type
 
-    def write_int(self, value):
-        self._buf.write(self._int_struct.pack(value))
+def _encode_none(buf, value):
+    pass
 
-    def write_bool(self, value):
-        self._buf.write(self._bool_struct.pack(value))
 
-    def write_binary(self, value):
-        # assert isinstance(value, bytes), repr(value)
-        self.write_int(len(value))
-        self._buf.write(value)
+def _encode_int(buf, value):
+    buf += _int_pack(value)
 
-    def write_unicode(self, value):
-        if type(value) is not bytes:
-            value = value.encode('utf-8')
-        self.write_int(len(value))
-        self._buf.write(value)
 
-    @dispatch.register(TNone)
-    def encode_none(self, t, value):
-        pass
+def _encode_bool(buf, value):
+    buf += _bool_pack(value)
+
+
+def _encode_binary(buf, value):
+    buf += _int_pack(len(value))
+    buf += value
+
+
+def _encode_string(buf, value):
+    if type(value) is not bytes:
+        value = value.encode('utf-8')
+    buf += _int_pack(len(value))
+    buf += value
+
+
+def _encode_datetime(buf, value):
+    _encode_string(buf, value.isoformat())
+
+
+def _fixed_run_encoder(fmt):
+    pack = struct.Struct('!' + fmt).pack
+
+    def encode_fixed_run(buf, values):
+        buf += pack(*values)
+
+    return encode_fixed_run
 
-    @dispatch.register(TInt)
-    def encode_int(self, t, value):
-        self.write_int(value)
-
-    @dispatch.register(TBool)
-    def encode_bool(self, t, value):
-        self.write_bool(value)
-
-    @dispatch.register(TBinary)
-    def encode_binary(self, t, value):
-        self.write_binary(value)
-
-    @dispatch.register(TString)
-    def encode_string(self, t, value):
-        self.write_unicode(value)
-
-    @dispatch.register(TDateTime)
-    def encode_datetime(self, t, value):
-        self.write_unicode(value.isoformat())
-
-    @dispatch.register(TOptional)
-    def encode_optional(self, t, value):
-        self.write_bool(value is not None)
-        if value is not None:
-            self.dispatch(t.base_t, value)
-
-    @dispatch.register(TRecord)
-    @dispatch.register(TException)
-    def encode_record(self, t, value):
-        ## print '*** encoding record', value, t, [field.name for field in t.fields]
-        for field_name, field_type in t.fields.items():
-            self.dispatch(field_type, getattr(value, field_name))
-
-    @dispatch.register(TList)
-    def encode_list(self, t, value):
-        self.write_int(len(value))
+
+def _optional_encoder(t):
+    base_encoder = _type_to_encoder(t.base_t)
+
+    def encode_optional(buf, value):
+        if value is None:
+            buf += _optional_missing
+        else:
+            buf += _optional_present
+            base_encoder(buf, value)
+
+    return encode_optional
+
+
+def _list_encoder(t):
+    fmt = _type_to_fixed_format.get(type(t.element_t))
+    if fmt:
+
+        def encode_fixed_list(buf, value):
+            size = len(value)
+            buf += struct.pack(f'!q{size}{fmt}', size, *value)
+
+        return encode_fixed_list
+
+    elt_encoder = _type_to_encoder(t.element_t)
+
+    def encode_list(buf, value):
+        buf += _int_pack(len(value))
         for elt in value:
-            self.dispatch(t.element_t, elt)
+            elt_encoder(buf, elt)
+
+    return encode_list
+
+
+def _record_steps(t, make_getter):
+    # Returns list of (getter, encoder) pairs. Runs of fixed-size fields are merged
+    # into single step with getter returning tuple of their values.
+    steps = []
+    run_keys = []
+    run_fmt = ''
+
+    def flush_run():
+        if len(run_keys) == 1:
+            steps.append((make_getter(run_keys[0]), _type_to_encoder(run_t)))
+        elif run_keys:
+            steps.append((make_getter(*run_keys), _fixed_run_encoder(run_fmt)))
+
+    for idx, (name, field_t) in enumerate(t.fields.items()):
+        if type(field_t) is TNone:
+            continue
+        key = name if isinstance(t, TException) else idx
+        fmt = _type_to_fixed_format.get(type(field_t))
+        if fmt:
+            run_keys.append(key)
+            run_fmt += fmt
+            run_t = field_t
+            continue
+        flush_run()
+        run_keys = []
+        run_fmt = ''
+        steps.append((make_getter(key), _type_to_encoder(field_t)))
+    flush_run()
+    return steps
+
+
+def _record_encoder(t):
+    # Record values are tuples, so fields are fetched by index. Exceptions are not.
+    if isinstance(t, TException):
+        make_getter = attrgetter
+    else:
+        make_getter = itemgetter
+    steps = _record_steps(t, make_getter)
+
+    def encode_record(buf, value):
+        for getter, encoder in steps:
+            encoder(buf, getter(value))
+
+    return encode_record
+
+
+_type_to_primitive_encoder = {
+    TNone: _encode_none,
+    TBinary: _encode_binary,
+    TString: _encode_string,
+    TInt: _encode_int,
+    TBool: _encode_bool,
+    TDateTime: _encode_datetime,
+    }
+
+_type_to_encoder_ctr = {
+    TOptional: _optional_encoder,
+    TList: _list_encoder,
+    TRecord: _record_encoder,
+    TException: _record_encoder,
+    TRef: _record_encoder,
+    }
+
+
+# Global cache, persists between systems, same as decoder one.
+_type_to_encoder_cache = {}
+
+
+def _type_to_encoder(t):
+    try:
+        return _type_to_encoder_cache[t]
+    except KeyError:
+        pass
+    tt = type(t)
+    try:
+        encoder = _type_to_primitive_encoder[tt]
+    except KeyError:
+        ctr = _type_to_encoder_ctr[tt]
+        encoder = ctr(t)
+    _type_to_encoder_cache[t] = encoder
+    return encoder
+
+
+class CdrEncoder:
+
+    @staticmethod
+    def encode(value, t):
+        encoder = _type_to_encoder(t)
+        buf = bytearray()
+        encoder(buf, value)
+        return bytes(buf)
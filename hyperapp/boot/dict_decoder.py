@@ -99,7 +99,7 @@ class DictDecoder(metaclass=abc.ABCMeta):
     def _decode_record_impl(self, t, value, path):
         self.expect_type(path, isinstance(value, dict), value, 'record (dict)')
         fields = self.decode_record_fields(t.fields, value, path)
-        return t(**fields)
+        return t.instantiate_trusted(fields.get(name) for name in t.fields)
 
     @dispatch.register(TList)
     def _decode_list(self, t, value, path):
@@ -200,6 +200,10 @@ class TException(Type):
             self._check_field_types(*args, **kw)
         return self._named_tuple(*args, _t=self, **kw)
 
+    def instantiate_trusted(self, values):
+        # Values are known to match field types, like ones produced by decoders.
+        return self._named_tuple(*values, self)
+
     def _check_field_types(self, *args, **kw):
         for (name, t), value in zip(self.fields.items(), args):
             assert isinstance(value, t), f"{name}: expected {t}, but got: {value!r}"
@@ -255,6 +255,11 @@ class TRecord(Type):
             self._check_field_types(*args, **kw)
         return self._named_tuple(*args, _t=self, **kw)
 
+    def instantiate_trusted(self, values):
+        # Values are known to match field types, like ones produced by decoders.
+        # No checks are performed and no kwargs are used.
+        return tuple.__new__(self._named_tuple, (*values, self))
+
     def _check_field_types(self, *args, **kw):
         for (name, t), value in zip(self.fields.items(), args):
             if not isinstance(value, t):
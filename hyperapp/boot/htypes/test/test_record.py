@@ -194,3 +194,16 @@ def test_default_value():
         some_int_opt=None,
         some_int_list=(),
         )
+
+
+def test_instantiate_trusted():
+    module_name = 'test_instantiate_trusted'
+    t = TRecord(module_name, 'test_record', {
+        'some_str': tString,
+        'some_int': tInt,
+        })
+    rec = t.instantiate_trusted(['foo', 123])
+    assert rec == t(some_str='foo', some_int=123)
+    assert rec._t is t
+    assert isinstance(rec, t)
+    assert repr(rec) == f"{module_name}.test_record(some_str='foo', some_int=123)"
@@ -0,0 +1,56 @@
+# bounded set of refs a peer is known to have, evicting least recently used ones
+
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_KNOWN_REFS_LIMIT = 100000
+
+
+class KnownRefs:
+    """Refs a peer has, so bundler may skip them when sending to it.
+
+    Holds at most limit refs. Least recently added or checked ones are evicted and are just sent again.
+    Supports what bundler and transports use from a set: in, |= and len.
+    """
+
+    def __init__(self, refs=(), limit=DEFAULT_KNOWN_REFS_LIMIT):
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._refs = OrderedDict()  # ref -> None
+        self._eviction_count = 0
+        self.update(refs)
+
+    def __repr__(self):
+        return f"<KnownRefs: {len(self._refs)}/{self._limit}, evicted: {self._eviction_count}>"
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __contains__(self, ref):
+        with self._lock:
+            if ref not in self._refs:
+                return False
+            self._refs.move_to_end(ref)
+            return True
+
+    def __ior__(self, refs):
+        self.update(refs)
+        return self
+
+    @property
+    def eviction_count(self):
+        return self._eviction_count
+
+    def update(self, refs):
+        with self._lock:
+            for ref in refs:
+                self._refs[ref] = None
+                self._refs.move_to_end(ref)
+            while len(self._refs) > self._limit:
+                self._refs.popitem(last=False)
+                self._eviction_count += 1
+
+    def clear(self):
+        with self._lock:
+            self._refs.clear()
@@ -2,81 +2,311 @@
 
 import logging
 import threading
-from collections import namedtuple
+from collections import OrderedDict, defaultdict, namedtuple
 
 from .htypes import capsule_t
 from .htypes.deduce_value_type import deduce_value_type_with_list
-from .ref import DecodedCapsule, decode_capsule, make_capsule, make_ref
+from .htypes.packet_coders import packet_coders
+from .ref import DEFAULT_CAPSULE_ENCODING, DecodedCapsule, decode_capsule, make_ref
 from .visual_rep import pprint
 
 log = logging.getLogger(__name__)
 
 
+DEFAULT_STRIPE_COUNT = 16
+
+MosaicStats = namedtuple(
+    'MosaicStats', 'entry_count encoded_size hit_count miss_count eviction_count deferred_count decoded_count')
+
+
+class _Stripe:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lru = OrderedDict()  # ref -> encoded size; entries with capsules, least recently used first.
+        self.encoded_size = 0
+        self.eviction_count = 0
+        self.decoded_count = 0  # Deferred capsules decoded on demand.
+
+
 class Mosaic:
+    """Registry of capsules and their decoded pieces, keyed by ref.
+
+    Refs are split into stripes by first byte of their hash. Registration takes only lock
+    of ref stripe; reads do not take locks at all. A piece is registered only once:
+    equal pieces have equal refs, thus are registered under the same lock.
+
+    Unbounded by default. With size limit set, least recently used entries are evicted
+    when total size of their encoded objects exceeds it. Limit is split equally between
+    stripes, and LRU order is kept per stripe. Evicted capsules are put to spill store,
+    if one is set, and are registered again when their refs are requested; otherwise
+    they should be available from other web sources.
+    Pinned refs and entries added without capsule are never evicted.
+    Spill store is compacted by compact_spill.
+
+    Pieces are encoded with capsule_encoding. It is a part of ref, so equal pieces put
+    to mosaics with different capsule encodings get different refs.
+    """
 
     _Rec = namedtuple('_Rec', 'capsule type_ref t value')
 
-    def __init__(self, pyobj_creg):
+    def __init__(self, pyobj_creg, size_limit=None, spill=None, stripe_count=DEFAULT_STRIPE_COUNT,
+                 capsule_encoding=DEFAULT_CAPSULE_ENCODING):
         self._pyobj_creg = pyobj_creg
+        self._capsule_encoding = capsule_encoding
+        # Dicts are shared by all stripes. Single dict operations are atomic,
+        # and a key is changed only under lock of it's ref stripe.
         self._ref_to_rec = {}  # ref -> _Rec
+        self._ref_to_capsule = {}  # ref -> capsule; registered, but not decoded yet.
         self._piece_to_ref = {}
-        self._lock = threading.Lock()
+        self._type_to_ref = {}  # Type refs are pinned.
+        self._ref_to_pin_count = {}
+        self._stripes = [_Stripe() for idx in range(stripe_count)]
+        self._size_limit = None
+        self._stripe_size_limit = None
+        self._spill = None
+        self._spill_lock = threading.Lock()
+        self._spilled_refs = None  # Refs spilled while compaction is running.
+        # Counters are updated without lock on hot paths, so are approximate under concurrent access.
+        self._hit_count = 0
+        self._miss_count = 0
+        if size_limit is not None:
+            self.set_size_limit(size_limit, spill)
+
+    def _stripe(self, ref):
+        hash = ref.hash
+        if not hash:
+            return self._stripes[0]
+        return self._stripes[hash[0] % len(self._stripes)]
+
+    def set_size_limit(self, size_limit, spill=None):
+        self._size_limit = size_limit
+        self._spill = spill
+        if size_limit is None:
+            self._stripe_size_limit = None
+        else:
+            self._stripe_size_limit = size_limit // len(self._stripes)
+        for stripe in self._stripes:
+            with stripe.lock:
+                self._evict(stripe)
+
+    def pin(self, ref):
+        with self._stripe(ref).lock:
+            self._ref_to_pin_count[ref] = self._ref_to_pin_count.get(ref, 0) + 1
 
-    def register_capsule(self, capsule):
+    def unpin(self, ref):
+        stripe = self._stripe(ref)
+        with stripe.lock:
+            count = self._ref_to_pin_count[ref] - 1
+            if count:
+                self._ref_to_pin_count[ref] = count
+            else:
+                del self._ref_to_pin_count[ref]
+            self._evict(stripe)
+
+    def register_capsule(self, capsule, ref=None):
+        # Ref may be passed by trusted sources which already know it, like local capsule store.
         assert isinstance(capsule, capsule_t), repr(capsule)
-        ref = make_ref(capsule)
+        if ref is None:
+            ref = make_ref(capsule)
         log.debug('Registering ref %s for capsule of type %s', ref, capsule.type_ref)
-        with self._lock:
+        stripe = self._stripe(ref)
+        with stripe.lock:
             rec = self._ref_to_rec.get(ref)
             if rec:
+                existing_capsule = rec.capsule
+            else:
+                existing_capsule = self._ref_to_capsule.get(ref)
+            if rec or existing_capsule:
                 log.debug('  (already exists)')
-                assert capsule == rec.capsule, repr((rec.capsule, capsule))  # new capsule does not match existing one
-                return
-            dc = decode_capsule(self._pyobj_creg, capsule)
-            self._register_capsule(dc.value, dc.t, ref, dc.type_ref, capsule)
+                assert capsule == existing_capsule, repr((existing_capsule, capsule))  # new capsule does not match existing one
+                return ref
+            # Capsule is decoded when it's ref is resolved first time.
+            self._ref_to_capsule[ref] = capsule
+            self._account(stripe, ref, capsule)
+            self._evict(stripe)
             return ref
 
     def put(self, piece, t=None):
         try:
-            return self._piece_to_ref[piece, type(piece)]
+            ref = self._piece_to_ref[piece, type(piece)]
         except TypeError as x:
             raise RuntimeError(f"{x}: {piece}")
         except KeyError:
             pass
-        t = t or deduce_value_type_with_list(self._pyobj_creg, piece)
-        # make_capsule should be outside the lock as mosaic.put is called somewhere inside it.
-        capsule = make_capsule(self._pyobj_creg, piece, t)
-        ref = make_ref(capsule)
-        with self._lock:
+        else:
+            if self._size_limit is not None:
+                self._touch(ref)
+            return ref
+        if t is None:
+            t = deduce_value_type_with_list(self._pyobj_creg, piece)
+        else:
+            # Encoder reads fields by position, so it does not catch a piece of another type.
+            assert isinstance(piece, t), repr((t, piece))
+        # Capsule should be made outside the lock as mosaic.put is called somewhere inside it.
+        capsule, ref = self._make_capsule_and_ref(piece, t)
+        stripe = self._stripe(ref)
+        with stripe.lock:
             try:
                 # Check it is not added by another thread.
                 return self._piece_to_ref[piece, type(piece)]
             except KeyError:
                 pass
             log.debug('Registering piece %r: %s', t.name, piece)
-            self._register_capsule(piece, t, ref, capsule.type_ref, capsule)
+            self._register_capsule(stripe, piece, t, ref, capsule.type_ref, capsule)
             log.debug('Registered piece %s (type: %s): %r', ref, capsule.type_ref, piece)
+            self._evict(stripe)
             return ref
 
-    def _register_capsule(self, piece, t, ref, type_ref, capsule):
-        self._ref_to_rec[ref] = self._Rec(capsule, type_ref, t, piece)
+    def put_many(self, piece_list, t=None):
+        # Same as put for every piece, but every stripe lock is taken only once.
+        # Pieces may have different types if t is None.
+        ref_list = []
+        stripe_to_recs = defaultdict(list)
+        for piece in piece_list:
+            try:
+                ref = self._piece_to_ref[piece, type(piece)]
+            except TypeError as x:
+                raise RuntimeError(f"{x}: {piece}")
+            except KeyError:
+                if t is None:
+                    piece_t = deduce_value_type_with_list(self._pyobj_creg, piece)
+                else:
+                    piece_t = t
+                    assert isinstance(piece, t), repr((t, piece))
+                capsule, ref = self._make_capsule_and_ref(piece, piece_t)
+                stripe_to_recs[self._stripe(ref)].append((piece, piece_t, ref, capsule))
+            else:
+                if self._size_limit is not None:
+                    self._touch(ref)
+            ref_list.append(ref)
+        for stripe, rec_list in stripe_to_recs.items():
+            with stripe.lock:
+                for piece, piece_t, ref, capsule in rec_list:
+                    # May be already added by another thread or be a duplicate within this list.
+                    if (piece, type(piece)) not in self._piece_to_ref:
+                        self._register_capsule(stripe, piece, piece_t, ref, capsule.type_ref, capsule)
+                self._evict(stripe)
+        return tuple(ref_list)
+
+    def _make_capsule_and_ref(self, piece, t):
+        encoding = self._capsule_encoding
+        encoded_object = packet_coders.encode(encoding, piece, t)
+        capsule = capsule_t.instantiate_trusted((self._type_ref(t), encoding, encoded_object))
+        return (capsule, make_ref(capsule))
+
+    def _type_ref(self, t):
+        try:
+            return self._type_to_ref[t]
+        except KeyError:
+            pass
+        ref = self._pyobj_creg.actor_to_ref(t)
+        # Capsules referring this type should be resolvable, do not let it be evicted.
+        self.pin(ref)
+        self._type_to_ref[t] = ref
+        return ref
+
+    def _register_capsule(self, stripe, piece, t, ref, type_ref, capsule):
+        rec = self._Rec(capsule, type_ref, t, piece)
+        self._ref_to_rec[ref] = rec
         self._piece_to_ref[piece, type(piece)] = ref
+        self._ref_to_capsule.pop(ref, None)
+        if capsule is not None and ref not in stripe.lru:
+            self._account(stripe, ref, capsule)
+        return rec
+
+    def _account(self, stripe, ref, capsule):
+        size = len(capsule.encoded_object)
+        stripe.lru[ref] = size
+        stripe.encoded_size += size
+
+    def _touch(self, ref):
+        # Called without lock. Single OrderedDict operation is atomic.
+        try:
+            self._stripe(ref).lru.move_to_end(ref)
+        except KeyError:
+            pass  # Not accounted or just evicted.
+
+    def _evict(self, stripe):
+        size_limit = self._stripe_size_limit
+        if size_limit is None:
+            return
+        lru = stripe.lru
+        pinned_count = 0
+        while stripe.encoded_size > size_limit and len(lru) > pinned_count:
+            ref, size = lru.popitem(last=False)
+            if ref in self._ref_to_pin_count:
+                lru[ref] = size
+                pinned_count += 1
+                continue
+            rec = self._ref_to_rec.pop(ref, None)
+            if rec:
+                capsule = rec.capsule
+                piece_key = (rec.value, type(rec.value))
+                if self._piece_to_ref.get(piece_key) == ref:
+                    del self._piece_to_ref[piece_key]
+            else:
+                capsule = self._ref_to_capsule.pop(ref)
+            if self._spill is not None:
+                with self._spill_lock:
+                    self._spill.put(capsule, ref)
+                    if self._spilled_refs is not None:
+                        self._spilled_refs.add(ref)
+            stripe.encoded_size -= size
+            stripe.eviction_count += 1
+            log.debug('Evicted ref %s (%d bytes)', ref, size)
+
+    def _decode_deferred(self, ref, capsule):
+        # Decode outside the lock: decoding resolves types, which may put or resolve other refs.
+        dc = decode_capsule(self._pyobj_creg, capsule)
+        stripe = self._stripe(ref)
+        with stripe.lock:
+            try:
+                # Check it is not decoded by another thread.
+                return self._ref_to_rec[ref]
+            except KeyError:
+                pass
+            stripe.decoded_count += 1
+            rec = self._register_capsule(stripe, dc.value, dc.t, ref, dc.type_ref, capsule)
+            if ref in stripe.lru:
+                stripe.lru.move_to_end(ref)
+            self._evict(stripe)
+            return rec
 
     def add_to_cache(self, piece, t, ref):
-        with self._lock:
-            self._register_capsule(piece, t, ref, None, None)
+        stripe = self._stripe(ref)
+        with stripe.lock:
+            self._register_capsule(stripe, piece, t, ref, None, None)
 
     def put_opt(self, piece, t=None):
         if piece is None:
             return None
         return self.put(piece, t)
 
+    def _unspill(self, ref):
+        # Returns capsule registered back from spill store, or None.
+        if self._spill is None:
+            return None
+        capsule = self._spill.pull(ref)
+        if capsule is None:
+            return None
+        log.debug('Ref %s is registered back from spill', ref)
+        self.register_capsule(capsule, ref)
+        return capsule
+
     def get(self, ref):
         rec = self._ref_to_rec.get(ref)
         if rec:
-            return rec.capsule
+            capsule = rec.capsule
         else:
-            return None
+            capsule = self._ref_to_capsule.get(ref)
+        if capsule is None:
+            self._miss_count += 1
+            return self._unspill(ref)
+        self._hit_count += 1
+        if self._size_limit is not None:
+            self._touch(ref)
+        return capsule
 
     # Alias for web source.
     def pull(self, ref):
@@ -84,6 +314,85 @@ class Mosaic:
 
     def resolve_ref(self, ref, expected_type=None):
         try:
-            return self._ref_to_rec[ref]
+            rec = self._ref_to_rec[ref]
         except KeyError:
-            raise KeyError(f"Unknown ref: {ref}")
+            pass
+        else:
+            self._hit_count += 1
+            if self._size_limit is not None:
+                self._touch(ref)
+            return rec
+        capsule = self._ref_to_capsule.get(ref)
+        if capsule is None:
+            # Record is inserted before capsule is removed, so it may be just decoded by another thread.
+            try:
+                return self._ref_to_rec[ref]
+            except KeyError:
+                pass
+            self._miss_count += 1
+            capsule = self._unspill(ref)
+            if capsule is None:
+                raise KeyError(f"Unknown ref: {ref}")
+        else:
+            self._hit_count += 1
+        return self._decode_deferred(ref, capsule)
+
+    def compact_spill(self, pick_refs):
+        """Drop spilled capsules not reachable from pinned refs and from entries in memory.
+
+        pick_refs(value, t) should return refs contained in a value.
+        """
+        spill = self._spill
+        if spill is None:
+            return
+        with self._spill_lock:
+            self._spilled_refs = set()
+        try:
+            live_refs = self._spill_live_refs(spill, pick_refs)
+            with self._spill_lock:
+                # Entries spilled while live refs were collected were in memory, so they are live too.
+                spill.compact(live_refs | self._spilled_refs)
+        finally:
+            with self._spill_lock:
+                self._spilled_refs = None
+        log.info('Mosaic: Spill is compacted to %d capsules', len(spill))
+
+    def _spill_live_refs(self, spill, pick_refs):
+        visited_refs = set()
+        unvisited_refs = list(self._ref_to_pin_count.copy())
+        for ref, rec in self._ref_to_rec.copy().items():
+            visited_refs.add(ref)
+            if rec.type_ref is not None:
+                unvisited_refs.append(rec.type_ref)
+                unvisited_refs += pick_refs(rec.value, rec.t)
+        for ref, capsule in self._ref_to_capsule.copy().items():
+            visited_refs.add(ref)
+            unvisited_refs += self._capsule_refs(pick_refs, capsule)
+        live_refs = set()
+        while unvisited_refs:
+            ref = unvisited_refs.pop()
+            if ref in visited_refs or ref.hash_algorithm == 'phony':
+                continue
+            visited_refs.add(ref)
+            capsule = spill.pull(ref)
+            if capsule is None:
+                continue
+            live_refs.add(ref)
+            unvisited_refs += self._capsule_refs(pick_refs, capsule)
+        return live_refs
+
+    def _capsule_refs(self, pick_refs, capsule):
+        dc = decode_capsule(self._pyobj_creg, capsule)
+        return [capsule.type_ref, *pick_refs(dc.value, dc.t)]
+
+    @property
+    def stats(self):
+        return MosaicStats(
+            entry_count=len(self._ref_to_rec) + len(self._ref_to_capsule),
+            encoded_size=sum(stripe.encoded_size for stripe in self._stripes),
+            hit_count=self._hit_count,
+            miss_count=self._miss_count,
+            eviction_count=sum(stripe.eviction_count for stripe in self._stripes),
+            deferred_count=len(self._ref_to_capsule),
+            decoded_count=sum(stripe.decoded_count for stripe in self._stripes),
+            )
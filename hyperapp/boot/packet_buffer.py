@@ -0,0 +1,117 @@
+# receive buffer for framed packets: header, encoding, packet data
+
+import struct
+from collections import namedtuple
+from multiprocessing import BufferTooShort
+
+
+# utf-8 encoded encoding size, packet data size. Same framing is used by tcp and subprocess transports.
+HEADER = struct.Struct('!QQ')
+DEFAULT_RECV_SIZE = 256 * 1024
+
+Packet = namedtuple('Packet', 'encoding data size')  # data is a memoryview; size is full size, with header.
+
+
+class PacketBuffer:
+    """Accumulates received bytes and splits them into packets.
+
+    Bytes are received directly into a bytearray, and packet data is returned as a memoryview
+    to it, so nothing is copied but the tail of an incomplete packet when buffer is moved.
+    Header is parsed once per packet, and the buffer is grown to hold whole packet at once.
+    Returned memoryview is valid until the next call of any buffer method.
+    """
+
+    def __init__(self, recv_size=DEFAULT_RECV_SIZE):
+        self._recv_size = recv_size
+        self._buf = bytearray(recv_size)
+        self._start = 0  # Offset of first unprocessed byte.
+        self._end = 0  # Offset of first free byte.
+        self._header = None  # (encoding size, data size) of packet at start, once it is parsed.
+        self._view = None  # Last returned packet data.
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def capacity(self):
+        return len(self._buf)
+
+    def recv_from_socket(self, sock):
+        # Returns received size; 0 means remote end closed connection.
+        self._reserve(self._wanted_size())
+        with memoryview(self._buf) as view:
+            size = sock.recv_into(view[self._end:])
+        self._end += size
+        return size
+
+    def recv_from_connection(self, connection):
+        # For multiprocessing connections. Message is received directly only if it fits into free space.
+        self._reserve(self._wanted_size())
+        try:
+            size = connection.recv_bytes_into(self._buf, self._end)
+        except BufferTooShort as x:
+            self.feed(x.args[0])
+            return len(x.args[0])
+        self._end += size
+        return size
+
+    def feed(self, data):
+        self._reserve(len(data))
+        self._buf[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def pop_packet(self):
+        # Returns next full packet or None.
+        self._release_view()
+        if self._header is None:
+            if len(self) < HEADER.size:
+                self._compact()
+                return None
+            self._header = HEADER.unpack_from(self._buf, self._start)
+        encoding_size, data_size = self._header
+        data_ofs = self._start + HEADER.size + encoding_size
+        packet_end = data_ofs + data_size
+        if packet_end > self._end:
+            return None
+        encoding = self._buf[self._start + HEADER.size:data_ofs].decode()
+        self._view = memoryview(self._buf)[data_ofs:packet_end]
+        size = packet_end - self._start
+        self._start = packet_end
+        self._header = None
+        return Packet(encoding, self._view, size)
+
+    def _release_view(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+
+    def _wanted_size(self):
+        if self._header is None:
+            return self._recv_size
+        encoding_size, data_size = self._header
+        missing_size = HEADER.size + encoding_size + data_size - len(self)
+        return max(missing_size, self._recv_size)
+
+    def _reserve(self, size):
+        # Ensure there is at least size free bytes after end.
+        self._release_view()
+        if self._start == self._end:
+            self._start = self._end = 0
+        if len(self._buf) - self._end >= size:
+            return
+        data_size = len(self)
+        capacity = len(self._buf)
+        if data_size + size > capacity:
+            capacity = max(capacity * 2, data_size + size)
+        # Bytearray can not be resized while there are views to it, so data is moved to a new one.
+        buf = bytearray(capacity)
+        buf[:data_size] = self._buf[self._start:self._end]
+        self._buf = buf
+        self._start = 0
+        self._end = data_size
+
+    def _compact(self):
+        # Called when there are no full packets left. Drop buffer grown for a large packet.
+        if self._start == self._end and len(self._buf) > self._recv_size:
+            self._buf = bytearray(self._recv_size)
+            self._start = self._end = 0
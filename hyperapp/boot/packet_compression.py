@@ -0,0 +1,171 @@
+# transparent packet compression, announced as encoding suffix: 'cdr2+zlib'
+
+import lzma
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from .htypes.packet_coders import DecodeError, packet_coders
+
+
+DEFAULT_COMPRESSION = 'zlib'
+DEFAULT_THRESHOLD = 4096  # Smaller packets are sent uncompressed: gain is small, and they are the most frequent ones.
+# Packets come from remote peers; Do not let a small one inflate beyond this.
+DEFAULT_MAX_DECOMPRESSED_SIZE = 1 << 30
+LZMA_MEMLIMIT = 256 * 1024**2  # Decoder memory; Largest preset dictionary is 64 MB.
+
+
+def _zlib_compress(data, level):
+    if level is None:
+        return zlib.compress(data)
+    return zlib.compress(data, level)
+
+
+def _lzma_compress(data, level):
+    return lzma.compress(data, preset=level)
+
+
+def _too_large(compression, max_size):
+    return DecodeError(f"Packet decompressed by {compression} is larger than {max_size} bytes")
+
+
+def _zlib_decompress(data, max_size):
+    decompressor = zlib.decompressobj()
+    try:
+        # One more byte tells data exceeding limit from data of exactly limit size.
+        raw_data = decompressor.decompress(data, max_size + 1)
+        if len(raw_data) > max_size or decompressor.unconsumed_tail:
+            raise _too_large('zlib', max_size)
+        raw_data += decompressor.flush()
+    except zlib.error as x:
+        raise DecodeError(f"Packet compressed by zlib is invalid: {x}")
+    if len(raw_data) > max_size:
+        raise _too_large('zlib', max_size)
+    if not decompressor.eof:
+        raise DecodeError("Packet compressed by zlib is truncated")
+    return raw_data
+
+
+def _lzma_decompress(data, max_size):
+    decompressor = lzma.LZMADecompressor(memlimit=LZMA_MEMLIMIT)
+    try:
+        raw_data = decompressor.decompress(data, max_size + 1)
+    except lzma.LZMAError as x:
+        raise DecodeError(f"Packet compressed by lzma is invalid: {x}")
+    if len(raw_data) > max_size:
+        raise _too_large('lzma', max_size)
+    if not decompressor.eof:
+        raise DecodeError("Packet compressed by lzma is truncated")
+    return raw_data
+
+
+# compression -> (compress, decompress). Level is sender-side only and is not announced.
+_compressions = {
+    'zlib': (_zlib_compress, _zlib_decompress),
+    'lzma': (_lzma_compress, _lzma_decompress),
+    }
+
+_CompressionStats = namedtuple('_CompressionStats', [
+    'out_count',
+    'out_compressed_count',
+    'out_raw_size',  # Encoded size before compression.
+    'out_size',  # Size actually sent.
+    'compress_time',  # CPU time of sending thread, in seconds.
+    'in_count',
+    'in_compressed_count',
+    'in_raw_size',
+    'in_size',
+    'decompress_time',
+    ])
+
+
+class CompressionStats(_CompressionStats):
+
+    @property
+    def out_ratio(self):
+        return self.out_raw_size / self.out_size if self.out_size else 1.
+
+    @property
+    def in_ratio(self):
+        return self.in_raw_size / self.in_size if self.in_size else 1.
+
+    def __str__(self):
+        return (
+            f"out: {self.out_compressed_count}/{self.out_count} compressed, ratio {self.out_ratio:.2f},"
+            f" {self.compress_time * 1000:.1f} ms;"
+            f" in: {self.in_compressed_count}/{self.in_count} compressed, ratio {self.in_ratio:.2f},"
+            f" {self.decompress_time * 1000:.1f} ms"
+            )
+
+
+def split_encoding(encoding):
+    base_encoding, sep, compression = encoding.partition('+')
+    return (base_encoding, compression or None)
+
+
+class PacketCompressor:
+    """Encodes packets for one connection, compressing ones larger than threshold.
+
+    Compression used is announced by encoding suffix, so receiving side decompresses
+    any packet regardless of it's own settings. Compression None disables it.
+    Packet decompressed to more than max_decompressed_size is rejected with DecodeError.
+    """
+
+    def __init__(self, compression=DEFAULT_COMPRESSION, threshold=DEFAULT_THRESHOLD, level=None,
+                 max_decompressed_size=DEFAULT_MAX_DECOMPRESSED_SIZE):
+        if compression is not None and compression not in _compressions:
+            raise RuntimeError(f"Unknown compression: {compression!r}")
+        self._compression = compression
+        self._threshold = threshold
+        self._level = level  # None means default one for compression.
+        self._max_decompressed_size = max_decompressed_size
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(CompressionStats._fields, 0)
+
+    @property
+    def stats(self):
+        with self._lock:
+            return CompressionStats(**self._counters)
+
+    def encode(self, value, encoding, t=None):
+        # Returns (encoding, data) tuple; encoding has compression suffix if data is compressed.
+        data = packet_coders.encode(encoding, value, t)
+        raw_size = len(data)
+        compress_time = 0
+        if self._compression is not None and raw_size >= self._threshold:
+            compress, decompress = _compressions[self._compression]
+            start = time.thread_time()
+            compressed_data = compress(data, self._level)
+            compress_time = time.thread_time() - start
+            if len(compressed_data) < raw_size:
+                encoding = f'{encoding}+{self._compression}'
+                data = compressed_data
+        self._count('out', raw_size, data, encoding, compress_time=compress_time)
+        return (encoding, data)
+
+    def decode(self, encoding, data, t):
+        base_encoding, compression = split_encoding(encoding)
+        decompress_time = 0
+        raw_data = data
+        if compression is not None:
+            try:
+                compress, decompress = _compressions[compression]
+            except KeyError:
+                raise DecodeError(f"Unknown packet compression: {compression!r}")
+            start = time.thread_time()
+            raw_data = decompress(data, self._max_decompressed_size)
+            decompress_time = time.thread_time() - start
+        self._count('in', len(raw_data), data, encoding, decompress_time=decompress_time)
+        return packet_coders.decode(base_encoding, raw_data, t)
+
+    def _count(self, direction, raw_size, data, encoding, **times):
+        with self._lock:
+            counters = self._counters
+            counters[f'{direction}_count'] += 1
+            if '+' in encoding:
+                counters[f'{direction}_compressed_count'] += 1
+            counters[f'{direction}_raw_size'] += raw_size
+            counters[f'{direction}_size'] += len(data)
+            for name, value in times.items():
+                counters[name] += value
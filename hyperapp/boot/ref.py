@@ -1,8 +1,7 @@
 from collections import namedtuple
 import codecs
-
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes
+import hashlib
+import struct
 
 from .htypes import Type, ref_t, capsule_t, ref_repr
 from .htypes.deduce_value_type import deduce_value_type
@@ -12,6 +11,16 @@ from .htypes.packet_coders import packet_coders
 DEFAULT_HASH_ALGORITHM = 'sha512'
 DEFAULT_CAPSULE_ENCODING = 'cdr'
 
+# Changing hash algorithm changes all refs. Peers can exchange only refs made with same algorithm,
+# as receiver calculates refs for capsules from bundles itself.
+_hash_algorithms = {
+    'sha512': hashlib.sha512,
+    'blake2b': hashlib.blake2b,
+    }
+
+_int_struct = struct.Struct('!q')
+_cdr_capsule_prefix_cache = {}  # type_ref -> cdr-encoded capsule part before encoded_object.
+
 
 DecodedCapsule = namedtuple('_DecodedCapsule', 'type_ref t value')
 
@@ -22,28 +31,49 @@ class UnexpectedTypeError(RuntimeError):
         super().__init__("Capsule has unexpected type: expected is %r, actual is %r", expected_type, actual_type)
 
 
+def register_hash_algorithm(name, factory):
+    # Factory should return hashlib-compatible object with update and digest methods.
+    _hash_algorithms[name] = factory
+
+
 def hash_sha512(source_bytes):
-    digest = hashes.Hash(hashes.SHA512(), backend=default_backend())
-    digest.update(source_bytes)
-    return digest.finalize()
+    return hashlib.sha512(source_bytes).digest()
 
 
-def make_ref(capsule):
-    assert isinstance(capsule, capsule_t)
-    # use same encoding for capsule as for object
-    encoded_capsule = packet_coders.encode(capsule.encoding, capsule, capsule_t)
-    hash = hash_sha512(encoded_capsule)
-    return ref_t(DEFAULT_HASH_ALGORITHM, hash)
+def _cdr_capsule_prefix(type_ref):
+    try:
+        return _cdr_capsule_prefix_cache[type_ref]
+    except KeyError:
+        pass
+    capsule = capsule_t.instantiate_trusted((type_ref, 'cdr', b''))
+    encoded_capsule = packet_coders.encode('cdr', capsule, capsule_t)
+    prefix = encoded_capsule[:-_int_struct.size]  # Strip empty encoded_object size.
+    _cdr_capsule_prefix_cache[type_ref] = prefix
+    return prefix
 
 
-def make_capsule(pyobj_creg, object, t=None):
+def make_ref(capsule, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    assert isinstance(capsule, capsule_t)
+    digest = _hash_algorithms[hash_algorithm]()
+    # use same encoding for capsule as for object
+    if capsule.encoding == 'cdr':
+        # Encoded object is already encoded; hash it as a part of encoded capsule without copying.
+        encoded_object = capsule.encoded_object
+        digest.update(_cdr_capsule_prefix(capsule.type_ref))
+        digest.update(_int_struct.pack(len(encoded_object)))
+        digest.update(encoded_object)
+    else:
+        digest.update(packet_coders.encode(capsule.encoding, capsule, capsule_t))
+    return ref_t.instantiate_trusted((hash_algorithm, digest.digest()))
+
+
+def make_capsule(pyobj_creg, object, t=None, encoding=DEFAULT_CAPSULE_ENCODING):
     t = t or deduce_value_type(object)
     assert isinstance(t, Type), repr(t)
     assert isinstance(object, t), repr((t, object))
-    encoding = DEFAULT_CAPSULE_ENCODING
     encoded_object = packet_coders.encode(encoding, object, t)
     type_ref = pyobj_creg.actor_to_ref(t)
-    return capsule_t(type_ref, encoding, encoded_object)
+    return capsule_t.instantiate_trusted((type_ref, encoding, encoded_object))
 
 
 def decode_capsule(pyobj_creg, capsule, expected_type=None):
@@ -0,0 +1,123 @@
+import pytest
+
+from hyperapp.boot.htypes import tString, capsule_t, ref_t
+from hyperapp.boot.capsule_store import CapsuleStore, CapsuleStoreError
+from hyperapp.boot.ref import make_capsule, make_ref
+from hyperapp.boot import cdr_coders  # register codec
+
+
+pytest_plugins = [
+    'hyperapp.boot.test.services',
+    ]
+
+
+def _capsule(idx):
+    return capsule_t(
+        type_ref=ref_t('sha512', b'\x01' * 64),
+        encoding='cdr',
+        encoded_object=b'object #%d' % idx,
+        )
+
+
+def test_put_and_pull(tmp_path):
+    capsule = _capsule(1)
+    with CapsuleStore(tmp_path) as store:
+        ref = store.put(capsule)
+        assert ref == make_ref(capsule)
+        assert ref in store
+        assert store.pull(ref) == capsule
+        assert store.put(capsule) == ref
+        assert len(store) == 1
+        assert store.pull(make_ref(_capsule(2))) is None
+
+
+def test_put_after_pull(tmp_path):
+    # Reading active segment should see records appended after it was opened for reading.
+    with CapsuleStore(tmp_path) as store:
+        ref_1 = store.put(_capsule(1))
+        assert store.pull(ref_1) == _capsule(1)
+        ref_2 = store.put(_capsule(2))
+        assert store.pull(ref_2) == _capsule(2)
+        assert store.put(_capsule(2)) == ref_2
+        ref_3 = store.put(_capsule(3))
+        assert store.put(_capsule(3)) == ref_3
+        assert len(store) == 3
+
+
+def test_reopen(tmp_path):
+    capsule_list = [_capsule(idx) for idx in range(100)]
+    with CapsuleStore(tmp_path, index_tail_limit=30) as store:
+        ref_list = [store.put(capsule) for capsule in capsule_list]
+    with CapsuleStore(tmp_path) as store:
+        assert len(store) == 100
+        for ref, capsule in zip(ref_list, capsule_list):
+            assert store.pull(ref) == capsule
+
+
+def test_recover_unindexed_records(tmp_path):
+    store = CapsuleStore(tmp_path)
+    ref_1 = store.put(_capsule(1))
+    store.sync()
+    ref_2 = store.put(_capsule(2))
+    # Simulate crash: index is not written, last record is torn.
+    store._active_file.write(b'\x00\x01\x02')
+    store._active_file.flush()
+    store._lock_file.close()
+    store = CapsuleStore(tmp_path)
+    assert store.pull(ref_1) == _capsule(1)
+    assert store.pull(ref_2) == _capsule(2)
+    ref_3 = store.put(_capsule(3))
+    store.close()
+    with CapsuleStore(tmp_path) as store:
+        assert len(store) == 3
+        assert store.pull(ref_3) == _capsule(3)
+
+
+def test_broken_index_is_rebuilt(tmp_path):
+    with CapsuleStore(tmp_path) as store:
+        ref = store.put(_capsule(1))
+    index_path = tmp_path / 'index'
+    index_path.write_bytes(index_path.read_bytes()[:-1] + b'\xff')
+    with CapsuleStore(tmp_path) as store:
+        assert store.pull(ref) == _capsule(1)
+
+
+def test_segments(tmp_path):
+    with CapsuleStore(tmp_path, segment_size_limit=1000) as store:
+        ref_list = [store.put(_capsule(idx)) for idx in range(100)]
+        assert store.stats.segment_count > 1
+    with CapsuleStore(tmp_path) as store:
+        assert [store.pull(ref) for ref in ref_list] == [_capsule(idx) for idx in range(100)]
+
+
+def test_compact(tmp_path):
+    with CapsuleStore(tmp_path) as store:
+        ref_list = [store.put(_capsule(idx)) for idx in range(10)]
+        total_size = store.stats.total_size
+        store.compact(ref_list[:3])
+        assert len(store) == 3
+        assert store.stats.live_size == store.stats.total_size < total_size
+        assert store.pull(ref_list[0]) == _capsule(0)
+        assert store.pull(ref_list[5]) is None
+        ref = store.put(_capsule(20))
+    with CapsuleStore(tmp_path) as store:
+        assert len(store) == 4
+        assert store.pull(ref_list[2]) == _capsule(2)
+        assert store.pull(ref) == _capsule(20)
+        assert store.pull(ref_list[5]) is None
+
+
+def test_used_by_another_store(tmp_path):
+    with CapsuleStore(tmp_path):
+        with pytest.raises(CapsuleStoreError):
+            CapsuleStore(tmp_path)
+
+
+def test_web_source(tmp_path, pyobj_creg, mosaic, web):
+    capsule = make_capsule(pyobj_creg, 'stored string')
+    with CapsuleStore(tmp_path) as store:
+        ref = store.put(capsule)
+        web.add_source(store)
+        assert web.summon(ref) == 'stored string'
+        # Now it is cached by mosaic.
+        assert mosaic.resolve_ref(ref).t is tString
@@ -0,0 +1,141 @@
+import struct
+from datetime import datetime
+
+import pytest
+from dateutil.tz import tzutc
+
+from hyperapp.boot.htypes import (
+    tNone,
+    tString,
+    tBinary,
+    tInt,
+    tBool,
+    tDateTime,
+    TOptional,
+    TList,
+    TRecord,
+    TException,
+    ref_t,
+    bundle_t,
+    capsule_t,
+    )
+from hyperapp.boot.htypes.packet_coders import DecodeError, packet_coders
+from hyperapp.boot import cdr_coders  # register codec
+
+
+def _roundtrip(value, t):
+    data = packet_coders.encode('cdr', value, t)
+    return packet_coders.decode('cdr', data, t)
+
+
+def test_primitives():
+    assert _roundtrip(None, tNone) is None
+    assert _roundtrip('abc', tString) == 'abc'
+    assert _roundtrip(b'\x00\x01', tBinary) == b'\x00\x01'
+    assert _roundtrip(-123, tInt) == -123
+    assert _roundtrip(True, tBool) is True
+    dt = datetime(2020, 1, 2, 3, 4, 5, 678, tzinfo=tzutc())
+    assert _roundtrip(dt, tDateTime) == dt
+
+
+def test_int_encoding():
+    assert packet_coders.encode('cdr', 1, tInt) == struct.pack('!q', 1)
+
+
+def test_record_fixed_run_encoding():
+    t = TRecord('test_cdr', 'fixed_run', {
+        'str_1': tString,
+        'int_1': tInt,
+        'bool_1': tBool,
+        'none_1': tNone,
+        'int_2': tInt,
+        'str_2': tString,
+        'int_3': tInt,
+        })
+    value = t('a', 1, True, None, 2, 'bc', 3)
+    data = packet_coders.encode('cdr', value, t)
+    assert data == (
+        struct.pack('!q', 1) + b'a'
+        + struct.pack('!q?q', 1, True, 2)
+        + struct.pack('!q', 2) + b'bc'
+        + struct.pack('!q', 3)
+        )
+    assert packet_coders.decode('cdr', data, t) == value
+
+
+def test_based_record():
+    base_t = TRecord('test_cdr', 'base', {
+        'int_1': tInt,
+        })
+    t = TRecord('test_cdr', 'derived', {
+        'str_1': tString,
+        }, base=base_t)
+    value = t(int_1=1, str_1='a')
+    assert _roundtrip(value, t) == value
+
+
+def test_list_and_optional():
+    elt_t = TRecord('test_cdr', 'element', {
+        'opt_int': TOptional(tInt),
+        'bool_list': TList(tBool),
+        'str_list': TList(tString),
+        })
+    t = TList(elt_t)
+    value = (
+        elt_t(None, (), ()),
+        elt_t(123, (True, False), ('a', 'b')),
+        )
+    assert _roundtrip(value, t) == value
+    assert _roundtrip((), TList(tInt)) == ()
+    assert _roundtrip((1, 2, 3), TList(tInt)) == (1, 2, 3)
+
+
+def test_exception():
+    t = TException('test_cdr', 'error', {
+        'message': tString,
+        'code': tInt,
+        'flag': tBool,
+        })
+    value = t('failed', 123, False)
+    assert _roundtrip(value, t) == value
+
+
+def test_bundle():
+    ref = ref_t('sha512', b'\x01' * 64)
+    capsule = capsule_t(ref, 'cdr', b'some object')
+    value = bundle_t(
+        roots=(ref,),
+        associations=(),
+        capsule_list=(capsule, capsule),
+        )
+    assert _roundtrip(value, bundle_t) == value
+
+
+def test_decode_memoryview():
+    value = bundle_t(
+        roots=(ref_t('sha512', b'\x02' * 64),),
+        associations=(),
+        capsule_list=(),
+        )
+    data = packet_coders.encode('cdr', value, bundle_t)
+    assert packet_coders.decode('cdr', memoryview(data), bundle_t) == value
+
+
+def test_decode_error_path():
+    ref = ref_t('sha512', b'\x01' * 64)
+    value = bundle_t(
+        roots=(ref,),
+        associations=(),
+        capsule_list=(capsule_t(ref, 'cdr', b'some object'),),
+        )
+    data = packet_coders.encode('cdr', value, bundle_t)
+    with pytest.raises(DecodeError) as excinfo:
+        packet_coders.decode('cdr', data[:-3], bundle_t)
+    assert str(excinfo.value).startswith("capsule_list.#0.encoded_object: Unexpected EOF while reading 11 bytes.")
+
+
+def test_decode_too_large_list():
+    data = struct.pack('!q', 1 << 61)
+    with pytest.raises(DecodeError) as excinfo:
+        packet_coders.decode('cdr', data, TList(tString))
+    assert str(excinfo.value) == f": List size is too large: {1 << 61}"
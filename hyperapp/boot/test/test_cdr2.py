@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from dateutil.tz import tzutc
+
+from hyperapp.boot.htypes import (
+    tNone,
+    tString,
+    tBinary,
+    tInt,
+    tBool,
+    tDateTime,
+    TOptional,
+    TList,
+    TRecord,
+    TException,
+    ref_t,
+    bundle_t,
+    capsule_t,
+    )
+from hyperapp.boot.htypes.packet_coders import DecodeError, packet_coders
+from hyperapp.boot import cdr_coders  # register codec
+
+
+def _roundtrip(value, t):
+    data = packet_coders.encode('cdr2', value, t)
+    return packet_coders.decode('cdr2', data, t)
+
+
+def test_primitives():
+    assert _roundtrip(None, tNone) is None
+    assert _roundtrip('abc', tString) == 'abc'
+    assert _roundtrip('', tString) == ''
+    assert _roundtrip(b'\x00\x01', tBinary) == b'\x00\x01'
+    assert _roundtrip(True, tBool) is True
+    assert _roundtrip(False, tBool) is False
+
+
+@pytest.mark.parametrize('value', [0, 1, -1, 63, 64, -64, -65, 300, 1 << 62, -(1 << 63), 1 << 100])
+def test_int(value):
+    assert _roundtrip(value, tInt) == value
+
+
+def test_int_encoding():
+    assert packet_coders.encode('cdr2', 1, tInt) == b'\x02'
+    assert packet_coders.encode('cdr2', -1, tInt) == b'\x01'
+    assert packet_coders.encode('cdr2', 300, tInt) == b'\xd8\x04'
+
+
+@pytest.mark.parametrize('dt', [
+    datetime(2020, 1, 2, 3, 4, 5, 678),
+    datetime(1900, 1, 2, 3, 4, 5),
+    datetime(2020, 1, 2, 3, 4, 5, 678, tzinfo=tzutc()),
+    datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=-5, minutes=-30))),
+    ])
+def test_datetime(dt):
+    result = _roundtrip(dt, tDateTime)
+    assert result == dt
+    assert result.utcoffset() == dt.utcoffset()
+    assert (result.year, result.hour, result.microsecond) == (dt.year, dt.hour, dt.microsecond)
+
+
+def test_string_interning():
+    t = TList(tString)
+    value = ('sha512', 'sha512', 'x' * 100, 'x' * 100, 'sha512')
+    data = packet_coders.encode('cdr2', value, t)
+    # Count, 'sha512' literal, 2 back-refs, 2 non-interned long literals with 2-byte size tags.
+    assert len(data) == 1 + (1 + 6) + 1 + 2 * (2 + 100) + 1
+    assert packet_coders.decode('cdr2', data, t) == value
+
+
+def test_record_list_and_optional():
+    elt_t = TRecord('test_cdr2', 'element', {
+        'opt_int': TOptional(tInt),
+        'none': tNone,
+        'bool_list': TList(tBool),
+        'str_list': TList(tString),
+        })
+    t = TList(elt_t)
+    value = (
+        elt_t(None, None, (), ()),
+        elt_t(123, None, (True, False), ('a', 'b', 'a')),
+        )
+    assert _roundtrip(value, t) == value
+
+
+def test_exception():
+    t = TException('test_cdr2', 'error', {
+        'message': tString,
+        'code': tInt,
+        })
+    value = t('failed', -123)
+    assert _roundtrip(value, t) == value
+
+
+def test_bundle():
+    ref = ref_t('sha512', b'\x01' * 64)
+    capsule = capsule_t(ref, 'cdr', b'some object')
+    value = bundle_t(
+        roots=(ref,),
+        associations=(),
+        capsule_list=(capsule, capsule),
+        )
+    data = packet_coders.encode('cdr2', value, bundle_t)
+    assert packet_coders.decode('cdr2', memoryview(data), bundle_t) == value
+    # Mostly hashes, but sizes shrink from 8 bytes to 1 and repeated strings are interned.
+    assert len(data) < len(packet_coders.encode('cdr', value, bundle_t)) - 60
+
+
+def test_decode_truncated():
+    value = capsule_t(ref_t('sha512', b'\x01' * 64), 'cdr', b'some object')
+    data = packet_coders.encode('cdr2', value, capsule_t)
+    for size in [0, 5, len(data) - 3]:
+        with pytest.raises(DecodeError):
+            packet_coders.decode('cdr2', data[:size], capsule_t)
+
+
+def test_decode_bad_string_ref():
+    with pytest.raises(DecodeError) as excinfo:
+        packet_coders.decode('cdr2', b'\x03', tString)
+    assert "unknown interned string #1" in str(excinfo.value)
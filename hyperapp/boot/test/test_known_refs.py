@@ -0,0 +1,24 @@
+from hyperapp.boot.htypes import ref_t
+from hyperapp.boot.known_refs import KnownRefs
+
+
+def _ref(idx):
+    return ref_t('sha512', idx.to_bytes(8, 'big'))
+
+
+def test_least_recently_used_is_evicted():
+    known_refs = KnownRefs([_ref(1), _ref(2)], limit=3)
+    known_refs |= {_ref(3)}
+    assert _ref(1) in known_refs  # Now ref 2 is least recently used.
+    known_refs |= {_ref(4)}
+    assert len(known_refs) == 3
+    assert known_refs.eviction_count == 1
+    assert _ref(2) not in known_refs
+    assert all(_ref(idx) in known_refs for idx in [1, 3, 4])
+
+
+def test_clear():
+    known_refs = KnownRefs([_ref(1)])
+    known_refs.clear()
+    assert _ref(1) not in known_refs
+    assert len(known_refs) == 0
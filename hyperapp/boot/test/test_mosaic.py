@@ -1,3 +1,19 @@
+import hashlib
+import threading
+
+import pytest
+
+from hyperapp.boot.htypes import TRecord, tInt, tString, ref_t, bundle_t, capsule_t
+from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.mosaic import Mosaic
+from hyperapp.boot.capsule_store import CapsuleStore
+from hyperapp.boot.ref import make_capsule, make_ref
+from hyperapp.boot import cdr_coders  # register codec
+
+
+pytest_plugins = [
+    'hyperapp.boot.test.services',
+    ]
 
 
 def test_bool_does_not_replace_int(mosaic, web):
@@ -5,3 +21,203 @@ def test_bool_does_not_replace_int(mosaic, web):
     ref = mosaic.put(1)  # Should not pick previously cached bool.
     value = web.summon(ref)
     assert type(value) is int
+
+
+def test_put_rejects_piece_of_other_type(mosaic):
+    fields = {'x': tString, 'y': tInt}
+    a_t = TRecord('test_mosaic', 'a', fields)
+    b_t = TRecord('test_mosaic', 'b', fields)
+    piece = a_t(x='s', y=1)
+    with pytest.raises(AssertionError):
+        mosaic.put(piece, b_t)
+    with pytest.raises(AssertionError):
+        mosaic.put_many([piece], b_t)
+
+
+def _make_capsule_and_ref(pyobj_creg, value):
+    capsule = make_capsule(pyobj_creg, value)
+    return (capsule, make_ref(capsule))
+
+
+def test_capsule_decoding_is_deferred(pyobj_creg, mosaic, web):
+    capsule, ref = _make_capsule_and_ref(pyobj_creg, 'sample string')
+    other_mosaic = Mosaic(pyobj_creg)
+    assert other_mosaic.register_capsule(capsule) == ref
+    assert other_mosaic.stats.deferred_count == 1
+    assert other_mosaic.stats.decoded_count == 0
+    assert other_mosaic.get(ref) == capsule
+    rec = other_mosaic.resolve_ref(ref)
+    assert rec.value == 'sample string'
+    assert rec.t is tString
+    assert rec.capsule == capsule
+    assert other_mosaic.stats.deferred_count == 0
+    assert other_mosaic.stats.decoded_count == 1
+    assert other_mosaic.resolve_ref(ref) is rec
+    assert other_mosaic.put('sample string') == ref
+    assert other_mosaic.stats.decoded_count == 1
+
+
+def test_put_replaces_deferred_capsule(pyobj_creg, mosaic):
+    capsule, ref = _make_capsule_and_ref(pyobj_creg, 'another string')
+    other_mosaic = Mosaic(pyobj_creg)
+    other_mosaic.register_capsule(capsule)
+    assert other_mosaic.put('another string') == ref
+    assert other_mosaic.stats.deferred_count == 0
+    assert other_mosaic.stats.decoded_count == 0
+    assert other_mosaic.resolve_ref(ref).value == 'another string'
+
+
+def test_register_existing_capsule_returns_ref(pyobj_creg, mosaic):
+    capsule, ref = _make_capsule_and_ref(pyobj_creg, 'registered twice')
+    other_mosaic = Mosaic(pyobj_creg)
+    assert other_mosaic.register_capsule(capsule) == ref
+    assert other_mosaic.register_capsule(capsule) == ref
+
+
+def test_deferred_capsule_is_memoized(pyobj_creg, mosaic):
+    capsule, ref = _make_capsule_and_ref(pyobj_creg, 'threaded')
+    other_mosaic = Mosaic(pyobj_creg)
+    other_mosaic.register_capsule(capsule)
+    barrier = threading.Barrier(8)
+    result = []
+
+    def resolve():
+        barrier.wait()
+        result.append(other_mosaic.resolve_ref(ref))
+
+    thread_list = [threading.Thread(target=resolve) for idx in range(8)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert len(result) == 8
+    assert all(rec is result[0] for rec in result)
+    assert other_mosaic.stats.decoded_count == 1
+
+
+def test_lru_eviction(pyobj_creg, mosaic):
+    capsule_list = [make_capsule(pyobj_creg, f'value-{idx}') for idx in range(4)]
+    size = len(capsule_list[0].encoded_object)
+    other_mosaic = Mosaic(pyobj_creg, size_limit=size * 3, stripe_count=1)
+    ref_list = [other_mosaic.register_capsule(capsule) for capsule in capsule_list[:3]]
+    assert other_mosaic.resolve_ref(ref_list[0]).value == 'value-0'  # Now #1 is least recently used.
+    ref_list.append(other_mosaic.register_capsule(capsule_list[3]))
+    assert other_mosaic.get(ref_list[1]) is None
+    assert other_mosaic.get(ref_list[0]) == capsule_list[0]
+    assert other_mosaic.get(ref_list[2]) == capsule_list[2]
+    assert other_mosaic.get(ref_list[3]) == capsule_list[3]
+    stats = other_mosaic.stats
+    assert stats.entry_count == 3
+    assert stats.encoded_size == size * 3
+    assert stats.eviction_count == 1
+    assert stats.miss_count == 1
+    assert stats.hit_count == 4
+
+
+def test_evicted_piece_is_put_again(pyobj_creg, mosaic):
+    other_mosaic = Mosaic(pyobj_creg, size_limit=1)
+    ref = other_mosaic.put('evicted piece')
+    assert other_mosaic.stats.eviction_count == 1
+    assert other_mosaic.stats.entry_count == 0
+    assert other_mosaic.put('evicted piece') == ref
+    assert other_mosaic.stats.eviction_count == 2
+
+
+def test_pinned_ref_is_not_evicted(pyobj_creg, mosaic):
+    capsule, ref = _make_capsule_and_ref(pyobj_creg, 'pinned')
+    other_mosaic = Mosaic(pyobj_creg, size_limit=1)
+    other_mosaic.pin(ref)
+    other_mosaic.register_capsule(capsule)
+    assert other_mosaic.resolve_ref(ref).value == 'pinned'
+    assert other_mosaic.stats.eviction_count == 0
+    other_mosaic.unpin(ref)
+    assert other_mosaic.stats.eviction_count == 1
+    assert other_mosaic.get(ref) is None
+
+
+def test_evicted_ref_is_resolved_from_spill(tmp_path, pyobj_creg, mosaic, web):
+    capsule, ref = _make_capsule_and_ref(pyobj_creg, 'spilled')
+    spill = CapsuleStore(tmp_path / 'spill')
+    other_mosaic = Mosaic(pyobj_creg)
+    other_mosaic.register_capsule(capsule)
+    other_mosaic.set_size_limit(1, spill)
+    assert other_mosaic.stats.entry_count == 0
+    assert other_mosaic.resolve_ref(ref).value == 'spilled'
+    assert other_mosaic.get(ref) == capsule
+    spill.close()
+
+
+def test_compact_spill(tmp_path, pyobj_creg, mosaic):
+    # Pinned bundle keeps it's roots in spill.
+    def pick_refs(value, t):
+        if t is bundle_t:
+            return list(value.roots)
+        return []
+
+    spill = CapsuleStore(tmp_path / 'spill')
+    other_mosaic = Mosaic(pyobj_creg, size_limit=1, spill=spill)
+    element_ref = other_mosaic.put('element')
+    dropped_ref = other_mosaic.put('dropped')
+    bundle_ref = other_mosaic.put(bundle_t(roots=(element_ref,), associations=(), capsule_list=()))
+    other_mosaic.pin(bundle_ref)
+    assert len(spill) == 3
+    other_mosaic.compact_spill(pick_refs)
+    assert len(spill) == 2
+    assert dropped_ref not in spill
+    assert other_mosaic.resolve_ref(element_ref).value == 'element'
+    with pytest.raises(KeyError):
+        other_mosaic.resolve_ref(dropped_ref)
+    spill.close()
+
+
+def test_put_many(pyobj_creg, mosaic):
+    other_mosaic = Mosaic(pyobj_creg)
+    existing_ref = other_mosaic.put('existing')
+    ref_list = other_mosaic.put_many(['new', 'existing', 123, 'new'])
+    assert ref_list == (
+        make_ref(make_capsule(pyobj_creg, 'new')),
+        existing_ref,
+        make_ref(make_capsule(pyobj_creg, 123)),
+        make_ref(make_capsule(pyobj_creg, 'new')),
+        )
+    assert other_mosaic.stats.entry_count == 3
+    assert other_mosaic.resolve_ref(ref_list[2]).value == 123
+    assert other_mosaic.put_many((), tString) == ()
+
+
+def test_make_ref_hashes_encoded_capsule(pyobj_creg, mosaic):
+    capsule = make_capsule(pyobj_creg, 'hashed')
+    encoded_capsule = packet_coders.encode('cdr', capsule, capsule_t)
+    assert make_ref(capsule) == ref_t('sha512', hashlib.sha512(encoded_capsule).digest())
+    assert make_ref(capsule, 'blake2b') == ref_t('blake2b', hashlib.blake2b(encoded_capsule).digest())
+
+
+def test_capsule_encoding(pyobj_creg, mosaic):
+    other_mosaic = Mosaic(pyobj_creg, capsule_encoding='cdr2')
+    ref = other_mosaic.put('compact')
+    assert ref == make_ref(make_capsule(pyobj_creg, 'compact', encoding='cdr2'))
+    assert ref != mosaic.put('compact')
+    assert other_mosaic.resolve_ref(ref).capsule.encoding == 'cdr2'
+    assert other_mosaic.resolve_ref(ref).value == 'compact'
+
+
+def test_concurrent_put(pyobj_creg, mosaic):
+    other_mosaic = Mosaic(pyobj_creg)
+    thread_count = 8
+    barrier = threading.Barrier(thread_count)
+    thread_to_refs = {}
+
+    def put(thread_idx):
+        barrier.wait()
+        # Every thread puts all pieces, in different order.
+        piece_list = [f'piece-{(thread_idx + idx) % 100}' for idx in range(100)]
+        thread_to_refs[thread_idx] = {piece: other_mosaic.put(piece) for piece in piece_list}
+
+    thread_list = [threading.Thread(target=put, args=[idx]) for idx in range(thread_count)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert len(thread_to_refs) == thread_count
+    assert all(piece_to_ref == thread_to_refs[0] for piece_to_ref in thread_to_refs.values())
+    assert other_mosaic.stats.entry_count == 100
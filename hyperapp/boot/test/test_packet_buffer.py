@@ -0,0 +1,69 @@
+import multiprocessing
+import socket
+
+from hyperapp.boot.packet_buffer import HEADER, PacketBuffer
+
+
+def _packet(encoding, data):
+    encoded_encoding = encoding.encode()
+    return HEADER.pack(len(encoded_encoding), len(data)) + encoded_encoding + data
+
+
+def _pop_all(buffer):
+    result = []
+    while packet := buffer.pop_packet():
+        result.append((packet.encoding, bytes(packet.data), packet.size))
+    return result
+
+
+def test_split_and_joined_packets():
+    buffer = PacketBuffer(recv_size=16)
+    data = _packet('cdr', b'first') + _packet('cdr2+zlib', b'second')
+    received = []
+    for idx in range(0, len(data), 7):
+        buffer.feed(data[idx:idx + 7])
+        received += _pop_all(buffer)
+        if idx + 7 < HEADER.size + 3 + 5:
+            assert received == []
+    assert received == [
+        ('cdr', b'first', HEADER.size + 3 + 5),
+        ('cdr2+zlib', b'second', HEADER.size + 9 + 6),
+        ]
+    assert len(buffer) == 0
+
+
+def test_large_packet_grows_and_shrinks_buffer():
+    buffer = PacketBuffer(recv_size=1024)
+    data = _packet('cdr', b'x' * 100000)
+    buffer.feed(data[:100])
+    assert buffer.pop_packet() is None
+    buffer.feed(data[100:])
+    [(encoding, packet_data, size)] = _pop_all(buffer)
+    assert packet_data == b'x' * 100000
+    assert buffer.capacity == 1024
+
+
+def test_recv_from_socket():
+    buffer = PacketBuffer(recv_size=1024)
+    data = _packet('cdr', b'y' * 5000) + _packet('cdr', b'z')
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(data)
+        received = []
+        while len(received) < 2:
+            assert buffer.recv_from_socket(b) > 0
+            received += _pop_all(buffer)
+        a.close()
+        assert buffer.recv_from_socket(b) == 0
+    assert [packet_data for encoding, packet_data, size in received] == [b'y' * 5000, b'z']
+
+
+def test_recv_from_connection():
+    buffer = PacketBuffer(recv_size=1024)
+    a, b = multiprocessing.Pipe()
+    with a, b:
+        # Larger message does not fit into free space and is received by BufferTooShort path.
+        for data in [b'small', b'large' * 1000, b'small']:
+            a.send_bytes(_packet('cdr', data))
+            buffer.recv_from_connection(b)
+            assert _pop_all(buffer) == [('cdr', data, HEADER.size + 3 + len(data))]
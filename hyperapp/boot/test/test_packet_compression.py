@@ -0,0 +1,67 @@
+import pytest
+
+from hyperapp.boot.htypes import ref_t, capsule_t, bundle_t
+from hyperapp.boot.htypes.packet_coders import DecodeError
+from hyperapp.boot.packet_compression import PacketCompressor, split_encoding
+from hyperapp.boot import cdr_coders  # register codec
+
+
+def _bundle(object_size):
+    ref = ref_t('sha512', b'\x01' * 64)
+    return bundle_t(
+        roots=(ref,),
+        associations=(),
+        capsule_list=(capsule_t(ref, 'cdr', b'source line\n' * (object_size // 12)),),
+        )
+
+
+def test_split_encoding():
+    assert split_encoding('cdr') == ('cdr', None)
+    assert split_encoding('cdr2+zlib') == ('cdr2', 'zlib')
+
+
+def test_small_packet_is_not_compressed():
+    compressor = PacketCompressor(threshold=1000)
+    bundle = _bundle(100)
+    encoding, data = compressor.encode(bundle, 'cdr', bundle_t)
+    assert encoding == 'cdr'
+    assert compressor.decode(encoding, data, bundle_t) == bundle
+    stats = compressor.stats
+    assert (stats.out_count, stats.out_compressed_count, stats.in_count) == (1, 0, 1)
+    assert stats.out_ratio == 1
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+def test_large_packet_is_compressed(compression):
+    sender = PacketCompressor(compression, threshold=1000)
+    receiver = PacketCompressor(compression=None)
+    bundle = _bundle(100000)
+    encoding, data = sender.encode(bundle, 'cdr2', bundle_t)
+    assert encoding == f'cdr2+{compression}'
+    assert receiver.decode(encoding, data, bundle_t) == bundle
+    assert sender.stats.out_compressed_count == 1
+    assert sender.stats.out_ratio > 10
+    assert receiver.stats.in_compressed_count == 1
+    assert receiver.stats.in_ratio == sender.stats.out_ratio
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+def test_decompressed_size_is_limited(compression):
+    sender = PacketCompressor(compression, threshold=1000)
+    receiver = PacketCompressor(compression=None, max_decompressed_size=10000)
+    bundle = _bundle(100000)
+    encoding, data = sender.encode(bundle, 'cdr2', bundle_t)
+    assert len(data) < 10000
+    with pytest.raises(DecodeError):
+        receiver.decode(encoding, data, bundle_t)
+    small_bundle = _bundle(5000)
+    encoding, data = sender.encode(small_bundle, 'cdr2', bundle_t)
+    assert encoding == f'cdr2+{compression}'
+    assert receiver.decode(encoding, data, bundle_t) == small_bundle
+
+
+def test_unknown_compression():
+    with pytest.raises(RuntimeError):
+        PacketCompressor('unknown')
+    with pytest.raises(DecodeError):
+        PacketCompressor().decode('cdr+unknown', b'', bundle_t)
@@ -23,6 +23,8 @@ class Unbundler:
         # Meta associations should be registered before others. So, collect association list first.
         ass_list = []
         for ass_ref in bundle.associations:
+            # Registered associations are kept by registry for the process lifetime.
+            self._mosaic.pin(ass_ref)
             decoded_capsule = self._mosaic.resolve_ref(ass_ref)
             log.debug("Unbundle association: %s %s: %s", ass_ref, decoded_capsule.t, decoded_capsule.value)
             ass_list.append(
@@ -1,7 +1,5 @@
 import logging
 
-from hyperapp.boot.htypes.packet_coders import packet_coders
-
 _log = logging.getLogger(__name__)
 
 
@@ -21,6 +19,9 @@ class Web(object):
     def add_source(self, source):
         self._sources.append(source)
 
+    def remove_source(self, source):
+        self._sources.remove(source)
+
     def pull(self, ref):
         _log.debug('Resolving ref: %s', ref)
         for source in [self._mosaic] + self._sources:
@@ -30,20 +31,21 @@ class Web(object):
                 return capsule
         raise RefResolveFailure(ref)
 
-    def summon_with_t(self, ref, expected_type=None):
+    def resolve_ref(self, ref):
         try:
-            rec = self._mosaic.resolve_ref(ref)
+            return self._mosaic.resolve_ref(ref)
         except KeyError:
             pass
-        else:
-            return (rec.value, rec.t)
         capsule = self.pull(ref)
-        # Following code is actually dead.
-        t = self._pyobj_creg.invite(capsule.type_ref)
+        # Cache pulled capsule, so next time it is resolved by mosaic.
+        self._mosaic.register_capsule(capsule, ref)
+        return self._mosaic.resolve_ref(ref)
+
+    def summon_with_t(self, ref, expected_type=None):
+        rec = self.resolve_ref(ref)
         if expected_type:
-            assert t is expected_type, (t, expected_type)
-        value = packet_coders.decode(capsule.encoding, capsule.encoded_object, t)
-        return (value, t)
+            assert rec.t is expected_type, (rec.t, expected_type)
+        return (rec.value, rec.t)
 
     def summon_with_t_opt(self, ref, expected_type=None):
         if ref is None:
@@ -1,6 +1,7 @@
 import argparse
 import asyncio
 import logging
+import time
 from pathlib import Path
 
 from PySide6 import QtWidgets
@@ -22,6 +23,7 @@ log = logging.getLogger(__name__)
 
 default_lcs_layers_path = hyperapp_dir / 'client/lcs-layers.yaml'
 default_layout_path = Path.home() / '.local/share/hyperapp/client/layout.json'
+default_identity_path = Path.home() / '.local/share/hyperapp/client/identity.json'
 
 
 async def make_default_piece(visualizer, ctx):
@@ -106,14 +108,24 @@ def _parse_args(sys_argv):
 
 
 @mark.service
-def client_identity(endpoint_registry, rpc_endpoint, generate_rsa_identity):
-    identity = generate_rsa_identity()
+def client_identity(endpoint_registry, rpc_endpoint, identity_creg, generate_rsa_identity, file_bundle_factory):
+    start = time.monotonic()
+    identity_bundle = file_bundle_factory(default_identity_path)
+    try:
+        identity = identity_creg.animate(identity_bundle.load_piece())
+        log.info("Client identity: loaded from: %s", identity_bundle.path)
+    except FileNotFoundError:
+        identity = generate_rsa_identity()
+        identity_bundle.save_piece(identity.piece)
+        log.info("Client identity: generated and saved to: %s", identity_bundle.path)
+    log.info("Client identity: ready in %.3f s", time.monotonic() - start)
     endpoint_registry.register(identity, rpc_endpoint)
     return identity
 
 
 @mark.service
 async def client_async_main(
+        async_tcp_loop,
         client_identity,
         file_bundle_factory,
         lcs_resource_storage_factory,
@@ -124,6 +136,8 @@ async def client_async_main(
         app,
         stop_event,
         ):
+    # Async TCP connections should run in this loop, so rpc calls from UI are awaited without extra threads.
+    async_tcp_loop.use_running_loop()
     project_imports = {client_project}
     lcs = LCSheet.from_layer_list_path(args.lcs_layers_path, lcs_resource_storage_factory, project_imports)
 
@@ -122,6 +122,12 @@ class ListDiffAppend:
 
 class ListDiffReplaceIdx:
 
+    @classmethod
+    @mark.actor.diff_creg
+    def from_piece(cls, piece):
+        item = web.summon(piece.item)
+        return cls(piece.idx, item)
+
     def __init__(self, idx, item):
         self.idx = idx
         self.item = item
@@ -129,12 +135,26 @@ class ListDiffReplaceIdx:
     def __repr__(self):
         return f"<ListDiffReplaceIdx: @#{self.idx}: {self.item}>"
 
+    @property
+    def piece(self):
+        return htypes.list_diff.replace_idx(
+            idx=self.idx,
+            item=mosaic.put(self.item),
+            )
+
     def replace(self, container, item):
         return replace(container, self.idx, item)
 
 
 class ListDiffReplaceKey:
 
+    @classmethod
+    @mark.actor.diff_creg
+    def from_piece(cls, piece):
+        key = web.summon(piece.key)
+        item = web.summon(piece.item)
+        return cls(key, item)
+
     def __init__(self, key, item):
         self.key = key
         self.item = item
@@ -142,6 +162,13 @@ class ListDiffReplaceKey:
     def __repr__(self):
         return f"<ListDiffReplaceKey: @#{self.key}: {self.item}>"
 
+    @property
+    def piece(self):
+        return htypes.list_diff.replace_key(
+            key=mosaic.put(self.key),
+            item=mosaic.put(self.item),
+            )
+
 
 class ListDiffModifyIdx:
 
@@ -31,3 +31,27 @@ def test_remove_key():
         )
     diff = list_diff.ListDiffRemoveKey.from_piece(piece)
     assert diff.piece == piece
+
+
+def test_replace_idx():
+    item = htypes.list_diff_tests.sample_item(
+        id='123',
+        )
+    piece = htypes.list_diff.replace_idx(
+        idx=123,
+        item=mosaic.put(item),
+        )
+    diff = list_diff.ListDiffReplaceIdx.from_piece(piece)
+    assert diff.piece == piece
+
+
+def test_replace_key():
+    item = htypes.list_diff_tests.sample_item(
+        id='123',
+        )
+    piece = htypes.list_diff.replace_key(
+        key=mosaic.put('123'),
+        item=mosaic.put(item),
+        )
+    diff = list_diff.ListDiffReplaceKey.from_piece(piece)
+    assert diff.piece == piece
@@ -1,7 +1,29 @@
+from . import htypes
+from .services import (
+    mosaic,
+    web,
+    )
+from .code.mark import mark
+
+
 class SetValueDiff:
+    # Value None means receiver should fetch the value anew, like when diffs before it were dropped.
+
+    @classmethod
+    @mark.actor.diff_creg
+    def from_piece(cls, piece):
+        if piece.new_value is None:
+            return cls(None)
+        return cls(web.summon(piece.new_value))
 
     def __init__(self, new_value):
         self.new_value = new_value
 
     def __repr__(self):
         return f"<SetValueDiff: {self.new_value}>"
+
+    @property
+    def piece(self):
+        return htypes.value_diff.set_value(
+            new_value=None if self.new_value is None else mosaic.put(self.new_value),
+            )
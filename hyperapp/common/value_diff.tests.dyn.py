@@ -0,0 +1,23 @@
+from . import htypes
+from .services import (
+    mosaic,
+    )
+from .tested.code import value_diff
+
+
+def test_set_value():
+    piece = htypes.value_diff.set_value(
+        new_value=mosaic.put('Sample value'),
+        )
+    diff = value_diff.SetValueDiff.from_piece(piece)
+    assert diff.new_value == 'Sample value'
+    assert diff.piece == piece
+
+
+def test_set_value_to_fetch():
+    piece = htypes.value_diff.set_value(
+        new_value=None,
+        )
+    diff = value_diff.SetValueDiff.from_piece(piece)
+    assert diff.new_value is None
+    assert diff.piece == piece
@@ -0,0 +1,33 @@
+from . import htypes
+from .code.mark import mark
+
+
+@mark.model
+def endpoint_scheduler_stats_model(piece, endpoint_scheduler):
+    stats = endpoint_scheduler.stats()
+    return [
+        htypes.endpoint_scheduler_stats.item(
+            name=queue.name,
+            length=queue.length,
+            lane_count=queue.lane_count,
+            task_count=queue.task_count,
+            wait_1ms=queue.wait_histogram[0],
+            wait_10ms=queue.wait_histogram[1],
+            wait_100ms=queue.wait_histogram[2],
+            wait_1s=queue.wait_histogram[3],
+            wait_10s=queue.wait_histogram[4],
+            wait_more=queue.wait_histogram[5],
+            )
+        for queue in stats.queue_list
+        ]
+
+
+@mark.global_command
+def open_endpoint_scheduler_stats():
+    return htypes.endpoint_scheduler_stats.model()
+
+
+@mark.actor.formatter_creg
+def format_model(piece, endpoint_scheduler):
+    stats = endpoint_scheduler.stats()
+    return f"Endpoint scheduler: {stats.busy_count}/{stats.worker_count} workers busy"
@@ -0,0 +1,23 @@
+from . import htypes
+from .code.mark import mark
+from .tested.code import endpoint_scheduler_stats
+
+
+@mark.fixture
+def piece():
+    return htypes.endpoint_scheduler_stats.model()
+
+
+def test_model(piece):
+    item_list = endpoint_scheduler_stats.endpoint_scheduler_stats_model(piece)
+    assert [item.name for item in item_list] == ['priority', 'request']
+
+
+def test_open():
+    piece = endpoint_scheduler_stats.open_endpoint_scheduler_stats()
+    assert piece
+
+
+def test_format_model(piece):
+    title = endpoint_scheduler_stats.format_model(piece)
+    assert type(title) is str
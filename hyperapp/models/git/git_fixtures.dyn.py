@@ -35,14 +35,18 @@ def repo_dir(data_dir, repo_name):
 
 @mark.fixture
 def file_bundle_factory(repo_dir, path, encoding):
+    assert path.stem.endswith('list'), f"Unexpected file bundle path: {path}"
     file_bundle = Mock()
-    if path.stem.endswith('list'):
-        storage = htypes.git.repo_list_storage(
-            path_list=(str(repo_dir),),
-            )
-        file_bundle.load_piece.return_value = storage
-    elif path.stem.endswith('objects'):
-        file_bundle.load_piece.side_effect = FileNotFoundError(path)
-    else:
-        assert False, "Unexpected file bundle path: {path}"
+    storage = htypes.git.repo_list_storage(
+        path_list=(str(repo_dir),),
+        )
+    file_bundle.load_piece.return_value = storage
     return file_bundle
+
+
+@mark.fixture
+def store_bundle_factory(path, legacy_path):
+    assert path.name.endswith('objects'), f"Unexpected store bundle path: {path}"
+    store_bundle = Mock()
+    store_bundle.load_piece.side_effect = FileNotFoundError(path)
+    return store_bundle
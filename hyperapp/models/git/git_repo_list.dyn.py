@@ -18,13 +18,14 @@ log = logging.getLogger(__name__)
 
 
 _REPO_LIST_PATH = 'git/repo-list.cdr'
-_REPO_OBJECTS_FMT = 'git/{repo_name}-objects.cdr'
+_REPO_OBJECTS_FMT = 'git/{repo_name}-objects'
+_LEGACY_REPO_OBJECTS_FMT = 'git/{repo_name}-objects.cdr'
 
 
 class Repository:
 
-    def __init__(self, file_bundle_factory, data_dir, name, path):
-        self._file_bundle_factory = file_bundle_factory
+    def __init__(self, store_bundle_factory, data_dir, name, path):
+        self._store_bundle_factory = store_bundle_factory
         self._data_dir = data_dir
         self.name = name
         self.path = path
@@ -63,7 +64,7 @@ class Repository:
             commit = htypes.git.commit(
                 id=str(git_commit.id),
                 short_id=git_commit.short_id,
-                parents=tuple(mosaic.put(p) for p in parents),
+                parents=mosaic.put_many(parents),
                 time=datetime.fromtimestamp(git_commit.commit_time),
                 author=str(git_commit.author),
                 committer=str(git_commit.committer),
@@ -75,7 +76,8 @@ class Repository:
     @property
     def _storage(self):
         path = self._data_dir / _REPO_OBJECTS_FMT.format(repo_name=self.name)
-        return self._file_bundle_factory(path, encoding='cdr')
+        legacy_path = self._data_dir / _LEGACY_REPO_OBJECTS_FMT.format(repo_name=self.name)
+        return self._store_bundle_factory(path, legacy_path=legacy_path)
 
     def add_head(self, name, git_object):
         commit = self.get_commit(git_object)
@@ -123,8 +125,8 @@ class Repository:
 
 class RepoList:
 
-    def __init__(self, file_bundle_factory, data_dir, file_bundle):
-        self._file_bundle_factory = file_bundle_factory
+    def __init__(self, store_bundle_factory, data_dir, file_bundle):
+        self._store_bundle_factory = store_bundle_factory
         self._data_dir = data_dir
         self._file_bundle = file_bundle
         self._name_to_path = {}
@@ -138,7 +140,7 @@ class RepoList:
         for path_str in storage.path_list:
             path = Path(path_str)
             self._name_to_path[path.name] = path
-            self._path_to_repo[path] = Repository(self._file_bundle_factory, self._data_dir, path.name, path)
+            self._path_to_repo[path] = Repository(self._store_bundle_factory, self._data_dir, path.name, path)
 
     def _save(self):
         storage = htypes.git.repo_list_storage(
@@ -175,7 +177,7 @@ class RepoList:
 
     def add(self, path):
         self._name_to_path[path.name] = path
-        self._path_to_repo[path] = Repository(self._file_bundle_factory, self._data_dir, path.name, path)
+        self._path_to_repo[path] = Repository(self._store_bundle_factory, self._data_dir, path.name, path)
         self._save()
         return path.name
 
@@ -187,9 +189,9 @@ class RepoList:
 
 
 @mark.service
-def repo_list(file_bundle_factory, data_dir):
+def repo_list(file_bundle_factory, store_bundle_factory, data_dir):
     file_bundle = file_bundle_factory(data_dir / _REPO_LIST_PATH, encoding='cdr')
-    repo_list = RepoList(file_bundle_factory, data_dir, file_bundle)
+    repo_list = RepoList(store_bundle_factory, data_dir, file_bundle)
     repo_list.load()
     return repo_list
 
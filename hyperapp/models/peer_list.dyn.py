@@ -1,6 +1,6 @@
 import logging
 import subprocess
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 from functools import cached_property
 from pathlib import Path
 
@@ -81,13 +81,27 @@ def peer_list_reg(file_bundle_factory, peer_creg):
     return PeerList(bundle, peer_creg, peer_list_path)
 
     
+def _route_health_str(stats):
+    if stats.is_up:
+        status = 'up'
+    else:
+        status = f'down ({stats.consecutive_errors} errors: {stats.last_error})'
+    if stats.rtt is not None:
+        status += f', rtt {stats.rtt * 1000:.0f} ms'
+    return f'{stats.route}: {status}'
+
+
 @mark.model(key='name')
-def peer_list_model(piece, peer_list_reg):
+def peer_list_model(piece, peer_list_reg, route_manager):
+    peer_to_routes = defaultdict(list)
+    for stats in route_manager.stats():
+        peer_to_routes[stats.peer.piece].append(_route_health_str(stats))
     return [
         htypes.peer_list.item(
             name=name,
             peer=mosaic.put(peer.piece),
             peer_repr=repr(peer),
+            routes='; '.join(peer_to_routes[peer.piece]),
             )
         for name, peer in peer_list_reg.items()
         ]
@@ -26,6 +26,8 @@ def test_rpc_request(rpc_target):
     piece = htypes.rpc.request(
         request_id='abc-def',
         target=mosaic.put(rpc_target),
+        timeout_ms=None,
+        lane=None,
         )
     title = rpc_message_format.format_rpc_request(piece)
     assert type(title) is str
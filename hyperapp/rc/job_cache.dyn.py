@@ -33,10 +33,7 @@ class CacheEntry:
         deps = [
             htypes.job_cache.dep(
                 requirement=mosaic.put(req.piece),
-                resource_list=tuple(
-                    mosaic.put(res.piece)
-                    for res in resource_set
-                    )
+                resource_list=mosaic.put_many(res.piece for res in resource_set),
                 )
             for req, resource_set in self.deps.items()
             ]
@@ -50,12 +47,13 @@ class CacheEntry:
             
 class JobCache:
 
-    def __init__(self, file_bundle_factory, rc_requirement_creg, rc_resource_creg, rc_job_result_creg, path, load):
-        self._file_bundle_factory = file_bundle_factory
+    def __init__(self, store_bundle_factory, rc_requirement_creg, rc_resource_creg, rc_job_result_creg, path, load, legacy_path=None):
+        self._store_bundle_factory = store_bundle_factory
         self._rc_requirement_creg = rc_requirement_creg
         self._rc_resource_creg = rc_resource_creg
         self._rc_job_result_creg = rc_job_result_creg
         self._path = path
+        self._legacy_path = legacy_path
         self._target_to_entry = {}  # target name -> CacheEntry
         self._changed = False
         if load:
@@ -77,11 +75,12 @@ class JobCache:
             in self._target_to_entry.values()
             )
         piece = htypes.job_cache.cache(entries)
-        bundle = self._file_bundle_factory(self._path, encoding='cdr')
+        # Only entries changed since previous save are written.
+        bundle = self._store_bundle_factory(self._path, legacy_path=self._legacy_path)
         bundle.save_piece(piece)
         
     def _load(self):
-        bundle = self._file_bundle_factory(self._path, encoding='cdr')
+        bundle = self._store_bundle_factory(self._path, legacy_path=self._legacy_path)
         try:
             piece = bundle.load_piece(register_associations=False)
         except FileNotFoundError:
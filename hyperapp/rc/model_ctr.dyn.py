@@ -89,3 +89,49 @@ class ModelCtr(ModuleCtr):
     def _ui_t_name(self):
         # Here we assume that ui_t is a record.
         return self._ui_t._t.name.replace('_', '-')
+
+
+class ModelCacheCtr(ModuleCtr):
+
+    @classmethod
+    def from_piece(cls, piece):
+        return cls(
+            module_name=piece.module_name,
+            model_t=pyobj_creg.invite(piece.model_t),
+            )
+
+    def __init__(self, module_name, model_t):
+        super().__init__(module_name)
+        self._model_t = model_t
+
+    @property
+    def piece(self):
+        return htypes.model_resource.model_cache_ctr(
+            module_name=self._module_name,
+            model_t=pyobj_creg.actor_to_ref(self._model_t),
+            )
+
+    def update_resource_targets(self, resource_tgt, target_set):
+        service_name = 'model_cache_reg'
+        req = CfgItemReq.from_actor(service_name, self._model_t)
+        ready_tgt, resolved_tgt, _ = target_set.factory.config_items(
+            service_name, self._resource_name, req, provider=resource_tgt, ctr=self)
+        resource_tgt.add_cfg_item_target(resolved_tgt)
+
+    def get_component(self, name_to_res):
+        return name_to_res[f'{self._resource_name}.model-cache-cfg-item']
+
+    def make_component(self, types, python_module, name_to_res=None):
+        cached_model = htypes.model.cached_model()
+        cfg_item = htypes.cfg_item.typed_cfg_item(
+            t=pyobj_creg.actor_to_ref(self._model_t),
+            value=mosaic.put(cached_model),
+            )
+        if name_to_res is not None:
+            name_to_res[f'{self._resource_name}.cached-model'] = cached_model
+            name_to_res[f'{self._resource_name}.model-cache-cfg-item'] = cfg_item
+        return cfg_item
+
+    @property
+    def _resource_name(self):
+        return f'{self._model_t.module_name}-{self._model_t.name}'
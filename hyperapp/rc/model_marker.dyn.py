@@ -15,7 +15,7 @@ from .code.marker_utils import (
     process_awaitable_result,
     split_actor_params,
     )
-from .code.model_ctr import ModelCtr
+from .code.model_ctr import ModelCacheCtr, ModelCtr
 from .code.feed_ctr import ListFeedCtr, IndexTreeFeedCtr
 
 log = logging.getLogger(__name__)
@@ -23,11 +23,12 @@ log = logging.getLogger(__name__)
 
 class ModelProbe:
 
-    def __init__(self, system_probe, ctr_collector, module_name, key, fn):
+    def __init__(self, system_probe, ctr_collector, module_name, key, cache, fn):
         self._system = system_probe
         self._ctr_collector = ctr_collector
         self._module_name = module_name
         self._key_field = key
+        self._cache = cache
         self._fn = fn
         system_probe.add_global(self)
 
@@ -80,6 +81,12 @@ class ModelProbe:
             service_params=params.service_names,
             )
         self._ctr_collector.add_constructor(ctr)
+        if self._cache:
+            cache_ctr = ModelCacheCtr(
+                module_name=self._module_name,
+                model_t=model_t,
+                )
+            self._ctr_collector.add_constructor(cache_ctr)
         if not FeedCtr:
             return
         feed_ctr = FeedCtr(
@@ -172,16 +179,17 @@ class ModelProbe:
 
 class ModelDecorator:
 
-    def __init__(self, system, ctr_collector, module_name, key):
+    def __init__(self, system, ctr_collector, module_name, key, cache):
         self._system = system
         self._ctr_collector = ctr_collector
         self._module_name = module_name
         self._key = key
+        self._cache = cache
 
     def __call__(self, fn):
         check_not_classmethod(fn)
         check_is_function(fn)
-        return ModelProbe(self._system, self._ctr_collector, self._module_name, self._key, fn)
+        return ModelProbe(self._system, self._ctr_collector, self._module_name, self._key, self._cache, fn)
 
 
 class ModelMarker:
@@ -191,11 +199,12 @@ class ModelMarker:
         self._system = system
         self._ctr_collector = ctr_collector
 
-    def __call__(self, fn=None, *, key=None):
+    def __call__(self, fn=None, *, key=None, cache=False):
+        # Results of remote calls for models marked with cache=True are cached by client until model feed sends a diff.
         if fn is None:
-            return ModelDecorator(self._system, self._ctr_collector, self._module_name, key)
-        if key is not None:
+            return ModelDecorator(self._system, self._ctr_collector, self._module_name, key, cache)
+        if key is not None or cache:
             raise RuntimeError(f"Model decorator does not support positional arguments")
         check_not_classmethod(fn)
         check_is_function(fn)
-        return ModelProbe(self._system, self._ctr_collector, self._module_name, key=None, fn=fn)
+        return ModelProbe(self._system, self._ctr_collector, self._module_name, key=None, cache=False, fn=fn)
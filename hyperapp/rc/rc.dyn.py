@@ -29,7 +29,8 @@ log = logging.getLogger(__name__)
 rc_log = logging.getLogger('rc')
 
 
-JOB_CACHE_PATH = Path.home() / '.local/share/hyperapp/rc-job-cache.cdr'
+JOB_CACHE_PATH = Path.home() / '.local/share/hyperapp/rc-job-cache'
+LEGACY_JOB_CACHE_PATH = Path.home() / '.local/share/hyperapp/rc-job-cache.cdr'
 
 
 Options = namedtuple('Options', 'clean timeout verbose fail_fast write show_diffs show_incomplete_traces check')
@@ -352,7 +353,7 @@ def compile_resources(
         })
     base_config_templates = get_layer_config_templates('base')
 
-    job_cache = job_cache(JOB_CACHE_PATH, load=not options.clean)
+    job_cache = job_cache(JOB_CACHE_PATH, load=not options.clean, legacy_path=LEGACY_JOB_CACHE_PATH)
     cached_count = Counter()
 
     full_target_set = build_target_sets(
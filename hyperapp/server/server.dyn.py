@@ -1,9 +1,15 @@
 import argparse
 import logging
+import threading
 from pathlib import Path
 
 from hyperapp.boot import dict_coders
+from hyperapp.boot.capsule_store import CapsuleStore
 
+from .services import (
+    mosaic,
+    web,
+    )
 from .code.mark import mark
 from .code.reconstructors import register_reconstructors
 
@@ -11,8 +17,12 @@ log = logging.getLogger(__name__)
 
 
 DEFAULT_IDENTITY_PATH = Path.home() / '.local/share/hyperapp/server/identity.json'
+DEFAULT_MOSAIC_SPILL_PATH = Path.home() / '.local/share/hyperapp/server/mosaic-spill'
 DEFAULT_HOST = 'localhost'
 DEFAULT_PORT = 7777
+SPILL_COMPACT_CHECK_SEC = 60
+SPILL_COMPACT_MIN_SIZE = 64 * 1024 * 1024
+SPILL_COMPACT_RATIO = 2  # Compact when spill grows this many times over it's size after last compaction.
 
 
 def _parse_args(sys_argv):
@@ -20,14 +30,27 @@ def _parse_args(sys_argv):
     parser.add_argument('--identity-path', type=Path, default=DEFAULT_IDENTITY_PATH, help="Path to server identity")
     parser.add_argument('--host', default=DEFAULT_HOST, help="Bind to host")
     parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Bind to port")
+    parser.add_argument('--mosaic-size-limit', type=int, help="Evict capsules from memory above this size (MB). Default is no limit")
+    parser.add_argument('--mosaic-spill-path', type=Path, default=DEFAULT_MOSAIC_SPILL_PATH, help="Where to keep evicted capsules")
     return parser.parse_args(sys_argv)
 
 
+def _compact_spill_loop(stop_signal, pick_refs, spill):
+    while not stop_signal.wait(SPILL_COMPACT_CHECK_SEC):
+        stats = spill.stats
+        if stats.total_size > SPILL_COMPACT_RATIO * max(stats.live_size, SPILL_COMPACT_MIN_SIZE):
+            try:
+                mosaic.compact_spill(pick_refs)
+            except Exception as x:
+                log.exception("Mosaic: Failed to compact spill: %s", x)
+
+
 @mark.service
 def server_main(
         stop_signal,
         route_table,
         identity_creg,
+        pick_refs,
         generate_rsa_identity,
         endpoint_registry,
         rpc_endpoint,
@@ -40,6 +63,15 @@ def server_main(
 
     register_reconstructors()
 
+    if args.mosaic_size_limit:
+        spill = CapsuleStore(args.mosaic_spill_path)
+        web.add_source(spill)
+        mosaic.set_size_limit(args.mosaic_size_limit * 1024 * 1024, spill)
+        log.info("Mosaic: size limit is %d MB; evicted capsules are kept at: %s", args.mosaic_size_limit, spill.path)
+        compact_thread = threading.Thread(
+            target=_compact_spill_loop, args=(stop_signal, pick_refs, spill), name='Mosaic-spill-compact', daemon=True)
+        compact_thread.start()
+
     identity_bundle = file_bundle_factory(args.identity_path)
     try:
         server_identity = identity_creg.animate(identity_bundle.load_piece())
@@ -1,6 +1,7 @@
 import logging
 import weakref
 from collections import defaultdict
+from functools import partial
 
 from . import htypes
 from .services import (
@@ -18,11 +19,27 @@ from .code.feed_servant import SubscriberIsGoneError, subscribe_server_feed, uns
 log = logging.getLogger(__name__)
 
 
+REMOTE_FEED_TIMEOUT_SEC = 10
+
+
+def remote_feed_lane(model):
+    # Requests for a remote model in this lane, like feed subscription and item fetching,
+    # are processed by it's server in order they are sent.
+    if not isinstance(model, htypes.model.remote_model):
+        return None
+    return f'model:{model.model.hash.hex()}'
+
+
 class Feed:
 
-    def __init__(self, peer_creg, rpc_system_call_factory, model):
+    # Subscribers fetch value anew on SetValueDiff without value; Slow remote ones are resynced this way.
+    is_resyncable = False
+
+    def __init__(self, peer_creg, rpc_system_call_factory, rpc_system_fn_submit_factory, rpc_result_cache, model):
         self._peer_creg = peer_creg
         self._rpc_system_call_factory = rpc_system_call_factory
+        self._rpc_system_fn_submit_factory = rpc_system_fn_submit_factory
+        self._rpc_result_cache = rpc_result_cache
         self._model = model
         self._close_hooks = []
         self._subscribed_to_remote_as = None
@@ -38,6 +55,7 @@ class Feed:
 
     def send(self, diff):
         log.info("Feed %s: Send: %s", self._model, diff)
+        self._rpc_result_cache.invalidate(self._model)
         for subscriber in [*self._subscribers]:
             try:
                 subscriber.process_diff(diff)
@@ -51,7 +69,8 @@ class Feed:
         if self._subscribed_to_remote_as:
             assert self._subscribed_to_remote_as == identity  # Already subscribed with another identity.
             return
-        self._call_remote_feed(identity, subscribe_server_feed)
+        # Not waited for, so it may be sent together with following requests, like fetching model items.
+        self._submit_remote_feed(identity, subscribe_server_feed)
         self._subscribed_to_remote_as = identity
         self.add_close_hook(self._unsubscribe_from_remote_feed)
 
@@ -59,9 +78,9 @@ class Feed:
         assert model is self._model
         if not self._subscribed_to_remote_as:
             return  # Not subscribed to remote.
-        self._call_remote_feed(self._subscribed_to_remote_as, unsubscribe_server_feed)
+        self._submit_remote_feed(self._subscribed_to_remote_as, unsubscribe_server_feed)
 
-    def _call_remote_feed(self, identity, remote_fn):
+    def _submit_remote_feed(self, identity, remote_fn):
         remote_peer = self._peer_creg.invite(self._model.remote_peer)
         real_model = web.summon(self._model.model)
         fn = ContextFn(
@@ -70,14 +89,21 @@ class Feed:
             service_params=('feed_factory', 'server_feed'),
             raw_fn=remote_fn,
             )
-        rpc_call = self._rpc_system_call_factory(
+        submit = self._rpc_system_fn_submit_factory(
             receiver_peer=remote_peer,
             sender_identity=identity,
             fn=fn,
+            timeout_sec=REMOTE_FEED_TIMEOUT_SEC,
+            lane=remote_feed_lane(self._model),
             )
         ctx = Context(real_model=real_model)
         call_kw = fn.call_kw(ctx)
-        rpc_call(**call_kw)
+        future = submit(**call_kw)
+        future.add_done_callback(partial(self._on_remote_feed_done, remote_fn))
+
+    def _on_remote_feed_done(self, remote_fn, future):
+        if not future.cancelled() and future.exception() is not None:
+            log.error("Feed %s: Remote %s failed: %r", self._model, remote_fn.__name__, future.exception())
 
     def _subscriber_gone(self):
         if self._subscribers:
@@ -88,7 +114,7 @@ class Feed:
 
 
 class ListFeed(Feed):
-    pass
+    is_resyncable = True
 
 
 class IndexTreeFeed(Feed):
@@ -120,7 +146,7 @@ def feed_map():
 
 
 @mark.service(ctl=DictConfigCtl(key_ctl=TypeKeyCtl()))
-def feed_factory(config, peer_creg, rpc_system_call_factory, feed_map, piece):
+def feed_factory(config, peer_creg, rpc_system_call_factory, rpc_system_fn_submit_factory, rpc_result_cache, feed_map, piece):
     try:
         return feed_map[piece]
     except KeyError:
@@ -136,9 +162,11 @@ def feed_factory(config, peer_creg, rpc_system_call_factory, feed_map, piece):
 
     model_t = deduce_t(real_model)
     Feed = config[model_t]
-    feed = Feed(peer_creg, rpc_system_call_factory, piece)
+    feed = Feed(peer_creg, rpc_system_call_factory, rpc_system_fn_submit_factory, rpc_result_cache, piece)
     feed_map[piece] = feed
     feed.add_close_hook(remove_feed)
+    # Cached results are invalidated by diffs, which do not come to closed feed.
+    feed.add_close_hook(rpc_result_cache.invalidate)
     return feed
 
 
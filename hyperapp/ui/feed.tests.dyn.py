@@ -96,6 +96,19 @@ def test_feed_finalizer(feed_map, feed_factory):
     assert piece not in feed_map
 
 
+def test_feed_close_invalidates_cache(feed_factory, rpc_result_cache):
+    piece = htypes.feed_tests.sample_list_feed()
+    feed = feed_factory(piece)
+    subscriber = Mock()
+    feed.subscribe(subscriber)
+    generation = rpc_result_cache.generation()
+    del subscriber
+    # Result fetched before feed is closed is not stored.
+    key = ('test-peer', 'test-fn', piece, ())
+    rpc_result_cache.put(key, ('item',), generation)
+    assert rpc_result_cache.get(key) is None
+
+
 def test_list_feed_actor(feed_type_creg, item_t):
     piece = htypes.feed.list_feed_type(mosaic.put(item_t))
     feed_type = feed_type_creg.animate(piece)
@@ -1,71 +1,355 @@
 import logging
-from collections import defaultdict
+import threading
+import time
+from collections import defaultdict, namedtuple
+from functools import partial
 
+from .services import (
+    mosaic,
+    )
 from .code.mark import mark
 from .code.context import Context
 from .code.system_fn import ContextFn
 from .code.transport import RemoteIsGoneError
+from .code.list_diff import ListDiffReplaceIdx, ListDiffReplaceKey
+from .code.value_diff import SetValueDiff
 from .code.remote_feed_receiver import remote_feed_receiver
 
 log = logging.getLogger(__name__)
 
 
+MAX_DELAY_SEC = 0.05  # Time first queued diff waits for following ones before they are sent.
+MAX_BATCH_DIFFS = 1000
+MAX_PENDING_DIFFS = 10000  # Diffs waiting for slow subscriber over this count are dropped, and it is resynced.
+MAX_UNRESYNCED_DIFFS = 100000  # Subscriber which can not resync is dropped when this many diffs are waiting for it.
+SEND_TIMEOUT_SEC = 10  # Batch not answered in this time is cancelled and counted as failed.
+DIFFS_LANE = 'feed-diffs'  # Receiver applies diffs from one server in order they are sent.
+
+
+DeliveryStats = namedtuple('DeliveryStats', [
+    'subscriber_count',
+    'pending_count',  # Diffs waiting to be sent.
+    'diff_count',  # Diffs put.
+    'sent_count',  # Diffs sent, after coalescing.
+    'batch_count',
+    'resync_count',
+    'drop_count',  # Subscribers dropped because they can not resync.
+    ])
+
+
 class SubscriberIsGoneError(Exception):
     pass
 
 
+def _replaces(prev_diff, diff):
+    if type(diff) is not type(prev_diff):
+        return False
+    if isinstance(diff, ListDiffReplaceIdx):
+        return diff.idx == prev_diff.idx
+    if isinstance(diff, ListDiffReplaceKey):
+        return diff.key == prev_diff.key
+    return False
+
+
+def _is_resync(diff):
+    return isinstance(diff, SetValueDiff) and diff.new_value is None
+
+
+def coalesce_diffs(diff_list):
+    # Drop diffs overridden by following ones: same element replaced again, or whole value set.
+    # Diffs following resync are dropped too: value fetched anew already has them applied.
+    result = []
+    for diff in diff_list:
+        if result and _is_resync(result[-1]):
+            continue
+        if isinstance(diff, SetValueDiff):
+            result = [diff]
+        elif result and _replaces(result[-1], diff):
+            result[-1] = diff
+        else:
+            result.append(diff)
+    return result
+
+
+def _min_wait(wait_sec, other_wait_sec):
+    # None means no wait limit.
+    if wait_sec is None:
+        return other_wait_sec
+    if other_wait_sec is None:
+        return wait_sec
+    return min(wait_sec, other_wait_sec)
+
+
+class _SubscriberQueue:
+
+    def __init__(self, subscription):
+        self.subscription = subscription
+        self.diff_list = []
+        self.coalesced_count = 0  # Diffs left after last coalescing.
+        self.first_put_time = None
+        self.in_flight = False
+        self.future = None  # Of batch in flight.
+        self.send_deadline = None
+
+
+class FeedDelivery:
+    """Sends diffs to remote subscribers from a thread, coalesced and in batches.
+
+    Batch is sent when it's first diff waited for max_delay_sec, or when it is full.
+    Subscriber has only one batch in flight, so diffs arrive in order, and slow one does not hold others.
+    When too many diffs are waiting for slow subscriber, they are replaced by SetValueDiff without value,
+    telling it to fetch the value anew; Only for subscriptions which can_resync. Others get all diffs,
+    up to max_unresynced_diffs; Subscription is set gone and dropped after that.
+    Waiting diffs are coalesced when their count doubles, so each put takes constant time on average.
+    Batch not answered in send_timeout_sec is cancelled, and is counted as a send failure.
+    """
+
+    def __init__(self, max_delay_sec=MAX_DELAY_SEC, max_batch_diffs=MAX_BATCH_DIFFS, max_pending_diffs=MAX_PENDING_DIFFS,
+                 max_unresynced_diffs=MAX_UNRESYNCED_DIFFS, send_timeout_sec=SEND_TIMEOUT_SEC):
+        self._max_delay_sec = max_delay_sec
+        self._max_batch_diffs = max_batch_diffs
+        self._max_pending_diffs = max_pending_diffs
+        self._max_unresynced_diffs = max_unresynced_diffs
+        self._send_timeout_sec = send_timeout_sec
+        self._cond = threading.Condition()
+        self._queues = {}  # subscription -> _SubscriberQueue
+        self._stopped = False
+        self._diff_count = 0
+        self._sent_count = 0
+        self._batch_count = 0
+        self._resync_count = 0
+        self._drop_count = 0
+
+    def put(self, subscription, diff):
+        with self._cond:
+            try:
+                queue = self._queues[subscription]
+            except KeyError:
+                queue = self._queues[subscription] = _SubscriberQueue(subscription)
+            self._diff_count += 1
+            if queue.diff_list and _is_resync(queue.diff_list[-1]):
+                return
+            if not queue.diff_list:
+                queue.first_put_time = time.monotonic()
+            queue.diff_list.append(diff)
+            if len(queue.diff_list) > max(self._max_pending_diffs, 2 * queue.coalesced_count):
+                queue.diff_list = coalesce_diffs(queue.diff_list)
+                queue.coalesced_count = len(queue.diff_list)
+            if len(queue.diff_list) > self._max_pending_diffs and subscription.can_resync:
+                log.warning("Feed delivery: %s is too slow, %d diffs are dropped; Resync it",
+                            subscription, len(queue.diff_list))
+                queue.diff_list = [SetValueDiff(None)]
+                self._resync_count += 1
+            if len(queue.diff_list) > self._max_unresynced_diffs:
+                error = SubscriberIsGoneError(
+                    f"{len(queue.diff_list)} diffs are waiting for it, and it can not be resynced")
+                del self._queues[subscription]
+                self._drop_count += 1
+            else:
+                error = None
+            self._cond.notify()
+        if error is not None:
+            log.warning("Feed delivery: %s is too slow: %s; Drop it", subscription, error)
+            subscription.set_gone(error)
+            raise error
+
+    def remove(self, subscription):
+        with self._cond:
+            self._queues.pop(subscription, None)
+
+    def stats(self):
+        with self._cond:
+            return DeliveryStats(
+                subscriber_count=len(self._queues),
+                pending_count=sum(len(queue.diff_list) for queue in self._queues.values()),
+                diff_count=self._diff_count,
+                sent_count=self._sent_count,
+                batch_count=self._batch_count,
+                resync_count=self._resync_count,
+                drop_count=self._drop_count,
+                )
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def run(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                expired_list, expire_wait_sec = self._take_expired_futures(now)
+                batch_list, wait_sec = self._take_ready_batches(now)
+                if not expired_list and not batch_list:
+                    self._cond.wait(_min_wait(wait_sec, expire_wait_sec))
+                    continue
+                self._cond.release()
+                try:
+                    for future in expired_list:
+                        # Done callback reports cancelled future as failed send.
+                        future.cancel()
+                    for queue, diff_list in batch_list:
+                        self._send(queue, diff_list)
+                finally:
+                    self._cond.acquire()
+
+    def _take_expired_futures(self, now):
+        # Returns futures of batches not answered in time, and time to wait for next one to expire.
+        future_list = []
+        wait_sec = None
+        for queue in self._queues.values():
+            if queue.future is None:
+                continue
+            if queue.send_deadline <= now:
+                log.warning("Feed delivery: %s: No response for diffs in %s seconds",
+                            queue.subscription, self._send_timeout_sec)
+                future_list.append(queue.future)
+                queue.future = None
+            else:
+                wait_sec = _min_wait(wait_sec, queue.send_deadline - now)
+        return (future_list, wait_sec)
+
+    def _take_ready_batches(self, now):
+        # Returns batches to send and time to wait for next one to become ready.
+        batch_list = []
+        wait_sec = None
+        for queue in self._queues.values():
+            if not queue.diff_list or queue.in_flight:
+                continue
+            ready_time = queue.first_put_time + self._max_delay_sec
+            if len(queue.diff_list) < self._max_batch_diffs and ready_time > now:
+                wait_sec = _min_wait(wait_sec, ready_time - now)
+                continue
+            diff_list = coalesce_diffs(queue.diff_list)
+            queue.diff_list = diff_list[self._max_batch_diffs:]
+            queue.coalesced_count = len(queue.diff_list)
+            queue.first_put_time = now
+            queue.in_flight = True
+            queue.send_deadline = now + self._send_timeout_sec
+            batch_list.append((queue, diff_list[:self._max_batch_diffs]))
+            self._batch_count += 1
+            self._sent_count += len(batch_list[-1][1])
+        return (batch_list, wait_sec)
+
+    def _send(self, queue, diff_list):
+        try:
+            future = queue.subscription.send_diffs(diff_list, self._send_timeout_sec)
+        except Exception as x:
+            self._on_sent(queue, x)
+            return
+        with self._cond:
+            queue.future = future
+            # Wake up to check it's deadline.
+            self._cond.notify()
+        future.add_done_callback(partial(self._on_future_done, queue))
+
+    def _on_future_done(self, queue, future):
+        if future.cancelled():
+            self._on_sent(queue, TimeoutError("Diffs are not answered in time, or their request is cancelled"))
+        else:
+            self._on_sent(queue, future.exception())
+
+    def _on_sent(self, queue, error):
+        if isinstance(error, RemoteIsGoneError):
+            log.info("Feed delivery: %s is gone: %s", queue.subscription, error)
+            queue.subscription.set_gone(error)
+            self.remove(queue.subscription)
+            return
+        if error is not None:
+            log.warning("Feed delivery: Failed to send diffs to %s: %r", queue.subscription, error)
+        with self._cond:
+            queue.in_flight = False
+            queue.future = None
+            self._cond.notify()
+
+
 class RemoteSubscription:
 
-    def __init__(self, rpc_system_call_factory, server_identity, remote_peer, model):
-        self._rpc_system_call_factory = rpc_system_call_factory
+    def __init__(self, rpc_system_fn_submit_factory, feed_delivery, server_identity, remote_peer, model, can_resync):
+        self._rpc_system_fn_submit_factory = rpc_system_fn_submit_factory
+        self._feed_delivery = feed_delivery
         self._server_identity = server_identity
         self._remote_peer = remote_peer
         self._model = model
+        self.can_resync = can_resync  # Subscriber fetches value anew on SetValueDiff without value.
+        self._gone_error = None
+
+    def __repr__(self):
+        return f"<RemoteSubscription: {self._remote_peer}: {self._model}>"
 
     def process_diff(self, diff):
-        log.info("Sending diff %s to %s", diff, self._remote_peer)
+        if self._gone_error is not None:
+            raise SubscriberIsGoneError(str(self._gone_error)) from self._gone_error
+        self._feed_delivery.put(self, diff)
+
+    def set_gone(self, error):
+        self._gone_error = error
+
+    def close(self):
+        self._feed_delivery.remove(self)
+
+    def send_diffs(self, diff_list, timeout_sec):
+        # Returns future.
+        log.info("Sending %d diffs to %s", len(diff_list), self._remote_peer)
         fn = ContextFn(
-            rpc_system_call_factory=self._rpc_system_call_factory,
-            ctx_params=('request', 'model', 'diff'),
+            rpc_system_call_factory=None,
+            ctx_params=('request', 'model', 'diff_list'),
             service_params=('diff_creg', 'feed_factory'),
             raw_fn=remote_feed_receiver,
             )
-        rpc_call = self._rpc_system_call_factory(
+        submit = self._rpc_system_fn_submit_factory(
             receiver_peer=self._remote_peer,
             sender_identity=self._server_identity,
             fn=fn,
+            timeout_sec=timeout_sec,
+            lane=DIFFS_LANE,
             )
         ctx = Context()
-        call_kw = fn.call_kw(ctx, model=self._model, diff=diff.piece)
-        try:
-            rpc_call(**call_kw)
-        except RemoteIsGoneError as x:
-            raise SubscriberIsGoneError(str(x)) from x
+        call_kw = fn.call_kw(ctx, model=self._model, diff_list=tuple(mosaic.put(diff.piece) for diff in diff_list))
+        return submit(**call_kw)
 
 
 class ServerFeed:
 
-    def __init__(self, rpc_system_call_factory, feed_factory):
-        self._rpc_system_call_factory = rpc_system_call_factory
+    def __init__(self, rpc_system_fn_submit_factory, feed_factory, feed_delivery):
+        self._rpc_system_fn_submit_factory = rpc_system_fn_submit_factory
         self._feed_factory = feed_factory
+        self._feed_delivery = feed_delivery
         self._peer_to_models = defaultdict(set)
         self._subscriptions = {}  # (remote_peer, model) -> RemoteSubscription
 
     def add(self, server_identity, remote_peer, model):
         feed = self._feed_factory(model)
         self._peer_to_models[remote_peer].add(model)
-        subscription = RemoteSubscription(self._rpc_system_call_factory, server_identity, remote_peer, model)
+        subscription = RemoteSubscription(
+            self._rpc_system_fn_submit_factory, self._feed_delivery, server_identity, remote_peer, model,
+            can_resync=feed.is_resyncable,
+            )
         feed.subscribe(subscription)
         self._subscriptions[remote_peer, model] = subscription
+        # Model is viewed by remote peer; keep it in memory while subscribed.
+        mosaic.pin(mosaic.put(model))
 
     def remove(self, server_identity, remote_peer, model):
         self._peer_to_models[remote_peer].remove(model)
-        del self._subscriptions[remote_peer, model]
+        subscription = self._subscriptions.pop((remote_peer, model))
+        subscription.close()
+        mosaic.unpin(mosaic.put(model))
+
+
+@mark.service
+def feed_delivery():
+    delivery = FeedDelivery()
+    thread = threading.Thread(target=delivery.run, name='Feed-delivery', daemon=True)
+    thread.start()
+    yield delivery
+    delivery.stop()
+    thread.join()
 
 
 @mark.service
-def server_feed(rpc_system_call_factory, feed_factory):
-    return ServerFeed(rpc_system_call_factory, feed_factory)
+def server_feed(rpc_system_fn_submit_factory, feed_factory, feed_delivery):
+    return ServerFeed(rpc_system_fn_submit_factory, feed_factory, feed_delivery)
 
 
 def subscribe_server_feed(feed_factory, server_feed, request, real_model):
@@ -1,5 +1,11 @@
+import threading
+import time
+from concurrent.futures import Future
+
 from . import htypes
 from .fixtures import feed_fixtures
+from .code.list_diff import IndexListDiff, KeyListDiff
+from .code.value_diff import SetValueDiff
 from .tested.code import feed_servant
 
 
@@ -9,3 +15,150 @@ def test_server_feed(generate_rsa_identity, server_feed):
     model = htypes.feed_servant_tests.sample_model()
     server_feed.add(server_feed, remote_identity.peer, model)
     server_feed.remove(server_feed, remote_identity.peer, model)
+
+
+def test_coalesce_diffs():
+    diff_list = [
+        IndexListDiff.Append('item-1'),
+        KeyListDiff.Replace('key-1', 'item-2'),
+        KeyListDiff.Replace('key-1', 'item-3'),
+        KeyListDiff.Replace('key-2', 'item-4'),
+        ]
+    assert feed_servant.coalesce_diffs(diff_list) == [diff_list[0], diff_list[2], diff_list[3]]
+    set_diff = SetValueDiff(['item-5'])
+    append_diff = IndexListDiff.Append('item-6')
+    assert feed_servant.coalesce_diffs([*diff_list, set_diff, append_diff]) == [set_diff, append_diff]
+
+
+class _Subscription:
+
+    def __init__(self, complete=True, can_resync=True):
+        self.complete = complete
+        self.can_resync = can_resync
+        self.batch_list = []
+        self.future_list = []
+        self.gone_error = None
+
+    def send_diffs(self, diff_list, timeout_sec):
+        self.batch_list.append(diff_list)
+        future = Future()
+        if self.complete:
+            future.set_result(None)
+        self.future_list.append(future)
+        return future
+
+    def set_gone(self, error):
+        self.gone_error = error
+
+
+def _wait_for(predicate):
+    for idx in range(200):
+        if predicate():
+            return
+        time.sleep(0.01)
+    assert predicate()
+
+
+def _run_delivery(delivery, fn):
+    thread = threading.Thread(target=delivery.run)
+    thread.start()
+    try:
+        fn()
+    finally:
+        delivery.stop()
+        thread.join()
+
+
+def test_diffs_are_sent_in_batches():
+    delivery = feed_servant.FeedDelivery(max_delay_sec=0.05, max_batch_diffs=100, max_pending_diffs=1000)
+    subscription_1 = _Subscription()
+    subscription_2 = _Subscription()
+    diff_list = [IndexListDiff.Append(f'item-{idx}') for idx in range(250)]
+
+    def send():
+        for diff in diff_list:
+            delivery.put(subscription_1, diff)
+            delivery.put(subscription_2, diff)
+        _wait_for(lambda: delivery.stats().sent_count == 500)
+
+    _run_delivery(delivery, send)
+    for subscription in [subscription_1, subscription_2]:
+        assert [diff for batch in subscription.batch_list for diff in batch] == diff_list
+        assert all(len(batch) <= 100 for batch in subscription.batch_list)
+
+
+def test_slow_subscriber_is_resynced():
+    delivery = feed_servant.FeedDelivery(max_delay_sec=0.01, max_batch_diffs=100, max_pending_diffs=20)
+    subscription = _Subscription(complete=False)
+
+    def send():
+        delivery.put(subscription, IndexListDiff.Append('first item'))
+        _wait_for(lambda: len(subscription.batch_list) == 1)
+        # First batch is not acknowledged yet; Following diffs are queued.
+        for idx in range(50):
+            delivery.put(subscription, IndexListDiff.Append(f'item-{idx}'))
+        assert delivery.stats().resync_count == 1
+        subscription.future_list[0].set_result(None)
+        _wait_for(lambda: len(subscription.batch_list) == 2)
+
+    _run_delivery(delivery, send)
+    [diff] = subscription.batch_list[1]
+    assert isinstance(diff, SetValueDiff)
+    assert diff.new_value is None
+
+
+def test_non_resyncable_subscriber_gets_all_diffs():
+    delivery = feed_servant.FeedDelivery(max_delay_sec=0.01, max_batch_diffs=100, max_pending_diffs=20)
+    subscription = _Subscription(complete=False, can_resync=False)
+    diff_list = [IndexListDiff.Append(f'item-{idx}') for idx in range(50)]
+
+    def send():
+        delivery.put(subscription, IndexListDiff.Append('first item'))
+        _wait_for(lambda: len(subscription.batch_list) == 1)
+        for diff in diff_list:
+            delivery.put(subscription, diff)
+        assert delivery.stats().resync_count == 0
+        subscription.future_list[0].set_result(None)
+        _wait_for(lambda: len(subscription.batch_list) == 2)
+
+    _run_delivery(delivery, send)
+    assert subscription.batch_list[1] == diff_list
+
+
+def test_slow_unresyncable_subscriber_is_dropped():
+    delivery = feed_servant.FeedDelivery(
+        max_delay_sec=0.01, max_batch_diffs=100, max_pending_diffs=20, max_unresynced_diffs=40)
+    subscription = _Subscription(complete=False, can_resync=False)
+
+    def send():
+        delivery.put(subscription, IndexListDiff.Append('first item'))
+        _wait_for(lambda: len(subscription.batch_list) == 1)
+        for idx in range(40):
+            delivery.put(subscription, IndexListDiff.Append(f'item-{idx}'))
+        try:
+            delivery.put(subscription, IndexListDiff.Append('one more item'))
+        except feed_servant.SubscriberIsGoneError:
+            pass
+        else:
+            assert False, "Slow subscriber is not dropped"
+
+    _run_delivery(delivery, send)
+    assert isinstance(subscription.gone_error, feed_servant.SubscriberIsGoneError)
+    stats = delivery.stats()
+    assert stats.subscriber_count == 0
+    assert stats.drop_count == 1
+
+
+def test_unanswered_batch_is_cancelled():
+    delivery = feed_servant.FeedDelivery(max_delay_sec=0.01, max_batch_diffs=100, send_timeout_sec=0.1)
+    subscription = _Subscription(complete=False)
+
+    def send():
+        delivery.put(subscription, IndexListDiff.Append('first item'))
+        _wait_for(lambda: len(subscription.batch_list) == 1)
+        delivery.put(subscription, IndexListDiff.Append('second item'))
+        # Next batch is sent after first one is timed out.
+        _wait_for(lambda: len(subscription.batch_list) == 2)
+
+    _run_delivery(delivery, send)
+    assert subscription.future_list[0].cancelled()
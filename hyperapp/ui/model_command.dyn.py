@@ -49,6 +49,19 @@ class ModelCommandFn(ModelCommandFnBase):
 
     _fn_t = htypes.command.model_command_fn
 
+    @classmethod
+    @mark.actor.system_fn_creg
+    def from_piece(cls, piece, system, rpc_system_call_factory, async_rpc_system_call_factory):
+        fn = pyobj_creg.invite(piece.function)
+        bound_fn = system.bind_services(fn, piece.service_params)
+        return cls(rpc_system_call_factory, piece.ctx_params, piece.service_params, fn, bound_fn,
+                   async_rpc_system_call_factory=async_rpc_system_call_factory)
+
+    def __init__(self, rpc_system_call_factory, ctx_params, service_params, raw_fn, bound_fn=None,
+                 async_rpc_system_call_factory=None):
+        super().__init__(rpc_system_call_factory, ctx_params, service_params, raw_fn, bound_fn)
+        self._async_rpc_system_call_factory = async_rpc_system_call_factory
+
     async def call(self, ctx, remote_peer=None, **kw):
         if remote_peer:
             return await self._remote_call(ctx, remote_peer, **kw)
@@ -56,17 +69,14 @@ class ModelCommandFn(ModelCommandFnBase):
             return await self._local_call(ctx, **kw)
 
     async def _remote_call(self, ctx, remote_peer, **kw):
-        rpc_call = self._rpc_system_call_factory(
+        # Event loop keeps running while remote side works on it.
+        rpc_call = self._async_rpc_system_call_factory(
             receiver_peer=remote_peer,
             sender_identity=ctx.identity,
             fn=self,
             )
         call_kw = self.call_kw(ctx, **kw)
-        result = rpc_call(**call_kw)
-        if inspect.iscoroutine(result):
-            # Special case for test fixtures.
-            result = await result
-        return result
+        return await rpc_call(**call_kw)
 
     async def _local_call(self, ctx, **kw):
         result = super().call(ctx, **kw)
@@ -102,13 +112,16 @@ class ModelCommandOpFn(ModelCommandFn):
 
     @classmethod
     @mark.actor.system_fn_creg
-    def from_piece(cls, piece, system, rpc_system_call_factory, model_servant):
+    def from_piece(cls, piece, system, rpc_system_call_factory, async_rpc_system_call_factory, model_servant):
         fn = pyobj_creg.invite(piece.function)
         bound_fn = system.bind_services(fn, piece.service_params)
-        return cls(rpc_system_call_factory, model_servant, piece.ctx_params, piece.service_params, fn, bound_fn)
+        return cls(rpc_system_call_factory, model_servant, piece.ctx_params, piece.service_params, fn, bound_fn,
+                   async_rpc_system_call_factory=async_rpc_system_call_factory)
 
-    def __init__(self, rpc_system_call_factory, model_servant, ctx_params, service_params, raw_fn, bound_fn=None):
-        super().__init__(rpc_system_call_factory, ctx_params, service_params, raw_fn, bound_fn)
+    def __init__(self, rpc_system_call_factory, model_servant, ctx_params, service_params, raw_fn, bound_fn=None,
+                 async_rpc_system_call_factory=None):
+        super().__init__(rpc_system_call_factory, ctx_params, service_params, raw_fn, bound_fn,
+                         async_rpc_system_call_factory=async_rpc_system_call_factory)
         self._model_servant = model_servant
 
     @staticmethod
@@ -108,9 +108,9 @@ def remote_identity(generate_rsa_identity):
 
 
 @mark.fixture
-def rpc_system_call_factory(remote_identity, receiver_peer, sender_identity, fn):
+def async_rpc_system_call_factory(remote_identity, receiver_peer, sender_identity, fn):
     request = Mock(receiver_identity=remote_identity)
-    def call(**kw):
+    async def call(**kw):
         ctx = Context(**kw, request=request)
         return fn.call(ctx)
     return call
@@ -1,4 +1,5 @@
 import logging
+import threading
 from functools import partial
 
 from .services import (
@@ -6,30 +7,44 @@ from .services import (
     )
 from .code.mark import mark
 from .code.system_fn import ContextFn
+from .code.value_diff import SetValueDiff
+from .code.feed import remote_feed_lane
 from .code.list_adapter import IndexListAdapterMixin, KeyListAdapterMixin, FnListAdapterBase
 from .code.list_servant_wrapper import list_wrapper
 
 log = logging.getLogger(__name__)
 
 
+FIRST_ITEMS_TIMEOUT_SEC = 10
+
+
 class FnListAdapter(FnListAdapterBase):
 
-    def __init__(self, system_fn_creg, rpc_system_call_factory, client_feed_factory, model_servant, column_visible_reg,
-                 model, real_model, item_t, remote_peer, ctx, fn):
+    def __init__(self, system_fn_creg, rpc_batcher, rpc_system_call_factory, rpc_system_stream_factory, rpc_result_cache,
+                 client_feed_factory, model_servant, column_visible_reg, model, real_model, item_t, remote_peer, ctx, fn):
         assert not (remote_peer and 'ctx' in fn.ctx_params)  # Functions with 'ctx' param are not remotable.
         super().__init__(column_visible_reg, real_model, item_t)
         self._system_fn_creg = system_fn_creg
         self._rpc_system_call_factory = rpc_system_call_factory
+        self._rpc_system_stream_factory = rpc_system_stream_factory
+        self._rpc_result_cache = rpc_result_cache
         self._model_servant = model_servant
         self._remote_peer = remote_peer
         self._ctx = ctx
         self._fn = fn
-        try:
-            self._feed = client_feed_factory(model, ctx)
-        except KeyError:
-            self._feed = None
-        else:
-            self._feed.subscribe(self)
+        self._lane = remote_feed_lane(model)
+        # Remote items received after populate are appended from endpoint worker thread.
+        self._lock = threading.RLock()
+        # Remote feed subscription and items request are sent together, in one bundle.
+        # Lock keeps diffs received meanwhile until items request is stored.
+        with self._lock, rpc_batcher.batch():
+            try:
+                self._feed = client_feed_factory(model, ctx)
+            except KeyError:
+                self._feed = None
+            else:
+                self._feed.subscribe(self)
+            self._receive_items = self._request_items()
 
     @property
     def function(self):
@@ -47,17 +62,29 @@ class FnListAdapter(FnListAdapterBase):
         return self._item_list
 
     def _ensure_populated(self):
-        if self._item_list is None:
-            self._populate()
+        with self._lock:
+            if self._item_list is None:
+                self._populate()
+
+    def process_diff(self, diff):
+        with self._lock:
+            if isinstance(diff, SetValueDiff):
+                # Items requested before are outdated.
+                self._receive_items = None
+            super().process_diff(diff)
 
     def _populate_item_list(self):
-        additional_kw = {
+        receive_items, self._receive_items = self._receive_items, None
+        if receive_items is None:
+            receive_items = self._request_items()
+        self._item_list = list(receive_items())
+
+    def _request_items(self):
+        # Remote items are requested at once; Returned function waits for them. Local function is called by it.
+        kw = {
             'model': self._real_model,
             'piece': self._real_model,
             }
-        self._item_list = list(self._call_fn(**additional_kw))
-
-    def _call_fn(self, **kw):
         if self._remote_peer:
             remote_peer = self._remote_peer
         else:
@@ -73,15 +100,49 @@ class FnListAdapter(FnListAdapterBase):
             'key_field_t': pyobj_creg.actor_to_piece_opt(self.key_field_t),
             }
         if remote_peer:
-            rpc_call = self._rpc_system_call_factory(
+            call_kw = wrapper_fn.call_kw(self._ctx, **wrapper_kw)
+            cache_key = self._rpc_result_cache.make_key(remote_peer, self._fn, self._real_model, call_kw)
+            generation = None
+            if cache_key is not None:
+                item_list = self._rpc_result_cache.get(cache_key)
+                if item_list is not None:
+                    log.info("Fn list adapter: %d items for %s are taken from cache", len(item_list), self._real_model)
+                    return partial(tuple, item_list)
+                generation = self._rpc_result_cache.generation()
+            open_stream = self._rpc_system_stream_factory(
                 receiver_peer=remote_peer,
                 sender_identity=self._ctx.identity,
                 fn=wrapper_fn,
+                lane=self._lane,
                 )
-            call_kw = wrapper_fn.call_kw(self._ctx, **wrapper_kw)
-            return rpc_call(**call_kw)
+            stream = open_stream(**call_kw)
+            return partial(self._receive_stream_items, stream, cache_key, generation)
         else:
-            return wrapper_fn.call(self._ctx, **wrapper_kw)
+            return partial(wrapper_fn.call, self._ctx, **wrapper_kw)
+
+    def _receive_stream_items(self, stream, cache_key, generation):
+        # Servant yielding items sends them in chunks; Show first ones without waiting for the rest.
+        stream.wait_for_items(FIRST_ITEMS_TIMEOUT_SEC)
+        stream.future.add_done_callback(partial(self._on_stream_done, stream, cache_key, generation))
+        return stream.subscribe(self._on_stream_items)
+
+    def _on_stream_items(self, item_list):
+        log.info("Fn list adapter: %d more items received for %s", len(item_list), self._real_model)
+        with self._lock:
+            for item in item_list:
+                visual_diff = self._apply_diff(self._append_diff(item))
+                for subscriber in self._subscribers:
+                    subscriber.process_diff(visual_diff)
+
+    def _on_stream_done(self, stream, cache_key, generation, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            log.error("Fn list adapter: Error receiving items for %s: %r", self._real_model, future.exception())
+            return
+        if cache_key is not None:
+            item_list = stream.items
+            self._rpc_result_cache.put(cache_key, item_list, generation, item_count=len(item_list))
 
     def _wrapper_fn(self):
         return ContextFn(
@@ -102,13 +163,13 @@ class FnIndexListAdapter(FnListAdapter, IndexListAdapterMixin):
     @classmethod
     @mark.actor.ui_adapter_creg
     def from_piece(cls, piece, model, ctx,
-                   system_fn_creg, rpc_system_call_factory, client_feed_factory,
-                   model_servant, column_visible_reg, peer_creg):
+                   system_fn_creg, rpc_batcher, rpc_system_call_factory, rpc_system_stream_factory, rpc_result_cache,
+                   client_feed_factory, model_servant, column_visible_reg, peer_creg):
         item_t = pyobj_creg.invite(piece.item_t)
         fn = system_fn_creg.invite(piece.system_fn)
         remote_peer, real_model = cls._resolve_model(peer_creg, model)
-        return cls(system_fn_creg, rpc_system_call_factory, client_feed_factory, model_servant, column_visible_reg,
-                   model, real_model, item_t, remote_peer, ctx, fn)
+        return cls(system_fn_creg, rpc_batcher, rpc_system_call_factory, rpc_system_stream_factory, rpc_result_cache,
+                   client_feed_factory, model_servant, column_visible_reg, model, real_model, item_t, remote_peer, ctx, fn)
     
 
 class FnKeyListAdapter(FnListAdapter, KeyListAdapterMixin):
@@ -116,17 +177,18 @@ class FnKeyListAdapter(FnListAdapter, KeyListAdapterMixin):
     @classmethod
     @mark.actor.ui_adapter_creg
     def from_piece(cls, piece, model, ctx,
-                   system_fn_creg, rpc_system_call_factory, client_feed_factory,
-                   model_servant, column_visible_reg, peer_creg):
+                   system_fn_creg, rpc_batcher, rpc_system_call_factory, rpc_system_stream_factory, rpc_result_cache,
+                   client_feed_factory, model_servant, column_visible_reg, peer_creg):
         item_t = pyobj_creg.invite(piece.item_t)
         fn = system_fn_creg.invite(piece.system_fn)
         remote_peer, real_model = cls._resolve_model(peer_creg, model)
         key_field_t = pyobj_creg.invite(piece.key_field_t)
-        return cls(system_fn_creg, rpc_system_call_factory, client_feed_factory, model_servant, column_visible_reg,
-                   model, real_model, item_t, remote_peer, ctx, fn, piece.key_field, key_field_t)
+        return cls(system_fn_creg, rpc_batcher, rpc_system_call_factory, rpc_system_stream_factory, rpc_result_cache,
+                   client_feed_factory, model_servant, column_visible_reg, model, real_model, item_t, remote_peer, ctx, fn, piece.key_field, key_field_t)
 
-    def __init__(self, system_fn_creg, rpc_system_call_factory, client_feed_factory, model_servant, column_visible_reg,
-                 model, real_model, item_t, remote_peer, ctx, fn, key_field, key_field_t):
-        super().__init__(system_fn_creg, rpc_system_call_factory, client_feed_factory, model_servant, column_visible_reg,
-                         model, real_model, item_t, remote_peer, ctx, fn)
+    def __init__(self, system_fn_creg, rpc_batcher, rpc_system_call_factory, rpc_system_stream_factory, rpc_result_cache,
+                 client_feed_factory, model_servant, column_visible_reg, model, real_model, item_t, remote_peer, ctx, fn, key_field, key_field_t):
+        # Key field is passed with items request, sent by base constructor.
         KeyListAdapterMixin.__init__(self, key_field, key_field_t)
+        super().__init__(system_fn_creg, rpc_batcher, rpc_system_call_factory, rpc_system_stream_factory, rpc_result_cache,
+                         client_feed_factory, model_servant, column_visible_reg, model, real_model, item_t, remote_peer, ctx, fn)
@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import threading
+import time
 from unittest.mock import Mock
 
 from . import htypes
@@ -250,3 +251,54 @@ def test_fn_adapter_with_remote_context(
             servant_ref=pyobj_creg.actor_to_ref(get_fn_called_flag),
             )
         assert get_fn_called_flag_call()
+
+
+def sample_remote_list_model_gen(piece):
+    log.info("Sample remote list generator fn: %s", piece)
+    yield from sample_list_model(piece)
+
+
+@mark.fixture
+def sample_remote_list_model_gen_fn():
+    return htypes.system_fn.ctx_fn(
+        function=pyobj_creg.actor_to_ref(sample_remote_list_model_gen),
+        ctx_params=('piece',),
+        service_params=(),
+        )
+
+
+def test_fn_adapter_with_remote_generator_model(
+        generate_rsa_identity,
+        endpoint_registry,
+        rpc_endpoint,
+        subprocess_rpc_server_running,
+        sample_remote_list_model_gen_fn,
+        ):
+
+    identity = generate_rsa_identity(fast=True)
+    endpoint_registry.register(identity, rpc_endpoint)
+
+    subprocess_name = 'test-remote-fn-list-adapter-main'
+    with subprocess_rpc_server_running(subprocess_name, identity) as process:
+        log.info("Started: %r", process)
+
+        model = htypes.list_adapter_tests.sample_list()
+        ctx = Context(
+            piece=model,
+            identity=identity,
+            remote_peer=process.peer,
+            )
+        adapter_piece = htypes.list_adapter.index_fn_list_adapter(
+            item_t=mosaic.put(pyobj_creg.actor_to_piece(htypes.list_adapter_tests.item)),
+            system_fn=mosaic.put(sample_remote_list_model_gen_fn),
+            )
+        adapter = fn_list_adapter.FnIndexListAdapter.from_piece(adapter_piece, model, ctx)
+
+        assert adapter.row_count() >= 1
+        assert adapter.cell_data(0, 0) == 11
+        for idx in range(100):
+            if adapter.row_count() == 3:
+                break
+            time.sleep(0.05)
+        assert adapter.row_count() == 3
+        assert adapter.cell_data(2, 1) == "third"
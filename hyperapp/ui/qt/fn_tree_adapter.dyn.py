@@ -26,10 +26,11 @@ class FnTreeAdapter(TreeAdapter):
             real_model = model
         return (remote_peer, real_model)
 
-    def __init__(self, rpc_system_call_factory, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn):
+    def __init__(self, rpc_system_call_factory, rpc_result_cache, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn):
         assert not (remote_peer and 'ctx' in fn.ctx_params)  # Functions with 'ctx' param are not remotable.
         super().__init__(real_model, item_t)
         self._rpc_system_call_factory = rpc_system_call_factory
+        self._rpc_result_cache = rpc_result_cache
         self._remote_peer = remote_peer
         self._column_names = sorted(self._item_t.fields)
         self._ctx = ctx
@@ -98,12 +99,7 @@ class FnTreeAdapter(TreeAdapter):
             **self._parent_model_kw(parent_id),
             **self._servant_wrapper_kw(),
             )
-        rpc_call = self._rpc_system_call_factory(
-            receiver_peer=remote_peer,
-            sender_identity=self._ctx.identity,
-            fn=wrapper_fn,
-            )
-        item_list, lateral_item_list_list = rpc_call(**call_kw)
+        item_list, lateral_item_list_list = self._remote_call(remote_peer, wrapper_fn, call_kw)
         log.info("Fn tree adapter: retrieved remote items for %s/%s: %s", self._real_model, parent_id, item_list)
         if item_list:
             self._store_item_list(parent_id, item_list)
@@ -113,6 +109,25 @@ class FnTreeAdapter(TreeAdapter):
             self._store_item_list(item_id, item_list)
             self._lateral_ids.add(item_id)
 
+    def _remote_call(self, remote_peer, wrapper_fn, call_kw):
+        cache_key = self._rpc_result_cache.make_key(remote_peer, self._fn, self._real_model, call_kw)
+        if cache_key is not None:
+            result = self._rpc_result_cache.get(cache_key)
+            if result is not None:
+                return result
+            generation = self._rpc_result_cache.generation()
+        rpc_call = self._rpc_system_call_factory(
+            receiver_peer=remote_peer,
+            sender_identity=self._ctx.identity,
+            fn=wrapper_fn,
+            )
+        item_list, lateral_item_list_list = rpc_call(**call_kw)
+        result = (item_list, lateral_item_list_list)
+        if cache_key is not None:
+            item_count = len(item_list or ()) + sum(len(items) for items in lateral_item_list_list)
+            self._rpc_result_cache.put(cache_key, result, generation, item_count)
+        return result
+
     @cached_property
     def _remote_result_t(self):
         item_t = self._item_t
@@ -127,14 +142,15 @@ class FnIndexTreeAdapter(FnTreeAdapter, IndexTreeAdapterMixin):
 
     @classmethod
     @mark.actor.ui_adapter_creg
-    def from_piece(cls, piece, model, ctx, system_fn_creg, rpc_system_call_factory, peer_creg, client_feed_factory):
+    def from_piece(cls, piece, model, ctx, system_fn_creg, rpc_system_call_factory, rpc_result_cache,
+                   peer_creg, client_feed_factory):
         item_t = pyobj_creg.invite(piece.item_t)
         fn = system_fn_creg.invite(piece.system_fn)
         remote_peer, real_model = cls._resolve_model(peer_creg, model)
-        return cls(rpc_system_call_factory, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn)
+        return cls(rpc_system_call_factory, rpc_result_cache, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn)
 
-    def __init__(self, rpc_system_call_factory, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn):
-        super().__init__(rpc_system_call_factory, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn)
+    def __init__(self, rpc_system_call_factory, rpc_result_cache, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn):
+        super().__init__(rpc_system_call_factory, rpc_result_cache, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn)
         IndexTreeAdapterMixin.__init__(self)
 
 
@@ -142,15 +158,16 @@ class FnKeyTreeAdapter(FnTreeAdapter, KeyTreeAdapterMixin):
 
     @classmethod
     @mark.actor.ui_adapter_creg
-    def from_piece(cls, piece, model, ctx, system_fn_creg, rpc_system_call_factory, peer_creg, client_feed_factory):
+    def from_piece(cls, piece, model, ctx, system_fn_creg, rpc_system_call_factory, rpc_result_cache,
+                   peer_creg, client_feed_factory):
         item_t = pyobj_creg.invite(piece.item_t)
         fn = system_fn_creg.invite(piece.system_fn)
         remote_peer, real_model = cls._resolve_model(peer_creg, model)
         key_field_t = pyobj_creg.invite(piece.key_field_t)
-        return cls(rpc_system_call_factory, client_feed_factory,
+        return cls(rpc_system_call_factory, rpc_result_cache, client_feed_factory,
                    model, real_model, item_t, remote_peer, ctx, fn, piece.key_field, key_field_t)
 
-    def __init__(self, rpc_system_call_factory, client_feed_factory,
+    def __init__(self, rpc_system_call_factory, rpc_result_cache, client_feed_factory,
                  model, real_model, item_t, remote_peer, ctx, fn, key_field, key_field_t):
-        super().__init__(rpc_system_call_factory, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn)
+        super().__init__(rpc_system_call_factory, rpc_result_cache, client_feed_factory, model, real_model, item_t, remote_peer, ctx, fn)
         KeyTreeAdapterMixin.__init__(self, key_field, key_field_t)
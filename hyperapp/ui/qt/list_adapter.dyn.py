@@ -12,6 +12,7 @@ from .services import (
     web,
     )
 from .code.list_diff import IndexListDiff, KeyListDiff
+from .code.value_diff import SetValueDiff
 
 log = logging.getLogger(__name__)
 
@@ -61,6 +62,10 @@ class IndexListAdapterMixin:
     def _populate(self):
         self._populate_item_list()
 
+    @staticmethod
+    def _append_diff(item):
+        return IndexListDiff.Append(item)
+
     def _apply_diff(self, diff):
         if isinstance(diff, IndexListDiff.Append):
             self._item_list.append(diff.item)
@@ -119,10 +124,15 @@ class KeyListAdapterMixin:
 
     def _populate(self):
         self._populate_item_list()
+        self._key_to_idx = {}
         for idx, item in enumerate(self._item_list):
             key = getattr(item, self._key_field)
             self._key_to_idx[key] = idx
 
+    @staticmethod
+    def _append_diff(item):
+        return KeyListDiff.Append(item)
+
     def _apply_diff(self, diff):
         if isinstance(diff, KeyListDiff.Append):
             key = getattr(diff.item, self._key_field)
@@ -199,8 +209,13 @@ class FnListAdapterBase(metaclass=abc.ABCMeta):
 
     def process_diff(self, diff):
         log.info("List adapter: process diff: %s", diff)
-        self._ensure_populated()
-        visual_diff = self._apply_diff(diff)
+        if isinstance(diff, SetValueDiff):
+            # Items are fetched anew when requested.
+            self._item_list = None
+            visual_diff = diff
+        else:
+            self._ensure_populated()
+            visual_diff = self._apply_diff(diff)
         for subscriber in self._subscribers:
             subscriber.process_diff(visual_diff)
 
@@ -11,8 +11,8 @@ from .tested.code import remote_command
 
 
 @mark.fixture
-def rpc_system_call_factory(receiver_peer, sender_identity, fn):
-    def call(**kw):
+def async_rpc_system_call_factory(receiver_peer, sender_identity, fn):
+    async def call(**kw):
         return htypes.command.command_result(
             model=mosaic.put('remote-sample-result'),
             key=None,
@@ -26,9 +26,10 @@ def sample_command():
 
 
 @mark.fixture
-def sample_command_fn(rpc_system_call_factory):
+def sample_command_fn(rpc_system_call_factory, async_rpc_system_call_factory):
     return ModelCommandFn(
         rpc_system_call_factory=rpc_system_call_factory,
+        async_rpc_system_call_factory=async_rpc_system_call_factory,
         ctx_params=(),
         service_params=(),
         raw_fn=sample_command,
@@ -10,12 +10,13 @@ log = logging.getLogger(__name__)
 
 
 @mark.service
-def remote_feed_receiver(diff_creg, feed_factory, request, model, diff):
-    diff_obj = diff_creg.animate(diff)
-    log.info("Received remote diff from %s for %s: %s", request.remote_peer, model, diff_obj)
+def remote_feed_receiver(diff_creg, feed_factory, request, model, diff_list):
+    diff_obj_list = [diff_creg.invite(diff_ref) for diff_ref in diff_list]
+    log.info("Received %d remote diffs from %s for %s: %s", len(diff_obj_list), request.remote_peer, model, diff_obj_list)
     remote_model = htypes.model.remote_model(
         model=mosaic.put(model),
         remote_peer=mosaic.put(request.remote_peer.piece),
         )
     feed = feed_factory(remote_model)
-    feed.send(diff_obj)
+    for diff_obj in diff_obj_list:
+        feed.send(diff_obj)
@@ -1,6 +1,9 @@
 from unittest.mock import Mock
 
 from . import htypes
+from .services import (
+    mosaic,
+    )
 from .code.mark import mark
 from .code.list_diff import IndexListDiff
 from .tested.code import remote_feed_receiver as remote_feed_receiver_module
@@ -19,5 +22,6 @@ def test_remote_feed_receiver(generate_rsa_identity, remote_feed_receiver):
     item = htypes.remote_feed_receiver_tests.sample_item(
         attr="Sample item",
         )
-    diff = IndexListDiff.Append(item)
-    remote_feed_receiver(request, model, diff.piece)
+    diff_1 = IndexListDiff.Append(item)
+    diff_2 = IndexListDiff.Remove(0)
+    remote_feed_receiver(request, model, [mosaic.put(diff_1.piece), mosaic.put(diff_2.piece)])
@@ -0,0 +1,185 @@
+import logging
+import threading
+from collections import OrderedDict, defaultdict, namedtuple
+
+from . import htypes
+from .services import (
+    deduce_t,
+    web,
+    )
+from .code.mark import mark
+from .code.config_ctl import DataValueCtl, DictConfigCtl
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_ENTRIES = 200
+DEFAULT_MAX_ITEMS = 100000  # Total items in all cached results.
+DEFAULT_MAX_INVALIDATIONS = 1000  # Models with remembered last invalidation.
+
+
+CacheStats = namedtuple('CacheStats', [
+    'entry_count',
+    'item_count',
+    'hit_count',
+    'miss_count',
+    'invalidate_count',  # Entries dropped because their model got a diff or it's feed was closed.
+    'evict_count',  # Entries dropped because of size limits.
+    ])
+
+
+def cache_hit_rate(stats):
+    request_count = stats.hit_count + stats.miss_count
+    if not request_count:
+        return None
+    return stats.hit_count / request_count
+
+
+def real_model(model):
+    if isinstance(model, htypes.model.remote_model):
+        return web.summon(model.model)
+    return model
+
+
+class _Entry:
+
+    def __init__(self, model, result, item_count):
+        self.model = model
+        self.result = result
+        self.item_count = item_count
+
+
+class RpcResultCache:
+    """Results of remote model function calls, for models marked with mark.model(cache=True).
+
+    Key is receiver peer, called function, model and call parameters.
+    Least recently used entries are dropped when entry or item count limit is exceeded.
+    All entries for a model are dropped when a diff for it is sent to it's feed, and when it's feed is closed;
+    Results of calls started before that are not stored.
+    Generation is a counter of all invalidations. Last invalidation generation is remembered for
+    recently invalidated models only; Results of calls started before forgotten ones are not stored.
+    """
+
+    def __init__(self, model_cache_reg, max_entries=DEFAULT_MAX_ENTRIES, max_items=DEFAULT_MAX_ITEMS,
+                 max_invalidations=DEFAULT_MAX_INVALIDATIONS):
+        self._model_cache_reg = model_cache_reg
+        self._max_entries = max_entries
+        self._max_items = max_items
+        self._max_invalidations = max_invalidations
+        self._lock = threading.Lock()
+        self._key_to_entry = OrderedDict()
+        self._model_to_keys = defaultdict(set)
+        self._generation = 0
+        self._model_to_invalidation = OrderedDict()  # model -> generation it was last invalidated at.
+        self._forgotten_generation = 0  # Last generation dropped from _model_to_invalidation.
+        self._item_count = 0
+        self._hit_count = 0
+        self._miss_count = 0
+        self._invalidate_count = 0
+        self._evict_count = 0
+
+    def is_cached_model(self, model):
+        try:
+            self._model_cache_reg[deduce_t(model)]
+        except KeyError:
+            return False
+        return True
+
+    def make_key(self, peer, fn, model, call_kw):
+        # Returns None if call is not cached.
+        if not self.is_cached_model(model):
+            return None
+        key = (peer.piece, fn.piece, model, tuple(sorted(call_kw.items())))
+        try:
+            hash(key)
+        except TypeError:
+            log.debug("Rpc result cache: Call parameters for %s are not hashable; not cached", model)
+            return None
+        return key
+
+    def generation(self):
+        # Pass to put to skip storing results fetched before model was invalidated.
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        # Returns None for missing entry.
+        with self._lock:
+            try:
+                entry = self._key_to_entry[key]
+            except KeyError:
+                self._miss_count += 1
+                return None
+            self._key_to_entry.move_to_end(key)
+            self._hit_count += 1
+            log.debug("Rpc result cache: Hit for %s", entry.model)
+            return entry.result
+
+    def put(self, key, result, generation, item_count=1):
+        model = key[2]
+        with self._lock:
+            if self._is_invalidated_since(model, generation):
+                log.debug("Rpc result cache: %s is changed while fetched; not stored", model)
+                return
+            if item_count > self._max_items:
+                return
+            self._remove(key)
+            self._key_to_entry[key] = _Entry(model, result, item_count)
+            self._model_to_keys[model].add(key)
+            self._item_count += item_count
+            while len(self._key_to_entry) > self._max_entries or self._item_count > self._max_items:
+                old_key = next(iter(self._key_to_entry))
+                self._remove(old_key)
+                self._evict_count += 1
+
+    def invalidate(self, model):
+        model = real_model(model)
+        with self._lock:
+            self._generation += 1
+            self._model_to_invalidation[model] = self._generation
+            self._model_to_invalidation.move_to_end(model)
+            if len(self._model_to_invalidation) > self._max_invalidations:
+                self._forgotten_generation = self._model_to_invalidation.popitem(last=False)[1]
+            key_set = self._model_to_keys.pop(model, set())
+            for key in key_set:
+                self._remove(key)
+            self._invalidate_count += len(key_set)
+        if key_set:
+            log.info("Rpc result cache: Dropped %d entries for %s", len(key_set), model)
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(
+                entry_count=len(self._key_to_entry),
+                item_count=self._item_count,
+                hit_count=self._hit_count,
+                miss_count=self._miss_count,
+                invalidate_count=self._invalidate_count,
+                evict_count=self._evict_count,
+                )
+
+    def _is_invalidated_since(self, model, generation):
+        if generation < self._forgotten_generation:
+            return True  # Can not tell.
+        return self._model_to_invalidation.get(model, 0) > generation
+
+    def _remove(self, key):
+        entry = self._key_to_entry.pop(key, None)
+        if entry is None:
+            return
+        self._item_count -= entry.item_count
+        key_set = self._model_to_keys.get(entry.model)
+        if key_set is not None:
+            key_set.discard(key)
+            if not key_set:
+                del self._model_to_keys[entry.model]
+
+
+@mark.service(ctl=DictConfigCtl(value_ctl=DataValueCtl()))
+def model_cache_reg(config):
+    return config
+
+
+@mark.service
+def rpc_result_cache(model_cache_reg):
+    return RpcResultCache(model_cache_reg)
@@ -0,0 +1,100 @@
+from unittest.mock import Mock
+
+from . import htypes
+from .services import (
+    mosaic,
+    )
+from .code.mark import mark
+from .tested.code import rpc_result_cache as rpc_result_cache_module
+
+
+@mark.config_fixture('model_cache_reg')
+def model_cache_reg_config():
+    return {
+        htypes.rpc_result_cache_tests.cached_sample_model: htypes.model.cached_model(),
+        }
+
+
+def _cache_key(cache, model, **kw):
+    peer = Mock(piece='test-peer')
+    fn = Mock(piece='test-fn')
+    return cache.make_key(peer, fn, model, kw)
+
+
+def test_not_cached_model(rpc_result_cache):
+    model = htypes.rpc_result_cache_tests.sample_model()
+    assert _cache_key(rpc_result_cache, model, param=1) is None
+
+
+def test_result_is_cached(rpc_result_cache):
+    model = htypes.rpc_result_cache_tests.cached_sample_model(name="cached")
+    key = _cache_key(rpc_result_cache, model, param=1)
+    generation = rpc_result_cache.generation()
+    assert rpc_result_cache.get(key) is None
+    rpc_result_cache.put(key, ('item-1', 'item-2'), generation, item_count=2)
+    assert rpc_result_cache.get(key) == ('item-1', 'item-2')
+    assert rpc_result_cache.get(_cache_key(rpc_result_cache, model, param=2)) is None
+    stats = rpc_result_cache.stats()
+    assert stats.hit_count == 1
+    assert stats.miss_count == 2
+    assert stats.item_count == 2
+    assert rpc_result_cache_module.cache_hit_rate(stats) == 1 / 3
+
+
+def test_diff_invalidates_result(rpc_result_cache):
+    model = htypes.rpc_result_cache_tests.cached_sample_model(name="invalidated")
+    key = _cache_key(rpc_result_cache, model)
+    rpc_result_cache.put(key, ('item',), rpc_result_cache.generation())
+    remote_model = htypes.model.remote_model(
+        model=mosaic.put(model),
+        remote_peer=mosaic.put("test-peer"),
+        )
+    rpc_result_cache.invalidate(remote_model)
+    assert rpc_result_cache.get(key) is None
+    assert rpc_result_cache.stats().invalidate_count == 1
+
+
+def test_result_fetched_before_diff_is_not_stored(rpc_result_cache):
+    model = htypes.rpc_result_cache_tests.cached_sample_model(name="changed")
+    key = _cache_key(rpc_result_cache, model)
+    generation = rpc_result_cache.generation()
+    rpc_result_cache.invalidate(model)
+    rpc_result_cache.put(key, ('old item',), generation)
+    assert rpc_result_cache.get(key) is None
+
+
+def test_least_recently_used_is_evicted():
+    model_cache_reg = {htypes.rpc_result_cache_tests.cached_sample_model: htypes.model.cached_model()}
+    cache = rpc_result_cache_module.RpcResultCache(model_cache_reg, max_entries=10, max_items=5)
+    model = htypes.rpc_result_cache_tests.cached_sample_model(name="evicted")
+    generation = cache.generation()
+    key_1 = _cache_key(cache, model, param=1)
+    key_2 = _cache_key(cache, model, param=2)
+    key_3 = _cache_key(cache, model, param=3)
+    cache.put(key_1, ('1',) * 2, generation, item_count=2)
+    cache.put(key_2, ('2',) * 2, generation, item_count=2)
+    cache.get(key_1)
+    cache.put(key_3, ('3',) * 2, generation, item_count=2)
+    assert cache.get(key_2) is None
+    assert cache.get(key_1) is not None
+    assert cache.get(key_3) is not None
+    assert cache.stats().evict_count == 1
+
+
+def test_invalidations_are_forgotten():
+    model_cache_reg = {htypes.rpc_result_cache_tests.cached_sample_model: htypes.model.cached_model()}
+    cache = rpc_result_cache_module.RpcResultCache(model_cache_reg, max_invalidations=2)
+    model = htypes.rpc_result_cache_tests.cached_sample_model(name="not invalidated")
+    key = _cache_key(cache, model)
+    generation = cache.generation()
+    for idx in range(2):
+        cache.invalidate(htypes.rpc_result_cache_tests.cached_sample_model(name=f"invalidated #{idx}"))
+    # Invalidation of other models does not prevent storing.
+    cache.put(key, ('first item',), generation)
+    assert cache.get(key) == ('first item',)
+    cache.invalidate(htypes.rpc_result_cache_tests.cached_sample_model(name="invalidated #2"))
+    # Whether this model was invalidated since generation is no longer known.
+    cache.put(key, ('second item',), generation)
+    assert cache.get(key) == ('first item',)
+    cache.put(key, ('third item',), cache.generation())
+    assert cache.get(key) == ('third item',)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Measure bundling of 10k-capsule graphs with current bundler and with one from given git revision,
+# and check both produce same bundles.
+# PYTHONPATH=. scripts/bundler-bench.py [--old-rev=<git revision>]
+
+import argparse
+import subprocess
+import sys
+import time
+import types
+
+from hyperapp.boot.htypes import tString
+from hyperapp.boot.services import HYPERAPP_DIR, Services
+from hyperapp.boot import cdr_coders  # register codec
+
+
+OLD_REV = 'dfba836'  # Last revision with list-based traversal.
+BASE_DIR = HYPERAPP_DIR / 'base'
+PACKAGE = 'bundler_bench'
+FAN_OUT = 10
+RUN_COUNT = 5  # First one fills caches.
+
+
+def load_dyn_module(name, source, services):
+    # Dyn modules import services relatively, from their package.
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = []
+        sys.modules[PACKAGE] = package
+        services_module = types.ModuleType(f'{PACKAGE}.services')
+        services_module.__dict__.update({name: getattr(services, name) for name in services.builtin_services})
+        sys.modules[services_module.__name__] = services_module
+    module = types.ModuleType(f'{PACKAGE}.{name}')
+    module.__package__ = PACKAGE
+    exec(compile(source, f'{name}.dyn.py', 'exec'), module.__dict__)
+    sys.modules[module.__name__] = module
+    return module
+
+
+def old_bundler_source(rev):
+    return subprocess.run(
+        ['git', 'show', f'{rev}:hyperapp/base/bundler.dyn.py'],
+        check=True, capture_output=True, text=True, cwd=HYPERAPP_DIR.parent,
+        ).stdout
+
+
+def make_tree_graph(mosaic, capsule_count):
+    # Layout-like: tree of string lists with string leaves.
+    level = [mosaic.put(f"leaf #{idx}") for idx in range(capsule_count * (FAN_OUT - 1) // FAN_OUT)]
+    while len(level) > 1:
+        level = [mosaic.put(tuple(level[idx:idx + FAN_OUT])) for idx in range(0, len(level), FAN_OUT)]
+    return level
+
+
+def make_chain_graph(mosaic, capsule_count):
+    # History-like: each commit refers to previous one and to it's own leaf.
+    prev = ()
+    for idx in range(capsule_count // 2):
+        leaf = mosaic.put(f"commit #{idx}")
+        prev = (mosaic.put((leaf, *prev)),)
+    return list(prev)
+
+
+def measure(bundle_fn, ref_list):
+    time_list = []
+    for idx in range(RUN_COUNT):
+        start = time.perf_counter()
+        result = bundle_fn(ref_list)
+        time_list.append(time.perf_counter() - start)
+    return (result, time_list[0], min(time_list[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare bundlers")
+    parser.add_argument('--old-rev', default=OLD_REV, help="Git revision with bundler to compare with")
+    parser.add_argument('--capsule-count', type=int, default=10000)
+    args = parser.parse_args()
+
+    services = Services()
+    services.init_services()
+    ref_picker = load_dyn_module('ref_picker', (BASE_DIR / 'ref_picker.dyn.py').read_text(), services)
+    new_bundler = load_dyn_module('bundler', (BASE_DIR / 'bundler.dyn.py').read_text(), services)
+    old_bundler = load_dyn_module('old_bundler', old_bundler_source(args.old_rev), services)
+
+    # Association lookups are done for every bundled ref and it's type; have one to find.
+    mosaic = services.mosaic
+    services.association_reg.set_association([services.pyobj_creg.actor_to_piece(tString)], 'bench', "bench cfg item")
+
+    cache = new_bundler.BundlerCache()
+    picker_cache = ref_picker.RefPickerCache({}, {})
+    pick_refs = lambda value, t=None: ref_picker.pick_refs(picker_cache, value, t)
+    bundle_fn = {
+        'old': lambda ref_list: old_bundler.bundler(pick_refs, ref_list),
+        'new': lambda ref_list: new_bundler.bundler(pick_refs, cache, ref_list),
+        }
+    for name, make_graph in [('tree', make_tree_graph), ('chain', make_chain_graph)]:
+        ref_list = make_graph(mosaic, args.capsule_count)
+        old_rb, old_first, old_time = measure(bundle_fn['old'], ref_list)
+        new_rb, new_first, new_time = measure(bundle_fn['new'], ref_list)
+        assert new_rb.bundle == old_rb.bundle, name
+        assert new_rb.ref_set == old_rb.ref_set, name
+        print(f"{name:>5}: {len(new_rb.bundle.capsule_list):6} capsules:"
+              f" first: old {old_first * 1000:7.1f} ms, new {new_first * 1000:7.1f} ms;"
+              f" repeated: old {old_time * 1000:7.1f} ms, new {new_time * 1000:7.1f} ms; same bundle")
+
+
+if __name__ == '__main__':
+    main()
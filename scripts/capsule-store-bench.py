@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# Compare cold start from capsule store with loading whole bundle file.
+# PYTHONPATH=. scripts/capsule-store-bench.py
+
+import tempfile
+import time
+from pathlib import Path
+
+from hyperapp.boot.htypes import ref_t, capsule_t, bundle_t
+from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.ref import make_ref
+from hyperapp.boot.mosaic import Mosaic
+from hyperapp.boot.capsule_store import CapsuleStore
+from hyperapp.boot import cdr_coders  # register codec
+
+
+def make_capsule_list(size):
+    return [
+        capsule_t(
+            type_ref=ref_t('sha512', bytes([idx % 256]) * 64),
+            encoding='cdr',
+            encoded_object=b'object-%d' % idx * 20,
+            )
+        for idx in range(size)
+        ]
+
+
+def load_bundle(path, ref):
+    # What FileBundle.load does: decode whole file and register every capsule.
+    bundle = packet_coders.decode('cdr', path.read_bytes(), bundle_t)
+    mosaic = Mosaic(pyobj_creg=None)
+    for capsule in bundle.capsule_list:
+        mosaic.register_capsule(capsule)
+    return mosaic.get(ref)
+
+
+def load_store(path, ref):
+    with CapsuleStore(path) as store:
+        return store.pull(ref)
+
+
+def measure(title, fn, *args, repeat=5):
+    best = None
+    for idx in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return (result, best)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        for size in [1000, 10000, 100000]:
+            capsule_list = make_capsule_list(size)
+            ref = make_ref(capsule_list[size // 2])
+            bundle_path = temp_dir / f'bundle-{size}.cdr'
+            bundle = bundle_t(roots=(ref,), associations=(), capsule_list=tuple(capsule_list))
+            bundle_path.write_bytes(packet_coders.encode('cdr', bundle, bundle_t))
+            store_path = temp_dir / f'store-{size}'
+            with CapsuleStore(store_path) as store:
+                for capsule in capsule_list:
+                    store.put(capsule)
+            bundle_capsule, bundle_time = measure("bundle", load_bundle, bundle_path, ref)
+            store_capsule, store_time = measure("store", load_store, store_path, ref)
+            assert bundle_capsule == store_capsule == capsule_list[size // 2]
+            print(f"{size:>7} capsules"
+                  f"  bundle file: {bundle_time * 1000:9.3f} ms"
+                  f"  capsule store: {store_time * 1000:9.3f} ms"
+                  f"  speedup: {bundle_time / store_time:7.1f}x")
+
+
+main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Compare fast-path CDR decoder with path-tracking one.
+# PYTHONPATH=. scripts/cdr-decoder-bench.py
+
+import time
+from timeit import repeat
+
+from hyperapp.boot.htypes import (
+    TList,
+    TOptional,
+    TRecord,
+    tBool,
+    tInt,
+    tString,
+    ref_t,
+    capsule_t,
+    bundle_t,
+    )
+from hyperapp.boot.cdr_encoder import CdrEncoder
+from hyperapp.boot.cdr_decoder import CdrDecoder
+
+
+def make_bundle(size):
+    capsule_list = tuple(
+        capsule_t(
+            type_ref=ref_t('sha512', bytes([idx % 256]) * 64),
+            encoding='cdr',
+            encoded_object=b'object-%d' % idx * 10,
+            )
+        for idx in range(size)
+        )
+    value = bundle_t(
+        roots=tuple(ref_t('sha512', bytes([idx % 256]) * 64) for idx in range(size // 10)),
+        associations=(),
+        capsule_list=capsule_list,
+        )
+    return (value, bundle_t)
+
+
+def make_item_list(size):
+    item_t = TRecord('bench', 'item', {
+        'id': tInt,
+        'name': tString,
+        'size': tInt,
+        'is_dir': tBool,
+        'parent_id': TOptional(tInt),
+        })
+    value = tuple(item_t(idx, f'item-{idx}', idx * 10, idx % 2 == 0, idx - 1 or None) for idx in range(size))
+    return (value, TList(item_t))
+
+
+def measure(title, value, t, number):
+    data = CdrEncoder.encode(value, t)
+    assert CdrDecoder.decode(t, data) == CdrDecoder.decode_with_path(t, data) == value, title
+    old_time = min(repeat(lambda: CdrDecoder.decode_with_path(t, data), number=number, repeat=5, timer=time.perf_counter))
+    new_time = min(repeat(lambda: CdrDecoder.decode(t, data), number=number, repeat=5, timer=time.perf_counter))
+    print(f"{title:<30} {len(data):>10} bytes"
+          f"  path-tracking: {old_time / number * 1000:9.3f} ms"
+          f"  fast: {new_time / number * 1000:9.3f} ms"
+          f"  speedup: {old_time / new_time:5.1f}x")
+
+
+def main():
+    measure("bundle, 10k capsules", *make_bundle(10000), number=5)
+    measure("item list, 10k items", *make_item_list(10000), number=5)
+
+
+main()
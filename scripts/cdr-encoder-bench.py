@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+# Compare compiled CDR encoder with previous singledispatch-based one.
+# PYTHONPATH=. scripts/cdr-encoder-bench.py
+
+import io
+import struct
+import time
+from functools import singledispatchmethod
+from timeit import repeat
+
+from hyperapp.boot.htypes import (
+    TNone,
+    TString,
+    TBinary,
+    TInt,
+    TBool,
+    TDateTime,
+    TOptional,
+    TRecord,
+    TException,
+    TList,
+    tString,
+    tInt,
+    tBool,
+    ref_t,
+    capsule_t,
+    bundle_t,
+    )
+from hyperapp.boot.cdr_encoder import CdrEncoder
+
+
+class SingledispatchCdrEncoder:
+    # Encoder implementation before compiled encoders were introduced.
+
+    _int_struct = struct.Struct('!q')
+    _bool_struct = struct.Struct('!?')
+
+    def encode(self, value, t):
+        self._buf = io.BytesIO()
+        self.dispatch(t, value)
+        return self._buf.getvalue()
+
+    @singledispatchmethod
+    def dispatch(self, t, value):
+        assert False, repr((t, value))  # Unknown type
+
+    def write_int(self, value):
+        self._buf.write(self._int_struct.pack(value))
+
+    def write_bool(self, value):
+        self._buf.write(self._bool_struct.pack(value))
+
+    def write_unicode(self, value):
+        if type(value) is not bytes:
+            value = value.encode('utf-8')
+        self.write_int(len(value))
+        self._buf.write(value)
+
+    @dispatch.register(TNone)
+    def encode_none(self, t, value):
+        pass
+
+    @dispatch.register(TInt)
+    def encode_int(self, t, value):
+        self.write_int(value)
+
+    @dispatch.register(TBool)
+    def encode_bool(self, t, value):
+        self.write_bool(value)
+
+    @dispatch.register(TBinary)
+    def encode_binary(self, t, value):
+        self.write_int(len(value))
+        self._buf.write(value)
+
+    @dispatch.register(TString)
+    def encode_string(self, t, value):
+        self.write_unicode(value)
+
+    @dispatch.register(TDateTime)
+    def encode_datetime(self, t, value):
+        self.write_unicode(value.isoformat())
+
+    @dispatch.register(TOptional)
+    def encode_optional(self, t, value):
+        self.write_bool(value is not None)
+        if value is not None:
+            self.dispatch(t.base_t, value)
+
+    @dispatch.register(TRecord)
+    @dispatch.register(TException)
+    def encode_record(self, t, value):
+        for field_name, field_type in t.fields.items():
+            self.dispatch(field_type, getattr(value, field_name))
+
+    @dispatch.register(TList)
+    def encode_list(self, t, value):
+        self.write_int(len(value))
+        for elt in value:
+            self.dispatch(t.element_t, elt)
+
+
+def make_nested(depth):
+    leaf_t = TRecord('bench', 'leaf', {
+        'id': tInt,
+        'flag': tBool,
+        'count': tInt,
+        'name': tString,
+        })
+    t = leaf_t
+    value = leaf_t(1, True, 2, 'leaf')
+    for level in range(depth):
+        node_t = TRecord('bench', f'node_{level}', {
+            'level': tInt,
+            'visible': tBool,
+            'child': t,
+            'siblings': TList(leaf_t),
+            'parent': TOptional(t),
+            })
+        value = node_t(level, True, value, tuple(leaf_t(i, False, i, 'x') for i in range(3)), value)
+        t = node_t
+    return (value, t)
+
+
+def make_bundle(size):
+    capsule_list = tuple(
+        capsule_t(
+            type_ref=ref_t('sha512', bytes([idx % 256]) * 64),
+            encoding='cdr',
+            encoded_object=b'object-%d' % idx * 10,
+            )
+        for idx in range(size)
+        )
+    value = bundle_t(
+        roots=tuple(ref_t('sha512', bytes([idx % 256]) * 64) for idx in range(size // 10)),
+        associations=(),
+        capsule_list=capsule_list,
+        )
+    return (value, bundle_t)
+
+
+def make_int_list(size):
+    return (tuple(range(size)), TList(tInt))
+
+
+def measure(title, value, t, number):
+    old_encoder = SingledispatchCdrEncoder()
+    new_encoder = CdrEncoder()
+    old_data = old_encoder.encode(value, t)
+    new_data = new_encoder.encode(value, t)
+    assert new_data == old_data, title
+    old_time = min(repeat(lambda: old_encoder.encode(value, t), number=number, repeat=5, timer=time.perf_counter))
+    new_time = min(repeat(lambda: new_encoder.encode(value, t), number=number, repeat=5, timer=time.perf_counter))
+    print(f"{title:<30} {len(new_data):>10} bytes"
+          f"  old: {old_time / number * 1000:9.3f} ms"
+          f"  new: {new_time / number * 1000:9.3f} ms"
+          f"  speedup: {old_time / new_time:5.1f}x")
+
+
+def main():
+    measure("nested records, depth 10", *make_nested(10), number=20)
+    measure("bundle, 10k capsules", *make_bundle(10000), number=5)
+    measure("int list, 100k elements", *make_int_list(100000), number=5)
+
+
+main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# Compare size and speed of cdr and cdr2 encodings on bundles like ones sent by transport.
+# PYTHONPATH=. scripts/cdr2-bench.py
+
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta
+
+from hyperapp.boot.htypes import (
+    tString,
+    tInt,
+    tDateTime,
+    TList,
+    TRecord,
+    ref_t,
+    capsule_t,
+    bundle_t,
+    )
+from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.ref import make_ref
+from hyperapp.boot import cdr_coders  # register codec
+
+
+# Same fields as in git.types, transport_log_model.types and list_diff.types.
+commit_t = TRecord('git', 'commit', {
+    'id': tString,
+    'short_id': tString,
+    'parents': TList(ref_t),
+    'time': tDateTime,
+    'author': tString,
+    'committer': tString,
+    'message': tString,
+    })
+log_item_t = TRecord('transport_log_model', 'item', {
+    'id': tInt,
+    'dt': tDateTime,
+    'direction': tString,
+    'transport_name': tString,
+    'msg_title': tString,
+    'msg_bundle': bundle_t,
+    'transport_bundle': bundle_t,
+    'transport_size': tInt,
+    })
+remove_idx_t = TRecord('list_diff', 'remove_idx', {
+    'idx': tInt,
+    })
+append_t = TRecord('list_diff', 'append', {
+    'item': ref_t,
+    })
+
+AUTHORS = [
+    'Vsevolod Fedorov <vsevolod.fedorov@gmail.com>',
+    'Some Contributor <contributor@example.com>',
+    'Another Contributor <another@example.com>',
+    ]
+WORDS = 'fix add remove model view command transport bundle ref type test list diff feed'.split()
+
+
+def fake_ref(idx):
+    return ref_t('sha512', hashlib.sha512(str(idx).encode()).digest())
+
+
+def make_commits(count):
+    rng = random.Random(1)
+    dt = datetime(2020, 1, 1)
+    commits = []
+    parents = ()
+    for idx in range(count):
+        commit_id = hashlib.sha1(str(idx).encode()).hexdigest()
+        author = rng.choice(AUTHORS)
+        dt += timedelta(seconds=rng.randrange(60, 86400))
+        message = ' '.join(rng.choice(WORDS) for i in range(rng.randrange(3, 12))).capitalize() + '\n'
+        commit = commit_t(commit_id, commit_id[:7], parents, dt, author, author, message)
+        commits.append(commit)
+        parents = (fake_ref(idx),)
+    return (commit_t, commits)
+
+
+def make_log_items(count):
+    small_bundle = bundle_t(
+        roots=(fake_ref(0),),
+        associations=(),
+        capsule_list=(capsule_t(fake_ref(1), 'cdr', b'\x00' * 40),),
+        )
+    dt = datetime(2020, 1, 1)
+    items = []
+    for idx in range(count):
+        dt += timedelta(milliseconds=137)
+        items.append(log_item_t(
+            idx, dt, ['in', 'out'][idx % 2], 'tcp', 'rpc_message.request', small_bundle, small_bundle, 200 + idx % 50))
+    return (log_item_t, items)
+
+
+def make_remove_diffs(count):
+    return (remove_idx_t, [remove_idx_t(idx) for idx in range(count)])
+
+
+def make_append_diffs(count):
+    return (append_t, [append_t(fake_ref(idx)) for idx in range(count)])
+
+
+def make_bundle(t, values, capsule_encoding):
+    type_ref = fake_ref('type')
+    capsules = [
+        capsule_t(type_ref, capsule_encoding, packet_coders.encode(capsule_encoding, value, t))
+        for value in values
+        ]
+    return bundle_t(
+        roots=(make_ref(capsules[0]),),
+        associations=(),
+        capsule_list=tuple(capsules),
+        )
+
+
+def decode_all(t, bundle_encoding, data):
+    bundle = packet_coders.decode(bundle_encoding, data, bundle_t)
+    for capsule in bundle.capsule_list:
+        packet_coders.decode(capsule.encoding, capsule.encoded_object, t)
+
+
+def best_time(fn, *args, repeat=5):
+    best = None
+    for idx in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(title, t, values):
+    print(title)
+    base_size = base_time = None
+    # Bundle encoding, capsule encoding. Capsule encoding is part of a ref,
+    # so transport can only change bundle encoding for already existing capsules.
+    for bundle_encoding, capsule_encoding in [('cdr', 'cdr'), ('cdr2', 'cdr'), ('cdr2', 'cdr2')]:
+        bundle = make_bundle(t, values, capsule_encoding)
+        data = packet_coders.encode(bundle_encoding, bundle, bundle_t)
+        encode_time = best_time(make_bundle, t, values, capsule_encoding)
+        decode_time = best_time(decode_all, t, bundle_encoding, data)
+        if base_size is None:
+            base_size, base_time = len(data), decode_time
+        print(f"  bundle {bundle_encoding:<4} capsules {capsule_encoding:<4}"
+              f"  size: {len(data):9d} ({len(data) / base_size:4.2f})"
+              f"  encode: {encode_time * 1000:8.2f} ms"
+              f"  decode: {decode_time * 1000:8.2f} ms ({base_time / decode_time:4.1f}x faster)")
+
+
+def main():
+    count = 10000
+    measure(f"git commits, {count}", *make_commits(count))
+    measure(f"transport log items, {count}", *make_log_items(count))
+    measure(f"list diffs: remove_idx, {count}", *make_remove_diffs(count))
+    measure(f"list diffs: append, {count}", *make_append_diffs(count))
+
+
+main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Measure time client spends getting its identity on start: generating new 4096-bit key as before,
+# loading persistent one, and taking pre-generated one from worker process.
+# PYTHONPATH=. scripts/client-identity-bench.py
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+
+from hyperapp.boot.rsa_keygen import generate_private_key_pem
+
+
+KEY_SIZE = 4096  # RSA_KEY_SIZE_SAFE.
+RUN_COUNT = 5
+
+
+def measure(fn):
+    time_list = []
+    for idx in range(RUN_COUNT):
+        start = time.perf_counter()
+        fn()
+        time_list.append(time.perf_counter() - start)
+    return (sum(time_list) / len(time_list), max(time_list))
+
+
+def main():
+    pem = generate_private_key_pem(KEY_SIZE)
+
+    def load():
+        serialization.load_pem_private_key(pem, password=None, backend=default_backend())
+
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    with executor:
+        future_list = [executor.submit(generate_private_key_pem, KEY_SIZE) for idx in range(RUN_COUNT)]
+        for future in future_list:
+            future.result()  # Wait until all are generated, as for a pool started well before it is used.
+
+        def take_pregenerated():
+            serialization.load_pem_private_key(future_list.pop().result(), password=None, backend=default_backend())
+
+        for name, fn in [
+                ('generate', lambda: generate_private_key_pem(KEY_SIZE)),
+                ('load persistent', load),
+                ('take pre-generated', take_pregenerated),
+                ]:
+            mean, worst = measure(fn)
+            print(f"{name:>18}: mean {mean * 1000:9.2f} ms  max {worst * 1000:9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
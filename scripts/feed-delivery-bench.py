@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# Deliver a burst of 10k feed diffs to 50 remote subscribers: one blocking rpc call per diff per subscriber,
+# and coalesced batches sent from delivery thread, one batch in flight per subscriber.
+# A call seals its diffs with AES-GCM, and a timer fires the response after the round trip time, opening them.
+# Blocking delivery is measured on first diffs only and extrapolated.
+# PYTHONPATH=. scripts/feed-delivery-bench.py
+
+import os
+import random
+import threading
+import time
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+RTT_LIST = [0.001, 0.02]  # Seconds.
+DIFF_COUNT = 10000
+SUBSCRIBER_COUNT = 50
+BLOCKING_SAMPLE_DIFFS = 20
+DIFF_SIZE = 150  # Bytes, encoded.
+HOT_KEY_COUNT = 5  # Replaces go to these keys.
+REPLACE_RATIO = 0.5
+# Same as feed_servant defaults.
+MAX_DELAY_SEC = 0.05
+MAX_BATCH_DIFFS = 1000
+NONCE_SIZE = 12
+
+
+class Link:
+
+    def __init__(self, rtt):
+        self._rtt = rtt
+        self._aead = AESGCM(AESGCM.generate_key(bit_length=256))
+        self.parcel_count = 0
+        self._lock = threading.Lock()
+
+    def call(self, diff_count, on_response):
+        # Request parcel with diffs, then empty response parcel.
+        with self._lock:
+            self.parcel_count += 1
+        nonce = os.urandom(NONCE_SIZE)
+        encrypted = self._aead.encrypt(nonce, os.urandom(DIFF_SIZE * diff_count), None)
+        timer = threading.Timer(self._rtt, self._respond, args=(nonce, encrypted, on_response))
+        timer.start()
+
+    def _respond(self, nonce, encrypted, on_response):
+        self._aead.decrypt(nonce, encrypted, None)
+        on_response()
+
+
+def make_diffs():
+    # Diff is (kind, key).
+    rng = random.Random(1)
+    diff_list = []
+    for idx in range(DIFF_COUNT):
+        if rng.random() < REPLACE_RATIO:
+            diff_list.append(('replace', rng.randrange(HOT_KEY_COUNT)))
+        else:
+            diff_list.append(('append', idx))
+    return diff_list
+
+
+def coalesce(diff_list):
+    result = []
+    for diff in diff_list:
+        if result and diff[0] == 'replace' and result[-1] == diff:
+            continue
+        result.append(diff)
+    return result
+
+
+def blocking(link, diff_list):
+    # Feed.send calls each subscriber in turn, and each one waits for rpc response.
+    for diff in diff_list:
+        for idx in range(SUBSCRIBER_COUNT):
+            done = threading.Event()
+            link.call(1, done.set)
+            done.wait()
+    return len(diff_list) * SUBSCRIBER_COUNT
+
+
+class Delivery:
+
+    def __init__(self, link):
+        self._link = link
+        self._cond = threading.Condition()
+        self._queues = [[] for idx in range(SUBSCRIBER_COUNT)]
+        self._first_put_time = [None] * SUBSCRIBER_COUNT
+        self._in_flight = [False] * SUBSCRIBER_COUNT
+        self._pending = 0
+        self.sent_count = 0
+        self.max_latency = 0
+
+    def put(self, diff):
+        now = time.monotonic()
+        with self._cond:
+            for idx, queue in enumerate(self._queues):
+                if not queue:
+                    self._first_put_time[idx] = now
+                queue.append((diff, now))
+                self._pending += 1
+            self._cond.notify()
+
+    def run(self):
+        with self._cond:
+            while self._pending or any(self._in_flight):
+                now = time.monotonic()
+                wait_sec = MAX_DELAY_SEC
+                for idx, queue in enumerate(self._queues):
+                    if not queue or self._in_flight[idx]:
+                        continue
+                    ready_time = self._first_put_time[idx] + MAX_DELAY_SEC
+                    if len(queue) < MAX_BATCH_DIFFS and ready_time > now:
+                        wait_sec = min(wait_sec, ready_time - now)
+                        continue
+                    batch = queue[:MAX_BATCH_DIFFS]
+                    del queue[:MAX_BATCH_DIFFS]
+                    self._first_put_time[idx] = now
+                    self._pending -= len(batch)
+                    self._in_flight[idx] = True
+                    diff_list = coalesce([diff for diff, put_time in batch])
+                    self.sent_count += len(diff_list)
+                    oldest_put_time = batch[0][1]
+                    self._link.call(len(diff_list), lambda idx=idx, t=oldest_put_time: self._on_response(idx, t))
+                self._cond.wait(wait_sec)
+
+    def _on_response(self, idx, oldest_put_time):
+        with self._cond:
+            self.max_latency = max(self.max_latency, time.monotonic() - oldest_put_time)
+            self._in_flight[idx] = False
+            self._cond.notify()
+
+
+def batched(link, diff_list):
+    delivery = Delivery(link)
+    for diff in diff_list:
+        delivery.put(diff)
+    delivery.run()
+    return delivery
+
+
+def main():
+    diff_list = make_diffs()
+    print(f"{DIFF_COUNT} diffs ({REPLACE_RATIO:.0%} replaces of {HOT_KEY_COUNT} keys) to {SUBSCRIBER_COUNT} subscribers")
+    for rtt in RTT_LIST:
+        link = Link(rtt)
+        start = time.perf_counter()
+        call_count = blocking(link, diff_list[:BLOCKING_SAMPLE_DIFFS])
+        sample_sec = time.perf_counter() - start
+        total_sec = sample_sec * DIFF_COUNT / BLOCKING_SAMPLE_DIFFS
+        print(f"rtt {rtt * 1000:3.0f} ms:  blocking: {call_count * DIFF_COUNT // BLOCKING_SAMPLE_DIFFS:7} rpc calls,"
+              f" {total_sec:8.2f} sec (extrapolated from {BLOCKING_SAMPLE_DIFFS} diffs)")
+        link = Link(rtt)
+        start = time.perf_counter()
+        delivery = batched(link, diff_list)
+        total_sec = time.perf_counter() - start
+        print(f"rtt {rtt * 1000:3.0f} ms:   batched: {link.parcel_count:7} rpc calls, {total_sec:8.2f} sec,"
+              f" {delivery.sent_count} diffs sent after coalescing, max latency {delivery.max_latency * 1000:.0f} ms")
+
+
+main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Measure Mosaic throughput with N threads doing mixed put/resolve, with single lock and striped locks.
+# PYTHONPATH=. scripts/mosaic-contention-bench.py
+
+import random
+import threading
+import time
+
+from hyperapp.boot.htypes import BuiltinTypeRegistry, register_builtin_types, ref_t
+from hyperapp.boot.mosaic import DEFAULT_STRIPE_COUNT, Mosaic
+from hyperapp.boot.pyobj_registry import PyObjRegistry
+from hyperapp.boot.services import pyobj_config
+from hyperapp.boot.web import Web
+from hyperapp.boot import cdr_coders  # register codec
+
+
+OPS_PER_THREAD = 20000
+PUT_RATIO = 0.2
+PRELOADED_COUNT = 10000
+
+
+def make_services():
+    pyobj_creg = PyObjRegistry(pyobj_config, reconstructors=[])
+    builtin_types = BuiltinTypeRegistry()
+    mosaic = Mosaic(pyobj_creg)
+    web = Web(mosaic, pyobj_creg)
+    pyobj_creg.init(builtin_types, mosaic, web)
+    register_builtin_types(builtin_types, pyobj_creg)
+    return pyobj_creg
+
+
+def make_piece(idx):
+    return ref_t('sha512', idx.to_bytes(8, 'big') * 8)
+
+
+def run(pyobj_creg, thread_count, stripe_count):
+    mosaic = Mosaic(pyobj_creg, stripe_count=stripe_count)
+    preloaded_refs = mosaic.put_many([make_piece(idx) for idx in range(PRELOADED_COUNT)])
+    barrier = threading.Barrier(thread_count + 1)
+
+    def worker(thread_idx):
+        rng = random.Random(thread_idx)
+        # Half of new pieces are shared with other threads, to have contention on the same refs.
+        new_pieces = [make_piece(PRELOADED_COUNT + rng.randrange(OPS_PER_THREAD * 2)) for idx in range(OPS_PER_THREAD)]
+        barrier.wait()
+        for idx in range(OPS_PER_THREAD):
+            if rng.random() < PUT_RATIO:
+                mosaic.put(new_pieces[idx])
+            else:
+                mosaic.resolve_ref(preloaded_refs[rng.randrange(PRELOADED_COUNT)])
+
+    thread_list = [threading.Thread(target=worker, args=[idx]) for idx in range(thread_count)]
+    for thread in thread_list:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in thread_list:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return thread_count * OPS_PER_THREAD / elapsed
+
+
+def main():
+    pyobj_creg = make_services()
+    for thread_count in [1, 2, 4, 8, 16, 32]:
+        single_rate = run(pyobj_creg, thread_count, stripe_count=1)
+        striped_rate = run(pyobj_creg, thread_count, stripe_count=DEFAULT_STRIPE_COUNT)
+        print(f"{thread_count:>3} threads"
+              f"  single lock: {single_rate:10.0f} ops/sec"
+              f"  {DEFAULT_STRIPE_COUNT} stripes: {striped_rate:10.0f} ops/sec")
+
+
+main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Measure Mosaic.put throughput compared to previous implementation, and hash algorithms.
+# PYTHONPATH=. scripts/mosaic-put-bench.py
+
+import os
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+
+from hyperapp.boot.htypes import BuiltinTypeRegistry, register_builtin_types, tBinary, ref_t, capsule_t
+from hyperapp.boot.htypes.deduce_value_type import deduce_value_type_with_list
+from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.mosaic import Mosaic
+from hyperapp.boot.pyobj_registry import PyObjRegistry
+from hyperapp.boot.ref import make_capsule, make_ref
+from hyperapp.boot.services import pyobj_config
+from hyperapp.boot.web import Web
+from hyperapp.boot import cdr_coders  # register codec
+
+
+def make_services():
+    pyobj_creg = PyObjRegistry(pyobj_config, reconstructors=[])
+    builtin_types = BuiltinTypeRegistry()
+    mosaic = Mosaic(pyobj_creg)
+    web = Web(mosaic, pyobj_creg)
+    pyobj_creg.init(builtin_types, mosaic, web)
+    register_builtin_types(builtin_types, pyobj_creg)
+    return pyobj_creg
+
+
+def old_make_ref(capsule):
+    # make_ref implementation before encoded object reuse: encode whole capsule and hash it.
+    encoded_capsule = packet_coders.encode(capsule.encoding, capsule, capsule_t)
+    digest = hashes.Hash(hashes.SHA512(), backend=default_backend())
+    digest.update(encoded_capsule)
+    return ref_t('sha512', digest.finalize())
+
+
+def old_put_all(pyobj_creg, piece_list, t):
+    piece_to_ref = {}
+    for piece in piece_list:
+        piece_t = t or deduce_value_type_with_list(pyobj_creg, piece)
+        capsule = make_capsule(pyobj_creg, piece, piece_t)
+        piece_to_ref[piece, type(piece)] = old_make_ref(capsule)
+    return len(piece_to_ref)
+
+
+def put_all(pyobj_creg, piece_list, t):
+    mosaic = Mosaic(pyobj_creg)
+    for piece in piece_list:
+        mosaic.put(piece, t)
+    return mosaic.stats.entry_count
+
+
+def put_many(pyobj_creg, piece_list, t):
+    mosaic = Mosaic(pyobj_creg)
+    mosaic.put_many(piece_list, t)
+    return mosaic.stats.entry_count
+
+
+def measure(title, pyobj_creg, piece_list, t=None):
+    results = []
+    for fn in [old_put_all, put_all, put_many]:
+        start = time.perf_counter()
+        count = fn(pyobj_creg, piece_list, t)
+        elapsed = time.perf_counter() - start
+        assert count == len(piece_list), (fn, count)
+        results.append(len(piece_list) / elapsed)
+    old_rate, put_rate, put_many_rate = results
+    print(f"{title:<30}"
+          f"  old: {old_rate:10.0f} puts/sec"
+          f"  put: {put_rate:10.0f} puts/sec"
+          f"  put_many: {put_many_rate:10.0f} puts/sec"
+          f"  speedup: {put_rate / old_rate:4.1f}x / {put_many_rate / old_rate:4.1f}x")
+
+
+def measure_hash(title, pyobj_creg, piece_list):
+    capsule_list = [make_capsule(pyobj_creg, piece) for piece in piece_list]
+    results = []
+    for hash_algorithm in ['sha512', 'blake2b']:
+        start = time.perf_counter()
+        for capsule in capsule_list:
+            make_ref(capsule, hash_algorithm)
+        elapsed = time.perf_counter() - start
+        results.append(len(capsule_list) / elapsed)
+    sha512_rate, blake2b_rate = results
+    print(f"{title:<30}"
+          f"  sha512: {sha512_rate:10.0f} refs/sec"
+          f"  blake2b: {blake2b_rate:10.0f} refs/sec")
+
+
+def main():
+    pyobj_creg = make_services()
+    small_records = [ref_t('sha512', idx.to_bytes(8, 'big') * 8) for idx in range(100000)]
+    large_binaries = [os.urandom(1024 * 1024) for idx in range(100)]
+    measure("small records, 100k", pyobj_creg, small_records)
+    measure("1 MB binaries, 100", pyobj_creg, large_binaries, tBinary)
+    measure_hash("small records, 100k", pyobj_creg, small_records)
+    measure_hash("1 MB binaries, 100", pyobj_creg, large_binaries)
+
+
+main()
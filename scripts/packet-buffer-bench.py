@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Compare receiving packets with PacketBuffer to previous bytes concatenation, using a socket pair.
+# PYTHONPATH=. scripts/packet-buffer-bench.py
+
+import socket
+import struct
+import threading
+import time
+
+from hyperapp.boot.packet_buffer import HEADER, PacketBuffer
+
+
+RECV_SIZE = 1024**2
+
+
+def make_packet(size):
+    encoding = b'cdr'
+    return HEADER.pack(len(encoding), size) + encoding + b'x' * size
+
+
+def old_has_full_packet(data):
+    header_size = struct.calcsize('!QQ')
+    if len(data) < header_size:
+        return False
+    encoding_size, size = struct.unpack('!QQ', data[:header_size])
+    return len(data) >= header_size + encoding_size + size
+
+
+def old_pop_packet(data):
+    header_size = struct.calcsize('!QQ')
+    encoding_size, size = struct.unpack('!QQ', data[:header_size])
+    packet_size = header_size + encoding_size + size
+    return (data[header_size + encoding_size:packet_size], data[packet_size:])
+
+
+def old_receive(sock, packet_count):
+    buffer = b''
+    received = 0
+    while received < packet_count:
+        buffer += sock.recv(RECV_SIZE)
+        while old_has_full_packet(buffer):
+            packet_data, buffer = old_pop_packet(buffer)
+            received += 1
+
+
+def new_receive(sock, packet_count):
+    buffer = PacketBuffer()
+    received = 0
+    while received < packet_count:
+        buffer.recv_from_socket(sock)
+        while buffer.pop_packet():
+            received += 1
+
+
+def measure(receive_fn, packet_size, packet_count):
+    data = make_packet(packet_size) * packet_count
+    a, b = socket.socketpair()
+    with a, b:
+        a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, RECV_SIZE)
+        b.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_SIZE)
+        sender = threading.Thread(target=a.sendall, args=[data])
+        start = time.perf_counter()
+        sender.start()
+        receive_fn(b, packet_count)
+        elapsed = time.perf_counter() - start
+        sender.join()
+    return len(data) / elapsed / 1024**2
+
+
+def main():
+    for packet_size, packet_count in [(100, 100000), (10 * 1024, 10000), (1024**2, 100), (16 * 1024**2, 4), (64 * 1024**2, 1)]:
+        old_rate = measure(old_receive, packet_size, packet_count)
+        new_rate = measure(new_receive, packet_size, packet_count)
+        print(f"{packet_count:>6} packets of {packet_size:>9} bytes"
+              f"  bytes concatenation: {old_rate:8.1f} MB/s"
+              f"  packet buffer: {new_rate:8.1f} MB/s"
+              f"  speedup: {new_rate / old_rate:5.1f}x")
+
+
+main()
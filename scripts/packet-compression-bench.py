@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# Measure packet compression ratio and CPU time on a bundle of python module sources,
+# like ones rc sends to it's driver subprocesses.
+# PYTHONPATH=. scripts/packet-compression-bench.py
+
+import hashlib
+from pathlib import Path
+
+from hyperapp.boot.htypes import tString, TRecord, ref_t, capsule_t, bundle_t
+from hyperapp.boot.htypes.packet_coders import packet_coders
+from hyperapp.boot.packet_compression import PacketCompressor
+from hyperapp.boot import cdr_coders  # register codec
+
+
+# Fields used by python module capsules.
+module_t = TRecord('bench', 'python_module', {
+    'module_name': tString,
+    'source': tString,
+    'file_path': tString,
+    })
+
+LINK_SPEED = 10 * 1024 * 1024 / 8  # 10 Mbit/s, bytes per second.
+
+
+def make_bundle(encoding):
+    type_ref = ref_t('sha512', hashlib.sha512(b'python_module').digest())
+    capsules = []
+    for path in sorted(Path('hyperapp').rglob('*.dyn.py')):
+        module = module_t(path.name.split('.')[0], path.read_text(), str(path))
+        capsules.append(capsule_t(type_ref, encoding, packet_coders.encode(encoding, module, module_t)))
+    return bundle_t(roots=(), associations=(), capsule_list=tuple(capsules))
+
+
+def measure(encoding, compression, level=None, repeat=5):
+    bundle = make_bundle(encoding)
+    for idx in range(repeat):
+        sender = PacketCompressor(compression, level=level)
+        receiver = PacketCompressor()
+        packet_encoding, data = sender.encode(bundle, encoding, bundle_t)
+        receiver.decode(packet_encoding, data, bundle_t)
+    out_stats = sender.stats
+    in_stats = receiver.stats
+    title = f"{encoding} {compression or 'none'}" + (f" level {level}" if level is not None else "")
+    print(f"{title:<20}"
+          f"  size: {out_stats.out_raw_size:9d} -> {out_stats.out_size:9d} (ratio {out_stats.out_ratio:5.2f})"
+          f"  compress: {out_stats.compress_time * 1000:7.2f} ms"
+          f"  decompress: {in_stats.decompress_time * 1000:6.2f} ms"
+          f"  10 Mbit/s link: {out_stats.out_size / LINK_SPEED * 1000:7.1f} ms")
+
+
+def main():
+    for encoding in ['cdr', 'cdr2']:
+        measure(encoding, None)
+        measure(encoding, 'zlib', level=1)
+        measure(encoding, 'zlib')
+        measure(encoding, 'lzma')
+
+
+main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Compare rpc requests made when navigator opens a remote list - feed subscribe, then items fetch -
+# submitted one by one, each waited for before the next, and submitted together inside rpc_batcher.batch().
+# Requests go through rpc_submit_target_factory and tcp_transport over localhost, to a server system
+# booted from rc config in this process, same as the client one.
+# PYTHONPATH=. scripts/rpc-batch-bench.py
+
+import itertools
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from hyperapp.boot import cdr_coders, dict_coders  # register codec
+from hyperapp.boot.project import load_boot_config
+from hyperapp.boot.services import HYPERAPP_DIR, Services
+
+
+SUBSCRIBE_SERVICE_NAME = 'rpc_batch_bench_subscribe'
+FETCH_SERVICE_NAME = 'rpc_batch_bench_fetch'
+TIMEOUT_SEC = 60
+ITEM_COUNT = 100
+CASES = [  # Opener count, opens per opener.
+    (1, 500),
+    (10, 50),
+    ]
+
+
+_model_idx = itertools.count()
+
+
+def subscribe(model):
+    return model
+
+
+def fetch(model):
+    return tuple(f'{model} item #{idx}' for idx in range(ITEM_COUNT))
+
+
+def p50(latency_list):
+    latency_list = sorted(latency_list)
+    return latency_list[len(latency_list) // 2]
+
+
+class Bench:
+
+    def __init__(self, services, boot_config, name_to_project):
+        self._services = services
+        self._boot_config = boot_config
+        self._name_to_project = name_to_project
+        self._system_list = []
+
+    def __enter__(self):
+        self.server_system = self._make_system()
+        self.client_system = self._make_system()
+        self.server_system.add_core_service(SUBSCRIBE_SERVICE_NAME, subscribe)
+        self.server_system.add_core_service(FETCH_SERVICE_NAME, fetch)
+        self.client_identity = self._register_identity(self.client_system)
+        server_identity = self._register_identity(self.server_system)
+        server = self.server_system['tcp_server_factory'](bind_address=None)
+        # Route from piece is not local, so client system sends by it.
+        route = self.client_system['route_creg'].animate(server.route.piece)
+        self.client_system['route_table'].add_route(server_identity.peer, route)
+        self.server_peer = self.client_system['peer_creg'].animate(server_identity.peer.piece)
+        return self
+
+    def __exit__(self, *args):
+        for system in reversed(self._system_list):
+            system.close()
+
+    def _make_system(self):
+        system_module_piece = self._name_to_project['base']['base.system.system', 'system.module']
+        system_module = self._services.pyobj_creg.animate(system_module_piece)
+        system = system_module.System()
+        system.load_projects(self._name_to_project.values())
+        system['load_config_layers'](self._boot_config)
+        system.set_default_layer(self._boot_config.default_layer)
+        system['init_hook'].run_hooks()
+        self._system_list.append(system)
+        return system
+
+    @staticmethod
+    def _register_identity(system):
+        identity = system['generate_rsa_identity'](fast=True)
+        system['endpoint_registry'].register(identity, system['rpc_endpoint'])
+        return identity
+
+    def submit_factory(self, service_name):
+        return self.client_system['service_submit_factory'](
+            self.server_peer, self.client_identity, service_name, timeout_sec=TIMEOUT_SEC)
+
+
+def open_one_by_one(bench, submit_subscribe, submit_fetch, model):
+    submit_subscribe(model=model).result(TIMEOUT_SEC)
+    return submit_fetch(model=model).result(TIMEOUT_SEC)
+
+
+def open_batched(bench, submit_subscribe, submit_fetch, model):
+    with bench.client_system['rpc_batcher'].batch():
+        subscribe_future = submit_subscribe(model=model)
+        fetch_future = submit_fetch(model=model)
+    subscribe_future.result(TIMEOUT_SEC)
+    return fetch_future.result(TIMEOUT_SEC)
+
+
+def measure(bench, open_model, opener_count, open_count):
+    latency_list = []
+    submit_subscribe = bench.submit_factory(SUBSCRIBE_SERVICE_NAME)
+    submit_fetch = bench.submit_factory(FETCH_SERVICE_NAME)
+
+    def opener():
+        for idx in range(open_count):
+            # Unique, so requests are not skipped as known to receiver.
+            model = f'model #{next(_model_idx)}'
+            start = time.perf_counter()
+            item_list = open_model(bench, submit_subscribe, submit_fetch, model)
+            latency_list.append(time.perf_counter() - start)
+            assert len(item_list) == ITEM_COUNT
+
+    thread_list = [threading.Thread(target=opener) for idx in range(opener_count)]
+    start = time.perf_counter()
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return (len(latency_list) / elapsed, p50(latency_list))
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    services = Services()
+    services.init_services()
+    try:
+        boot_config = load_boot_config(HYPERAPP_DIR / 'rc.yaml')
+        # Route table stores routes to default layer. Keep them out of project resources.
+        temp_dir = tempfile.TemporaryDirectory()
+        boot_config.config_layers = {'bench': Path(temp_dir.name) / 'config.cdr'}
+        boot_config.default_layer = 'bench'
+        name_to_project = services.load_projects(boot_config, HYPERAPP_DIR)
+        with Bench(services, boot_config, name_to_project) as bench:
+            for opener_count, open_count in CASES:
+                for name, open_model in [('one by one', open_one_by_one), ('batched', open_batched)]:
+                    rate, latency = measure(bench, open_model, opener_count, open_count)
+                    print(f"{opener_count:>3} openers x {open_count:>4} opens, {name:>10}:"
+                          f" {rate:7.0f} opens/s, p50 {latency * 1000:7.2f} ms")
+    finally:
+        services.stop()
+
+
+main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Compare latency of small rpc request/response parcel pairs, paced at 1000 calls per second,
+# for per-parcel RSA keys (rsa_identity parcels) and for session keys (rsa_session_store parcels).
+# Client and server are two systems booted from rc config in this process; Parcels are passed between them
+# by pieces and animated with receiver parcel_creg, as transport does. No sockets.
+# PYTHONPATH=. scripts/rsa-session-bench.py
+
+import time
+
+from hyperapp.boot import cdr_coders, dict_coders  # register codec
+from hyperapp.boot.htypes import bundle_t
+from hyperapp.boot.project import load_boot_config
+from hyperapp.boot.services import HYPERAPP_DIR, Services
+
+
+CALLS_PER_SEC = 1000
+CALL_COUNT = 1000
+MESSAGE_SIZE = 200
+
+
+class Side:
+
+    def __init__(self, system):
+        self.identity = system['generate_rsa_identity']()  # Safe key size.
+        self.parcel_creg = system['parcel_creg']
+        self.session_store = system['rsa_session_store']
+
+
+def make_system(services, boot_config, name_to_project):
+    system_module_piece = name_to_project['base']['base.system.system', 'system.module']
+    system_module = services.pyobj_creg.animate(system_module_piece)
+    system = system_module.System()
+    system.load_projects(name_to_project.values())
+    system['load_config_layers'](boot_config)
+    system['init_hook'].run_hooks()
+    return system
+
+
+def per_parcel_make(sender, receiver, bundle):
+    return receiver.identity.peer.make_parcel(bundle, sender.identity)
+
+
+def session_make(sender, receiver, bundle):
+    return sender.session_store.make_parcel(receiver.identity.peer, bundle, sender.identity)
+
+
+def transfer(make_parcel, mosaic, sender, receiver, message_idx):
+    message = f'{message_idx:08} ' + 'x' * MESSAGE_SIZE
+    bundle = bundle_t(roots=(mosaic.put(message),), associations=(), capsule_list=())
+    parcel = make_parcel(sender, receiver, bundle)
+    received = receiver.parcel_creg.animate(parcel.piece)
+    received.verify()
+    assert received.decrypt(receiver.identity) == bundle
+
+
+def measure(make_parcel, mosaic, client, server):
+    latency_list = []
+    start = time.perf_counter()
+    for idx in range(CALL_COUNT):
+        # Calls are started on schedule; a call waits for previous ones if scheme can not keep up.
+        scheduled = start + idx / CALLS_PER_SEC
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        transfer(make_parcel, mosaic, client, server, idx * 2)
+        transfer(make_parcel, mosaic, server, client, idx * 2 + 1)
+        latency_list.append(time.perf_counter() - scheduled)
+    elapsed = time.perf_counter() - start
+    latency_list.sort()
+    return (
+        CALL_COUNT / elapsed,
+        latency_list[len(latency_list) // 2],
+        latency_list[int(len(latency_list) * 0.99)],
+        )
+
+
+def main():
+    services = Services()
+    services.init_services()
+    system_list = []
+    try:
+        boot_config = load_boot_config(HYPERAPP_DIR / 'rc.yaml')
+        name_to_project = services.load_projects(boot_config, HYPERAPP_DIR)
+        for idx in range(2):
+            system_list.append(make_system(services, boot_config, name_to_project))
+        client, server = [Side(system) for system in system_list]
+        print(f"{CALL_COUNT} calls of {MESSAGE_SIZE} bytes, scheduled at {CALLS_PER_SEC}/s")
+        for name, make_parcel in [('per-parcel RSA', per_parcel_make), ('session keys', session_make)]:
+            rate, p50, p99 = measure(make_parcel, services.mosaic, client, server)
+            print(f"{name:>15}: {rate:7.0f} calls/s  p50 {p50 * 1000:9.2f} ms  p99 {p99 * 1000:9.2f} ms")
+    finally:
+        for system in reversed(system_list):
+            system.close()
+        services.stop()
+
+
+main()
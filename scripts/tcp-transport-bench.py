@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Compare rpc round trips over localhost for tcp_transport with callers blocked on futures in threads
+# and for async_tcp_transport with callers awaiting in one event loop.
+# Server and client are two systems booted from rc config in this process; Client connects by server route pieces.
+# PYTHONPATH=. scripts/tcp-transport-bench.py
+
+import asyncio
+import itertools
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from hyperapp.boot import cdr_coders, dict_coders  # register codec
+from hyperapp.boot.project import load_boot_config
+from hyperapp.boot.services import HYPERAPP_DIR, Services
+
+
+SERVICE_NAME = 'tcp_transport_bench_echo'
+TIMEOUT_SEC = 60
+CASES = [  # caller count, call count, payload size.
+    (1, 2000, 100),
+    (10, 200, 100),
+    (100, 20, 100),
+    (10, 10, 1024**2),
+    ]
+
+
+_message_idx = itertools.count()
+
+
+def make_message(payload):
+    # Unique, so repeated payload is not skipped as known to receiver.
+    return f'{next(_message_idx)} {payload}'
+
+
+def p99(latency_list):
+    latency_list = sorted(latency_list)
+    return latency_list[int(len(latency_list) * 0.99)]
+
+
+def echo(message):
+    return message
+
+
+class Bench:
+
+    def __init__(self, services, boot_config, name_to_project):
+        self._services = services
+        self._boot_config = boot_config
+        self._name_to_project = name_to_project
+        self._system_list = []
+
+    def __enter__(self):
+        self.server_system = self._make_system()
+        self.client_system = self._make_system()
+        self.server_system.add_core_service(SERVICE_NAME, echo)
+        self.client_identity = self._register_identity(self.client_system)
+        self.sync_peer = self._add_server(self.server_system['tcp_server_factory'])
+        self.async_peer = self._add_server(self.server_system['async_tcp_server_factory'])
+        return self
+
+    def __exit__(self, *args):
+        for system in reversed(self._system_list):
+            system.close()
+
+    def _make_system(self):
+        system_module_piece = self._name_to_project['base']['base.system.system', 'system.module']
+        system_module = self._services.pyobj_creg.animate(system_module_piece)
+        system = system_module.System()
+        system.load_projects(self._name_to_project.values())
+        system['load_config_layers'](self._boot_config)
+        system.set_default_layer(self._boot_config.default_layer)
+        system['init_hook'].run_hooks()
+        self._system_list.append(system)
+        return system
+
+    @staticmethod
+    def _register_identity(system):
+        identity = system['generate_rsa_identity'](fast=True)
+        system['endpoint_registry'].register(identity, system['rpc_endpoint'])
+        return identity
+
+    def _add_server(self, server_factory):
+        server_identity = self._register_identity(self.server_system)
+        server = server_factory(bind_address=None)
+        # Route from piece is not local, so client system sends by it.
+        route = self.client_system['route_creg'].animate(server.route.piece)
+        self.client_system['route_table'].add_route(server_identity.peer, route)
+        return self.client_system['peer_creg'].animate(server_identity.peer.piece)
+
+
+def measure_sync(bench, caller_count, call_count, payload):
+    latency_list = []
+    call = bench.client_system['service_call_factory'](
+        bench.sync_peer, bench.client_identity, SERVICE_NAME, timeout_sec=TIMEOUT_SEC)
+
+    def caller():
+        for idx in range(call_count):
+            start = time.perf_counter()
+            call(message=make_message(payload))
+            latency_list.append(time.perf_counter() - start)
+
+    thread_list = [threading.Thread(target=caller) for idx in range(caller_count)]
+    start = time.perf_counter()
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return (len(latency_list) / elapsed, p99(latency_list))
+
+
+def measure_async(bench, event_loop, caller_count, call_count, payload):
+    latency_list = []
+    submit = bench.client_system['service_submit_factory'](
+        bench.async_peer, bench.client_identity, SERVICE_NAME, timeout_sec=TIMEOUT_SEC)
+    rpc_await_future = bench.client_system['rpc_await_future']
+
+    async def caller():
+        for idx in range(call_count):
+            start = time.perf_counter()
+            await rpc_await_future(submit(message=make_message(payload)), TIMEOUT_SEC)
+            latency_list.append(time.perf_counter() - start)
+
+    async def main():
+        start = time.perf_counter()
+        await asyncio.gather(*[caller() for idx in range(caller_count)])
+        return time.perf_counter() - start
+
+    elapsed = event_loop.run_until_complete(main())
+    return (len(latency_list) / elapsed, p99(latency_list))
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    services = Services()
+    services.init_services()
+    try:
+        boot_config = load_boot_config(HYPERAPP_DIR / 'rc.yaml')
+        # Route table stores routes to default layer. Keep them out of project resources.
+        temp_dir = tempfile.TemporaryDirectory()
+        boot_config.config_layers = {'bench': Path(temp_dir.name) / 'config.cdr'}
+        boot_config.default_layer = 'bench'
+        name_to_project = services.load_projects(boot_config, HYPERAPP_DIR)
+        event_loop = asyncio.new_event_loop()
+        with Bench(services, boot_config, name_to_project) as bench:
+            # Client side async connections run in this loop, as in client with qasync loop.
+            event_loop.run_until_complete(_use_running_loop(bench.client_system['async_tcp_loop']))
+            for caller_count, call_count, payload_size in CASES:
+                payload = 'x' * payload_size
+                sync_rate, sync_p99 = measure_sync(bench, caller_count, call_count, payload)
+                async_rate, async_p99 = measure_async(bench, event_loop, caller_count, call_count, payload)
+                print(f"{caller_count:>4} callers x {call_count:>5} calls of {payload_size:>8} bytes"
+                      f"  tcp_transport: {sync_rate:8.0f} req/s, p99 {sync_p99 * 1000:7.2f} ms"
+                      f"  async_tcp_transport: {async_rate:8.0f} req/s, p99 {async_p99 * 1000:7.2f} ms")
+            event_loop.run_until_complete(_cancel_tasks())
+        event_loop.close()
+    finally:
+        services.stop()
+
+
+async def _use_running_loop(async_tcp_loop):
+    async_tcp_loop.use_running_loop()
+
+
+async def _cancel_tasks():
+    task_list = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in task_list:
+        task.cancel()
+    await asyncio.gather(*task_list, return_exceptions=True)
+
+
+main()